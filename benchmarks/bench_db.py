@@ -0,0 +1,316 @@
+#!/usr/local/bin/python3
+"""
+Micro-benchmarks of the libs/db client layer.
+
+Measures session create and teardown, connection acquire, the connection
+probe of MariaDB.cursor(), SELECT 1 round trips, insert throughput (single
+row vs batched) and fetch throughput by result size and cursor type.
+Without --host the benchmarks run against a MariaDB started on a throwaway
+datadir, see db.local_server.
+
+    python benchmarks/bench_db.py [--json results.json] [--compare base.json]
+
+Results are written as JSON together with the commit they were measured
+at, --compare prints the change of every benchmark against an earlier
+result file and with --check the exit status is non-zero if one of them
+regressed by more than --threshold.
+"""
+import argparse
+import json
+import os
+import platform
+import subprocess
+import sys
+import time
+
+ROOT_DIR = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+sys.path.insert(0, os.path.join(ROOT_DIR, 'libs'))
+
+from db import DbSession, MariaDB  # noqa: E402
+from db.local_server import LocalMariaDB  # noqa: E402
+
+clock = time.perf_counter
+
+INSERT_BATCH_SIZES = (1, 100, 1000)
+FETCH_SIZES = (1, 100, 10000, 100000)
+# Keyword arguments of connection.cursor() per cursor type
+CURSOR_TYPES = (
+    ('default', {}),
+    ('buffered', {'buffered': True}),
+    ('raw', {'raw': True, 'buffered': True}),
+    ('dictionary', {'dictionary': True}),
+)
+
+
+def summarize(name, timings, params=None, rows=None):
+    """
+    Args:
+        name (str): benchmark name
+        timings (list): seconds of every iteration
+        params (dict): benchmark parameters
+        rows (int): rows processed per iteration, for throughput
+
+    Returns:
+        result (dict): JSON serializable result
+    """
+    ordered = sorted(timings)
+    result = {
+        'name': name,
+        'params': params or {},
+        'iterations': len(ordered),
+        'median_ms': ordered[len(ordered) // 2] * 1000,
+        'p95_ms': ordered[min(len(ordered) - 1,
+                              int(len(ordered) * 0.95))] * 1000,
+        'min_ms': ordered[0] * 1000,
+        'mean_ms': sum(ordered) / len(ordered) * 1000,
+    }
+    if rows:
+        result['rows'] = rows
+        result['rows_per_sec'] = rows / ordered[len(ordered) // 2]
+    return result
+
+
+def key(result):
+    params = ','.join('{}={}'.format(k, v)
+                      for k, v in sorted(result['params'].items()))
+    return '{}[{}]'.format(result['name'], params) if params else \
+        result['name']
+
+
+def session_connection(session):
+    """
+    Driver connection of a session. DbSession.session_db creates the user
+    and database but only connects on the first cursor, the benchmarks need
+    the connection itself for cursor types and transactions.
+    """
+    session_db = session.session_db
+    if session_db.connection is None:
+        session_db.connect()
+    return session_db.connection
+
+
+def bench_session_lifecycle(conn_params, iterations):
+    create, teardown = [], []
+    for _ in range(iterations):
+        start = clock()
+        session = DbSession(conn_params, isolate_db=True)
+        session_connection(session)
+        created = clock()
+        session.close()
+        create.append(created - start)
+        teardown.append(clock() - created)
+    return [summarize('session_create', create),
+            summarize('session_teardown', teardown)]
+
+
+def bench_connection(conn_params, iterations):
+    acquire, probe = [], []
+    mdb = MariaDB(conn_params)
+    for _ in range(iterations):
+        start = clock()
+        mdb.connect()
+        acquire.append(clock() - start)
+        mdb.close()
+
+    mdb.connect()
+    for _ in range(iterations):
+        start = clock()
+        mdb.cursor().close()
+        probe.append(clock() - start)
+    mdb.close()
+    return [summarize('connection_acquire', acquire),
+            summarize('ensure_connection', probe)]
+
+
+def bench_select_1(session, iterations):
+    timings = []
+    cursor = session_connection(session).cursor()
+    for _ in range(iterations):
+        start = clock()
+        cursor.execute('SELECT 1')
+        cursor.fetchall()
+        timings.append(clock() - start)
+    cursor.close()
+    return [summarize('select_1', timings)]
+
+
+def bench_insert(session, rows, repeat):
+    connection = session_connection(session)
+    cursor = connection.cursor()
+    cursor.execute("CREATE TABLE bench_insert "
+                   "(id int primary key, a int, b varchar(64))")
+    data = [(i, i * 7, 'row {}'.format(i)) for i in range(rows)]
+    sql = "INSERT INTO bench_insert (id, a, b) VALUES (%s, %s, %s)"
+
+    results = []
+    connection.autocommit = False
+    for batch_size in INSERT_BATCH_SIZES:
+        timings = []
+        for _ in range(repeat):
+            cursor.execute("TRUNCATE TABLE bench_insert")
+            start = clock()
+            if batch_size == 1:
+                for row in data:
+                    cursor.execute(sql, row)
+            else:
+                for i in range(0, rows, batch_size):
+                    cursor.executemany(sql, data[i:i + batch_size])
+            connection.commit()
+            timings.append(clock() - start)
+        results.append(summarize('insert', timings,
+                                 {'batch_size': batch_size}, rows))
+    connection.autocommit = True
+    cursor.execute("DROP TABLE bench_insert")
+    cursor.close()
+    return results
+
+
+def bench_fetch(session, max_rows, repeat):
+    connection = session_connection(session)
+    cursor = connection.cursor()
+    cursor.execute("CREATE TABLE bench_fetch "
+                   "(id int primary key, a int, b varchar(64), c double)")
+    connection.autocommit = False
+    for i in range(0, max_rows, 1000):
+        cursor.executemany(
+            "INSERT INTO bench_fetch VALUES (%s, %s, %s, %s)",
+            [(j, j * 7, 'row {}'.format(j), j / 3.0)
+             for j in range(i, min(max_rows, i + 1000))]
+        )
+    connection.commit()
+    connection.autocommit = True
+    cursor.close()
+
+    results = []
+    for size in FETCH_SIZES:
+        if size > max_rows:
+            continue
+        sql = "SELECT id, a, b, c FROM bench_fetch LIMIT {}".format(size)
+        for cursor_type, kwargs in CURSOR_TYPES:
+            timings = []
+            for _ in range(repeat):
+                cursor = connection.cursor(**kwargs)
+                start = clock()
+                cursor.execute(sql)
+                cursor.fetchall()
+                timings.append(clock() - start)
+                cursor.close()
+            results.append(summarize(
+                'fetch', timings, {'rows': size, 'cursor': cursor_type}, size
+            ))
+    return results
+
+
+def git_commit():
+    try:
+        return subprocess.check_output(
+            ['git', 'rev-parse', 'HEAD'], cwd=ROOT_DIR,
+            stderr=subprocess.DEVNULL
+        ).decode().strip()
+    except (OSError, subprocess.CalledProcessError):
+        return None
+
+
+def run(conn_params, args):
+    results = []
+    results += bench_session_lifecycle(conn_params, args.sessions)
+    results += bench_connection(conn_params, args.iterations)
+    with DbSession(conn_params, isolate_db=True) as session:
+        results += bench_select_1(session, args.iterations)
+        results += bench_insert(session, args.rows, args.repeat)
+        results += bench_fetch(session, args.fetch_rows, args.repeat)
+
+        cursor = session_connection(session).cursor()
+        cursor.execute("SELECT VERSION()")
+        version = cursor.fetchall()[0][0]
+        cursor.close()
+
+    return {
+        'commit': git_commit(),
+        'timestamp': time.strftime('%Y-%m-%dT%H:%M:%S'),
+        'python': platform.python_version(),
+        'server_version': version,
+        'results': results,
+    }
+
+
+def compare(report, baseline, threshold):
+    """
+    Print every benchmark against the baseline report.
+
+    Returns:
+        regressions (list): keys of benchmarks whose median grew by more
+            than threshold times
+    """
+    previous = {key(r): r for r in baseline['results']}
+    regressions = []
+    print("\nAgainst {}".format(baseline.get('commit')))
+    for result in report['results']:
+        before = previous.get(key(result))
+        if before is None:
+            continue
+        ratio = result['median_ms'] / before['median_ms']
+        flag = ''
+        if ratio > threshold:
+            regressions.append(key(result))
+            flag = '  REGRESSION'
+        print("{:<45} {:>10.3f} -> {:>10.3f} ms  x{:.2f}{}".format(
+            key(result), before['median_ms'], result['median_ms'], ratio,
+            flag
+        ))
+    return regressions
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.split('\n\n')[0])
+    parser.add_argument('--host', help='existing server, a local one is '
+                        'started otherwise')
+    parser.add_argument('--port', type=int, default=3306)
+    parser.add_argument('--user', default='root')
+    parser.add_argument('--password', default='')
+    parser.add_argument('--dbname', default='test')
+    parser.add_argument('--binary-dir', help='directory of mariadbd')
+    parser.add_argument('--iterations', type=int, default=200)
+    parser.add_argument('--sessions', type=int, default=20)
+    parser.add_argument('--repeat', type=int, default=5)
+    parser.add_argument('--rows', type=int, default=10000,
+                        help='rows per insert benchmark')
+    parser.add_argument('--fetch-rows', type=int, default=100000,
+                        help='size of the largest fetch')
+    parser.add_argument('--json', help='write the results to this file')
+    parser.add_argument('--compare', help='earlier result file')
+    parser.add_argument('--threshold', type=float, default=1.2)
+    parser.add_argument('--check', action='store_true')
+    args = parser.parse_args()
+
+    if args.host:
+        report = run({
+            'host': args.host, 'port': args.port, 'user': args.user,
+            'password': args.password, 'dbname': args.dbname,
+        }, args)
+    else:
+        with LocalMariaDB(binary_dir=args.binary_dir) as server:
+            report = run(server.conn_params, args)
+
+    print("{:<45} {:>10} {:>10} {:>14}".format(
+        'benchmark', 'median ms', 'p95 ms', 'rows/s'))
+    for result in report['results']:
+        print("{:<45} {:>10.3f} {:>10.3f} {:>14}".format(
+            key(result), result['median_ms'], result['p95_ms'],
+            '{:.0f}'.format(result['rows_per_sec'])
+            if 'rows_per_sec' in result else '-'
+        ))
+
+    if args.json:
+        with open(args.json, 'w') as wfp:
+            json.dump(report, wfp, indent=2)
+
+    if args.compare:
+        with open(args.compare) as rfp:
+            regressions = compare(report, json.load(rfp), args.threshold)
+        if args.check and regressions:
+            sys.exit(1)
+
+
+if __name__ == '__main__':
+    main()
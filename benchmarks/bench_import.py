@@ -0,0 +1,122 @@
+#!/usr/local/bin/python3
+"""
+Import time benchmark of the libs packages.
+
+Every statement is run in fresh interpreters, the way worker processes and
+CLI tools start, and the median wall time is reported together with the
+heavy third party modules the statement ended up loading.
+
+    python benchmarks/bench_import.py [--runs 20] [--check]
+
+With --check the exit status is non-zero if a statement loads a heavy
+module it does not need.
+"""
+import argparse
+import json
+import os
+import statistics
+import subprocess
+import sys
+import time
+
+LIBS_DIR = os.path.abspath(
+    os.path.join(os.path.dirname(os.path.abspath(__file__)), '../libs')
+)
+
+HEAVY_MODULES = (
+    'mysql.connector',
+    'pytest',
+    'paramiko',
+    'scp',
+    'sqlparse',
+    'multiprocessing.pool',
+    'psycopg2',
+    'prettytable',
+)
+
+# statement -> heavy modules it is allowed to load
+STATEMENTS = (
+    ('pass', ()),
+    ('import db', ()),
+    ('from db import validate_conn_params', ()),
+    ('from db import DbSession', ()),
+    ('from db import db_session_fxt', ('pytest',)),
+    ('from db import *', ('mysql.connector',)),
+    ('import sysbench', ()),
+    ('from sysbench import SysbenchConfig', ()),
+    ('from sysbench import Sysbench', ('paramiko', 'scp',
+                                       'multiprocessing.pool')),
+    ('import query_corpus', ()),
+    ('import query_helper', ()),
+)
+
+_PROBE = """
+import sys, time
+start = time.perf_counter()
+{statement}
+elapsed = time.perf_counter() - start
+print(repr((elapsed, [m for m in {heavy!r} if m in sys.modules])))
+"""
+
+
+def measure(statement, runs):
+    """
+    Returns:
+        tuple of (median in-process import seconds, median process wall
+        seconds, heavy modules loaded)
+    """
+    env = dict(os.environ, PYTHONPATH=LIBS_DIR, PYTHONDONTWRITEBYTECODE='')
+    probe = _PROBE.format(statement=statement, heavy=HEAVY_MODULES)
+    imports, walls = [], []
+    loaded = []
+    for _ in range(runs):
+        start = time.perf_counter()
+        output = subprocess.check_output(
+            [sys.executable, '-c', probe], env=env
+        )
+        walls.append(time.perf_counter() - start)
+        elapsed, loaded = eval(output.decode().strip().splitlines()[-1])
+        imports.append(elapsed)
+    return statistics.median(imports), statistics.median(walls), loaded
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.split('\n\n')[0])
+    parser.add_argument('--runs', type=int, default=10)
+    parser.add_argument('--json', help='write the results to this file')
+    parser.add_argument('--check', action='store_true')
+    args = parser.parse_args()
+
+    results = []
+    failed = []
+    print("{:<45} {:>10} {:>10}  {}".format(
+        'statement', 'import ms', 'process ms', 'heavy modules loaded'
+    ))
+    for statement, allowed in STATEMENTS:
+        import_time, wall, loaded = measure(statement, args.runs)
+        unexpected = [m for m in loaded if m not in allowed]
+        if unexpected:
+            failed.append((statement, unexpected))
+        results.append({
+            'statement': statement,
+            'import_ms': import_time * 1000,
+            'process_ms': wall * 1000,
+            'loaded': loaded,
+        })
+        print("{:<45} {:>10.1f} {:>10.1f}  {}".format(
+            statement, import_time * 1000, wall * 1000,
+            ', '.join(loaded) or '-'
+        ))
+
+    if args.json:
+        with open(args.json, 'w') as wfp:
+            json.dump(results, wfp, indent=2)
+
+    for statement, unexpected in failed:
+        print("{} loads {}".format(statement, ', '.join(unexpected)))
+    if args.check and failed:
+        sys.exit(1)
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,47 @@
+import importlib
+import os
+import sys
+
+# Submodules are imported on first attribute access (PEP 562), importing
+# the package itself loads nothing. The modules import each other by their
+# top level names (tests/conftest.py puts this directory on sys.path), so
+# they are loaded under those names too and libs.db is the same module
+# object as db.
+_LIBS_DIR = os.path.dirname(os.path.abspath(__file__))
+
+_SUBMODULES = (
+    'baseexception',
+    'cachedproperty',
+    'connection',
+    'db',
+    'hostmetrics',
+    'infra',
+    'query_corpus',
+    'query_helper',
+    'query_scheduler',
+    'remote_log',
+    'replay',
+    'result_cache',
+    'shm_ring',
+    'sysbench',
+    'transfer',
+    'yamlconfig',
+)
+
+__all__ = list(_SUBMODULES)
+
+
+def __getattr__(name):
+    if name not in _SUBMODULES:
+        raise AttributeError(
+            "module {!r} has no attribute {!r}".format(__name__, name)
+        )
+    if _LIBS_DIR not in sys.path:
+        sys.path.insert(0, _LIBS_DIR)
+    module = importlib.import_module(name)
+    globals()[name] = module
+    return module
+
+
+def __dir__():
+    return sorted(set(globals()) | set(_SUBMODULES))
@@ -1,6 +1,11 @@
 class CommandError(Exception):
     pass
 
+class GroupCommandError(CommandError):
+    def __init__(self, message, results=None):
+        super(GroupCommandError, self).__init__(message)
+        self.results = results or {}
+
 class ConfigMissing(Exception):
     pass
 
@@ -1,10 +1,17 @@
+import collections
+import os
 import paramiko
 from scp import SCPClient
 import baseexception as be
 import logging
+import threading
+from concurrent.futures import ThreadPoolExecutor, as_completed
+from transfer import SftpTransfer, copy_many
+import remote_log
 
 DEF_CONNECT_TIMEOUT = 60
 DEF_EXEC_TIMEOUT = 120
+DEF_MAX_PARALLEL = 32
 
 log = logging.getLogger(__name__)
 
@@ -17,6 +24,11 @@ class Connection(object):
         self._hostname = hostname
         self._username = username
         self._password = password
+        self._sftp = None
+        # Copies of copy_many share the connection: the transport is checked
+        # and rebuilt by one thread at a time, scp has one channel only
+        self._transport_lock = threading.RLock()
+        self._scp_lock = threading.Lock()
         self.connect()
 
     @property
@@ -35,6 +47,7 @@ class Connection(object):
         """
         connect to the target host
         """
+        self._sftp = None
         self._ssh_paramiko = paramiko.SSHClient()
         self._ssh_paramiko.set_missing_host_key_policy(
             paramiko.AutoAddPolicy()
@@ -71,6 +84,9 @@ class Connection(object):
         """
         close connection
         """
+        if self._sftp is not None:
+            self._sftp.close()
+            self._sftp = None
         self._ssh_paramiko.close()
 
     def execute(self, cmd, *args, raise_on_error=True,
@@ -128,18 +144,112 @@ class Connection(object):
         return (stdout_full, stderr_full, exit_status)
 
 
+    def open_stream(self, cmd):
+        """
+        Start a long running command on its own channel without waiting for
+        it, e.g. a sampling loop.
+
+        :param cmd: command to run
+        :return: tuple of (stdout file yielding lines as bytes, callable
+            closing the channel and so ending the command)
+        """
+        self._ensure_transport()
+        channel = self._ssh_paramiko.get_transport().open_session()
+        channel.exec_command(cmd)
+        return channel.makefile('rb'), channel.close
+
+    @property
+    def sftp(self):
+        """
+        persistent SFTP channel, opened on first use
+        """
+        with self._transport_lock:
+            if self._sftp is None:
+                self._ensure_transport()
+                self._sftp = self._ssh_paramiko.open_sftp()
+            return self._sftp
+
+    def log_cursor(self, path, **kwargs):
+        """
+        :param path: remote file path
+        :param kwargs: options of remote_log.RemoteLogCursor (offset, inode,
+            max_read)
+        :return: RemoteLogCursor returning what is appended to path
+        """
+        return remote_log.RemoteLogCursor(self, path, **kwargs)
+
+    def fetch_since(self, path, offset, max_bytes=remote_log.DEF_MAX_READ):
+        """
+        :param path: remote file path
+        :param offset: position already fetched, 0 for the whole file
+        :param max_bytes: maximum bytes returned
+        :return: tuple of (data, new_offset)
+        """
+        return remote_log.fetch_since(self, path, offset, max_bytes)
+
+    def tail(self, path, follow=True, from_start=False,
+             poll_interval=remote_log.DEF_POLL_INTERVAL, timeout=None):
+        """
+        Lines of a remote file as they are written, following rotation like
+        tail -F. Only appended bytes are transferred on every poll.
+
+        :param path: remote file path
+        :param follow: keep waiting for new lines
+        :param from_start: start at the beginning instead of the end
+        :param poll_interval: seconds between polls when idle
+        :param timeout: stop following after this many seconds
+        :return: generator of lines
+        """
+        return remote_log.tail(
+            self, path, follow=follow, from_start=from_start,
+            poll_interval=poll_interval, timeout=timeout
+        )
+
+    def transfer(self, **kwargs):
+        """
+        :param kwargs: options of transfer.SftpTransfer (compress,
+            parallel_chunks, progress, ...)
+        :return: SftpTransfer engine on this connection
+        """
+        return SftpTransfer(self._ssh_paramiko, **kwargs)
+
+    def _ensure_transport(self):
+        """
+        reconnect if the ssh transport was lost
+        """
+        with self._transport_lock:
+            transport = self._ssh_paramiko.get_transport()
+            if transport is None or not transport.is_active():
+                log.warning(
+                    "Connection to {} lost, reconnecting".format(
+                        self._hostname
+                    )
+                )
+                self.reconnect()
+
     def copy(self, local_file, remote_file, from_remote=True,
              raise_on_error=True,
-             timeout=DEF_CONNECT_TIMEOUT):
+             timeout=DEF_CONNECT_TIMEOUT, compress=False, progress=None,
+             resume=True):
         """
+        Regular files are copied with the SFTP transfer engine (pipelined,
+        parallel chunks for large files, resumable). Directories are copied
+        recursively with scp.
 
         :param local_file: path of local file
         :param remote_file: path of remote file
         :param from_remote: default - copy from remote to local
         :param timeout: timeout for copy
         :param raise_on_error: raise exception if copy fails
+        :param compress: stream the file through gzip
+        :param progress: callback(path, bytes_done, total_bytes, bytes_per_sec)
+        :param resume: continue an interrupted transfer
         :return: None
         """
+        self._ensure_transport()
+        engine = self.transfer(
+            compress=compress, progress=progress, timeout=timeout
+        )
         try:
             if from_remote:
                 log.info(
@@ -147,25 +257,240 @@ class Connection(object):
                         remote_file, local_file
                     )
                 )
-                self._scp.get(
-                    remote_file, local_file, recursive=True,
-                    preserve_rimes=True
-                )
+                if engine.is_remote_dir(remote_file):
+                    with self._scp_lock:
+                        self._scp.get(
+                            remote_file, local_file, recursive=True,
+                            preserve_times=True
+                        )
+                else:
+                    engine.get(remote_file, local_file, resume=resume)
             else:
                 log.info(
                     "copy to remote({}) from local({})".format(
                         remote_file, local_file
                     )
                 )
-                self._scp.put(
-                    local_file, remote_file, recursive=True,
-                    preserve_times=True
-                )
+                if os.path.isdir(local_file):
+                    with self._scp_lock:
+                        self._scp.put(
+                            local_file, remote_file, recursive=True,
+                            preserve_times=True
+                        )
+                else:
+                    engine.put(local_file, remote_file, resume=resume)
         except Exception as e:
-            self.reconnect()
             if raise_on_error:
-                raise Exception("Exception during scp ({})".format(str(e)))
+                raise Exception("Exception during copy ({})".format(str(e)))
             else:
                 log.warning(
-                    "Exception during scp ({})".format(str(e))
+                    "Exception during copy ({})".format(str(e))
+                )
+        finally:
+            engine.close()
+
+
+# Outcome of a command on one host of a ConnectionGroup. error is set when
+# the command could not be run at all (connection lost, timeout).
+HostResult = collections.namedtuple(
+    'HostResult', ['hostname', 'stdout', 'stderr', 'exit_code', 'error']
+)
+
+
+class ConnectionGroup(object):
+    """
+    Persistent connections to many hosts, running the same command on all of
+    them concurrently.
+
+    Example usage:
+
+        with ConnectionGroup(['host1', 'host2'], password='pw') as group:
+            # results as they complete
+            for result in group.execute_iter('sync'):
+                log.info(result)
+
+            # all results, raising if any host failed
+            results = group.execute('uptime', timeouts={'host2': 10})
+    """
+
+    def __init__(self, hostnames, username='root', password='',
+                 max_parallel=DEF_MAX_PARALLEL):
+        """
+        Connects to all hosts concurrently. Hosts that cannot be reached are
+        left out of the group and listed in connect_errors.
+
+        Args:
+            hostnames (list): hosts to connect to
+            username (str): ssh user
+            password (str): ssh password
+            max_parallel (int): maximum number of hosts worked on at once
+        """
+        self._username = username
+        self._password = password
+        self._max_parallel = max_parallel
+        self._connections = collections.OrderedDict()
+        self.connect_errors = dict()
+
+        hostnames = list(hostnames)
+        results = dict(
+            (hostname, (conn, error)) for hostname, conn, error in
+            self._run_on_hosts(
+                hostnames,
+                lambda hostname: Connection(hostname, username, password)
+            )
+        )
+        for hostname in hostnames:
+            conn, error = results[hostname]
+            if error is None:
+                self._connections[hostname] = conn
+            else:
+                log.error(
+                    "Leaving host {} out of group ({})".format(hostname, error)
+                )
+                self.connect_errors[hostname] = error
+
+    @property
+    def hostnames(self):
+        return list(self._connections)
+
+    def __getitem__(self, hostname):
+        return self._connections[hostname]
+
+    def __len__(self):
+        return len(self._connections)
+
+    def _run_on_hosts(self, hostnames, func):
+        """
+        Run func(hostname) for every host with at most max_parallel at once.
+
+        Yields:
+            (hostname, return value, error message) as they complete
+        """
+        if not hostnames:
+            return
+        workers = min(self._max_parallel, len(hostnames))
+        with ThreadPoolExecutor(max_workers=workers) as executor:
+            futures = {
+                executor.submit(func, hostname): hostname
+                for hostname in hostnames
+            }
+            for future in as_completed(futures):
+                hostname = futures[future]
+                try:
+                    yield hostname, future.result(), None
+                except Exception as e:
+                    yield hostname, None, str(e)
+
+    def execute_iter(self, cmd, timeout=DEF_EXEC_TIMEOUT, timeouts=None,
+                     hostnames=None):
+        """
+        Run cmd on every host and yield the results as they complete. A
+        failing host never stops the others.
+
+        Args:
+            cmd (str): command to execute
+            timeout (int): default cmd timeout
+            timeouts (dict): per-host timeout overrides
+            hostnames (list): subset of hosts to run on, all by default
+
+        Yields:
+            HostResult for every host
+        """
+        timeouts = timeouts or dict()
+
+        def _execute(hostname):
+            return self._connections[hostname].execute(
+                cmd, raise_on_error=False,
+                timeout=timeouts.get(hostname, timeout)
+            )
+
+        hosts = hostnames or self.hostnames
+        for hostname, output, error in self._run_on_hosts(hosts, _execute):
+            if error is None:
+                yield HostResult(hostname, output[0], output[1], output[2],
+                                 None)
+            else:
+                log.error(
+                    "Failure ({}) while executing cmd ({}) on {}".format(
+                        error, cmd, hostname
+                    )
                 )
+                yield HostResult(hostname, None, None, None, error)
+
+    def execute(self, cmd, timeout=DEF_EXEC_TIMEOUT, timeouts=None,
+                hostnames=None, raise_on_error=True):
+        """
+        Run cmd on every host and wait for all of them.
+
+        Args:
+            cmd (str): command to execute
+            timeout (int): default cmd timeout
+            timeouts (dict): per-host timeout overrides
+            hostnames (list): subset of hosts to run on, all by default
+            raise_on_error (bool): raise once all hosts are done if the
+                command failed on any of them
+
+        Returns:
+            dictionary of hostname -> HostResult
+
+        Raises:
+            GroupCommandError carrying all results if any host failed
+        """
+        results = dict(
+            (result.hostname, result) for result in
+            self.execute_iter(cmd, timeout, timeouts, hostnames)
+        )
+
+        failed = sorted(
+            hostname for hostname, result in results.items()
+            if result.error is not None or result.exit_code != 0
+        )
+        if failed and raise_on_error:
+            raise be.GroupCommandError(
+                "Command({}) failed on {} of {} hosts: {}".format(
+                    cmd, len(failed), len(results), failed
+                ),
+                results
+            )
+
+        return results
+
+    def get_all(self, remote_file, local_dir, hostnames=None, **kwargs):
+        """
+        Copy remote_file from every host to local_dir/<hostname>/, all hosts
+        concurrently.
+
+        :param remote_file: path of remote file
+        :param local_dir: local directory, created if missing
+        :param hostnames: subset of hosts, all by default
+        :param kwargs: passed on to Connection.copy
+        :return: dictionary of hostname -> local path
+        """
+        hosts = hostnames or self.hostnames
+        jobs = []
+        local_files = dict()
+        for hostname in hosts:
+            host_dir = os.path.join(local_dir, hostname)
+            os.makedirs(host_dir, exist_ok=True)
+            local_files[hostname] = os.path.join(
+                host_dir, os.path.basename(remote_file)
+            )
+            jobs.append(
+                (self._connections[hostname], local_files[hostname],
+                 remote_file, True)
+            )
+        copy_many(jobs, max_parallel=self._max_parallel, **kwargs)
+        return local_files
+
+    def close(self):
+        """
+        close all connections
+        """
+        for conn in self._connections.values():
+            conn.close()
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, exc_type, exc_val, exc_tb):
+        self.close()
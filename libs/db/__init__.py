@@ -1,12 +1,69 @@
-from .helper import MAX_IDENTIFIER_LEN
-from .helper import MAX_USERNAME_LEN
-from .helper import DEFAULT_DB_SETTINGS
-from .helper import get_random_identifier
-from .helper import validate_conn_params
-from .db_defaults import DBDefaults
-from .mariadb import MariaDB
-from .session_context import SessionContext
-from .session import DbSession
-
-from .fixture import db_session_fxt
-from .fixture import cursor_fxt
+import importlib
+
+# Public names and the submodule defining them. Submodules are imported on
+# first access (PEP 562), so that importing db does not load the MariaDB
+# driver or pytest until they are needed.
+_LAZY_ATTRS = {
+    'MAX_IDENTIFIER_LEN': '.helper',
+    'MAX_USERNAME_LEN': '.helper',
+    'DEFAULT_DB_SETTINGS': '.helper',
+    'get_random_identifier': '.helper',
+    'validate_conn_params': '.helper',
+    'DBDefaults': '.db_defaults',
+    'MariaDB': '.mariadb',
+    'SessionContext': '.session_context',
+    'DbSession': '.session',
+    'ISOLATION_DATABASE': '.session',
+    'ISOLATION_TRANSACTION': '.session',
+    'SessionCursor': '.session_cursor',
+    'ChunkDiff': '.checksum',
+    'TableChecksum': '.checksum',
+    'compare_table_checksums': '.checksum',
+    'ServerStatusSampler': '.status_sampler',
+    'SampledQuery': '.status_sampler',
+    'Aggregator': '.instrumentation',
+    'LocalMariaDB': '.local_server',
+    'Column': '.datagen',
+    'TableSpec': '.datagen',
+    'DataGenerator': '.datagen',
+    'reap_sessions': '.reaper',
+    'TopologyProvider': '.topology',
+    'RoutedSession': '.topology',
+    'TableInfo': '.metadata',
+    'MetadataCache': '.metadata',
+    'ColumnarResult': '.columnar',
+    'fetch_columnar': '.columnar',
+    'compare_columns': '.columnar',
+}
+
+# pytest fixtures, importable by name but left out of __all__ so that
+# "from db import *" does not load pytest. Test suites register them with
+# pytest_plugins = ['db.fixture'].
+_FIXTURES = {
+    'db_session_fxt': '.fixture',
+    'cursor_fxt': '.fixture',
+    'worker_db_session_fxt': '.fixture',
+    'module_db_session_fxt': '.fixture',
+    'session_db_session_fxt': '.fixture',
+    'worker_txn_session_fxt': '.fixture',
+    'txn_db_session_fxt': '.fixture',
+}
+
+__all__ = list(_LAZY_ATTRS)
+
+_LAZY_ATTRS.update(_FIXTURES)
+
+
+def __getattr__(name):
+    module = _LAZY_ATTRS.get(name)
+    if module is None:
+        raise AttributeError(
+            "module {!r} has no attribute {!r}".format(__name__, name)
+        )
+    value = getattr(importlib.import_module(module, __name__), name)
+    globals()[name] = value
+    return value
+
+
+def __dir__():
+    return sorted(set(globals()) | set(_LAZY_ATTRS))
@@ -0,0 +1,348 @@
+import collections
+import logging
+
+log = logging.getLogger(__name__)
+
+# Number of rows per checksum chunk
+DEFAULT_CHUNK_SIZE = 100000
+
+# Mismatching chunks at most this large are compared row by row, larger
+# ones are split into smaller chunks first
+DEFAULT_DIFF_ROWS = 1000
+
+# Each chunk is split into this many sub-chunks while drilling down
+DRILL_DOWN_FACTOR = 16
+
+ChunkChecksum = collections.namedtuple(
+    'ChunkChecksum', ['lower', 'upper', 'row_count', 'checksum']
+)
+
+TableChecksum = collections.namedtuple(
+    'TableChecksum', ['table', 'key_column', 'chunks']
+)
+
+ChunkDiff = collections.namedtuple(
+    'ChunkDiff', ['lower', 'upper', 'only_in_a', 'only_in_b']
+)
+
+
+def _quote(identifier):
+    return '`{}`'.format(identifier.replace('`', '``'))
+
+
+def get_columns(cursor, table):
+    """
+    Args:
+        cursor (mariadb Cursor): cursor on the table's database
+        table (str): table name
+
+    Returns:
+        columns (list): column names in table order
+    """
+
+    cursor.execute(
+        "SELECT COLUMN_NAME FROM information_schema.COLUMNS "
+        "WHERE TABLE_SCHEMA = DATABASE() AND TABLE_NAME = %s "
+        "ORDER BY ORDINAL_POSITION", (table,)
+    )
+    columns = [row[0] for row in cursor.fetchall()]
+    if not columns:
+        raise ValueError("Table {} not found".format(table))
+    return columns
+
+
+def get_chunk_key(cursor, table):
+    """
+    Args:
+        cursor (mariadb Cursor): cursor on the table's database
+        table (str): table name
+
+    Returns:
+        column (str): single column primary key usable for chunking, None if
+            the primary key is missing or spans several columns
+    """
+
+    cursor.execute(
+        "SELECT COLUMN_NAME FROM information_schema.KEY_COLUMN_USAGE "
+        "WHERE TABLE_SCHEMA = DATABASE() AND TABLE_NAME = %s "
+        "AND CONSTRAINT_NAME = 'PRIMARY'", (table,)
+    )
+    key_columns = [row[0] for row in cursor.fetchall()]
+    if len(key_columns) == 1:
+        return key_columns[0]
+    return None
+
+
+def _row_expr(columns):
+    """
+    Text form of a row. CONCAT_WS skips NULLs, so a NULL map is appended to
+    tell NULL apart from an empty string.
+    """
+
+    quoted = [_quote(c) for c in columns]
+    null_map = 'CONCAT({})'.format(
+        ', '.join('ISNULL({})'.format(c) for c in quoted)
+    )
+    return "CONCAT_WS('#', {}, {})".format(', '.join(quoted), null_map)
+
+
+def _range_clause(key_column, lower, upper):
+    """
+    Returns:
+        (clause, params): WHERE clause for lower <= key < upper, where None
+            means unbounded
+    """
+
+    clauses, params = [], []
+    if lower is not None:
+        clauses.append('{} >= %s'.format(_quote(key_column)))
+        params.append(lower)
+    if upper is not None:
+        clauses.append('{} < %s'.format(_quote(key_column)))
+        params.append(upper)
+    if not clauses:
+        return '', ()
+    return ' WHERE ' + ' AND '.join(clauses), tuple(params)
+
+
+def validate_chunk_size(chunk_size):
+    """
+    Raises:
+        ValueError if chunk_size is below 1; the boundary walk would never
+        advance
+    """
+
+    if chunk_size < 1:
+        raise ValueError(
+            "chunk_size must be at least 1, got {}".format(chunk_size))
+
+
+def chunk_boundaries(cursor, table, key_column, chunk_size,
+                     lower=None, upper=None):
+    """
+    Walk the primary key index to find chunk boundaries of chunk_size rows
+    within [lower, upper). Only one key value per chunk is read.
+
+    The first and last chunk are open ended so that rows outside the key
+    range seen on this side are still covered on the other side.
+
+    Returns:
+        boundaries (list): list of (lower, upper) key ranges
+
+    Raises:
+        ValueError if chunk_size is below 1
+    """
+
+    validate_chunk_size(chunk_size)
+    key = _quote(key_column)
+    sql = "SELECT {key} FROM {table}{where} ORDER BY {key} LIMIT 1 OFFSET %s"
+
+    boundaries = []
+    current = lower
+    while True:
+        where, params = _range_clause(key_column, current, upper)
+        cursor.execute(
+            sql.format(key=key, table=_quote(table), where=where),
+            params + (chunk_size,)
+        )
+        row = cursor.fetchone()
+        if row is None:
+            boundaries.append((current, upper))
+            return boundaries
+        boundaries.append((current, row[0]))
+        current = row[0]
+
+
+def checksum_chunks(cursor, table, key_column, boundaries, columns=None):
+    """
+    Compute an order independent checksum of every chunk on the server: the
+    row count plus the SUM and BIT_XOR of the CRC32 of every row.
+
+    Args:
+        cursor (mariadb Cursor): cursor on the table's database
+        table (str): table name
+        key_column (str): chunking column, unused for a single open chunk
+        boundaries (list): list of (lower, upper) key ranges
+        columns (list): columns to checksum, all columns by default
+
+    Returns:
+        chunks (list): list of ChunkChecksum
+    """
+
+    columns = columns or get_columns(cursor, table)
+    row = _row_expr(columns)
+    sql = (
+        "SELECT COUNT(*), COALESCE(SUM(CRC32({row})), 0), "
+        "COALESCE(BIT_XOR(CRC32({row})), 0) FROM {table}{where}"
+    )
+
+    chunks = []
+    for lower, upper in boundaries:
+        where, params = _range_clause(key_column, lower, upper)
+        cursor.execute(
+            sql.format(row=row, table=_quote(table), where=where), params
+        )
+        count, crc_sum, crc_xor = cursor.fetchone()
+        chunks.append(ChunkChecksum(
+            lower, upper, int(count), '{}:{}'.format(int(crc_sum), crc_xor)
+        ))
+
+    return chunks
+
+
+def checksum_table(cursor, tables):
+    """
+    Whole-table checksums via CHECKSUM TABLE. This is the cheapest check
+    when both copies live in the same storage engine and row format, as the
+    result depends on the physical row format.
+
+    Args:
+        cursor (mariadb Cursor): cursor on the tables' database
+        tables (list): table names
+
+    Returns:
+        checksums (dict): table name -> checksum, None for missing tables
+    """
+
+    cursor.execute(
+        'CHECKSUM TABLE {}'.format(', '.join(_quote(t) for t in tables))
+    )
+    return {
+        name.split('.')[-1]: checksum for name, checksum in cursor.fetchall()
+    }
+
+
+def table_checksum(cursor, table, chunk_size=DEFAULT_CHUNK_SIZE,
+                   boundaries=None, key_column=None):
+    """
+    Chunked checksum of a table. Tables without a single column primary key
+    are checksummed as one chunk.
+
+    Args:
+        cursor (mariadb Cursor): cursor on the table's database
+        table (str): table name
+        chunk_size (int): rows per chunk
+        boundaries (list): explicit (lower, upper) key ranges, e.g. taken
+            from the checksum of another copy of the table
+        key_column (str): chunking column, looked up when not given
+
+    Returns:
+        checksum (TableChecksum): per-chunk checksums
+
+    Raises:
+        ValueError if chunk_size is below 1
+    """
+
+    validate_chunk_size(chunk_size)
+    if key_column is None:
+        key_column = get_chunk_key(cursor, table)
+    if boundaries is None:
+        if key_column is None:
+            boundaries = [(None, None)]
+        else:
+            boundaries = chunk_boundaries(
+                cursor, table, key_column, chunk_size
+            )
+
+    return TableChecksum(
+        table, key_column,
+        checksum_chunks(cursor, table, key_column, boundaries)
+    )
+
+
+def _diff_chunk(cursor_a, cursor_b, table, key_column, lower, upper):
+    where, params = _range_clause(key_column, lower, upper)
+    sql = 'SELECT * FROM {}{}'.format(_quote(table), where)
+
+    cursor_a.execute(sql, params)
+    rows_a = collections.Counter(cursor_a.fetchall())
+    cursor_b.execute(sql, params)
+    rows_b = collections.Counter(cursor_b.fetchall())
+
+    return ChunkDiff(
+        lower, upper,
+        list((rows_a - rows_b).elements()),
+        list((rows_b - rows_a).elements()),
+    )
+
+
+def _drill_down(cursor_a, cursor_b, table, key_column, chunk, chunk_size,
+                diff_rows):
+    """
+    Narrow a mismatching chunk down to sub-chunks of at most diff_rows rows
+    and fetch only those.
+    """
+
+    if key_column is None or chunk.row_count <= diff_rows or chunk_size <= 1:
+        return [_diff_chunk(
+            cursor_a, cursor_b, table, key_column, chunk.lower, chunk.upper
+        )]
+
+    sub_size = max(1, chunk_size // DRILL_DOWN_FACTOR)
+    boundaries = chunk_boundaries(
+        cursor_a, table, key_column, sub_size, chunk.lower, chunk.upper
+    )
+    columns = get_columns(cursor_a, table)
+    sub_a = checksum_chunks(cursor_a, table, key_column, boundaries, columns)
+    sub_b = checksum_chunks(cursor_b, table, key_column, boundaries, columns)
+
+    diffs = []
+    for chunk_a, chunk_b in zip(sub_a, sub_b):
+        if chunk_a.checksum != chunk_b.checksum or \
+                chunk_a.row_count != chunk_b.row_count:
+            diffs.extend(_drill_down(
+                cursor_a, cursor_b, table, key_column,
+                max(chunk_a, chunk_b, key=lambda c: c.row_count),
+                sub_size, diff_rows
+            ))
+    return diffs
+
+
+def compare_table_checksums(db_a, db_b, table, chunk_size=DEFAULT_CHUNK_SIZE,
+                            diff_rows=DEFAULT_DIFF_ROWS):
+    """
+    Compare a table between two sessions or engines by chunk checksums.
+    Chunk boundaries are computed on db_a and reused on db_b so that
+    both sides checksum the same key ranges. Only the mismatching chunks
+    are drilled into and only their smallest mismatching sub-chunks are
+    fetched to the client.
+
+    Args:
+        db_a (DbSession or MariaDB): first copy of the table
+        db_b (DbSession or MariaDB): second copy of the table
+        table (str): table name
+        chunk_size (int): rows per chunk
+        diff_rows (int): largest chunk compared row by row
+
+    Returns:
+        diffs (list): list of ChunkDiff, empty if the tables match
+
+    Raises:
+        ValueError if chunk_size is below 1
+    """
+
+    validate_chunk_size(chunk_size)
+    with db_a.cursor() as cursor_a, db_b.cursor() as cursor_b:
+        checksum_a = table_checksum(cursor_a, table, chunk_size)
+        boundaries = [(c.lower, c.upper) for c in checksum_a.chunks]
+        checksum_b = table_checksum(
+            cursor_b, table, chunk_size, boundaries, checksum_a.key_column
+        )
+
+        diffs = []
+        for chunk_a, chunk_b in zip(checksum_a.chunks, checksum_b.chunks):
+            if chunk_a.checksum == chunk_b.checksum and \
+                    chunk_a.row_count == chunk_b.row_count:
+                continue
+            log.info(
+                "Checksum mismatch in {} for key range [{}, {})".format(
+                    table, chunk_a.lower, chunk_a.upper
+                )
+            )
+            diffs.extend(_drill_down(
+                cursor_a, cursor_b, table, checksum_a.key_column,
+                max(chunk_a, chunk_b, key=lambda c: c.row_count),
+                chunk_size, diff_rows
+            ))
+
+    return diffs
@@ -0,0 +1,350 @@
+"""
+Column oriented query results.
+
+Rows of the driver are tuples of Python objects (int, Decimal, str,
+datetime), around a hundred bytes per value. fetch_columnar() reads a
+result in batches from a raw mode cursor, which returns the values as the
+server sent them, and decodes every column of a batch at once into a typed
+NumPy array, 8 bytes per numeric value plus a NULL mask. Results can be
+compared column by column with compare_columns(), with a tolerance for
+floating point and decimal columns.
+"""
+
+import collections
+import logging
+
+import numpy as np
+from mysql.connector.constants import FieldFlag, FieldType
+
+try:
+    import pyarrow as pa
+except ImportError:
+    pa = None
+
+log = logging.getLogger(__name__)
+
+# Rows fetched and decoded at a time
+DEFAULT_BATCH_SIZE = 10000
+
+# Default tolerance of compare_columns for float and decimal columns
+DEFAULT_RTOL = 1e-9
+DEFAULT_ATOL = 1e-12
+
+# Fields of cursor.description
+_NAME, _TYPE_CODE, _FLAGS = 0, 1, 7
+
+_INT_TYPES = frozenset((
+    FieldType.TINY, FieldType.SHORT, FieldType.LONG, FieldType.LONGLONG,
+    FieldType.INT24, FieldType.YEAR,
+))
+_FLOAT_TYPES = frozenset((
+    FieldType.FLOAT, FieldType.DOUBLE, FieldType.DECIMAL,
+    FieldType.NEWDECIMAL,
+))
+_DATE_TYPES = frozenset((FieldType.DATE, FieldType.NEWDATE))
+_DATETIME_TYPES = frozenset((FieldType.DATETIME, FieldType.TIMESTAMP))
+_BLOB_TYPES = frozenset((
+    FieldType.TINY_BLOB, FieldType.MEDIUM_BLOB, FieldType.LONG_BLOB,
+    FieldType.BLOB, FieldType.VAR_STRING, FieldType.STRING, FieldType.BIT,
+    FieldType.GEOMETRY,
+))
+
+# Placeholder of NULL values in the arrays, by dtype kind
+_NULL_FILL = {'i': 0, 'u': 0, 'f': 0, 'M': '1970-01-01', 'U': '', 'O': b''}
+
+
+def column_dtype(description):
+    """
+    Args:
+        description (tuple): cursor.description entry of a column
+
+    Returns:
+        NumPy dtype of the column, object for values kept as Python objects
+        (binary strings, TIME)
+    """
+    type_code = description[_TYPE_CODE]
+    flags = description[_FLAGS] if len(description) > _FLAGS else 0
+    if type_code in _INT_TYPES:
+        if type_code == FieldType.LONGLONG and flags & FieldFlag.UNSIGNED:
+            return np.dtype(np.uint64)
+        return np.dtype(np.int64)
+    if type_code in _FLOAT_TYPES:
+        return np.dtype(np.float64)
+    if type_code in _DATE_TYPES:
+        return np.dtype('datetime64[D]')
+    if type_code in _DATETIME_TYPES:
+        return np.dtype('datetime64[us]')
+    if type_code in _BLOB_TYPES and flags & FieldFlag.BINARY:
+        return np.dtype(object)
+    if type_code == FieldType.TIME:
+        return np.dtype(object)
+    return np.dtype(str)
+
+
+def _decode(values, dtype):
+    """
+    Decode one column of a batch.
+
+    Args:
+        values (tuple): column values, bytes in raw mode, Python objects
+            otherwise, None for NULL
+        dtype: NumPy dtype of the column
+
+    Returns:
+        tuple of (array, NULL mask or None)
+    """
+    raw = any(isinstance(v, (bytes, bytearray)) for v in values)
+    nulls = None
+    if None in values:
+        nulls = np.fromiter((v is None for v in values), dtype=bool,
+                            count=len(values))
+        fill = _NULL_FILL[dtype.kind]
+        if raw and not isinstance(fill, bytes):
+            fill = str(fill).encode()
+        values = [fill if v is None else v for v in values]
+
+    if dtype.kind == 'O':
+        array = np.empty(len(values), dtype=object)
+        array[:] = [bytes(v) for v in values] if raw else values
+        return array, nulls
+    if not raw:
+        return np.array(values, dtype=object).astype(dtype), nulls
+
+    if any(isinstance(v, bytearray) for v in values):
+        values = [bytes(v) for v in values]
+    array = np.array(values, dtype=bytes)
+    if dtype.kind == 'U':
+        return np.char.decode(array, 'utf-8', 'replace'), nulls
+    if dtype.kind == 'M':
+        # Zero dates have no datetime64 value, they read as NaT
+        zero = np.char.startswith(array, b'0000-00-00')
+        if zero.any():
+            array[zero] = b'NaT'
+    return array.astype(dtype), nulls
+
+
+class ColumnarResult(object):
+    """
+    Query result as one NumPy array per column. NULLs are recorded in a
+    bool mask per column, the array holds a placeholder at their positions
+    (0, '' or 1970-01-01).
+    """
+
+    def __init__(self, names, columns, nulls):
+        """
+        Args:
+            names (list): column names
+            columns (list): one array per column
+            nulls (list): one bool mask per column, None if the column has
+                no NULLs
+        """
+        self.names = list(names)
+        self.columns = list(columns)
+        self.nulls = list(nulls)
+
+    def __len__(self):
+        return len(self.columns[0]) if self.columns else 0
+
+    def __getitem__(self, name):
+        """
+        Returns:
+            array of the column name (or number)
+        """
+        return self.columns[self._index(name)]
+
+    def _index(self, name):
+        if isinstance(name, int):
+            return name
+        return self.names.index(name)
+
+    def null_mask(self, name):
+        """
+        Returns:
+            bool array, True where the column is NULL
+        """
+        nulls = self.nulls[self._index(name)]
+        if nulls is None:
+            return np.zeros(len(self), dtype=bool)
+        return nulls
+
+    @property
+    def nbytes(self):
+        """
+        Returns:
+            memory of the arrays, not counting Python objects of object
+            columns
+        """
+        return sum(c.nbytes for c in self.columns) + \
+            sum(n.nbytes for n in self.nulls if n is not None)
+
+    def rows(self):
+        """
+        Returns:
+            list of row tuples, None for NULL, as the driver returns them
+            apart from the value types
+        """
+        columns = []
+        for column, nulls in zip(self.columns, self.nulls):
+            values = column.tolist()
+            if nulls is not None:
+                for position in np.flatnonzero(nulls).tolist():
+                    values[position] = None
+            columns.append(values)
+        return list(zip(*columns))
+
+    def sorted(self):
+        """
+        Returns:
+            ColumnarResult with the rows sorted by all columns, NULLs
+            first, for comparing results of queries without ORDER BY
+        """
+        if not len(self):
+            return self
+        keys = []
+        for column, nulls in zip(self.columns, self.nulls):
+            if column.dtype.kind == 'O':
+                column = column.astype(str)
+            keys.append(~nulls if nulls is not None
+                        else np.ones(len(self), dtype=bool))
+            keys.append(column)
+        # lexsort sorts by the last key first
+        order = np.lexsort(keys[::-1])
+        return ColumnarResult(
+            self.names,
+            [column[order] for column in self.columns],
+            [None if nulls is None else nulls[order]
+             for nulls in self.nulls],
+        )
+
+    def to_arrow(self):
+        """
+        Returns:
+            pyarrow.Table of the result
+
+        Raises:
+            ImportError if pyarrow is not installed
+        """
+        if pa is None:
+            raise ImportError("to_arrow() requires pyarrow")
+        return pa.table(
+            [pa.array(column, mask=nulls)
+             for column, nulls in zip(self.columns, self.nulls)],
+            names=self.names,
+        )
+
+
+def fetch_columnar(cursor, batch_size=DEFAULT_BATCH_SIZE):
+    """
+    Fetch the rest of the result of an executed statement into columns.
+    Raw mode cursors (MariaDB.cursor(raw=True)) are decoded fastest, rows
+    of ordinary cursors are converted.
+
+    Args:
+        cursor: cursor with an executed statement
+        batch_size (int): rows fetched and decoded at a time
+
+    Returns:
+        ColumnarResult
+    """
+
+    description = cursor.description
+    if description is None:
+        raise ValueError("The statement returned no result set")
+    names = [d[_NAME] for d in description]
+    dtypes = [column_dtype(d) for d in description]
+
+    batches = [[] for _ in names]
+    null_batches = [[] for _ in names]
+    rows = 0
+    while True:
+        batch = cursor.fetchmany(batch_size)
+        if not batch:
+            break
+        rows += len(batch)
+        for position, values in enumerate(zip(*batch)):
+            array, nulls = _decode(values, dtypes[position])
+            batches[position].append(array)
+            null_batches[position].append(nulls)
+
+    columns, nulls = [], []
+    for dtype, arrays, masks in zip(dtypes, batches, null_batches):
+        if not arrays:
+            columns.append(np.empty(0, dtype=dtype))
+            nulls.append(None)
+            continue
+        columns.append(np.concatenate(arrays))
+        if all(mask is None for mask in masks):
+            nulls.append(None)
+        else:
+            nulls.append(np.concatenate([
+                np.zeros(len(array), dtype=bool) if mask is None else mask
+                for array, mask in zip(arrays, masks)
+            ]))
+    log.debug("Fetched {} rows into {} columns".format(rows, len(names)))
+    return ColumnarResult(names, columns, nulls)
+
+
+# Mismatch of one column between two results: row positions that differ
+# and up to MAX_REPORTED_ROWS example (position, value_a, value_b)
+ColumnDiff = collections.namedtuple(
+    'ColumnDiff', ['column', 'mismatches', 'examples']
+)
+
+MAX_REPORTED_ROWS = 10
+
+
+def _item(value):
+    return value.item() if isinstance(value, np.generic) else value
+
+
+def compare_columns(result_a, result_b, rtol=DEFAULT_RTOL,
+                    atol=DEFAULT_ATOL, ignore_order=False):
+    """
+    Compare two results column by column. Float and decimal columns match
+    within the tolerance of numpy.isclose(), every other column must be
+    equal. NULL only matches NULL.
+
+    Args:
+        result_a (ColumnarResult): first result
+        result_b (ColumnarResult): second result
+        rtol (float): relative tolerance
+        atol (float): absolute tolerance
+        ignore_order (bool): sort both results before comparing
+
+    Returns:
+        diffs (list): list of ColumnDiff, empty if the results match
+
+    Raises:
+        ValueError if the results differ in shape
+    """
+
+    if len(result_a.columns) != len(result_b.columns):
+        raise ValueError("Results have {} and {} columns".format(
+            len(result_a.columns), len(result_b.columns)))
+    if len(result_a) != len(result_b):
+        raise ValueError("Results have {} and {} rows".format(
+            len(result_a), len(result_b)))
+    if ignore_order:
+        result_a, result_b = result_a.sorted(), result_b.sorted()
+
+    diffs = []
+    for position, name in enumerate(result_a.names):
+        a, b = result_a.columns[position], result_b.columns[position]
+        nulls_a = result_a.null_mask(position)
+        nulls_b = result_b.null_mask(position)
+        if a.dtype.kind == 'f' or b.dtype.kind == 'f':
+            equal = np.isclose(a.astype(np.float64), b.astype(np.float64),
+                               rtol=rtol, atol=atol, equal_nan=True)
+        else:
+            equal = a == b
+        equal = np.where(nulls_a | nulls_b, nulls_a == nulls_b, equal)
+        mismatches = np.flatnonzero(~equal)
+        if len(mismatches):
+            examples = [
+                (row,
+                 None if nulls_a[row] else _item(a[row]),
+                 None if nulls_b[row] else _item(b[row]))
+                for row in mismatches[:MAX_REPORTED_ROWS].tolist()
+            ]
+            diffs.append(ColumnDiff(name, len(mismatches), examples))
+    return diffs
@@ -0,0 +1,472 @@
+import collections
+import logging
+import multiprocessing
+import os
+import tempfile
+import time
+
+try:
+    import numpy as np
+except ImportError:
+    np = None
+
+from .mariadb import MariaDB
+
+log = logging.getLogger(__name__)
+
+# Rows generated and loaded per chunk. Every chunk has its own random
+# streams, so the data only depends on the seed and the chunk size.
+DEFAULT_CHUNK_SIZE = 100000
+
+DEFAULT_LOAD_WORKERS = min(8, multiprocessing.cpu_count())
+
+LOAD_INFILE = 'infile'
+LOAD_INSERT = 'insert'
+
+# Rows per INSERT of the LOAD_INSERT fallback
+INSERT_BATCH_SIZE = 1000
+
+# LOAD DATA field for NULL
+_TSV_NULL = '\\N'
+
+# Errors of LOAD DATA LOCAL when local_infile is disabled on either side
+_INFILE_DISABLED_ERRNOS = (1148, 2068, 3948)
+
+# Spill directory for LOAD DATA chunk files, memory backed where possible
+_SPILL_DIR = '/dev/shm' if os.path.isdir('/dev/shm') else None
+
+ALPHANUMERIC = 'abcdefghijklmnopqrstuvwxyzABCDEFGHIJKLMNOPQRSTUVWXYZ0123456789'
+
+
+def _require_numpy():
+    if np is None:
+        raise ImportError("The data generator requires numpy")
+
+
+class Distribution(object):
+    """
+    Values of a column. generate() returns a NumPy array of n values for
+    the rows starting at row index start, drawn from rng.
+    """
+
+    def generate(self, rng, start, n):
+        raise NotImplementedError
+
+    def to_text(self, values):
+        """
+        Returns:
+            str array of values as LOAD DATA reads them
+        """
+        return values.astype(str)
+
+    def to_python(self, values):
+        return values.tolist()
+
+
+class Sequential(Distribution):
+    """
+    start, start + step, ... by row index, e.g. primary keys.
+    """
+
+    def __init__(self, start=1, step=1):
+        self.start = start
+        self.step = step
+
+    def generate(self, rng, start, n):
+        first = self.start + start * self.step
+        return np.arange(first, first + n * self.step, self.step,
+                         dtype=np.int64)
+
+
+class Uniform(Distribution):
+    """
+    Uniform integers in [low, high], or decimals with decimals digits.
+    """
+
+    def __init__(self, low, high, decimals=None):
+        self.low = low
+        self.high = high
+        self.decimals = decimals
+
+    def generate(self, rng, start, n):
+        if self.decimals is None:
+            return rng.integers(self.low, self.high, size=n,
+                                endpoint=True, dtype=np.int64)
+        return np.round(rng.uniform(self.low, self.high, size=n),
+                        self.decimals)
+
+    def to_text(self, values):
+        if self.decimals is None:
+            return values.astype(str)
+        return np.char.mod('%.{}f'.format(self.decimals), values)
+
+
+class Normal(Distribution):
+    """
+    Normally distributed decimals, rounded to decimals digits.
+    """
+
+    def __init__(self, mean, stddev, decimals=2):
+        self.mean = mean
+        self.stddev = stddev
+        self.decimals = decimals
+
+    def generate(self, rng, start, n):
+        return np.round(rng.normal(self.mean, self.stddev, size=n),
+                        self.decimals)
+
+    def to_text(self, values):
+        return np.char.mod('%.{}f'.format(self.decimals), values)
+
+
+class Zipf(Distribution):
+    """
+    Zipf distributed integers offset, offset + 1, ..., offset + values - 1:
+    a few values are very frequent, like hot customers or products.
+    """
+
+    def __init__(self, a=1.2, values=1000000, offset=1):
+        if a <= 1:
+            raise ValueError("The zipf parameter must be greater than 1")
+        self.a = a
+        self.values = values
+        self.offset = offset
+
+    def generate(self, rng, start, n):
+        return (rng.zipf(self.a, size=n) - 1) % self.values + self.offset
+
+
+class Choice(Distribution):
+    """
+    One of values, with optional weights.
+    """
+
+    def __init__(self, values, weights=None):
+        self.values = np.asarray(values)
+        if weights is not None:
+            weights = np.asarray(weights, dtype=np.float64)
+            weights = weights / weights.sum()
+        self.weights = weights
+
+    def generate(self, rng, start, n):
+        return rng.choice(self.values, size=n, p=self.weights)
+
+
+class RandomString(Distribution):
+    """
+    Random strings of length characters of alphabet.
+    """
+
+    def __init__(self, length, alphabet=ALPHANUMERIC):
+        self.length = length
+        self.alphabet = np.frombuffer(alphabet.encode('ascii'),
+                                      dtype=np.uint8)
+
+    def generate(self, rng, start, n):
+        codes = self.alphabet[
+            rng.integers(0, len(self.alphabet), size=(n, self.length))
+        ]
+        return np.ascontiguousarray(codes).view(
+            'S{}'.format(self.length)).ravel().astype(str)
+
+
+class Pattern(Distribution):
+    """
+    Strings formatted from another distribution's values, e.g.
+    Pattern('user{}@example.com', Zipf()). The pattern has one {} field.
+    """
+
+    def __init__(self, pattern, values):
+        self.prefix, _, self.suffix = pattern.partition('{}')
+        self.values = values
+
+    def generate(self, rng, start, n):
+        text = self.values.to_text(self.values.generate(rng, start, n))
+        return np.char.add(np.char.add(self.prefix, text), self.suffix)
+
+
+class DateRange(Distribution):
+    """
+    Uniform dates (or timestamps with seconds=True) in [start, end).
+    """
+
+    def __init__(self, start, end, seconds=False):
+        unit = 's' if seconds else 'D'
+        self.start = np.datetime64(start, unit)
+        self.end = np.datetime64(end, unit)
+
+    def generate(self, rng, start, n):
+        span = int((self.end - self.start).astype(np.int64))
+        return self.start + rng.integers(0, span, size=n)
+
+    def to_text(self, values):
+        return np.char.replace(np.datetime_as_string(values), 'T', ' ')
+
+    def to_python(self, values):
+        return self.to_text(values).tolist()
+
+
+# A column of a generated table: SQL type, distribution of its values and
+# the fraction of NULLs
+Column = collections.namedtuple(
+    'Column', ['name', 'sql_type', 'distribution', 'null_fraction']
+)
+Column.__new__.__defaults__ = (0.0,)
+
+
+class TableSpec(object):
+    """
+    Definition of a generated table.
+
+    Example usage:
+
+        spec = TableSpec('orders', [
+            Column('id', 'BIGINT NOT NULL', Sequential()),
+            Column('customer', 'INT', Zipf(1.3, values=100000)),
+            Column('amount', 'DECIMAL(12,2)', Uniform(0, 1000, decimals=2),
+                   null_fraction=0.05),
+            Column('state', 'VARCHAR(16)', Choice(['new', 'paid'])),
+        ], primary_key='id', indexes=['customer'])
+    """
+
+    def __init__(self, name, columns, primary_key=None, indexes=(),
+                 engine=None):
+        """
+        Args:
+            name (str): table name
+            columns (list): Column definitions
+            primary_key (str): primary key column(s), comma separated
+            indexes (list): secondary index columns, created after the
+                data is loaded
+            engine (str): storage engine, the server default otherwise
+        """
+        self.name = name
+        self.columns = list(columns)
+        self.primary_key = primary_key
+        self.indexes = list(indexes)
+        self.engine = engine
+
+    @property
+    def column_names(self):
+        return [column.name for column in self.columns]
+
+    @property
+    def create_sql(self):
+        definitions = ['`{}` {}'.format(c.name, c.sql_type)
+                       for c in self.columns]
+        if self.primary_key:
+            definitions.append('PRIMARY KEY ({})'.format(self.primary_key))
+        sql = 'CREATE TABLE `{}` ({})'.format(self.name,
+                                              ', '.join(definitions))
+        if self.engine:
+            sql += ' ENGINE={}'.format(self.engine)
+        return sql
+
+    @property
+    def index_sql(self):
+        return [
+            'CREATE INDEX `ix_{0}_{1}` ON `{0}` ({2})'.format(
+                self.name, index.replace(',', '_').replace(' ', ''), index)
+            for index in self.indexes
+        ]
+
+
+class DataGenerator(object):
+    """
+    Deterministic, vectorized generator of a table's rows. Chunk i is
+    always the same for a given seed and chunk size, whichever process
+    generates it and in whichever order, which lets chunks be generated and
+    loaded in parallel.
+    """
+
+    def __init__(self, spec, rows, seed=0, chunk_size=DEFAULT_CHUNK_SIZE):
+        """
+        Args:
+            spec (TableSpec): table to generate
+            rows (int): number of rows
+            seed (int): random seed
+            chunk_size (int): rows per chunk
+        """
+        _require_numpy()
+        self.spec = spec
+        self.rows = rows
+        self.seed = seed
+        self.chunk_size = chunk_size
+
+    @property
+    def chunks(self):
+        return (self.rows + self.chunk_size - 1) // self.chunk_size
+
+    def chunk(self, index):
+        """
+        Args:
+            index (int): chunk number
+
+        Returns:
+            tuple of (values, nulls) lists with one array per column; nulls
+            holds a bool mask or None for columns without NULLs
+        """
+        start = index * self.chunk_size
+        n = min(self.chunk_size, self.rows - start)
+        values, nulls = [], []
+        for position, column in enumerate(self.spec.columns):
+            rng = np.random.default_rng([self.seed, index, position])
+            values.append(column.distribution.generate(rng, start, n))
+            if column.null_fraction:
+                nulls.append(rng.random(n) < column.null_fraction)
+            else:
+                nulls.append(None)
+        return values, nulls
+
+    def chunk_rows(self, index):
+        """
+        Returns:
+            list of row tuples of chunk index, None for NULL
+        """
+        values, nulls = self.chunk(index)
+        columns = []
+        for column, data, null in zip(self.spec.columns, values, nulls):
+            data = column.distribution.to_python(data)
+            if null is not None:
+                for position in np.flatnonzero(null).tolist():
+                    data[position] = None
+            columns.append(data)
+        return list(zip(*columns))
+
+    def chunk_tsv(self, index):
+        """
+        Returns:
+            chunk index as LOAD DATA text (tab separated, \\N for NULL)
+        """
+        values, nulls = self.chunk(index)
+        line = None
+        for column, data, null in zip(self.spec.columns, values, nulls):
+            text = column.distribution.to_text(data)
+            if data.dtype.kind in 'US':
+                text = np.char.replace(text, '\\', '\\\\')
+                text = np.char.replace(text, '\t', '\\t')
+                text = np.char.replace(text, '\n', '\\n')
+            if null is not None:
+                text = np.where(null, _TSV_NULL, text)
+            line = text if line is None else \
+                np.char.add(np.char.add(line, '\t'), text)
+        return '\n'.join(line.tolist()) + '\n'
+
+    def load(self, session, workers=DEFAULT_LOAD_WORKERS, create=True,
+             method=LOAD_INFILE):
+        """
+        Create the table in a DbSession database and load it through
+        parallel connections, one worker process per connection.
+
+        Args:
+            session (DbSession): session owning the database
+            workers (int): parallel connections
+            create (bool): create the table first
+            method (str): LOAD_INFILE (LOAD DATA LOCAL INFILE, falls back to
+                LOAD_INSERT if the server does not allow it) or LOAD_INSERT
+                (multi-row INSERTs)
+
+        Returns:
+            seconds the load took
+        """
+        started = time.monotonic()
+        with session.cursor() as cursor:
+            if create:
+                cursor.execute(self.spec.create_sql)
+
+        session_db = session.session_db
+        settings = dict(session_db.settings, autocommit=False,
+                        allow_local_infile=method == LOAD_INFILE)
+        tasks = [(session_db.conn_params, settings, self, index, method)
+                 for index in range(self.chunks)]
+        if workers <= 1 or self.chunks <= 1:
+            loaded = [_load_chunk(*task) for task in tasks]
+        else:
+            with multiprocessing.Pool(min(workers, self.chunks)) as pool:
+                loaded = pool.starmap(_load_chunk, tasks)
+        _close_worker_conn()
+
+        with session.cursor() as cursor:
+            for sql in self.spec.index_sql:
+                cursor.execute(sql)
+
+        elapsed = time.monotonic() - started
+        log.info("Loaded {} rows into {} in {:.1f}s".format(
+            sum(loaded), self.spec.name, elapsed))
+        return elapsed
+
+
+# Connection of a load worker process, kept across its chunks
+_worker_db = None
+
+# Whether LOAD DATA LOCAL failed as disabled on the worker's connection,
+# its later chunks are inserted right away
+_worker_infile_disabled = False
+
+
+def _worker_connection(conn_params, settings):
+    global _worker_db
+    if _worker_db is None:
+        _worker_db = MariaDB(conn_params, settings)
+        with _worker_db.cursor() as cursor:
+            cursor.execute("SET unique_checks = 0, foreign_key_checks = 0")
+    return _worker_db
+
+
+def _close_worker_conn():
+    global _worker_db, _worker_infile_disabled
+    if _worker_db is not None:
+        _worker_db.close()
+        _worker_db = None
+    _worker_infile_disabled = False
+
+
+def _load_chunk(conn_params, settings, generator, index, method):
+    """
+    Generate and load one chunk.
+
+    Returns:
+        rows loaded
+    """
+    global _worker_infile_disabled
+    db = _worker_connection(conn_params, settings)
+    spec = generator.spec
+    columns = ', '.join('`{}`'.format(c) for c in spec.column_names)
+    cursor = db.cursor()
+    try:
+        if method == LOAD_INFILE and not _worker_infile_disabled:
+            try:
+                loaded = _load_chunk_infile(cursor, generator, index,
+                                            columns)
+                db.commit()
+                return loaded
+            except Exception as e:
+                if getattr(e, 'errno', None) not in _INFILE_DISABLED_ERRNOS:
+                    raise
+                log.warning("LOAD DATA LOCAL is disabled ({}), using "
+                            "INSERT".format(e))
+                _worker_infile_disabled = True
+                db.rollback()
+
+        rows = generator.chunk_rows(index)
+        sql = 'INSERT INTO `{}` ({}) VALUES ({})'.format(
+            spec.name, columns, ', '.join(['%s'] * len(spec.columns)))
+        for start in range(0, len(rows), INSERT_BATCH_SIZE):
+            cursor.executemany(sql, rows[start:start + INSERT_BATCH_SIZE])
+        db.commit()
+        return len(rows)
+    finally:
+        cursor.close()
+
+
+def _load_chunk_infile(cursor, generator, index, columns):
+    with tempfile.NamedTemporaryFile('w', dir=_SPILL_DIR, suffix='.tsv',
+                                     encoding='utf-8') as fp:
+        fp.write(generator.chunk_tsv(index))
+        fp.flush()
+        cursor.execute(
+            "LOAD DATA LOCAL INFILE '{}' INTO TABLE `{}` "
+            "CHARACTER SET utf8mb4 ({})".format(
+                fp.name, generator.spec.name, columns)
+        )
+    return cursor.rowcount
@@ -1,8 +1,123 @@
+import logging
+import os
+
 import pytest
+from . import reaper
+from .helper import primary_conn_params
+from .mariadb import MariaDB
 from .session import DbSession
+from .session import ISOLATION_TRANSACTION
+
+log = logging.getLogger(__name__)
+
+# Servers this process ran the session reaper against, by (host, port)
+_reaped = set()
+
+
+def worker_id():
+    """
+    Returns:
+        worker (str): pytest-xdist worker name (gw0, gw1, ...), 'master'
+            when not running distributed
+    """
+    return os.environ.get('PYTEST_XDIST_WORKER', 'master')
+
+
+def reap_stale_sessions(conn_params):
+    """
+    Drop users and databases left behind by killed test processes, once per
+    process and server before the first session fixture. The reaper itself
+    runs at most every reaper.DEFAULT_REAP_INTERVAL_SEC per server, so
+    concurrent and back-to-back runs mostly skip it. Sessions are created
+    on the primary of connection parameters with endpoints, so that is
+    where the reaper runs.
+    """
+    import mysql.connector
+
+    conn_params = primary_conn_params(conn_params)
+    key = (conn_params['host'], conn_params['port'])
+    if key in _reaped:
+        return
+    _reaped.add(key)
+    try:
+        with MariaDB(conn_params) as base_db:
+            reaper.reap_sessions(base_db)
+    except mysql.connector.Error as e:
+        log.warning("Session reaper failed: {}".format(e))
+
+
+@pytest.fixture(scope="session")
+def worker_db_session_fxt(conn_params):
+    """
+    Session user and database of this test worker, created once and kept
+    for the whole run. Under pytest -n every worker gets its own, so
+    workers never share state and only create users and databases once.
+    """
+    reap_stale_sessions(conn_params)
+    with DbSession(conn_params, isolate_db=True) as session:
+        log.info("Worker {} uses database {}".format(
+            worker_id(), session.dbname))
+        yield session
+
 
 @pytest.fixture(scope="function")
-def db_session_fxt(conn_params):
+def db_session_fxt(worker_db_session_fxt):
+    """
+    Empty isolated database for one test. The worker's session is reused
+    and reset after the test, which drops only what the test created.
+    """
+    yield worker_db_session_fxt
+
+    try:
+        worker_db_session_fxt.reset()
+    except Exception as e:
+        # Start the next test from a new user and database instead
+        log.warning("Resetting session failed ({}), recreating it".format(e))
+        worker_db_session_fxt.close()
+
+
+@pytest.fixture(scope="session")
+def worker_txn_session_fxt(conn_params):
+    """
+    Transaction isolated session of this test worker, see
+    txn_db_session_fxt.
+    """
+    reap_stale_sessions(conn_params)
+    with DbSession(conn_params, isolation=ISOLATION_TRANSACTION) as session:
+        log.info("Worker {} uses database {} with transaction "
+                 "isolation".format(worker_id(), session.dbname))
+        yield session
+
+
+@pytest.fixture(scope="function")
+def txn_db_session_fxt(worker_txn_session_fxt):
+    """
+    Worker session whose changes are rolled back after the test, much
+    cheaper than resetting the database. Suits tests running DML on shared
+    data; a test running DDL commits, and its tables are dropped or
+    truncated instead.
+    """
+    with worker_txn_session_fxt.scope():
+        yield worker_txn_session_fxt
+
+
+@pytest.fixture(scope="module")
+def module_db_session_fxt(conn_params):
+    """
+    Isolated database shared by the tests of a module, e.g. for expensive
+    test data loaded once.
+    """
+    reap_stale_sessions(conn_params)
+    with DbSession(conn_params, isolate_db=True) as session:
+        yield session
+
+
+@pytest.fixture(scope="session")
+def session_db_session_fxt(conn_params):
+    """
+    Isolated database shared by all tests of a worker for the whole run.
+    """
+    reap_stale_sessions(conn_params)
     with DbSession(conn_params, isolate_db=True) as session:
         yield session
 
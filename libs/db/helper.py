@@ -11,6 +11,11 @@ DEFAULT_DB_SETTINGS = {
     'connect_timeout': DEFAULT_CONNECT_TIMEOUT_SEC,
 }
 
+# Roles of the servers of a replicated topology, see validate_conn_params
+ROLE_PRIMARY = 'primary'
+ROLE_REPLICA = 'replica'
+ENDPOINT_ROLES = (ROLE_PRIMARY, ROLE_REPLICA)
+
 
 def get_random_identifier(max_len=MAX_IDENTIFIER_LEN, prefix_str=''):
     """
@@ -49,6 +54,22 @@ def validate_conn_params(conn_params):
         'password': 'Testing1234'
     }
 
+    A replicated topology lists its servers under 'endpoints' instead of a
+    single host, each with a role (ROLE_PRIMARY or ROLE_REPLICA) and
+    optionally its own port, 'port' being the default:
+
+    conn_params = {
+        'endpoints': [
+            {'host': 'db1', 'role': 'primary'},
+            {'host': 'db2', 'role': 'replica'},
+            {'host': 'db3', 'port': 3307, 'role': 'replica'},
+        ],
+        'port': 3306,
+        'dbname': 'dev',
+        'user': 'master',
+        'password': 'Testing1234'
+    }
+
     Args:
         conn_params (dict): Connection parameters dictionary
 
@@ -59,9 +80,69 @@ def validate_conn_params(conn_params):
     if not isinstance(conn_params, dict):
         raise ValueError("Connection parameters must be a dictionary")
 
-    required_keys = {'host', 'dbname', 'port', 'user', 'password'}
+    if 'endpoints' in conn_params:
+        required_keys = {'dbname', 'user', 'password'}
+    else:
+        required_keys = {'host', 'dbname', 'port', 'user', 'password'}
     conn_param_keys = conn_params.keys()
     if not required_keys.issubset(set(conn_param_keys)):
         missing_params = list(set(required_keys) - set(conn_param_keys))
         raise ValueError(
             "Required field(s) missing: {}".format(str(missing_params)))
+
+    if 'endpoints' in conn_params:
+        _validate_endpoints(conn_params)
+
+
+def _validate_endpoints(conn_params):
+    endpoints = conn_params['endpoints']
+    if not isinstance(endpoints, (list, tuple)) or not endpoints:
+        raise ValueError("endpoints must be a non-empty list")
+
+    for endpoint in endpoints:
+        if not isinstance(endpoint, dict) or 'host' not in endpoint:
+            raise ValueError(
+                "Endpoint {} must be a dictionary with a host".format(
+                    endpoint))
+        if endpoint.get('role') not in ENDPOINT_ROLES:
+            raise ValueError("Endpoint {} role must be one of {}".format(
+                endpoint['host'], ENDPOINT_ROLES))
+        if 'port' not in endpoint and 'port' not in conn_params:
+            raise ValueError("Endpoint {} has no port".format(
+                endpoint['host']))
+
+    if not any(e['role'] == ROLE_PRIMARY for e in endpoints):
+        raise ValueError("endpoints must include a {}".format(ROLE_PRIMARY))
+
+
+def endpoint_conn_params(conn_params, endpoint):
+    """
+    Args:
+        conn_params (dict): connection parameters with endpoints
+        endpoint (dict): one of the endpoints
+
+    Returns:
+        conn_params (dict): single host connection parameters of endpoint
+    """
+
+    params = dict(conn_params, host=endpoint['host'],
+                  port=endpoint.get('port', conn_params.get('port')))
+    params.pop('endpoints', None)
+    return params
+
+
+def primary_conn_params(conn_params):
+    """
+    Args:
+        conn_params (dict): connection parameters, with or without endpoints
+
+    Returns:
+        conn_params (dict): single host connection parameters of the
+            (first) primary
+    """
+
+    if 'endpoints' not in conn_params:
+        return conn_params
+    primary = next(e for e in conn_params['endpoints']
+                   if e['role'] == ROLE_PRIMARY)
+    return endpoint_conn_params(conn_params, primary)
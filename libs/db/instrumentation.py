@@ -0,0 +1,285 @@
+import bisect
+import collections
+import logging
+import threading
+import time
+
+log = logging.getLogger(__name__)
+
+# Monotonic clock of every timing
+clock = time.perf_counter
+
+# Event kinds
+EVENT_CONNECT = 'connect'
+# Liveness probe of an existing connection by _ensure_connection
+EVENT_PING = 'ping'
+EVENT_EXECUTE = 'execute'
+EVENT_FETCH = 'fetch'
+# Backoff sleep of a failed session DDL statement before it is retried
+EVENT_RETRY = 'retry'
+EVENT_SESSION_SETUP = 'session_setup'
+EVENT_SESSION_TEARDOWN = 'session_teardown'
+EVENT_SESSION_RESET = 'session_reset'
+
+# Time spent in the server and the driver, the rest of a run's wall time is
+# harness overhead
+DATABASE_EVENTS = (EVENT_CONNECT, EVENT_PING, EVENT_EXECUTE, EVENT_FETCH)
+
+# Upper bounds of the histogram buckets in seconds, 10us doubling up to
+# about 84s. Slower events land in a final overflow bucket.
+HISTOGRAM_BOUNDS = tuple(0.00001 * 2 ** i for i in range(24))
+
+Event = collections.namedtuple(
+    'Event', ['kind', 'start', 'elapsed', 'rows', 'detail']
+)
+
+# Registered hooks. Instrumented code takes no timings while this is empty,
+# see start() and emit().
+hooks = ()
+
+_hooks_lock = threading.Lock()
+
+
+def add_hook(hook):
+    """
+    Args:
+        hook (callable): called with an Event for every instrumented
+            operation, from whichever thread ran it
+    """
+
+    global hooks
+    with _hooks_lock:
+        hooks = hooks + (hook,)
+
+
+def remove_hook(hook):
+    global hooks
+    with _hooks_lock:
+        hooks = tuple(h for h in hooks if h != hook)
+
+
+def start():
+    """
+    Returns:
+        clock() to time an operation with, None while no hooks are
+        registered
+    """
+    return clock() if hooks else None
+
+
+def emit(kind, start, rows=None, detail=None):
+    """
+    Deliver an event to the hooks.
+
+    Args:
+        kind (str): one of the EVENT_* kinds
+        start (float): start() value when the operation started, nothing
+            is emitted for None
+        rows (int): rows affected or fetched, None if not applicable
+        detail: SQL text, host or other kind specific context
+    """
+
+    if start is None:
+        return
+    event = Event(kind, start, clock() - start, rows, detail)
+    for hook in hooks:
+        try:
+            hook(event)
+        except Exception as e:
+            log.warning("Instrumentation hook {} failed: {}".format(hook, e))
+
+
+class TimedCursor(object):
+    """
+    Cursor wrapper emitting execute and fetch events. MariaDB.cursor()
+    returns one only while hooks are registered.
+    """
+
+    def __init__(self, cursor):
+        self._cursor = cursor
+
+    def execute(self, operation, params=None, *args, **kwargs):
+        start = clock()
+        try:
+            return self._cursor.execute(operation, params, *args, **kwargs)
+        finally:
+            emit(EVENT_EXECUTE, start, self._cursor.rowcount, operation)
+
+    def executemany(self, operation, seq_params):
+        start = clock()
+        try:
+            return self._cursor.executemany(operation, seq_params)
+        finally:
+            emit(EVENT_EXECUTE, start, self._cursor.rowcount, operation)
+
+    def fetchone(self):
+        start = clock()
+        row = self._cursor.fetchone()
+        emit(EVENT_FETCH, start, 0 if row is None else 1)
+        return row
+
+    def fetchmany(self, *args, **kwargs):
+        start = clock()
+        rows = self._cursor.fetchmany(*args, **kwargs)
+        emit(EVENT_FETCH, start, len(rows))
+        return rows
+
+    def fetchall(self):
+        start = clock()
+        rows = self._cursor.fetchall()
+        emit(EVENT_FETCH, start, len(rows))
+        return rows
+
+    def __getattr__(self, name):
+        return getattr(self._cursor, name)
+
+    def __iter__(self):
+        return iter(self.fetchone, None)
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, exc_type, exc_val, exc_tb):
+        self._cursor.close()
+
+
+class Histogram(object):
+    """
+    Log scale histogram of durations, see HISTOGRAM_BOUNDS.
+    """
+
+    def __init__(self):
+        self.buckets = [0] * (len(HISTOGRAM_BOUNDS) + 1)
+        self.count = 0
+        self.total = 0.0
+        self.max = 0.0
+
+    def add(self, value):
+        self.buckets[bisect.bisect_left(HISTOGRAM_BOUNDS, value)] += 1
+        self.count += 1
+        self.total += value
+        if value > self.max:
+            self.max = value
+
+    def percentile(self, pct):
+        """
+        Args:
+            pct (float): percentile, 0 to 100
+
+        Returns:
+            upper bound of the bucket holding the percentile, the maximum
+            for the overflow bucket, 0.0 when empty
+        """
+
+        if not self.count:
+            return 0.0
+        rank = max(1, pct / 100.0 * self.count)
+        seen = 0
+        for index, count in enumerate(self.buckets):
+            seen += count
+            if seen >= rank:
+                if index == len(HISTOGRAM_BOUNDS):
+                    return self.max
+                return min(HISTOGRAM_BOUNDS[index], self.max)
+        return self.max
+
+
+class Aggregator(object):
+    """
+    In-process hook counting events and rows and keeping a duration
+    histogram per event kind.
+
+    Example usage:
+
+        with Aggregator() as agg:
+            run_queries(session)
+        print(agg.report())
+    """
+
+    def __init__(self):
+        self._lock = threading.Lock()
+        self.histograms = collections.OrderedDict()
+        self.rows = collections.Counter()
+
+    def __call__(self, event):
+        with self._lock:
+            histogram = self.histograms.get(event.kind)
+            if histogram is None:
+                histogram = self.histograms[event.kind] = Histogram()
+            histogram.add(event.elapsed)
+            if event.rows is not None and event.rows > 0:
+                self.rows[event.kind] += event.rows
+
+    def start(self):
+        add_hook(self)
+        return self
+
+    def stop(self):
+        remove_hook(self)
+
+    def __enter__(self):
+        return self.start()
+
+    def __exit__(self, exc_type, exc_val, exc_tb):
+        self.stop()
+
+    def database_time(self):
+        """
+        Returns:
+            seconds spent in DATABASE_EVENTS
+        """
+
+        with self._lock:
+            return sum(h.total for kind, h in self.histograms.items()
+                       if kind in DATABASE_EVENTS)
+
+    def summary(self):
+        """
+        Returns:
+            OrderedDict of event kind to dictionary of count, rows, total,
+            mean, p50, p99 and max seconds
+        """
+
+        summary = collections.OrderedDict()
+        with self._lock:
+            for kind, histogram in self.histograms.items():
+                summary[kind] = {
+                    'count': histogram.count,
+                    'rows': self.rows[kind],
+                    'total': histogram.total,
+                    'mean': histogram.total / histogram.count,
+                    'p50': histogram.percentile(50),
+                    'p99': histogram.percentile(99),
+                    'max': histogram.max,
+                }
+        return summary
+
+    def report(self, wall_time=None):
+        """
+        Args:
+            wall_time (float): seconds the measured run took, to report the
+                harness overhead outside of database time
+
+        Returns:
+            one line per event kind, times in milliseconds
+        """
+
+        lines = []
+        for kind, stats in self.summary().items():
+            lines.append(
+                "  {:<18} count {:>8}  rows {:>10}  total {:>10.1f}  "
+                "mean {:>8.3f}  p99 {:>8.3f}  max {:>8.3f}".format(
+                    kind, stats['count'], stats['rows'],
+                    stats['total'] * 1000, stats['mean'] * 1000,
+                    stats['p99'] * 1000, stats['max'] * 1000
+                )
+            )
+        if wall_time:
+            database = self.database_time()
+            lines.append(
+                "  database {:.1f} ms, harness {:.1f} ms of {:.1f} ms".format(
+                    database * 1000, (wall_time - database) * 1000,
+                    wall_time * 1000
+                )
+            )
+        return '\n'.join(lines)
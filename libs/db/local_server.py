@@ -0,0 +1,229 @@
+import logging
+import os
+import shutil
+import socket
+import subprocess
+import tempfile
+import time
+
+from .db_exception import OperationalError
+from .helper import DEFAULT_DB_SETTINGS
+
+log = logging.getLogger(__name__)
+
+# Binaries, newest name first
+SERVER_BINARIES = ('mariadbd', 'mysqld')
+INSTALL_DB_BINARIES = ('mariadb-install-db', 'mysql_install_db')
+
+DEFAULT_DBNAME = 'bench'
+DEFAULT_START_TIMEOUT_SEC = 60
+
+# Server options of a throwaway instance: nothing is worth making durable.
+# Name resolution stays on, session users are created @localhost.
+DEFAULT_SERVER_OPTIONS = (
+    '--skip-log-bin',
+    '--innodb-flush-log-at-trx-commit=0',
+    '--innodb-doublewrite=0',
+    '--innodb-buffer-pool-size=256M',
+)
+
+
+def _find_binary(names, binary_dir=None):
+    path = os.pathsep.join(
+        p for p in (binary_dir, os.environ.get('PATH'), '/usr/sbin',
+                    '/usr/local/mysql/bin') if p
+    )
+    for name in names:
+        found = shutil.which(name, path=path)
+        if found:
+            return found
+    raise OperationalError(
+        "None of {} found, is MariaDB installed?".format(', '.join(names))
+    )
+
+
+def free_port():
+    """
+    Returns:
+        port (int): TCP port nothing listens on right now
+    """
+    with socket.socket(socket.AF_INET, socket.SOCK_STREAM) as sock:
+        sock.bind(('127.0.0.1', 0))
+        return sock.getsockname()[1]
+
+
+class LocalMariaDB(object):
+    """
+    MariaDB server on a throwaway datadir, for benchmarks and tests that
+    need a server of their own. The datadir is created in a temporary
+    directory and removed again by stop().
+
+    Example usage:
+
+        with LocalMariaDB() as server:
+            with DbSession(server.conn_params, isolate_db=True) as session:
+                # do stuff
+    """
+
+    def __init__(self, port=None, binary_dir=None, options=(),
+                 start_timeout=DEFAULT_START_TIMEOUT_SEC):
+        """
+        Args:
+            port (int): TCP port, a free one by default
+            binary_dir (str): directory of mariadbd and mariadb-install-db
+                if they are not on the PATH
+            options (tuple): extra mariadbd options, appended to
+                DEFAULT_SERVER_OPTIONS
+            start_timeout (float): seconds to wait for the server to accept
+                connections
+        """
+        self.port = port or free_port()
+        self.binary_dir = binary_dir
+        self.options = DEFAULT_SERVER_OPTIONS + tuple(options)
+        self.start_timeout = start_timeout
+        self.basedir = None
+        self._process = None
+
+    @property
+    def datadir(self):
+        return os.path.join(self.basedir, 'data')
+
+    @property
+    def socket(self):
+        return os.path.join(self.basedir, 'mysqld.sock')
+
+    @property
+    def conn_params(self):
+        """
+        Returns:
+            conn_params (dict): root connection parameters of the server
+        """
+        return {
+            'host': '127.0.0.1',
+            'port': self.port,
+            'user': 'root',
+            'password': '',
+            'dbname': DEFAULT_DBNAME,
+        }
+
+    def start(self):
+        """
+        Initialize the datadir, start the server and wait until it accepts
+        connections.
+
+        Raises:
+            OperationalError if MariaDB is not installed or the server does
+            not come up
+        """
+
+        server = _find_binary(SERVER_BINARIES, self.binary_dir)
+        install_db = _find_binary(INSTALL_DB_BINARIES, self.binary_dir)
+
+        self.basedir = tempfile.mkdtemp(prefix='mdb_local_')
+        log.info("Initializing datadir {}".format(self.datadir))
+        cmd = [
+            install_db, '--no-defaults', '--datadir={}'.format(self.datadir),
+            '--auth-root-authentication-method=normal', '--skip-test-db',
+        ]
+        if os.geteuid() == 0:
+            cmd.append('--user=root')
+        result = subprocess.run(cmd, stdout=subprocess.PIPE,
+                                stderr=subprocess.STDOUT)
+        if result.returncode:
+            output = result.stdout.decode(errors='replace')
+            self._remove_basedir()
+            raise OperationalError(
+                "{} failed: {}".format(os.path.basename(install_db), output)
+            )
+
+        cmd = [
+            server, '--no-defaults',
+            '--datadir={}'.format(self.datadir),
+            '--socket={}'.format(self.socket),
+            '--port={}'.format(self.port),
+            '--bind-address=127.0.0.1',
+            '--log-error={}'.format(os.path.join(self.basedir, 'error.log')),
+            '--pid-file={}'.format(os.path.join(self.basedir, 'mysqld.pid')),
+        ] + list(self.options)
+        if os.geteuid() == 0:
+            cmd.append('--user=root')
+        log.info("Starting {} on port {}".format(server, self.port))
+        self._process = subprocess.Popen(cmd, stdout=subprocess.DEVNULL,
+                                         stderr=subprocess.DEVNULL)
+        self._wait_ready()
+        return self
+
+    def _wait_ready(self):
+        import mysql.connector
+
+        deadline = time.monotonic() + self.start_timeout
+        params = dict(self.conn_params)
+        params.pop('dbname')
+        while True:
+            returncode = self._process.poll()
+            if returncode is not None:
+                error = self.error_log()
+                self.stop()
+                raise OperationalError(
+                    "MariaDB exited with {}: {}".format(returncode, error)
+                )
+            try:
+                conn = mysql.connector.connect(
+                    connect_timeout=DEFAULT_DB_SETTINGS['connect_timeout'],
+                    **params
+                )
+            except mysql.connector.Error:
+                if time.monotonic() > deadline:
+                    self.stop()
+                    raise OperationalError(
+                        "MariaDB did not start within {} seconds".format(
+                            self.start_timeout)
+                    )
+                time.sleep(0.1)
+                continue
+
+            cursor = conn.cursor()
+            cursor.execute(
+                "CREATE DATABASE IF NOT EXISTS {}".format(DEFAULT_DBNAME))
+            cursor.close()
+            conn.close()
+            return
+
+    def error_log(self):
+        """
+        Returns:
+            contents of the server error log, '' if there is none
+        """
+        try:
+            with open(os.path.join(self.basedir, 'error.log'),
+                      errors='replace') as fp:
+                return fp.read()
+        except (OSError, TypeError):
+            return ''
+
+    def stop(self):
+        """
+        Stop the server and remove its datadir.
+        """
+
+        if self._process is not None:
+            if self._process.poll() is None:
+                self._process.terminate()
+                try:
+                    self._process.wait(timeout=30)
+                except subprocess.TimeoutExpired:
+                    self._process.kill()
+                    self._process.wait()
+            self._process = None
+        self._remove_basedir()
+
+    def _remove_basedir(self):
+        if self.basedir:
+            shutil.rmtree(self.basedir, ignore_errors=True)
+            self.basedir = None
+
+    def __enter__(self):
+        return self.start()
+
+    def __exit__(self, exc_type, exc_val, exc_tb):
+        self.stop()
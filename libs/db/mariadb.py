@@ -1,10 +1,13 @@
 import logging
-import mysql.connector
 
+from . import instrumentation
 from .helper import DEFAULT_DB_SETTINGS
 
 log = logging.getLogger(__name__)
 
+# Settings passed on to the driver when connecting
+_CONNECT_SETTINGS = ('connect_timeout', 'allow_local_infile')
+
 
 class MariaDB(object):
     """
@@ -21,6 +24,7 @@ class MariaDB(object):
         self.conn_params = conn_params
         self.settings = settings or DEFAULT_DB_SETTINGS.copy()
         self._autocommit = self.settings.get('autocommit', False)
+        self.connection = None
 
     def connect(self, debug=False):
         """
@@ -30,17 +34,27 @@ class MariaDB(object):
             connection: New connection object
         """
 
+        # Imported here so that importing db stays cheap for processes
+        # that never connect
+        import mysql.connector
+
         log.debug(
             "Establishing connection to {} database".format(self.dbname)
         )
 
+        options = dict((name, self.settings[name])
+                       for name in _CONNECT_SETTINGS if name in self.settings)
+        start = instrumentation.start()
         self.connection = mysql.connector.connect(
             host = self.conn_params['host'],
             user = self.conn_params['user'],
             password = self.conn_params['password'],
             port = self.conn_params['port'],
             database = self.conn_params['dbname'],
+            **options
         )
+        instrumentation.emit(instrumentation.EVENT_CONNECT, start,
+                             detail=self.conn_params['host'])
 
         self.connection.autocommit = self.autocommit
 
@@ -70,8 +84,12 @@ class MariaDB(object):
                              "with debug flag set to True")
                     self.connect(debug=True)
             else:
+                start = instrumentation.start()
                 with self.connection.cursor() as cursor:
                     cursor.execute('SELECT 1')
+                    # Fetching keeps the driver from raising on unread rows
+                    cursor.fetchall()
+                instrumentation.emit(instrumentation.EVENT_PING, start)
 
         except Exception as exp:
             log.debug("Connection None or Closed, {}".format(exp))
@@ -86,13 +104,19 @@ class MariaDB(object):
         """
         self.connection.autocommit = value
 
-    def cursor(self):
+    def cursor(self, raw=False):
         """
+        Args:
+            raw (bool): return values as the server sent them (bytes),
+                without converting them to Python types
+
         Returns:
             Cursor object
         """
         self._ensure_connection()
-        cursor = self.connection.cursor()
+        cursor = self.connection.cursor(raw=raw)
+        if instrumentation.hooks:
+            cursor = instrumentation.TimedCursor(cursor)
         return cursor
 
     def clone(self):
@@ -106,7 +130,7 @@ class MariaDB(object):
         """
         return self.__class__(
             conn_params=self.conn_params,
-            setting=self.settings
+            settings=self.settings
             #**self.driver_property
         )
 
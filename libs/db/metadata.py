@@ -0,0 +1,232 @@
+import collections
+import logging
+import re
+
+from .session_cursor import _statement_body
+
+log = logging.getLogger(__name__)
+
+# Statements changing the schema (or the statistics) of tables, after which
+# cached metadata is stale. Temporary tables are not in information_schema.
+_SCHEMA_CHANGE_RE = re.compile(
+    r'(ALTER|CREATE|DROP|RENAME|TRUNCATE|ANALYZE|OPTIMIZE|REPAIR)\b', re.I
+)
+_TEMPORARY_RE = re.compile(r'(CREATE|DROP)\s+TEMPORARY\b', re.I)
+
+# Tables, columns and indexes of a database in one round trip. Every row is
+# (kind, table, name, a, b, c, d, position), the meaning of a-d depends on
+# the kind.
+_METADATA_SQL = """
+SELECT 'table', TABLE_NAME, NULL, ENGINE, TABLE_TYPE, TABLE_ROWS,
+       DATA_LENGTH, NULL
+FROM information_schema.TABLES WHERE TABLE_SCHEMA = %s
+UNION ALL
+SELECT 'column', TABLE_NAME, COLUMN_NAME, DATA_TYPE, COLUMN_TYPE,
+       IS_NULLABLE, COLUMN_DEFAULT, ORDINAL_POSITION
+FROM information_schema.COLUMNS WHERE TABLE_SCHEMA = %s
+UNION ALL
+SELECT 'index', TABLE_NAME, INDEX_NAME, COLUMN_NAME, NON_UNIQUE, NULL,
+       NULL, SEQ_IN_INDEX
+FROM information_schema.STATISTICS WHERE TABLE_SCHEMA = %s
+"""
+
+ColumnInfo = collections.namedtuple(
+    'ColumnInfo', ['name', 'data_type', 'column_type', 'nullable', 'default']
+)
+
+IndexInfo = collections.namedtuple('IndexInfo', ['name', 'columns', 'unique'])
+
+
+def is_schema_change(sql):
+    """
+    Args:
+        sql (str): SQL statement
+
+    Returns:
+        True if the statement may change cached table metadata
+    """
+    body = _statement_body(sql)
+    return bool(_SCHEMA_CHANGE_RE.match(body)) and \
+        not _TEMPORARY_RE.match(body)
+
+
+def _text(value):
+    if isinstance(value, (bytes, bytearray)):
+        return value.decode('utf-8')
+    return value
+
+
+def _int(value):
+    return None if value is None else int(_text(value))
+
+
+class TableInfo(object):
+    """
+    Metadata of a table or view: engine, columns, indexes and the row
+    estimate of the storage engine, as of the time it was read.
+    """
+
+    def __init__(self, database, name, engine=None, table_type=None,
+                 row_estimate=None, data_length=None):
+        self.database = database
+        self.name = name
+        self.engine = engine
+        self.table_type = table_type
+        self.row_estimate = row_estimate
+        self.data_length = data_length
+        self.columns = []
+        self.indexes = []
+
+    @property
+    def column_names(self):
+        return [column.name for column in self.columns]
+
+    @property
+    def primary_key(self):
+        """
+        Returns:
+            list of primary key columns, empty if there is none
+        """
+        for index in self.indexes:
+            if index.name == 'PRIMARY':
+                return list(index.columns)
+        return []
+
+    @property
+    def is_view(self):
+        return self.table_type == 'VIEW'
+
+    def column(self, name):
+        """
+        Returns:
+            ColumnInfo of the column name (case insensitive)
+
+        Raises:
+            KeyError if the table has no such column
+        """
+        for column in self.columns:
+            if column.name.lower() == name.lower():
+                return column
+        raise KeyError("{}.{} has no column {}".format(
+            self.database, self.name, name))
+
+    def __repr__(self):
+        return '<TableInfo {}.{} ({} columns, ~{} rows)>'.format(
+            self.database, self.name, len(self.columns), self.row_estimate)
+
+
+def read_metadata(cursor, database):
+    """
+    Read the metadata of all tables of a database with one query.
+
+    Args:
+        cursor (mariadb Cursor): cursor to query information_schema with
+        database (str): database name
+
+    Returns:
+        tables (dict): TableInfo by table name
+    """
+
+    cursor.execute(_METADATA_SQL, (database, database, database))
+    rows = cursor.fetchall()
+
+    tables = {}
+    columns = collections.defaultdict(list)
+    indexes = collections.defaultdict(list)
+    for kind, table, name, a, b, c, d, position in rows:
+        kind, table, name = _text(kind), _text(table), _text(name)
+        if kind == 'table':
+            tables[table] = TableInfo(database, table, _text(a), _text(b),
+                                      _int(c), _int(d))
+        elif kind == 'column':
+            columns[table].append((_int(position), ColumnInfo(
+                name, _text(a), _text(b), _text(c) == 'YES', _text(d))))
+        else:
+            indexes[table].append((name, _int(position), _text(a),
+                                   _int(b) == 0))
+
+    for table, info in tables.items():
+        info.columns = [column for _, column in sorted(columns[table])]
+        by_name = collections.OrderedDict()
+        for name, _, column, unique in sorted(indexes[table]):
+            by_name.setdefault(name, (unique, []))[1].append(column)
+        info.indexes = [IndexInfo(name, tuple(index_columns), unique)
+                        for name, (unique, index_columns) in by_name.items()]
+
+    log.debug("Read metadata of {} tables of {}".format(len(tables),
+                                                       database))
+    return tables
+
+
+class MetadataCache(object):
+    """
+    Table metadata of databases, read with one bulk query per database on
+    first use instead of one information_schema lookup per table, which is
+    slow on servers with many databases. DbSession invalidates its cache
+    whenever a statement run through it changes a schema, changes made
+    through other connections are only seen after invalidate(), apart from
+    tables missing from the cache, which are looked up once more.
+    """
+
+    def __init__(self, cursor_factory):
+        """
+        Args:
+            cursor_factory (callable): returns a cursor to read metadata with
+        """
+        self._cursor_factory = cursor_factory
+        self._databases = {}
+        # Names of missing tables by database, not looked up again until
+        # the next invalidation
+        self._missing = {}
+
+    def tables(self, database):
+        """
+        Returns:
+            tables (dict): TableInfo by table name of database
+        """
+        tables = self._databases.get(database)
+        if tables is None:
+            with self._cursor_factory() as cursor:
+                tables = read_metadata(cursor, database)
+            self._databases[database] = tables
+        return tables
+
+    def table_info(self, database, name):
+        """
+        Args:
+            database (str): database name
+            name (str): table name
+
+        Returns:
+            TableInfo, None if the table does not exist
+        """
+        cached = database in self._databases
+        info = self.tables(database).get(name)
+        missing = self._missing.setdefault(database, set())
+        if info is None and cached and name not in missing:
+            # Possibly created by another connection since the cache was
+            # filled
+            del self._databases[database]
+            info = self.tables(database).get(name)
+        if info is None:
+            missing.add(name)
+        return info
+
+    def invalidate(self, database=None):
+        """
+        Drop cached metadata of database, of every database by default.
+        """
+        if database is None:
+            self._databases.clear()
+            self._missing.clear()
+        else:
+            self._databases.pop(database, None)
+            self._missing.pop(database, None)
+
+    def on_statement(self, sql):
+        """
+        Invalidate the cache if sql may change a schema. Statements can
+        name tables of any database, so everything is dropped.
+        """
+        if self._databases and is_schema_change(sql):
+            self.invalidate()
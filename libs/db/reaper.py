@@ -0,0 +1,251 @@
+import collections
+import logging
+import os
+import socket
+import time
+
+log = logging.getLogger(__name__)
+
+# Database holding the session registry. Session databases are named
+# db<hex>, the registry never matches them.
+REGISTRY_DATABASE = 'mdb_registry'
+
+_CREATE_DATABASE_SQL = 'CREATE DATABASE IF NOT EXISTS {}'.format(
+    REGISTRY_DATABASE)
+
+_CREATE_SESSIONS_SQL = """
+CREATE TABLE IF NOT EXISTS {}.sessions (
+    username VARCHAR(80) NOT NULL,
+    dbname VARCHAR(64) NOT NULL,
+    host VARCHAR(255) NOT NULL,
+    pid INT NOT NULL,
+    created DATETIME NOT NULL DEFAULT CURRENT_TIMESTAMP,
+    PRIMARY KEY (username, dbname),
+    KEY ix_created (created)
+)""".format(REGISTRY_DATABASE)
+
+# Time of the last reaper run, one row
+_CREATE_REAPER_SQL = """
+CREATE TABLE IF NOT EXISTS {}.reaper (
+    id TINYINT NOT NULL PRIMARY KEY,
+    last_run DATETIME NOT NULL
+)""".format(REGISTRY_DATABASE)
+
+# Named lock held while reaping, reapers of concurrent runs skip instead of
+# waiting for it
+REAPER_LOCK = 'mdb_session_reaper'
+
+# Seconds between reaper runs against one server
+DEFAULT_REAP_INTERVAL_SEC = 600
+
+# Sessions older than this are stale even if their owner looks alive (the
+# pid may have been reused, or the owner runs on another host), unless
+# their user is still connected
+DEFAULT_MAX_AGE_SEC = 6 * 3600
+
+# Users and databases dropped per statement batch
+REAP_BATCH_SIZE = 100
+
+# Pause between batches, to keep DROP DATABASE bursts from stalling the
+# sessions of active runs
+REAP_BATCH_PAUSE_SEC = 0.05
+
+# Owner of a registered session
+HOSTNAME = socket.gethostname()
+
+ReapResult = collections.namedtuple('ReapResult', ['users', 'databases'])
+
+# Servers whose registry tables exist, by (host, port)
+_ensured = set()
+
+
+def _server_key(conn_params):
+    return conn_params['host'], conn_params['port']
+
+
+def _ensure_registry(cursor, conn_params):
+    key = _server_key(conn_params)
+    if key in _ensured:
+        return
+    for sql in (_CREATE_DATABASE_SQL, _CREATE_SESSIONS_SQL,
+                _CREATE_REAPER_SQL):
+        cursor.execute(sql)
+    _ensured.add(key)
+
+
+def _pid_alive(pid):
+    if pid <= 0:
+        return False
+    try:
+        os.kill(pid, 0)
+    except ProcessLookupError:
+        return False
+    except PermissionError:
+        pass
+    return True
+
+
+def register_session(cursor, conn_params, username, dbname):
+    """
+    Record a session's user and database with this process as owner. Called
+    before the resources are created, so that a process killed in between
+    leaves a registry entry behind rather than untracked resources.
+
+    Args:
+        cursor (mariadb Cursor): cursor of the base connection
+        conn_params (dict): base connection parameters
+        username (str): session user, '' if the session has none
+        dbname (str): session database, '' if the session has none
+    """
+
+    _ensure_registry(cursor, conn_params)
+    cursor.execute(
+        "REPLACE INTO {}.sessions (username, dbname, host, pid) "
+        "VALUES (%s, %s, %s, %s)".format(REGISTRY_DATABASE),
+        (username, dbname, HOSTNAME, os.getpid())
+    )
+
+
+def unregister_session(cursor, username, dbname):
+    """
+    Remove a session from the registry once its resources are dropped.
+    """
+
+    cursor.execute(
+        "DELETE FROM {}.sessions WHERE username = %s AND dbname = %s".format(
+            REGISTRY_DATABASE),
+        (username, dbname)
+    )
+
+
+def find_stale_sessions(cursor, max_age=DEFAULT_MAX_AGE_SEC):
+    """
+    Registered sessions whose owner is gone: processes of this host that no
+    longer exist, and sessions older than max_age, unless their user still
+    has a connection.
+
+    Args:
+        cursor (mariadb Cursor): cursor of the base connection
+        max_age (float): seconds after which sessions of other hosts count
+            as stale
+
+    Returns:
+        list of (username, dbname) tuples
+    """
+
+    cursor.execute(
+        "SELECT s.username, s.dbname, s.host, s.pid, "
+        "s.created < NOW() - INTERVAL %s SECOND, "
+        "EXISTS (SELECT 1 FROM information_schema.PROCESSLIST p "
+        "WHERE p.USER = s.username) "
+        "FROM {}.sessions s".format(REGISTRY_DATABASE),
+        (int(max_age),)
+    )
+    stale = []
+    for username, dbname, host, pid, expired, connected in cursor.fetchall():
+        if connected:
+            continue
+        if expired or (host == HOSTNAME and not _pid_alive(pid)):
+            stale.append((username, dbname))
+    return stale
+
+
+def _batches(items):
+    for start in range(0, len(items), REAP_BATCH_SIZE):
+        yield items[start:start + REAP_BATCH_SIZE]
+
+
+def _execute_batch(cursor, statements):
+    """
+    Run several statements in one round trip and consume their results.
+    """
+
+    cursor.execute(';\n'.join(statements))
+    while cursor.nextset():
+        pass
+
+
+def drop_session_resources(cursor, sessions):
+    """
+    Drop the users and databases of sessions and their registry entries,
+    in batches.
+
+    Args:
+        cursor (mariadb Cursor): cursor of the base connection
+        sessions (list): (username, dbname) tuples
+
+    Returns:
+        ReapResult of the number of users and databases dropped
+    """
+
+    users = sorted({u for u, _ in sessions if u})
+    databases = sorted({d for _, d in sessions if d})
+
+    for batch in _batches(users):
+        # One statement drops the whole batch
+        cursor.execute("DROP USER IF EXISTS {}".format(
+            ', '.join("'{}'@localhost".format(u) for u in batch)))
+        time.sleep(REAP_BATCH_PAUSE_SEC)
+
+    for batch in _batches(databases):
+        _execute_batch(cursor, ['DROP DATABASE IF EXISTS `{}`'.format(d)
+                                for d in batch])
+        time.sleep(REAP_BATCH_PAUSE_SEC)
+
+    for batch in _batches(sessions):
+        cursor.execute(
+            "DELETE FROM {}.sessions WHERE (username, dbname) IN ({})".format(
+                REGISTRY_DATABASE, ', '.join(['(%s, %s)'] * len(batch))),
+            [value for session in batch for value in session]
+        )
+
+    log.info("Reaped {} users and {} databases of stale sessions".format(
+        len(users), len(databases)))
+    return ReapResult(len(users), len(databases))
+
+
+def reap_sessions(base_db, interval=DEFAULT_REAP_INTERVAL_SEC,
+                  max_age=DEFAULT_MAX_AGE_SEC):
+    """
+    Drop the users and databases of sessions that were never closed, e.g.
+    of killed test processes. Runs at most once per interval against a
+    server and is skipped while another process is reaping.
+
+    Args:
+        base_db (MariaDB): connection of a user allowed to drop users and
+            databases
+        interval (float): seconds since the last run below which the reaper
+            does nothing, 0 to always run
+        max_age (float): see find_stale_sessions()
+
+    Returns:
+        ReapResult, None if the run was skipped
+    """
+
+    with base_db.cursor() as cursor:
+        _ensure_registry(cursor, base_db.conn_params)
+        cursor.execute("SELECT GET_LOCK(%s, 0)", (REAPER_LOCK,))
+        if not cursor.fetchall()[0][0]:
+            log.debug("Session reaper is running elsewhere, skipped")
+            return None
+        try:
+            cursor.execute(
+                "SELECT last_run > NOW() - INTERVAL %s SECOND "
+                "FROM {}.reaper".format(REGISTRY_DATABASE), (int(interval),)
+            )
+            recent = cursor.fetchall()
+            if recent and recent[0][0]:
+                log.debug("Session reaper ran recently, skipped")
+                return None
+            cursor.execute(
+                "REPLACE INTO {}.reaper VALUES (1, NOW())".format(
+                    REGISTRY_DATABASE))
+            base_db.commit()
+
+            stale = find_stale_sessions(cursor, max_age)
+            result = drop_session_resources(cursor, stale)
+            base_db.commit()
+            return result
+        finally:
+            cursor.execute("SELECT RELEASE_LOCK(%s)", (REAPER_LOCK,))
+            cursor.fetchall()
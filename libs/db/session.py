@@ -1,53 +1,118 @@
+import contextlib
 import logging
+import random
 import time
 
+from . import instrumentation
+from . import reaper
 from .session_context import SessionContext
 from .helper import DEFAULT_DB_SETTINGS
 from .helper import get_random_identifier
 from .helper import validate_conn_params
+from .helper import primary_conn_params
 from .helper import MAX_IDENTIFIER_LEN
 from .mariadb import MariaDB
+from .metadata import MetadataCache
+from .checksum import DEFAULT_CHUNK_SIZE
+from .checksum import compare_table_checksums
+from .checksum import table_checksum
+from .checksum import validate_chunk_size
+from .session_cursor import SessionCursor
+from .session_cursor import TransactionScope
+from .session_cursor import classify_session_statement
+from .session_cursor import STATEMENT_COMMIT
+from .session_cursor import STATEMENT_ROLLBACK
+from .session_cursor import STATEMENT_WRITE
 
 from cachedproperty import cached_property
 
 from .db_exception import (
     Error,
-    InternalError,
-    ProgrammingError,
     DatabaseError
 )
 
 log = logging.getLogger(__name__)
 
+# Isolation modes of a DbSession
+ISOLATION_NONE = None
+# Own user and database, dropped when the session closes
+ISOLATION_DATABASE = 'database'
+# Own user and database for the life of the session, the work of each scope
+# is rolled back
+ISOLATION_TRANSACTION = 'transaction'
+
+_ISOLATION_MODES = (ISOLATION_NONE, ISOLATION_DATABASE, ISOLATION_TRANSACTION)
+
+
+# Retries of session DDL (CREATE USER, GRANT, ...) which may collide with
+# other sessions changing the grant tables at the same time, e.g. parallel
+# test workers. The delay doubles with every attempt, with random jitter so
+# that colliding sessions do not retry in lock step.
+MAX_EXECUTE_ATTEMPTS = 6
+# Server errors retried: deadlock, lock wait timeout and connection lost
+# during the statement. Any other error is raised right away.
+TRANSIENT_ERRNOS = frozenset((1213, 1205, 2013))
+RETRY_BASE_DELAY_SEC = 0.05
+RETRY_MAX_DELAY_SEC = 2.0
+
+
+def _retry_delay(attempt):
+    """
+    Args:
+        attempt (int): number of failed attempts so far, from 1
+
+    Returns:
+        delay (float): seconds to sleep before the next attempt
+    """
+
+    delay = min(RETRY_MAX_DELAY_SEC,
+                RETRY_BASE_DELAY_SEC * (2 ** (attempt - 1)))
+    return delay * random.uniform(0.5, 1.0)
+
 
 def _try_execute(sql, cursor, log_str):
     """
     Helper function to execute SQL statements with a given cursor. It
-    automatically retries under certain error conditions.
+    retries errors in TRANSIENT_ERRNOS, backing off exponentially.
 
     Args:
         sql (str): SQL statement
         cursor (mariadb Cursor): Cursor instance
         log_str (str): Debug logging statement
+
+    Raises:
+        the error of the statement if it is not transient, or if it still
+        fails after MAX_EXECUTE_ATTEMPTS attempts
     """
 
-    max_attempts = 3
-    delay_sec = 5
+    import mysql.connector
 
-    for count in range(max_attempts, -1, -1):
+    for attempt in range(1, MAX_EXECUTE_ATTEMPTS + 1):
         try:
             log.debug(log_str)
             cursor.execute(sql)
             break
-        except (InternalError, ProgrammingError, DatabaseError) as e:
+        except (DatabaseError, mysql.connector.DatabaseError) as e:
+            if getattr(e, 'errno', None) not in TRANSIENT_ERRNOS:
+                raise
+            if attempt == MAX_EXECUTE_ATTEMPTS:
+                log.warning("Giving up on: {}. Encountered: {}".format(
+                    sql, str(e).strip()))
+                raise
+
+            delay_sec = _retry_delay(attempt)
             warning_msgs = [
                 "Failed to execute: {}.".format(sql),
-                "Encountered: {}.".format(e.message.strip()),
-                "Retry attempts remaining: {}".format(count),
-                "Sleeping for {} seconds.".format(delay_sec)
+                "Encountered: {}.".format(str(e).strip()),
+                "Retry attempts remaining: {}".format(
+                    MAX_EXECUTE_ATTEMPTS - attempt),
+                "Sleeping for {:.2f} seconds.".format(delay_sec)
             ]
             log.debug('\n'.join(warning_msgs))
+            start = instrumentation.start()
             time.sleep(delay_sec)
+            instrumentation.emit(instrumentation.EVENT_RETRY, start,
+                                 detail=sql)
 
 
 class DbSession(object):
@@ -128,6 +193,27 @@ class DbSession(object):
             cursor.execute("CREATE TABLE t1 (col1 int);")
             cursor.execute("INSERT INTO t1 values (1);")
             session.connection.rollback()  # Or commit()
+
+    # Transaction isolation: one user, database and connection for the life
+    # of the session, and whatever a scope does is rolled back when it ends.
+    # Nested scopes use savepoints.
+
+        with DbSession(conn_params, isolation='transaction') as session:
+            with session.scope():
+                cursor = session.cursor()
+                cursor.execute("INSERT INTO t1 values (1);")
+                with session.scope():
+                    cursor.execute("DELETE FROM t1;")
+                # t1 holds 1 row again
+            # t1 is as before the scope
+
+    Statements that commit implicitly (DDL such as CREATE TABLE, LOCK
+    TABLES, ...) end the transaction and its savepoints. Cursors of a
+    transaction session detect them, and the scopes they happened in fall
+    back to table cleanup on exit: tables created in the scope are dropped
+    and other tables written in the scope are truncated, since what they
+    held before can no longer be restored. Statements run through
+    session.connection directly are not seen.
     """
 
     DB_PREFIX_NAME = 'db'
@@ -138,6 +224,8 @@ class DbSession(object):
             conn_settings=None,
             session_ctx=None,
             isolate_db=False,
+            isolation=ISOLATION_NONE,
+            register=True,
     ):
         """
         Initialize a new DbSession object with specified connection settings
@@ -152,14 +240,23 @@ class DbSession(object):
             session_ctx (SessionContext): Session context object for creating
                 a session user and database with custom properties.
 
-            isolate_db (bool): Flag to enable creation of an isolated database
+            isolate_db (bool): Flag to enable creation of an isolated
+                database, same as isolation='database'
+
+            isolation (str): None, 'database' or 'transaction', see above
+
+            register (bool): Record the session user and database in the
+                session registry, so that db.reaper can drop them if this
+                process dies before closing the session
 
         Raises:
             ValueError if invalid connection parameters are supplied
         """
 
         validate_conn_params(base_conn_params)
-        self._base_conn_params = base_conn_params
+        # Sessions create their user and database on the primary of a
+        # replicated topology, replicas receive them through replication
+        self._base_conn_params = primary_conn_params(base_conn_params)
 
         self._base_conn_settings = DEFAULT_DB_SETTINGS.copy()
         self.conn_settings = conn_settings or DEFAULT_DB_SETTINGS.copy()
@@ -173,7 +270,20 @@ class DbSession(object):
                         session_ctx, SessionContext))
             self.session_ctx = session_ctx
 
-        self.isolate_db = isolate_db
+        if isolation not in _ISOLATION_MODES:
+            raise ValueError("isolation must be one of {}".format(
+                _ISOLATION_MODES))
+        if isolate_db and isolation is ISOLATION_NONE:
+            isolation = ISOLATION_DATABASE
+        self.isolation = isolation
+        self.isolate_db = isolation is not ISOLATION_NONE
+
+        if isolation == ISOLATION_TRANSACTION:
+            self.conn_settings = dict(self.conn_settings, autocommit=False)
+        self._scopes = []
+        self.register = register
+        self._registered = None
+        self._metadata = MetadataCache(lambda: self.session_db.cursor())
 
         self._session_conn_params = {
             'host': self._base_conn_params['host'],
@@ -231,7 +341,9 @@ class DbSession(object):
         """
 
         if not self._created_resources:
+            start = instrumentation.start()
             session_username = self.session_ctx.username
+            self._register_session()
             # Create the session user
             if session_username != self._base_conn_params['user']:
                 log_str = "Creating user: {}".format(session_username)
@@ -255,6 +367,47 @@ class DbSession(object):
             # Close base_db conn as it is not needed until final cleanup later
             # in which it will auto-open it anyway if closed
             self._close_conn_attempt(self.base_db)
+            instrumentation.emit(instrumentation.EVENT_SESSION_SETUP,
+                                 start, detail=self.dbname)
+
+    def _register_session(self):
+        """
+        Record the user and database about to be created in the session
+        registry. Failing to register is not fatal, the session then just
+        cannot be reaped.
+        """
+
+        username = dbname = ''
+        if self.session_ctx.username != self._base_conn_params['user']:
+            username = self.session_ctx.username
+        if (self.isolate_db and
+                (self.dbname != self._base_conn_params['dbname'])):
+            dbname = self.dbname
+        if not self.register or not (username or dbname):
+            return
+
+        import mysql.connector
+
+        try:
+            with self.base_db.cursor() as cursor:
+                reaper.register_session(cursor, self._base_conn_params,
+                                        username, dbname)
+            self._registered = (username, dbname)
+        except (Error, mysql.connector.Error) as e:
+            log.warning("Failed to register session: {}".format(e))
+
+    def _unregister_session(self):
+        if self._registered is None:
+            return
+
+        import mysql.connector
+
+        try:
+            with self.base_db.cursor() as cursor:
+                reaper.unregister_session(cursor, *self._registered)
+            self._registered = None
+        except (Error, mysql.connector.Error) as e:
+            log.warning("Failed to unregister session: {}".format(e))
 
     def _set_session_search_path(self, db):
         """
@@ -281,6 +434,8 @@ class DbSession(object):
         user and database.
         """
 
+        start = instrumentation.start()
+
         # Drop the session database
         database_name = self.session_ctx.dbname
 
@@ -311,7 +466,10 @@ class DbSession(object):
             _try_execute(self.session_ctx.drop_user_sql,
                          self.base_db.cursor(), log_str)
 
+        self._unregister_session()
         self._created_resources = False
+        instrumentation.emit(instrumentation.EVENT_SESSION_TEARDOWN,
+                             start, detail=self.dbname)
 
     @property
     def session_db(self):
@@ -357,9 +515,273 @@ class DbSession(object):
         with the intent being to isolate sessions from each other.
 
         Returns:
-            cursor (mariadb.cursor): Cursor object for the db connection
+            cursor (SessionCursor): Cursor object for the db connection
+        """
+        return self._session_cursor
+
+    def _session_cursor(self, raw=False):
+        return SessionCursor(self.session_db.cursor(raw=raw),
+                             self._on_statement)
+
+    def _on_statement(self, sql):
+        """
+        Called by session cursors before every statement: invalidates cached
+        metadata on schema changes and records what the open scopes need to
+        know to restore the database when they end.
+        """
+
+        self._metadata.on_statement(sql)
+        if not self._scopes:
+            return
+
+        kind, table = classify_session_statement(sql)
+        if table is not None:
+            database, name = table
+            if database not in (None, self.dbname):
+                table = None
+            else:
+                table = name
+
+        if kind == STATEMENT_WRITE:
+            if table:
+                self._scopes[-1].written.add(table)
+        elif kind == STATEMENT_COMMIT:
+            log.debug("Implicit commit by ({}), scopes fall back to table "
+                      "cleanup".format(sql))
+            if table:
+                self._scopes[-1].created.add(table)
+            for scope in self._scopes:
+                scope.committed = True
+                scope.savepoint_lost = True
+        elif kind == STATEMENT_ROLLBACK:
+            for scope in self._scopes:
+                scope.savepoint_lost = True
+
+    def begin_scope(self):
+        """
+        Start a transaction scope: the outermost scope starts a transaction,
+        nested scopes set a savepoint.
+        """
+
+        if self.isolation != ISOLATION_TRANSACTION:
+            raise ValueError("Scopes require isolation='transaction'")
+
+        savepoint = None
+        with self.session_db.cursor() as cursor:
+            if not self._scopes:
+                cursor.execute("START TRANSACTION")
+            else:
+                # Also valid after an implicit commit: with autocommit off
+                # the next transaction is already open
+                savepoint = 'mdb_scope_{}'.format(len(self._scopes))
+                cursor.execute("SAVEPOINT {}".format(savepoint))
+        self._scopes.append(TransactionScope(savepoint))
+
+    def end_scope(self):
+        """
+        End the innermost scope, undoing what was done in it.
+        """
+
+        scope = self._scopes.pop()
+        session_db = self.session_db
+
+        if not scope.savepoint_lost:
+            with session_db.cursor() as cursor:
+                if scope.savepoint:
+                    cursor.execute(
+                        "ROLLBACK TO SAVEPOINT {}".format(scope.savepoint))
+                else:
+                    cursor.execute("ROLLBACK")
+        else:
+            session_db.rollback()
+
+        if scope.committed:
+            self._cleanup_tables(scope)
+            # Enclosing scopes must clean up what this one left behind
+            if self._scopes:
+                self._scopes[-1].written.update(scope.written)
+
+    def _cleanup_tables(self, scope):
         """
-        return self.session_db.cursor
+        Table level fallback for a scope whose transaction was committed.
+        """
+
+        dropped = sorted(scope.created)
+        truncated = sorted(scope.written - scope.created)
+        log.warning("Scope committed implicitly, dropping tables {} and "
+                    "truncating tables {}".format(dropped, truncated))
+
+        self._metadata.invalidate()
+        with self.session_db.cursor() as cursor:
+            cursor.execute("SET FOREIGN_KEY_CHECKS = 0")
+            if dropped:
+                cursor.execute("DROP TABLE IF EXISTS {}".format(
+                    ', '.join('`{}`'.format(t) for t in dropped)))
+            for table in truncated:
+                cursor.execute("TRUNCATE TABLE `{}`".format(table))
+            cursor.execute("SET FOREIGN_KEY_CHECKS = 1")
+
+    @contextlib.contextmanager
+    def scope(self):
+        """
+        Context manager around begin_scope() and end_scope(): the work done
+        in the with block is rolled back when it exits.
+        """
+
+        self.begin_scope()
+        try:
+            yield self
+        finally:
+            self.end_scope()
+
+    def table_checksum(self, table, chunk_size=DEFAULT_CHUNK_SIZE):
+        """
+        Chunked, order independent checksum of a table in the session
+        database, computed on the server. See db.checksum for details.
+
+        Args:
+            table (str): table name
+            chunk_size (int): rows per chunk
+
+        Returns:
+            checksum (TableChecksum): per-chunk checksums
+
+        Raises:
+            ValueError if chunk_size is below 1
+        """
+
+        validate_chunk_size(chunk_size)
+        with self.cursor() as cursor:
+            return table_checksum(cursor, table, chunk_size)
+
+    def compare_table(self, other, table, chunk_size=DEFAULT_CHUNK_SIZE):
+        """
+        Compare a table with its copy in another session or engine by chunk
+        checksums, fetching rows only for mismatching chunks.
+
+        Args:
+            other (DbSession or MariaDB): holder of the other copy
+            table (str): table name
+            chunk_size (int): rows per chunk
+
+        Returns:
+            diffs (list): list of ChunkDiff, empty if the tables match
+
+        Raises:
+            ValueError if chunk_size is below 1
+        """
+
+        return compare_table_checksums(self, other, table, chunk_size)
+
+    def table_info(self, name, database=None):
+        """
+        Metadata of a table: columns, types, indexes and row estimate. The
+        metadata of all tables of a database is read with one query and
+        cached until a statement run through the session changes a schema.
+        Call invalidate_metadata() after schema changes made through other
+        connections.
+
+        Args:
+            name (str): table name
+            database (str): database name, the session database by default
+
+        Returns:
+            info (TableInfo): table metadata, None if there is no such table
+        """
+
+        return self._metadata.table_info(database or self.dbname, name)
+
+    def invalidate_metadata(self):
+        """
+        Drop the cached table metadata.
+        """
+
+        self._metadata.invalidate()
+
+    def query_columns(self, sql, params=None, batch_size=None):
+        """
+        Run a query and fetch its result into typed NumPy arrays, one per
+        column, instead of row tuples. See db.columnar for details.
+
+        Args:
+            sql (str): query
+            params (tuple): query parameters
+            batch_size (int): rows fetched and decoded at a time,
+                columnar.DEFAULT_BATCH_SIZE by default
+
+        Returns:
+            result (ColumnarResult): the query result
+        """
+
+        # numpy is only needed by sessions fetching columns
+        from . import columnar
+
+        with self.cursor(raw=True) as cursor:
+            cursor.execute(sql, params)
+            return columnar.fetch_columnar(
+                cursor, batch_size or columnar.DEFAULT_BATCH_SIZE)
+
+    def reset(self):
+        """
+        Return the session to a clean state without recreating its user and
+        database: roll back any open transaction, drop every table, view and
+        routine of the session database and reset the session connection's
+        variables. Much cheaper than a new session, which is what lets
+        test fixtures reuse one session per worker.
+
+        Raises:
+            ValueError if the session does not own an isolated database
+        """
+
+        if not self.isolate_db or \
+                self.dbname == self._base_conn_params['dbname']:
+            raise ValueError(
+                "Only sessions with an isolated database can be reset"
+            )
+        if not self._created_resources:
+            return
+
+        start = instrumentation.start()
+        session_db = self.session_db
+        session_db.rollback()
+        self._scopes = []
+        self._metadata.invalidate()
+        with session_db.cursor() as cursor:
+            cursor.execute(
+                "SELECT TABLE_NAME, TABLE_TYPE FROM information_schema.TABLES "
+                "WHERE TABLE_SCHEMA = %s", (self.dbname,)
+            )
+            objects = cursor.fetchall()
+            views = [name for name, kind in objects if kind == 'VIEW']
+            tables = [name for name, kind in objects if kind != 'VIEW']
+
+            cursor.execute(
+                "SELECT ROUTINE_NAME, ROUTINE_TYPE "
+                "FROM information_schema.ROUTINES WHERE ROUTINE_SCHEMA = %s",
+                (self.dbname,)
+            )
+            routines = cursor.fetchall()
+
+            cursor.execute("SET FOREIGN_KEY_CHECKS = 0")
+            if views:
+                cursor.execute("DROP VIEW IF EXISTS {}".format(
+                    ', '.join('`{}`'.format(v) for v in views)))
+            if tables:
+                cursor.execute("DROP TABLE IF EXISTS {}".format(
+                    ', '.join('`{}`'.format(t) for t in tables)))
+            for name, kind in routines:
+                cursor.execute("DROP {} IF EXISTS `{}`".format(kind, name))
+
+        log.debug("Reset session database {}: dropped {} tables, {} views, "
+                  "{} routines".format(self.dbname, len(tables), len(views),
+                                       len(routines)))
+
+        # Clears session variables, temporary tables and user locks
+        session_db.connection.reset_session()
+        session_db._set_autocommit(session_db.autocommit)
+        instrumentation.emit(instrumentation.EVENT_SESSION_RESET, start,
+                             rows=len(tables) + len(views) + len(routines),
+                             detail=self.dbname)
 
     def _close_conn_attempt(self, db):
         """
@@ -0,0 +1,145 @@
+import logging
+import re
+
+log = logging.getLogger(__name__)
+
+# Statements after which MariaDB commits the open transaction, destroying
+# its savepoints. CREATE/DROP TEMPORARY TABLE are the exception.
+_IMPLICIT_COMMIT_RE = re.compile(
+    r'(ALTER|CREATE|DROP|RENAME|TRUNCATE|GRANT|REVOKE|LOCK|UNLOCK|BEGIN|'
+    r'START\s+TRANSACTION|COMMIT|ANALYZE|CHECK|OPTIMIZE|REPAIR|FLUSH|'
+    r'INSTALL|UNINSTALL|CACHE\s+INDEX|LOAD\s+INDEX|SET\s+PASSWORD)\b',
+    re.I
+)
+_TEMPORARY_RE = re.compile(r'(CREATE|DROP)\s+TEMPORARY\b', re.I)
+
+# ROLLBACK of the whole transaction, not to a savepoint
+_ROLLBACK_RE = re.compile(r'ROLLBACK(\s+WORK)?\s*(;|$)', re.I)
+
+_LEADING_NOISE_RE = re.compile(
+    r'^(\s+|--[^\n]*\n?|#[^\n]*\n?|/\*.*?\*/|\()*', re.S
+)
+
+_NAME = r'((?:`[^`]+`|\w+)(?:\s*\.\s*(?:`[^`]+`|\w+))?)'
+_WRITTEN_TABLE_RES = (
+    re.compile(
+        r'(?:INSERT|REPLACE)\s+(?:(?:LOW_PRIORITY|DELAYED|HIGH_PRIORITY|'
+        r'IGNORE)\s+)*(?:INTO\s+)?' + _NAME, re.I
+    ),
+    re.compile(r'UPDATE\s+(?:(?:LOW_PRIORITY|IGNORE)\s+)*' + _NAME, re.I),
+    re.compile(
+        r'DELETE\s+(?:(?:LOW_PRIORITY|QUICK|IGNORE)\s+)*FROM\s+' + _NAME,
+        re.I
+    ),
+    re.compile(r'LOAD\s+DATA\s.*?\sINTO\s+TABLE\s+' + _NAME, re.I | re.S),
+)
+_CREATED_TABLE_RE = re.compile(
+    r'CREATE\s+(?:OR\s+REPLACE\s+)?TABLE\s+(?:IF\s+NOT\s+EXISTS\s+)?' + _NAME,
+    re.I
+)
+
+STATEMENT_QUERY = 'query'
+STATEMENT_WRITE = 'write'
+STATEMENT_COMMIT = 'commit'
+STATEMENT_ROLLBACK = 'rollback'
+
+
+def _statement_body(sql):
+    return sql[_LEADING_NOISE_RE.match(sql).end():]
+
+
+def _table_name(match):
+    """
+    Returns:
+        tuple of (database or None, table) of a matched table name
+    """
+    parts = [p.strip().strip('`') for p in match.group(1).split('.')]
+    return (None, parts[0]) if len(parts) == 1 else (parts[0], parts[1])
+
+
+def classify_session_statement(sql):
+    """
+    Classify a statement by its effect on an open transaction.
+
+    Args:
+        sql (str): SQL statement
+
+    Returns:
+        tuple of (kind, table): kind is one of STATEMENT_QUERY,
+        STATEMENT_WRITE (DML, table is the written table), STATEMENT_COMMIT
+        (implicitly commits, table is the created table if any) or
+        STATEMENT_ROLLBACK. table is a (database or None, name) tuple.
+    """
+
+    body = _statement_body(sql)
+    if _IMPLICIT_COMMIT_RE.match(body) and not _TEMPORARY_RE.match(body):
+        created = _CREATED_TABLE_RE.match(body)
+        return STATEMENT_COMMIT, _table_name(created) if created else None
+
+    if _ROLLBACK_RE.match(body):
+        return STATEMENT_ROLLBACK, None
+
+    for regex in _WRITTEN_TABLE_RES:
+        match = regex.match(body)
+        if match:
+            return STATEMENT_WRITE, _table_name(match)
+
+    return STATEMENT_QUERY, None
+
+
+class TransactionScope(object):
+    """
+    One level of transaction isolation: the whole transaction for the
+    outermost scope, a savepoint for nested ones. Tracks what is needed to
+    clean up when an implicit commit makes rolling back impossible.
+    """
+
+    def __init__(self, savepoint=None):
+        self.savepoint = savepoint
+        # Tables written or created while the scope was open
+        self.written = set()
+        self.created = set()
+        # The transaction was committed (implicitly) while the scope was
+        # open, rollback alone no longer restores its state
+        self.committed = False
+        # The savepoint no longer exists
+        self.savepoint_lost = False
+
+
+class SessionCursor(object):
+    """
+    Cursor wrapper reporting every statement to its DbSession before it is
+    run. The session uses it to notice schema changes and statements that
+    break transaction isolation. Everything else is delegated to the driver
+    cursor.
+    """
+
+    def __init__(self, cursor, on_statement):
+        """
+        Args:
+            cursor (mariadb Cursor): driver cursor
+            on_statement (callable): called with the SQL text of every
+                statement before it is executed
+        """
+        self._cursor = cursor
+        self._on_statement = on_statement
+
+    def execute(self, operation, params=None, *args, **kwargs):
+        self._on_statement(operation)
+        return self._cursor.execute(operation, params, *args, **kwargs)
+
+    def executemany(self, operation, seq_params):
+        self._on_statement(operation)
+        return self._cursor.executemany(operation, seq_params)
+
+    def __getattr__(self, name):
+        return getattr(self._cursor, name)
+
+    def __iter__(self):
+        return iter(self._cursor)
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, exc_type, exc_val, exc_tb):
+        self._cursor.close()
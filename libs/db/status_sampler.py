@@ -0,0 +1,486 @@
+import array
+import collections
+import logging
+import math
+import re
+import threading
+import time
+
+log = logging.getLogger(__name__)
+
+DEFAULT_STATUS_INTERVAL = 1.0
+
+# SHOW ENGINE INNODB STATUS is large and takes a global mutex, so it is only
+# read every that many samples
+DEFAULT_INNODB_STATUS_EVERY = 5
+
+# Cumulative SHOW GLOBAL STATUS counters, reported as per-second rates
+STATUS_COUNTERS = (
+    'Uptime',
+    'Questions',
+    'Com_select',
+    'Com_insert',
+    'Com_update',
+    'Com_delete',
+    'Com_commit',
+    'Com_rollback',
+    'Handler_read_first',
+    'Handler_read_key',
+    'Handler_read_next',
+    'Handler_read_prev',
+    'Handler_read_rnd',
+    'Handler_read_rnd_next',
+    'Innodb_rows_read',
+    'Innodb_rows_inserted',
+    'Innodb_rows_updated',
+    'Innodb_rows_deleted',
+    'Innodb_buffer_pool_read_requests',
+    'Innodb_buffer_pool_reads',
+    'Innodb_row_lock_waits',
+    'Innodb_row_lock_time',
+    'Innodb_deadlocks',
+    'Innodb_data_reads',
+    'Innodb_data_writes',
+    'Innodb_os_log_written',
+    'Bytes_received',
+    'Bytes_sent',
+    'Created_tmp_disk_tables',
+    'Slow_queries',
+    'Table_locks_waited',
+)
+
+# SHOW GLOBAL STATUS values reported as they are
+STATUS_GAUGES = (
+    'Threads_running',
+    'Threads_connected',
+    'Innodb_buffer_pool_pages_dirty',
+    'Innodb_buffer_pool_pages_free',
+)
+
+# Values parsed out of SHOW ENGINE INNODB STATUS
+INNODB_STATUS_GAUGES = (
+    'history_list_length',
+    'checkpoint_age',
+)
+
+# Extra single value query sampled alongside the status. counter is True
+# for cumulative values reported as per-second rates.
+SampledQuery = collections.namedtuple(
+    'SampledQuery', ['name', 'sql', 'counter']
+)
+
+DEFAULT_QUERIES = (
+    SampledQuery(
+        'active_trx',
+        "SELECT COUNT(*) FROM information_schema.INNODB_TRX",
+        False,
+    ),
+    SampledQuery(
+        'lock_wait_trx',
+        "SELECT COUNT(*) FROM information_schema.INNODB_TRX "
+        "WHERE trx_state = 'LOCK WAIT'",
+        False,
+    ),
+    SampledQuery(
+        'oldest_trx_age',
+        "SELECT COALESCE(MAX(TIMESTAMPDIFF(SECOND, trx_started, NOW())), 0) "
+        "FROM information_schema.INNODB_TRX",
+        False,
+    ),
+    SampledQuery(
+        'statement_wait_ms',
+        "SELECT COALESCE(SUM(SUM_TIMER_WAIT), 0) / 1000000000 "
+        "FROM performance_schema.events_statements_summary_global_by_event_type",
+        True,
+    ),
+)
+
+_HISTORY_LIST_RE = re.compile(r'History list length\s+(\d+)')
+_LSN_RE = re.compile(r'Log sequence number\s+(\d+)')
+_CHECKPOINT_RE = re.compile(r'Last checkpoint at\s+(\d+)')
+
+_NAN = float('nan')
+
+
+def parse_innodb_status(text):
+    """
+    Args:
+        text (str): Status column of SHOW ENGINE INNODB STATUS
+
+    Returns:
+        dictionary of INNODB_STATUS_GAUGES, missing values are NaN
+    """
+
+    history = _HISTORY_LIST_RE.search(text)
+    lsn = _LSN_RE.search(text)
+    checkpoint = _CHECKPOINT_RE.search(text)
+    return {
+        'history_list_length':
+            float(history.group(1)) if history else _NAN,
+        'checkpoint_age':
+            float(int(lsn.group(1)) - int(checkpoint.group(1)))
+            if lsn and checkpoint else _NAN,
+    }
+
+
+def _ratio(numerator, denominator):
+    return numerator / denominator if denominator else _NAN
+
+
+class StatusSeries(object):
+    """
+    Raw server status samples and the rates derived from them.
+
+    Every sample is one row of counter and gauge values appended to a flat
+    array('d'); deltas between consecutive rows are computed column-wise
+    when rates are requested, so sampling itself does no arithmetic.
+    """
+
+    def __init__(self, queries=DEFAULT_QUERIES):
+        """
+        Args:
+            queries (tuple): SampledQuery sampled alongside the status
+        """
+        self.columns = (
+            list(STATUS_COUNTERS) + list(STATUS_GAUGES) +
+            list(INNODB_STATUS_GAUGES) + [q.name for q in queries]
+        )
+        self._counter = array.array('b', (
+            [1] * len(STATUS_COUNTERS) +
+            [0] * (len(STATUS_GAUGES) + len(INNODB_STATUS_GAUGES)) +
+            [1 if q.counter else 0 for q in queries]
+        ))
+        self._index = {name: idx for idx, name in enumerate(self.columns)}
+        self._times = array.array('d')
+        self._data = array.array('d')
+
+    def __len__(self):
+        return len(self._times)
+
+    def append(self, timestamp, values):
+        """
+        Args:
+            timestamp (float): monotonic time of the sample
+            values (dict): column name to value, missing columns are NaN
+        """
+        self._times.append(timestamp)
+        self._data.extend(
+            float(values.get(name, _NAN)) for name in self.columns
+        )
+
+    def _row(self, idx):
+        width = len(self.columns)
+        return self._data[idx * width:(idx + 1) * width]
+
+    def rates(self):
+        """
+        Per interval values between consecutive samples. Intervals across
+        a server restart (Uptime going back) are NaN.
+
+        Returns:
+            OrderedDict of name to array('d'): 'time' (end of the interval,
+            relative to the first sample), the derived rates (qps, tps,
+            rows_read, rows_changed, handler_reads, bp_hit_ratio,
+            lock_waits, lock_wait_ms, deadlocks, tmp_disk_tables,
+            slow_queries), every gauge, and per-second rates of counter
+            queries
+        """
+
+        col = self._index
+        gauges = [
+            name for name in self.columns[len(STATUS_COUNTERS):]
+            if not self._counter[col[name]]
+        ]
+        query_counters = [
+            name for name in self.columns[len(STATUS_COUNTERS):]
+            if self._counter[col[name]]
+        ]
+        names = [
+            'time', 'qps', 'tps', 'rows_read', 'rows_changed',
+            'handler_reads', 'bp_hit_ratio', 'lock_waits', 'lock_wait_ms',
+            'deadlocks', 'tmp_disk_tables', 'slow_queries',
+        ] + gauges + query_counters
+        result = collections.OrderedDict(
+            (name, array.array('d')) for name in names
+        )
+        if len(self) < 2:
+            return result
+
+        handler_cols = [
+            col[name] for name in STATUS_COUNTERS
+            if name.startswith('Handler_read_')
+        ]
+        start = self._times[0]
+        prev = self._row(0)
+        for idx in range(1, len(self)):
+            cur = self._row(idx)
+            elapsed = self._times[idx] - self._times[idx - 1]
+            delta = array.array(
+                'd', (c - p if counter else c
+                      for c, p, counter in zip(cur, prev, self._counter))
+            )
+            prev = cur
+            if elapsed <= 0 or delta[col['Uptime']] < 0:
+                delta = array.array('d', [_NAN] * len(delta))
+                elapsed = _NAN
+
+            def per_sec(*names):
+                return sum(delta[col[n]] for n in names) / elapsed
+
+            values = {
+                'time': self._times[idx] - start,
+                'qps': per_sec('Questions'),
+                'tps': per_sec('Com_commit', 'Com_rollback'),
+                'rows_read': per_sec('Innodb_rows_read'),
+                'rows_changed': per_sec(
+                    'Innodb_rows_inserted', 'Innodb_rows_updated',
+                    'Innodb_rows_deleted'
+                ),
+                'handler_reads': sum(delta[c] for c in handler_cols) /
+                elapsed,
+                'bp_hit_ratio': 1.0 - _ratio(
+                    delta[col['Innodb_buffer_pool_reads']],
+                    delta[col['Innodb_buffer_pool_read_requests']]
+                ),
+                'lock_waits': per_sec('Innodb_row_lock_waits'),
+                'lock_wait_ms': _ratio(
+                    delta[col['Innodb_row_lock_time']],
+                    delta[col['Innodb_row_lock_waits']]
+                ),
+                'deadlocks': per_sec('Innodb_deadlocks'),
+                'tmp_disk_tables': per_sec('Created_tmp_disk_tables'),
+                'slow_queries': per_sec('Slow_queries'),
+            }
+            for name in gauges:
+                values[name] = cur[col[name]]
+            for name in query_counters:
+                values[name] = per_sec(name)
+
+            for name, series in result.items():
+                series.append(values[name])
+
+        return result
+
+    def summary(self):
+        """
+        Returns:
+            OrderedDict of rate name to dictionary of mean, min, max and
+            last value, NaN intervals ignored
+        """
+
+        summary = collections.OrderedDict()
+        for name, series in self.rates().items():
+            if name == 'time':
+                continue
+            values = [v for v in series if not math.isnan(v)]
+            if not values:
+                continue
+            summary[name] = {
+                'mean': sum(values) / len(values),
+                'min': min(values),
+                'max': max(values),
+                'last': values[-1],
+            }
+        return summary
+
+
+class ServerStatusSampler(object):
+    """
+    Background sampler of MariaDB server counters.
+
+    A thread polls SHOW GLOBAL STATUS, SHOW ENGINE INNODB STATUS and a few
+    information_schema / performance_schema queries every interval, on a
+    dedicated connection cloned from db_instance so the sampled workload
+    is not disturbed. Rates (QPS, row reads, buffer pool hit ratio, lock
+    waits, ...) are derived from the deltas when asked for.
+
+    A sampled query that fails (missing privilege, performance_schema
+    disabled) is dropped after the first failure.
+
+    Example usage:
+
+        with ServerStatusSampler(db_instance, interval=1) as sampler:
+            sb.start()
+        log.info(sampler.report())
+        report['server_status'] = sampler.as_dict()
+    """
+
+    def __init__(self, db_instance, interval=DEFAULT_STATUS_INTERVAL,
+                 innodb_status_every=DEFAULT_INNODB_STATUS_EVERY,
+                 queries=DEFAULT_QUERIES):
+        """
+        Args:
+            db_instance (MariaDB): instance whose server is sampled, it is
+                cloned and not used itself
+            interval (float): seconds between samples
+            innodb_status_every (int): read SHOW ENGINE INNODB STATUS every
+                that many samples, 0 never
+            queries (tuple): SampledQuery sampled alongside the status
+        """
+
+        self._db = db_instance.clone()
+        self._interval = interval
+        self._innodb_status_every = innodb_status_every
+        self._queries = list(queries)
+        self._innodb = dict.fromkeys(INNODB_STATUS_GAUGES, _NAN)
+        self._samples_taken = 0
+        self._stop_event = threading.Event()
+        self._thread = None
+        self._lock = threading.Lock()
+        self.series = StatusSeries(queries)
+        self.errors = 0
+
+    @property
+    def interval(self):
+        return self._interval
+
+    def _read_status(self, cursor):
+        cursor.execute('SHOW GLOBAL STATUS')
+        status = {}
+        for name, value in cursor.fetchall():
+            if isinstance(value, (bytes, bytearray)):
+                value = value.decode()
+            try:
+                status[name] = float(value)
+            except (TypeError, ValueError):
+                continue
+        return status
+
+    def _read_innodb_status(self, cursor):
+        cursor.execute('SHOW ENGINE INNODB STATUS')
+        row = cursor.fetchone()
+        text = row[2] if row else ''
+        if isinstance(text, (bytes, bytearray)):
+            text = text.decode()
+        return parse_innodb_status(text)
+
+    def _read_queries(self, cursor):
+        values = {}
+        for query in list(self._queries):
+            try:
+                cursor.execute(query.sql)
+                row = cursor.fetchone()
+                values[query.name] = float(row[0]) if row else _NAN
+            except Exception as exp:
+                log.warning(
+                    "Not sampling {} any more: {}".format(query.name, exp)
+                )
+                self._queries.remove(query)
+        return values
+
+    def sample(self):
+        """
+        Take one sample now.
+        """
+
+        if self._db.connection is None:
+            self._db.connect()
+            self._db.autocommit = True
+
+        timestamp = time.monotonic()
+        cursor = self._db.connection.cursor()
+        try:
+            values = self._read_status(cursor)
+            if self._innodb_status_every and \
+                    self._samples_taken % self._innodb_status_every == 0:
+                self._innodb = self._read_innodb_status(cursor)
+            values.update(self._innodb)
+            values.update(self._read_queries(cursor))
+        finally:
+            cursor.close()
+
+        with self._lock:
+            self.series.append(timestamp, values)
+        self._samples_taken += 1
+
+    def _run(self):
+        next_sample = time.monotonic()
+        while not self._stop_event.is_set():
+            try:
+                self.sample()
+            except Exception as exp:
+                self.errors += 1
+                log.warning("Server status sample failed: {}".format(exp))
+                # Reconnect on the next sample
+                self._db.close()
+
+            next_sample += self._interval
+            self._stop_event.wait(max(0, next_sample - time.monotonic()))
+
+    def start(self):
+        self._stop_event.clear()
+        self._thread = threading.Thread(
+            target=self._run, name='status-sampler', daemon=True
+        )
+        self._thread.start()
+        log.info(
+            "Sampling server status of {} every {}s".format(
+                self._db.conn_params['host'], self._interval
+            )
+        )
+
+    def stop(self):
+        """
+        Stop sampling, taking a last sample so that the whole run is
+        covered.
+        """
+
+        if self._thread is None:
+            return
+        self._stop_event.set()
+        self._thread.join()
+        self._thread = None
+        try:
+            self.sample()
+        except Exception as exp:
+            log.warning("Server status sample failed: {}".format(exp))
+        self._db.close()
+
+    def __enter__(self):
+        self.start()
+        return self
+
+    def __exit__(self, exc_type, exc_val, exc_tb):
+        self.stop()
+
+    def rates(self):
+        with self._lock:
+            return self.series.rates()
+
+    def summary(self):
+        with self._lock:
+            return self.series.summary()
+
+    def as_dict(self):
+        """
+        Returns:
+            JSON serializable dictionary with the interval, the summary and
+            every rate series, NaN replaced by None, to attach to a run
+            report
+        """
+
+        return {
+            'interval': self._interval,
+            'summary': self.summary(),
+            'series': {
+                name: [None if math.isnan(v) else v for v in values]
+                for name, values in self.rates().items()
+            },
+        }
+
+    def report(self):
+        """
+        Returns:
+            one line per rate with its mean, min and max
+        """
+
+        lines = ["Server status of {}, {} samples".format(
+            self._db.conn_params['host'], len(self.series)
+        )]
+        for name, stats in self.summary().items():
+            lines.append(
+                "  {:<20} mean {:>12.2f}  min {:>12.2f}  max {:>12.2f}".format(
+                    name, stats['mean'], stats['min'], stats['max']
+                )
+            )
+        return '\n'.join(lines)
@@ -0,0 +1,561 @@
+import collections
+import contextlib
+import logging
+import random
+import re
+import threading
+import time
+
+from .db_exception import InterfaceError
+from .db_exception import OperationalError
+from .helper import DEFAULT_DB_SETTINGS
+from .helper import ROLE_PRIMARY
+from .helper import ROLE_REPLICA
+from .helper import endpoint_conn_params
+from .helper import validate_conn_params
+from .mariadb import MariaDB
+from .session_cursor import STATEMENT_QUERY
+from .session_cursor import classify_session_statement
+from .session_cursor import _statement_body
+
+log = logging.getLogger(__name__)
+
+# Replica balancing: fewest connections in use, or weighted by the inverse
+# of the replica's recent latency
+BALANCE_LEAST_CONNECTIONS = 'least_connections'
+BALANCE_LATENCY = 'latency'
+_BALANCING_MODES = (BALANCE_LEAST_CONNECTIONS, BALANCE_LATENCY)
+
+# Replicas lagging more seconds behind their primary get no reads
+DEFAULT_MAX_LAG_SEC = 5
+
+# Seconds a replica's lag is trusted before SHOW SLAVE STATUS is run again
+DEFAULT_LAG_CHECK_INTERVAL_SEC = 1.0
+
+# Seconds a failed endpoint is skipped before it is tried again
+DEFAULT_RETRY_DOWN_SEC = 5.0
+
+# Server errors after which a connection is unusable: server gone away,
+# connection lost during the query
+CONNECTION_LOST_ERRNOS = (2006, 2013)
+
+# Weight of the newest sample in an endpoint's latency average
+LATENCY_EWMA_ALPHA = 0.2
+
+_READ_RE = re.compile(r'(SELECT|SHOW|WITH|DESC|DESCRIBE|EXPLAIN)\b', re.I)
+
+# SELECTs that lock rows belong on the primary
+_LOCKING_READ_RE = re.compile(
+    r'.*\b(FOR\s+UPDATE|LOCK\s+IN\s+SHARE\s+MODE|FOR\s+SHARE)\b',
+    re.I | re.S
+)
+
+# Statements changing the state of the session (variables, current
+# database, temporary tables, prepared statements, locks), which later
+# statements of the session may depend on
+_SESSION_STATE_RE = re.compile(
+    r'(SET|USE|CALL|PREPARE|EXECUTE|DEALLOCATE|HANDLER|LOCK\s+TABLES?|'
+    r'(CREATE|DROP)\s+TEMPORARY)\b',
+    re.I
+)
+# Queries assigning user variables or taking named locks
+_SESSION_STATE_QUERY_RE = re.compile(
+    r'.*(@\w+\s*:=|\bGET_LOCK\s*\()', re.I | re.S
+)
+
+# SET autocommit alone, group 1 is the new value. Tracked like BEGIN and
+# COMMIT rather than pinning the session for good.
+_AUTOCOMMIT_RE = re.compile(
+    r'SET\s+(?:(?:SESSION|LOCAL)\s+|@@(?:SESSION\.|LOCAL\.)?)?'
+    r'autocommit\s*:?=\s*(\w+)\s*;?\s*$',
+    re.I
+)
+
+ReplicaStatus = collections.namedtuple(
+    'ReplicaStatus', ['io_running', 'sql_running', 'lag']
+)
+
+
+def is_read_statement(sql):
+    """
+    Args:
+        sql (str): SQL statement
+
+    Returns:
+        True if sql can run on a replica: a query that neither writes nor
+        locks rows
+    """
+
+    if is_write_statement(sql) or is_session_state_statement(sql):
+        return False
+    body = _statement_body(sql)
+    return bool(_READ_RE.match(body)) and not _LOCKING_READ_RE.match(body)
+
+
+def is_write_statement(sql):
+    """
+    Returns:
+        True if sql changes data or schema (or ends a transaction), after
+        which replicas lag behind what the session wrote
+    """
+
+    kind, _ = classify_session_statement(sql)
+    return kind != STATEMENT_QUERY
+
+
+def is_session_state_statement(sql):
+    """
+    Returns:
+        True if sql may change session state, e.g. SET @x, USE db, CREATE
+        TEMPORARY TABLE, CALL p(), after which the session must stay on
+        one connection
+    """
+
+    body = _statement_body(sql)
+    return bool(_SESSION_STATE_RE.match(body) or
+                _SESSION_STATE_QUERY_RE.match(body))
+
+
+def _connection_lost(error):
+    """
+    Returns:
+        True if error broke the connection, False for errors of the
+        statement (duplicate key, syntax) which leave it usable
+    """
+
+    import mysql.connector
+
+    if isinstance(error, (InterfaceError, mysql.connector.InterfaceError)):
+        return True
+    return getattr(error, 'errno', None) in CONNECTION_LOST_ERRNOS
+
+
+def replica_status(cursor):
+    """
+    Replication state of a server from SHOW SLAVE STATUS.
+
+    Args:
+        cursor (mariadb Cursor): cursor of the server
+
+    Returns:
+        ReplicaStatus, None if the server does not replicate
+    """
+
+    cursor.execute("SHOW SLAVE STATUS")
+    rows = cursor.fetchall()
+    if not rows:
+        return None
+    status = dict(zip([d[0] for d in cursor.description], rows[0]))
+    return ReplicaStatus(
+        status.get('Slave_IO_Running') == 'Yes',
+        status.get('Slave_SQL_Running') == 'Yes',
+        status.get('Seconds_Behind_Master'),
+    )
+
+
+class Endpoint(object):
+    """
+    One server of a topology and what the provider knows about it.
+    """
+
+    def __init__(self, conn_params, role):
+        self.conn_params = conn_params
+        self.role = role
+        # Connections handed out and not yet released
+        self.active = 0
+        # Average statement latency in seconds, None until measured
+        self.latency = None
+        self.lag = None
+        self.lag_checked = None
+        self.down_until = 0.0
+        self._idle = []
+
+    @property
+    def name(self):
+        return '{}:{}'.format(self.conn_params['host'],
+                              self.conn_params['port'])
+
+    def is_up(self, now):
+        return now >= self.down_until
+
+    def record_latency(self, elapsed):
+        if self.latency is None:
+            self.latency = elapsed
+        else:
+            self.latency += LATENCY_EWMA_ALPHA * (elapsed - self.latency)
+
+    def __repr__(self):
+        return '<Endpoint {} {}>'.format(self.name, self.role)
+
+
+class TopologyProvider(object):
+    """
+    Connections to a primary and its replicas. Writes go to the primary,
+    reads are balanced over the replicas that are up and not lagging, and
+    fall back to the primary when there are none. Idle connections are
+    kept per endpoint for reuse. Safe to share between threads.
+
+    Example usage:
+
+        topology = TopologyProvider(conn_params)
+        with topology.connection(read_only=True) as db:
+            with db.cursor() as cursor:
+                # run queries on a replica
+
+        with topology.session() as session:
+            session.execute("INSERT INTO t1 VALUES (1)")
+            # Read from the primary: the replicas may not have the row yet
+            session.execute("SELECT * FROM t1")
+    """
+
+    def __init__(self, conn_params, balancing=BALANCE_LEAST_CONNECTIONS,
+                 max_lag=DEFAULT_MAX_LAG_SEC,
+                 lag_check_interval=DEFAULT_LAG_CHECK_INTERVAL_SEC,
+                 retry_down=DEFAULT_RETRY_DOWN_SEC, settings=None):
+        """
+        Args:
+            conn_params (dict): connection parameters with endpoints, see
+                validate_conn_params; single host parameters make a
+                topology of just a primary
+            balancing (str): BALANCE_LEAST_CONNECTIONS or BALANCE_LATENCY
+            max_lag (float): seconds a replica may lag behind and still
+                serve reads
+            lag_check_interval (float): seconds between lag checks of a
+                replica
+            retry_down (float): seconds a failed endpoint is skipped
+            settings (dict): MariaDB connection settings
+
+        Raises:
+            ValueError for invalid connection parameters or balancing
+        """
+
+        validate_conn_params(conn_params)
+        if balancing not in _BALANCING_MODES:
+            raise ValueError("balancing must be one of {}".format(
+                _BALANCING_MODES))
+
+        endpoints = conn_params.get('endpoints') or [
+            {'host': conn_params['host'], 'role': ROLE_PRIMARY}
+        ]
+        self.endpoints = [
+            Endpoint(endpoint_conn_params(conn_params, e), e['role'])
+            for e in endpoints
+        ]
+        self.balancing = balancing
+        self.max_lag = max_lag
+        self.lag_check_interval = lag_check_interval
+        self.retry_down = retry_down
+        self.settings = settings or DEFAULT_DB_SETTINGS.copy()
+        self._lock = threading.Lock()
+        self._random = random.Random()
+
+    @property
+    def primaries(self):
+        return [e for e in self.endpoints if e.role == ROLE_PRIMARY]
+
+    @property
+    def replicas(self):
+        return [e for e in self.endpoints if e.role == ROLE_REPLICA]
+
+    def _candidates(self, read_only):
+        """
+        Returns:
+            endpoints to try in order of preference
+        """
+
+        now = time.monotonic()
+        with self._lock:
+            # With every primary down, trying them beats failing outright
+            primaries = [e for e in self.primaries if e.is_up(now)] or \
+                self.primaries
+            if not read_only:
+                return primaries
+
+            replicas = [e for e in self.replicas if e.is_up(now)]
+            if self.balancing == BALANCE_LEAST_CONNECTIONS:
+                self._random.shuffle(replicas)
+                replicas.sort(key=lambda e: e.active)
+            else:
+                replicas = self._weighted_order(replicas)
+            return replicas + primaries
+
+    def _weighted_order(self, replicas):
+        # Unmeasured replicas get the best weight so that they are sampled
+        measured = [e.latency for e in replicas if e.latency]
+        best = min(measured) if measured else 1.0
+        weights = [1.0 / (e.latency or best) for e in replicas]
+        order = []
+        while replicas:
+            pick = self._random.choices(range(len(replicas)), weights)[0]
+            order.append(replicas.pop(pick))
+            weights.pop(pick)
+        return order
+
+    def _mark_down(self, endpoint, reason):
+        log.warning("Endpoint {} is down for {}s: {}".format(
+            endpoint.name, self.retry_down, reason))
+        with self._lock:
+            endpoint.down_until = time.monotonic() + self.retry_down
+            idle, endpoint._idle = endpoint._idle, []
+        for db in idle:
+            _close_quietly(db)
+
+    def _lag_ok(self, endpoint, db):
+        """
+        Check the replication lag of a replica, at most every
+        lag_check_interval.
+        """
+
+        now = time.monotonic()
+        if endpoint.lag_checked is not None and \
+                now - endpoint.lag_checked < self.lag_check_interval:
+            return endpoint.lag is not None and endpoint.lag <= self.max_lag
+
+        start = time.perf_counter()
+        with db.cursor() as cursor:
+            status = replica_status(cursor)
+        endpoint.record_latency(time.perf_counter() - start)
+
+        if status is None or not status.sql_running or status.lag is None:
+            # Not replicating, what it holds may be arbitrarily old
+            log.warning("Replica {} is not replicating: {}".format(
+                endpoint.name, status))
+            lag = None
+        else:
+            lag = status.lag
+        with self._lock:
+            endpoint.lag = lag
+            endpoint.lag_checked = now
+        return lag is not None and lag <= self.max_lag
+
+    def acquire(self, read_only=False):
+        """
+        Connection to the primary, or to a replica for read_only, with
+        failover to the next candidate when an endpoint is down or lags.
+        Return it with release().
+
+        Args:
+            read_only (bool): the connection only runs reads
+
+        Returns:
+            tuple of (Endpoint, MariaDB)
+
+        Raises:
+            OperationalError if no suitable endpoint is reachable
+        """
+
+        import mysql.connector
+
+        errors = []
+        for endpoint in self._candidates(read_only):
+            with self._lock:
+                db = endpoint._idle.pop() if endpoint._idle else None
+                endpoint.active += 1
+            try:
+                if db is None:
+                    db = MariaDB(endpoint.conn_params, self.settings)
+                    db.connect()
+                if endpoint.role == ROLE_REPLICA and \
+                        not self._lag_ok(endpoint, db):
+                    errors.append('{} lags'.format(endpoint.name))
+                    self._put_back(endpoint, db)
+                    continue
+                return endpoint, db
+            except (mysql.connector.Error, OperationalError) as e:
+                errors.append('{}: {}'.format(endpoint.name, e))
+                with self._lock:
+                    endpoint.active -= 1
+                if db is not None:
+                    _close_quietly(db)
+                self._mark_down(endpoint, e)
+
+        raise OperationalError("No {} endpoint available ({})".format(
+            'readable' if read_only else ROLE_PRIMARY, '; '.join(errors)))
+
+    def _put_back(self, endpoint, db):
+        with self._lock:
+            endpoint.active -= 1
+            endpoint._idle.append(db)
+
+    def release(self, endpoint, db, failed=False):
+        """
+        Return a connection from acquire(). A failed connection is closed
+        instead of being kept for reuse.
+        """
+
+        if failed:
+            with self._lock:
+                endpoint.active -= 1
+            _close_quietly(db)
+        else:
+            self._put_back(endpoint, db)
+
+    @contextlib.contextmanager
+    def connection(self, read_only=False):
+        """
+        Context manager around acquire() and release().
+
+        Yields:
+            MariaDB connection
+        """
+
+        endpoint, db = self.acquire(read_only)
+        failed = False
+        try:
+            yield db
+        except Exception:
+            failed = True
+            raise
+        finally:
+            self.release(endpoint, db, failed)
+
+    def session(self, pin_sec=None):
+        """
+        Returns:
+            RoutedSession of this topology
+        """
+
+        return RoutedSession(self, pin_sec)
+
+    def close(self):
+        """
+        Close the idle connections of every endpoint.
+        """
+
+        for endpoint in self.endpoints:
+            with self._lock:
+                idle, endpoint._idle = endpoint._idle, []
+            for db in idle:
+                _close_quietly(db)
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, exc_type, exc_val, exc_tb):
+        self.close()
+
+
+def _close_quietly(db):
+    try:
+        db.close()
+    except Exception as e:
+        log.debug("Closing connection failed: {}".format(e))
+
+
+class RoutedSession(object):
+    """
+    Statement level routing with read-your-writes consistency: reads run on
+    replicas until the session writes, then on the primary until the
+    replicas may have caught up (pin_sec, max_lag of the topology by
+    default). Writes and transactions use one primary connection held by
+    the session. Once a statement changes session state (SET, USE,
+    temporary tables, ...) every statement runs on that connection.
+    """
+
+    def __init__(self, topology, pin_sec=None):
+        self.topology = topology
+        self.pin_sec = topology.max_lag if pin_sec is None else pin_sec
+        self._primary = None
+        self._pinned_until = 0.0
+        self._in_transaction = False
+        self._autocommit = True
+        self._session_state = False
+
+    @property
+    def pinned(self):
+        return self._in_transaction or not self._autocommit or \
+            self._session_state or time.monotonic() < self._pinned_until
+
+    def _primary_db(self):
+        if self._primary is None:
+            self._primary = self.topology.acquire()
+        return self._primary
+
+    def execute(self, sql, params=None):
+        """
+        Run a statement where it belongs.
+
+        Args:
+            sql (str): SQL statement
+            params (tuple): statement parameters
+
+        Returns:
+            rows of a query, the row count otherwise
+        """
+
+        if is_read_statement(sql) and not self.pinned:
+            endpoint, db = self.topology.acquire(read_only=True)
+            try:
+                result = self._run(db, sql, params, endpoint)
+            except Exception as e:
+                self.topology.release(endpoint, db, _connection_lost(e))
+                raise
+            self.topology.release(endpoint, db)
+            return result
+
+        endpoint, db = self._primary_db()
+        try:
+            result = self._run(db, sql, params, endpoint)
+        except Exception as e:
+            if _connection_lost(e):
+                # The transaction and session state went with the
+                # connection
+                self.topology.release(endpoint, db, failed=True)
+                self._primary = None
+                self._in_transaction = False
+                self._autocommit = True
+            raise
+        self._track_transaction(sql)
+        if is_session_state_statement(sql) and \
+                not _AUTOCOMMIT_RE.match(_statement_body(sql)):
+            self._session_state = True
+        if is_write_statement(sql):
+            self._pinned_until = time.monotonic() + self.pin_sec
+        return result
+
+    def _run(self, db, sql, params, endpoint):
+        start = time.perf_counter()
+        with db.cursor() as cursor:
+            cursor.execute(sql, params)
+            if cursor.description is not None:
+                result = cursor.fetchall()
+            else:
+                result = cursor.rowcount
+        endpoint.record_latency(time.perf_counter() - start)
+        return result
+
+    def _track_transaction(self, sql):
+        body = _statement_body(sql).lstrip().upper()
+        match = _AUTOCOMMIT_RE.match(body)
+        if match:
+            # With autocommit off every statement is part of a transaction
+            self._autocommit = match.group(1) not in ('0', 'OFF', 'FALSE')
+            if self._autocommit:
+                # Enabling autocommit commits the open transaction
+                self._in_transaction = False
+        elif body.startswith(('START TRANSACTION', 'BEGIN')):
+            self._in_transaction = True
+        elif body.startswith(('COMMIT', 'ROLLBACK')) and \
+                not body.startswith('ROLLBACK TO'):
+            self._in_transaction = False
+
+    def close(self):
+        """
+        Return the primary connection to the topology. A connection with
+        changed session state is closed, so that its state does not leak
+        into other sessions.
+        """
+
+        if self._primary is not None:
+            endpoint, db = self._primary
+            self.topology.release(
+                endpoint, db,
+                failed=self._session_state or not self._autocommit
+            )
+            self._primary = None
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, exc_type, exc_val, exc_tb):
+        self.close()
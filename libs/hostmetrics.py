@@ -0,0 +1,504 @@
+import array
+import collections
+import logging
+import re
+import threading
+import time
+
+log = logging.getLogger(__name__)
+
+DEF_SAMPLE_INTERVAL = 1.0
+
+# A host is considered saturated on a resource when it is above the
+# threshold for at least this fraction of the samples
+DEF_SATURATED_FRACTION = 0.5
+
+# Saturation thresholds, percent
+DEF_CPU_THRESHOLD = 90.0
+DEF_IOWAIT_THRESHOLD = 30.0
+DEF_DISK_THRESHOLD = 90.0
+DEF_MEMORY_THRESHOLD = 95.0
+
+ROLE_CLIENT = 'client'
+ROLE_SERVER = 'server'
+
+_MARKER = '@@'
+_SECTIONS = ('uptime', 'stat', 'diskstats', 'net/dev', 'meminfo')
+
+# Runs on the host for the life of the sampler: one snapshot of every file
+# per interval, sections separated by marker lines
+SAMPLE_SCRIPT = (
+    'while :; do '
+    'for f in {sections}; do echo "{marker}$f"; cat /proc/$f; done; '
+    'echo "{marker}end"; sleep {interval}; '
+    'done'
+)
+
+METRICS = (
+    'time',             # seconds since the sampler started
+    'cpu_util',         # percent of CPU time not idle or waiting for I/O
+    'cpu_user',
+    'cpu_system',
+    'cpu_iowait',
+    'cpu_steal',
+    'disk_read_mbps',
+    'disk_write_mbps',
+    'disk_util',        # percent busy of the busiest disk
+    'net_rx_mbps',
+    'net_tx_mbps',
+    'mem_used',         # percent of memory not available
+)
+
+_SECTOR_SIZE = 512
+_MB = 1024.0 * 1024.0
+_VIRTUAL_DISK_RE = re.compile(r'^(loop|ram|zram|sr|fd|dm-)')
+
+# A resource found saturated on a host during a run
+Saturation = collections.namedtuple(
+    'Saturation', ['hostname', 'role', 'resource', 'fraction', 'peak']
+)
+
+
+def parse_cpu(text):
+    """
+    Args:
+        text (str): contents of /proc/stat
+
+    Returns:
+        dictionary of aggregate cpu counters (user, nice, system, idle,
+        iowait, irq, softirq, steal) in clock ticks
+    """
+    names = ('user', 'nice', 'system', 'idle', 'iowait', 'irq', 'softirq',
+             'steal')
+    for line in text.splitlines():
+        if line.startswith('cpu '):
+            values = [int(v) for v in line.split()[1:len(names) + 1]]
+            values += [0] * (len(names) - len(values))
+            return dict(zip(names, values))
+    return dict.fromkeys(names, 0)
+
+
+def _is_partition(name, names):
+    """
+    sda1 of sda, nvme0n1p1 of nvme0n1: counted through the whole disk.
+    """
+    base = name.rstrip('0123456789')
+    if base.endswith('p') and base[:-1] in names:
+        return True
+    return base != name and base in names
+
+
+def parse_diskstats(text):
+    """
+    Args:
+        text (str): contents of /proc/diskstats
+
+    Returns:
+        dictionary of whole physical disk name to (sectors_read,
+        sectors_written, io_ticks_ms)
+    """
+    disks = {}
+    for line in text.splitlines():
+        fields = line.split()
+        if len(fields) < 14 or _VIRTUAL_DISK_RE.match(fields[2]):
+            continue
+        disks[fields[2]] = (int(fields[5]), int(fields[9]), int(fields[12]))
+    return {
+        name: stats for name, stats in disks.items()
+        if not _is_partition(name, disks)
+    }
+
+
+def parse_net_dev(text):
+    """
+    Args:
+        text (str): contents of /proc/net/dev
+
+    Returns:
+        dictionary of interface name to (rx_bytes, tx_bytes), loopback
+        excluded
+    """
+    interfaces = {}
+    for line in text.splitlines():
+        if ':' not in line:
+            continue
+        name, counters = line.split(':', 1)
+        name = name.strip()
+        fields = counters.split()
+        if name == 'lo' or len(fields) < 9:
+            continue
+        interfaces[name] = (int(fields[0]), int(fields[8]))
+    return interfaces
+
+
+def parse_meminfo(text):
+    """
+    Args:
+        text (str): contents of /proc/meminfo
+
+    Returns:
+        dictionary of field name to value in kB
+    """
+    meminfo = {}
+    for line in text.splitlines():
+        name, _, value = line.partition(':')
+        fields = value.split()
+        if fields:
+            meminfo[name] = int(fields[0])
+    return meminfo
+
+
+# Parsed counters of one snapshot of a host
+Snapshot = collections.namedtuple(
+    'Snapshot', ['uptime', 'cpu', 'disks', 'net', 'meminfo']
+)
+
+
+def parse_snapshot(sections):
+    """
+    Args:
+        sections (dict): /proc file name (as in SAMPLE_SCRIPT) to contents
+
+    Returns:
+        Snapshot
+    """
+    return Snapshot(
+        float(sections['uptime'].split()[0]),
+        parse_cpu(sections['stat']),
+        parse_diskstats(sections['diskstats']),
+        parse_net_dev(sections['net/dev']),
+        parse_meminfo(sections['meminfo']),
+    )
+
+
+def snapshot_delta(prev, cur):
+    """
+    Rates and utilizations between two snapshots of the same host.
+
+    Returns:
+        dictionary of metric name to value, all of METRICS but time. None
+        if the host's clock did not advance.
+    """
+    elapsed = cur.uptime - prev.uptime
+    if elapsed <= 0:
+        return None
+
+    cpu = {k: cur.cpu[k] - prev.cpu[k] for k in cur.cpu}
+    ticks = float(sum(cpu.values())) or 1.0
+
+    read = written = 0
+    busiest = 0
+    for name, (rd, wr, busy) in cur.disks.items():
+        if name not in prev.disks:
+            continue
+        p_rd, p_wr, p_busy = prev.disks[name]
+        read += rd - p_rd
+        written += wr - p_wr
+        busiest = max(busiest, busy - p_busy)
+
+    rx = tx = 0
+    for name, (n_rx, n_tx) in cur.net.items():
+        if name in prev.net:
+            rx += n_rx - prev.net[name][0]
+            tx += n_tx - prev.net[name][1]
+
+    total = cur.meminfo.get('MemTotal', 0)
+    available = cur.meminfo.get('MemAvailable', cur.meminfo.get('MemFree', 0))
+
+    return {
+        'cpu_util': 100.0 * (ticks - cpu['idle'] - cpu['iowait']) / ticks,
+        'cpu_user': 100.0 * (cpu['user'] + cpu['nice']) / ticks,
+        'cpu_system': 100.0 * (cpu['system'] + cpu['irq'] +
+                               cpu['softirq']) / ticks,
+        'cpu_iowait': 100.0 * cpu['iowait'] / ticks,
+        'cpu_steal': 100.0 * cpu['steal'] / ticks,
+        'disk_read_mbps': read * _SECTOR_SIZE / _MB / elapsed,
+        'disk_write_mbps': written * _SECTOR_SIZE / _MB / elapsed,
+        'disk_util': min(100.0, busiest / 10.0 / elapsed),
+        'net_rx_mbps': rx / _MB / elapsed,
+        'net_tx_mbps': tx / _MB / elapsed,
+        'mem_used': 100.0 * (total - available) / total if total else 0.0,
+    }
+
+
+class HostSeries(object):
+    """
+    Time series of one host, one array('d') per metric.
+    """
+
+    def __init__(self, hostname, role):
+        self.hostname = hostname
+        self.role = role
+        self._series = {name: array.array('d') for name in METRICS}
+
+    def append(self, elapsed, values):
+        self._series['time'].append(elapsed)
+        for name in METRICS[1:]:
+            self._series[name].append(values[name])
+
+    def __len__(self):
+        return len(self._series['time'])
+
+    def values(self, metric):
+        """
+        Returns:
+            array('d') of the metric, one value per sample
+        """
+        return self._series[metric]
+
+    def mean(self, metric):
+        values = self._series[metric]
+        return sum(values) / len(values) if values else 0.0
+
+    def peak(self, metric):
+        values = self._series[metric]
+        return max(values) if values else 0.0
+
+    def aligned(self, metric, interval, count=None, offset=0.0):
+        """
+        Average the metric over consecutive windows of interval seconds,
+        matching sysbench --report-interval lines: value i covers
+        (offset + i * interval, offset + (i + 1) * interval].
+
+        Args:
+            metric (str): one of METRICS
+            interval (float): window length in seconds
+            count (int): number of windows, up to the last sample when None
+            offset (float): sampler time at which the benchmark started
+
+        Returns:
+            list of averages, None for windows without samples
+        """
+        times = self._series['time']
+        values = self._series[metric]
+        if count is None:
+            count = int(max(0.0, (times[-1] - offset)) // interval) \
+                if times else 0
+
+        sums = [0.0] * count
+        counts = [0] * count
+        for sample_time, value in zip(times, values):
+            window = int(-(-(sample_time - offset) // interval)) - 1
+            if 0 <= window < count:
+                sums[window] += value
+                counts[window] += 1
+
+        return [s / c if c else None for s, c in zip(sums, counts)]
+
+
+class _HostReader(threading.Thread):
+    """
+    Reads the snapshots a host streams on its persistent channel.
+    """
+
+    def __init__(self, series, stream, stop, started_at):
+        super(_HostReader, self).__init__(
+            name='hostmetrics-{}'.format(series.hostname), daemon=True
+        )
+        self._series = series
+        self._stream = stream
+        self._stop_stream = stop
+        self._started_at = started_at
+        self.error = None
+
+    def run(self):
+        prev = None
+        sections = {}
+        current = None
+        try:
+            for raw in self._stream:
+                line = raw.decode('utf-8', errors='replace').rstrip('\n')
+                if not line.startswith(_MARKER):
+                    if current is not None:
+                        sections[current].append(line)
+                    continue
+
+                name = line[len(_MARKER):]
+                if name != 'end':
+                    current = name
+                    sections[name] = []
+                    continue
+
+                snapshot = parse_snapshot(
+                    {k: '\n'.join(v) for k, v in sections.items()}
+                )
+                elapsed = time.monotonic() - self._started_at
+                if prev is not None:
+                    values = snapshot_delta(prev, snapshot)
+                    if values is not None:
+                        self._series.append(elapsed, values)
+                prev = snapshot
+                sections = {}
+                current = None
+        except Exception as e:
+            # The channel is closed under us on stop
+            self.error = e
+
+    def stop(self):
+        self._stop_stream()
+
+
+class HostMetricsSampler(object):
+    """
+    Samples CPU, disk, network and memory of client and server hosts while
+    a benchmark runs, to tell a database bottleneck from a saturated load
+    generator.
+
+    Every host runs one long-lived shell loop over a persistent channel,
+    printing /proc/stat, /proc/diskstats, /proc/net/dev and /proc/meminfo
+    every interval, so sampling costs no connection or command setup. The
+    samples are kept as compact per-metric arrays (HostSeries) that can be
+    averaged over the sysbench report intervals.
+
+    A host is anything with a hostname and open_stream(cmd), such as
+    Connection.
+
+    Example usage:
+
+        sampler = HostMetricsSampler(interval=1)
+        sampler.add_host(client_conn, ROLE_CLIENT)
+        sampler.add_host(server_conn, ROLE_SERVER)
+        with sampler:
+            sb.start()
+        log.info(sampler.report())
+        if sampler.client_limited():
+            ...
+    """
+
+    def __init__(self, interval=DEF_SAMPLE_INTERVAL):
+        """
+        Args:
+            interval (float): seconds between samples
+        """
+        self._interval = interval
+        self._hosts = []
+        self._readers = []
+        self.series = collections.OrderedDict()
+
+    @property
+    def interval(self):
+        return self._interval
+
+    def add_host(self, conn, role=ROLE_SERVER):
+        """
+        Args:
+            conn (Connection): connection to the host
+            role (str): ROLE_CLIENT or ROLE_SERVER
+        """
+        self._hosts.append((conn, role))
+        self.series[conn.hostname] = HostSeries(conn.hostname, role)
+
+    def start(self):
+        cmd = SAMPLE_SCRIPT.format(
+            sections=' '.join(_SECTIONS), marker=_MARKER,
+            interval=self._interval
+        )
+        started_at = time.monotonic()
+        for conn, _ in self._hosts:
+            stream, stop = conn.open_stream(cmd)
+            reader = _HostReader(
+                self.series[conn.hostname], stream, stop, started_at
+            )
+            reader.start()
+            self._readers.append(reader)
+        log.info(
+            "Sampling host metrics of {} every {}s".format(
+                list(self.series), self._interval
+            )
+        )
+
+    def stop(self):
+        for reader in self._readers:
+            reader.stop()
+        for reader in self._readers:
+            reader.join(self._interval + 5)
+        self._readers = []
+
+    def __enter__(self):
+        self.start()
+        return self
+
+    def __exit__(self, exc_type, exc_val, exc_tb):
+        self.stop()
+
+    def saturation(self, cpu_threshold=DEF_CPU_THRESHOLD,
+                   iowait_threshold=DEF_IOWAIT_THRESHOLD,
+                   disk_threshold=DEF_DISK_THRESHOLD,
+                   memory_threshold=DEF_MEMORY_THRESHOLD,
+                   min_fraction=DEF_SATURATED_FRACTION):
+        """
+        Returns:
+            list of Saturation, one per host and resource above its threshold
+            for at least min_fraction of the samples
+        """
+        thresholds = (
+            ('cpu', 'cpu_util', cpu_threshold),
+            ('iowait', 'cpu_iowait', iowait_threshold),
+            ('disk', 'disk_util', disk_threshold),
+            ('memory', 'mem_used', memory_threshold),
+        )
+        found = []
+        for series in self.series.values():
+            if not len(series):
+                continue
+            for resource, metric, threshold in thresholds:
+                values = series.values(metric)
+                fraction = sum(1 for v in values if v >= threshold) / \
+                    float(len(values))
+                if fraction >= min_fraction:
+                    found.append(Saturation(
+                        series.hostname, series.role, resource, fraction,
+                        series.peak(metric)
+                    ))
+        return found
+
+    def client_limited(self, **kwargs):
+        """
+        True when a client host, and no server host, was saturated: the
+        results measure the load generator rather than the database.
+
+        Args:
+            kwargs: thresholds of saturation()
+        """
+        roles = set(s.role for s in self.saturation(**kwargs))
+        return ROLE_CLIENT in roles and ROLE_SERVER not in roles
+
+    def report(self, **kwargs):
+        """
+        Args:
+            kwargs: thresholds of saturation()
+
+        Returns:
+            multi-line summary of every host and of saturated resources
+        """
+        lines = []
+        for series in self.series.values():
+            lines.append(
+                "{} ({}): {} samples, cpu {:.1f}% (peak {:.1f}%), "
+                "iowait {:.1f}%, disk r/w {:.1f}/{:.1f} MB/s "
+                "(util peak {:.1f}%), net rx/tx {:.1f}/{:.1f} MB/s, "
+                "mem {:.1f}%".format(
+                    series.hostname, series.role, len(series),
+                    series.mean('cpu_util'), series.peak('cpu_util'),
+                    series.mean('cpu_iowait'),
+                    series.mean('disk_read_mbps'),
+                    series.mean('disk_write_mbps'),
+                    series.peak('disk_util'),
+                    series.mean('net_rx_mbps'), series.mean('net_tx_mbps'),
+                    series.mean('mem_used'),
+                )
+            )
+
+        for found in self.saturation(**kwargs):
+            lines.append(
+                "{} {} saturated on {} for {:.0f}% of the run "
+                "(peak {:.1f}%)".format(
+                    found.role, found.hostname, found.resource,
+                    100 * found.fraction, found.peak
+                )
+            )
+        if self.client_limited(**kwargs):
+            lines.append(
+                "Client hosts, not the database, limit this run"
+            )
+        return '\n'.join(lines)
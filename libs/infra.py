@@ -1,48 +1,195 @@
 import logging
+import os
+import selectors
+import signal
 import subprocess
 import shlex
+import time
+import baseexception as be
+from concurrent.futures import ThreadPoolExecutor
 
 logger = logging.getLogger(__name__)
 logger.setLevel(logging.INFO)
 
 DEFAULT_TIMEOUT = 300
 
+# Maximum number of local commands run at once by execute_cmds
+DEFAULT_MAX_PARALLEL = 8
+
+# Seconds between SIGTERM and SIGKILL when a command times out
+KILL_GRACE_PERIOD = 5
+
+_READ_SIZE = 64 * 1024
+
 def print_banner(given_string):
     banner_str = "\n\n" + '=' * 80 + "\n"
     banner_str += "|| {} ||\n".format(given_string.center(74))
     banner_str += '=' * 80 + "\n\n"
     print(banner_str)
 
-def execute_cmd(cmd, timeout=DEFAULT_TIMEOUT):
+def _kill_process_group(proc):
+    """
+    Terminate the process group of proc, which was started in its own
+    session, escalating to SIGKILL after KILL_GRACE_PERIOD seconds.
+    """
+
+    for sig, grace in ((signal.SIGTERM, KILL_GRACE_PERIOD),
+                       (signal.SIGKILL, None)):
+        try:
+            os.killpg(proc.pid, sig)
+        except ProcessLookupError:
+            return
+        try:
+            proc.wait(timeout=grace)
+            return
+        except subprocess.TimeoutExpired:
+            continue
+
+def execute_cmd(cmd, timeout=DEFAULT_TIMEOUT, raise_on_error=True,
+                line_callback=None, output_file=None, capture_output=True):
     """
     Execute cmd on local system and return stdout, stderr and exit status
+
+    Both output streams are drained concurrently as the command runs, so
+    commands writing more than the pipe buffer do not block. The command
+    runs in its own process group which is killed as a whole on timeout.
+
+    Args:
+        cmd (str): command line
+        timeout (int): seconds before the command is killed
+        raise_on_error (bool): raise if the command fails or times out
+        line_callback (callable): called as line_callback(stream, line) for
+            every output line, stream being 'stdout' or 'stderr'
+        output_file (str): file both streams are written to as they arrive
+        capture_output (bool): keep the output in memory and return it. Turn
+            off for very large outputs sent to output_file or line_callback.
+
+    Returns:
+        tuple of (stdout, stderr, exit_status). A killed command has a
+        negative exit status.
+
+    Raises:
+        CommandError if the command exits with a non-zero status and
+        subprocess.TimeoutExpired if it times out, unless raise_on_error is
+        turned off
     """
-    with subprocess.Popen(
+    proc = subprocess.Popen(
         shlex.split(cmd),
-        cmd,
-        stdin=subprocess.PIPE,
+        stdin=subprocess.DEVNULL,
         stdout=subprocess.PIPE,
         stderr=subprocess.PIPE,
-    ) as proc:
+        start_new_session=True,
+    )
+
+    names = {proc.stdout.fileno(): 'stdout', proc.stderr.fileno(): 'stderr'}
+    chunks = {'stdout': [], 'stderr': []}
+    partial = {'stdout': b'', 'stderr': b''}
+    deadline = time.monotonic() + timeout
+    timed_out = False
+
+    out_fp = open(output_file, 'wb') if output_file else None
+    try:
+        with selectors.DefaultSelector() as selector:
+            selector.register(proc.stdout, selectors.EVENT_READ)
+            selector.register(proc.stderr, selectors.EVENT_READ)
 
-        proc.wait(timeout=timeout)
-        exit_status = proc.returncode
+            while selector.get_map():
+                remaining = deadline - time.monotonic()
+                if remaining <= 0:
+                    timed_out = True
+                    break
 
-        if proc.stdout:
-            stdout_full = proc.stdout.read().decode()
-        else:
-            stdout_full = ''
+                for key, _ in selector.select(remaining):
+                    data = os.read(key.fd, _READ_SIZE)
+                    if not data:
+                        selector.unregister(key.fileobj)
+                        continue
 
-        if proc.stderr:
-            stderr_full = proc.stderr.read().decode()
-        else:
-            stderr_full = ''
+                    name = names[key.fd]
+                    if capture_output:
+                        chunks[name].append(data)
+                    if out_fp:
+                        out_fp.write(data)
+                    if line_callback:
+                        lines = (partial[name] + data).split(b'\n')
+                        partial[name] = lines.pop()
+                        for line in lines:
+                            line_callback(name, line.decode(errors='replace'))
 
-    if exit_status != 0:
+        if not timed_out:
+            try:
+                proc.wait(timeout=max(0, deadline - time.monotonic()))
+            except subprocess.TimeoutExpired:
+                timed_out = True
+
+        if timed_out:
+            _kill_process_group(proc)
+    finally:
+        if out_fp:
+            out_fp.close()
+        proc.stdout.close()
+        proc.stderr.close()
+        if proc.poll() is None:
+            _kill_process_group(proc)
+
+    if line_callback:
+        for name, rest in partial.items():
+            if rest:
+                line_callback(name, rest.decode(errors='replace'))
+
+    stdout_full = b''.join(chunks['stdout']).decode(errors='replace')
+    stderr_full = b''.join(chunks['stderr']).decode(errors='replace')
+    exit_status = proc.returncode
+
+    if timed_out:
+        msg = "Command {} timed out after {}s\nOutput: {}\nError: {}\n"
+        logger.error(msg.format(cmd, timeout, stdout_full, stderr_full))
+        if raise_on_error:
+            raise subprocess.TimeoutExpired(
+                cmd, timeout, output=stdout_full, stderr=stderr_full
+            )
+
+    elif exit_status != 0:
         msg = "Command {} failed!\nOutput: {}\nError: {}\n Exit Status {}\n"
         msg = msg.format(cmd, stdout_full, stderr_full, exit_status)
 
         logger.error(msg)
-        raise Exception("command {} failed!".format(cmd))
+        if raise_on_error:
+            raise be.CommandError("command {} failed!".format(cmd))
 
     return stdout_full, stderr_full, exit_status
+
+def execute_cmds(cmds, max_parallel=DEFAULT_MAX_PARALLEL,
+                 raise_on_error=True, **kwargs):
+    """
+    Execute many commands on local system, at most max_parallel at a time.
+
+    Args:
+        cmds (list): command lines
+        max_parallel (int): maximum number of commands running at once
+        raise_on_error (bool): raise once all commands are done if any of
+            them failed or timed out
+        kwargs: passed on to execute_cmd for every command
+
+    Returns:
+        list of (stdout, stderr, exit_status) tuples in the order of cmds
+
+    Raises:
+        CommandError listing the failed commands
+    """
+    with ThreadPoolExecutor(max_workers=max_parallel) as executor:
+        futures = [
+            executor.submit(execute_cmd, cmd, raise_on_error=False, **kwargs)
+            for cmd in cmds
+        ]
+        results = [future.result() for future in futures]
+
+    failed = [cmd for cmd, result in zip(cmds, results) if result[2] != 0]
+    if failed and raise_on_error:
+        raise be.CommandError(
+            "{} of {} commands failed: {}".format(
+                len(failed), len(cmds), failed
+            )
+        )
+
+    return results
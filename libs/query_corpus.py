@@ -0,0 +1,310 @@
+import collections
+import gzip
+import hashlib
+import json
+import logging
+import multiprocessing
+import os
+import re
+
+log = logging.getLogger(__name__)
+
+DEFAULT_CACHE_DIR = os.path.join(
+    os.path.expanduser('~'), '.cache', 'mdb', 'corpus'
+)
+
+# Bumped whenever the index layout or the classification changes
+INDEX_VERSION = 1
+
+KIND_SELECT = 'SELECT'
+KIND_DML = 'DML'
+KIND_DDL = 'DDL'
+KIND_OTHER = 'OTHER'
+
+_STATEMENT_KINDS = {
+    'SELECT': KIND_SELECT,
+    'INSERT': KIND_DML,
+    'UPDATE': KIND_DML,
+    'DELETE': KIND_DML,
+    'REPLACE': KIND_DML,
+    'MERGE': KIND_DML,
+    'CREATE': KIND_DDL,
+    'CREATE OR REPLACE': KIND_DDL,
+    'ALTER': KIND_DDL,
+    'DROP': KIND_DDL,
+    'TRUNCATE': KIND_DDL,
+    'RENAME': KIND_DDL,
+}
+
+# First keywords that identify the statement kind without a full parse
+_LEADING_KINDS = {
+    'SELECT': KIND_SELECT,
+    'INSERT': KIND_DML,
+    'UPDATE': KIND_DML,
+    'DELETE': KIND_DML,
+    'REPLACE': KIND_DML,
+    'CREATE': KIND_DDL,
+    'ALTER': KIND_DDL,
+    'DROP': KIND_DDL,
+    'TRUNCATE': KIND_DDL,
+    'RENAME': KIND_DDL,
+    'SET': KIND_OTHER,
+    'SHOW': KIND_OTHER,
+    'USE': KIND_OTHER,
+}
+
+_LEADING_NOISE_RE = re.compile(
+    r'^(\s+|--[^\n]*\n?|#[^\n]*\n?|/\*.*?\*/)*', re.S
+)
+_FIRST_WORD_RE = re.compile(r'[(\s]*([A-Za-z]+)')
+_LEADING_LINE_COMMENTS_RE = re.compile(r'^(\s+|--[^\n]*\n?|#[^\n]*\n?)*')
+_TAGS_RE = re.compile(r'^\s*--\s*tags?\s*:\s*(.*)$', re.M | re.I)
+
+CorpusStatement = collections.namedtuple(
+    'CorpusStatement', ['sql', 'kind', 'tags']
+)
+
+
+def classify_statement(sql, parsed=None):
+    """
+    Classify a statement as SELECT, DML, DDL or OTHER. The leading keyword
+    decides where it is unambiguous, sqlparse is only used for the rest
+    (e.g. WITH ... SELECT).
+
+    Args:
+        sql (str): SQL statement
+        parsed (sqlparse.sql.Statement): already parsed statement, if any
+
+    Returns:
+        kind (str): one of KIND_SELECT, KIND_DML, KIND_DDL, KIND_OTHER
+    """
+
+    body = sql[_LEADING_NOISE_RE.match(sql).end():]
+    match = _FIRST_WORD_RE.match(body)
+    if match and match.group(1).upper() in _LEADING_KINDS:
+        return _LEADING_KINDS[match.group(1).upper()]
+
+    if parsed is None:
+        import sqlparse
+        parsed = sqlparse.parse(sql)[0]
+    return _STATEMENT_KINDS.get(parsed.get_type(), KIND_OTHER)
+
+
+def _statement_tags(sql):
+    tags = []
+    for match in _TAGS_RE.finditer(sql):
+        tags.extend(t.strip() for t in match.group(1).split(',') if t.strip())
+    return tags
+
+
+def parse_sql_file(filepath):
+    """
+    Stream a .sql file through sqlparse, splitting and classifying every
+    statement. Tags are read from '-- tags: a, b' comments preceding a
+    statement. Leading line comments are dropped from the statement text,
+    block comments (optimizer hints, /*! */ sections) are kept.
+
+    Args:
+        filepath (str): path of the .sql file
+
+    Returns:
+        statements (list): list of CorpusStatement
+    """
+
+    import sqlparse
+
+    statements = []
+    with open(filepath, 'r') as rfp:
+        for parsed in sqlparse.parsestream(rfp):
+            text = str(parsed)
+            sql = text[_LEADING_LINE_COMMENTS_RE.match(text).end():].strip()
+            if not sql or sql == ';':
+                continue
+            statements.append(CorpusStatement(
+                sql, classify_statement(sql, parsed), _statement_tags(text)
+            ))
+    return statements
+
+
+def _file_sha1(filepath):
+    sha1 = hashlib.sha1()
+    with open(filepath, 'rb') as rfp:
+        for block in iter(lambda: rfp.read(1024 * 1024), b''):
+            sha1.update(block)
+    return sha1.hexdigest()
+
+
+class QueryCorpus(object):
+    """
+    Loader for corpora of .sql files. Parsed statements are stored in a
+    compact gzipped index per file under cache_dir, keyed by the file's path
+    and validated against its mtime and size, falling back to its content
+    hash. Unchanged files are never re-parsed, and filtering by statement
+    kind or tag works on the index alone.
+
+    Cache misses are parsed in parallel when more than one file changed.
+
+    Example usage:
+
+        corpus = QueryCorpus(['/path/to/queries/'])
+        selects = corpus.queries(kinds=[KIND_SELECT], tags=['tpch'])
+    """
+
+    def __init__(self, paths, cache_dir=DEFAULT_CACHE_DIR, processes=None):
+        """
+        Args:
+            paths (list): .sql files or directories searched recursively
+            cache_dir (str): directory holding the parsed indexes, None
+                disables caching
+            processes (int): parser processes for cache misses
+        """
+
+        if isinstance(paths, str):
+            paths = [paths]
+
+        self._files = self._find_files(paths)
+        self._cache_dir = cache_dir
+        self._processes = processes
+        self._statements = None
+
+    @staticmethod
+    def _find_files(paths):
+        files = []
+        for path in paths:
+            if os.path.isdir(path):
+                for root, _, names in sorted(os.walk(path)):
+                    files.extend(
+                        os.path.join(root, n) for n in sorted(names)
+                        if n.endswith('.sql')
+                    )
+            else:
+                files.append(path)
+        return [os.path.abspath(f) for f in files]
+
+    @property
+    def files(self):
+        return list(self._files)
+
+    def _index_path(self, filepath):
+        name = hashlib.sha1(filepath.encode('utf-8')).hexdigest()
+        return os.path.join(self._cache_dir, '{}.json.gz'.format(name))
+
+    def _load_index(self, filepath):
+        """
+        Returns:
+            statements (list): cached statements of filepath, None on a miss
+        """
+
+        if not self._cache_dir:
+            return None
+
+        index_path = self._index_path(filepath)
+        try:
+            with gzip.open(index_path, 'rt') as rfp:
+                index = json.load(rfp)
+        except (IOError, ValueError):
+            return None
+
+        if index.get('version') != INDEX_VERSION or \
+                index.get('path') != filepath:
+            return None
+
+        stat = os.stat(filepath)
+        if (index['mtime_ns'], index['size']) != (stat.st_mtime_ns,
+                                                  stat.st_size):
+            # Touched but maybe unchanged, e.g. after a checkout
+            if index['sha1'] != _file_sha1(filepath):
+                return None
+            index['mtime_ns'], index['size'] = stat.st_mtime_ns, stat.st_size
+            self._write_index(index)
+
+        return [CorpusStatement(*s) for s in index['statements']]
+
+    def _write_index(self, index):
+        os.makedirs(self._cache_dir, exist_ok=True)
+        index_path = self._index_path(index['path'])
+        tmp_path = '{}.{}.tmp'.format(index_path, os.getpid())
+        with gzip.open(tmp_path, 'wt') as wfp:
+            json.dump(index, wfp, separators=(',', ':'))
+        os.replace(tmp_path, index_path)
+
+    def _store_index(self, filepath, statements):
+        if not self._cache_dir:
+            return
+
+        stat = os.stat(filepath)
+        self._write_index({
+            'version': INDEX_VERSION,
+            'path': filepath,
+            'mtime_ns': stat.st_mtime_ns,
+            'size': stat.st_size,
+            'sha1': _file_sha1(filepath),
+            'statements': [list(s) for s in statements],
+        })
+
+    def load(self):
+        """
+        Load every file, from the index where possible.
+
+        Returns:
+            statements (list): list of CorpusStatement in file order
+        """
+
+        if self._statements is not None:
+            return self._statements
+
+        per_file = {f: self._load_index(f) for f in self._files}
+        misses = [f for f, stmts in per_file.items() if stmts is None]
+
+        log.info(
+            "Loading corpus of {} files, {} not in the index".format(
+                len(self._files), len(misses)
+            )
+        )
+
+        if len(misses) > 1 and self._processes != 1:
+            with multiprocessing.Pool(self._processes) as pool:
+                parsed = pool.map(parse_sql_file, misses)
+        else:
+            parsed = [parse_sql_file(f) for f in misses]
+
+        for filepath, statements in zip(misses, parsed):
+            self._store_index(filepath, statements)
+            per_file[filepath] = statements
+
+        self._statements = [
+            stmt for f in self._files for stmt in per_file[f]
+        ]
+        return self._statements
+
+    def statements(self, kinds=None, tags=None):
+        """
+        Args:
+            kinds (list): statement kinds to keep, all when None
+            tags (list): keep statements carrying any of these tags, all
+                when None
+
+        Returns:
+            statements (list): matching CorpusStatement objects
+        """
+
+        kinds = set(kinds) if kinds else None
+        tags = set(tags) if tags else None
+        return [
+            stmt for stmt in self.load()
+            if (kinds is None or stmt.kind in kinds) and
+            (tags is None or tags.intersection(stmt.tags))
+        ]
+
+    def queries(self, kinds=None, tags=None):
+        """
+        Same as statements() but returns only the SQL text.
+        """
+
+        return [stmt.sql for stmt in self.statements(kinds, tags)]
+
+    def __len__(self):
+        return len(self.load())
+
+    def __iter__(self):
+        return iter(self.load())
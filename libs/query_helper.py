@@ -1,36 +1,668 @@
 # encoding=utf8
 
 import collections
-import functools
 import logging
-import math
 import multiprocessing
-import operator
-import psycopg2
 import random
-import sqlparse
 import time
-from paramiko import SSHException
-from raff.common import retry
-from datetime import datetime
-from prettytable import PrettyTable
-from multiprocessing import Manager
+import multiprocessing.connection
+from db.metadata import TableInfo
+from query_corpus import KIND_SELECT, QueryCorpus, classify_statement
+from query_scheduler import (
+    DEFAULT_BATCH_THRESHOLD,
+    DEFAULT_MAX_BATCH_SIZE,
+    QueryCostHistory,
+    WorkStealingScheduler,
+    make_batches,
+    normalize_query,
+)
+from result_cache import result_digest
+from shm_ring import SharedMemoryRing
 
-class TableInfo(object):
-    pass
+log = logging.getLogger(__name__)
+
+DEFAULT_NUM_WORKERS = multiprocessing.cpu_count()
+
+STATUS_PASS = 'PASS'
+STATUS_FAIL = 'FAIL'
+STATUS_ERROR = 'ERROR'
+
+# Seconds to wait for a worker process to exit once it ran out of work
+WORKER_JOIN_TIMEOUT = 30
+
+# Rows per side kept in the diff of a mismatching query
+MAX_DIFF_ROWS = 100
+
+# Session setting selecting the engine a query is routed to, see
+# switch_db_and_compare_query in tests/test.py
+ROUTING_MODE_SQL = 'set mapi_monetdb_query_routing={}'
+
+# Everything needed to build result cache keys for both sides of a run
+_CacheContext = collections.namedtuple(
+    '_CacheContext',
+    ['cache', 'data_checksum', 'server_versions', 'routing_modes']
+)
 
 class CorrectnessTestExecutor(object):
     pass
 
-def execute_queries():
-    pass
+def _fetch_result_sets(cursor, queries):
+    """
+    Execute one or more statements in a single round trip.
+
+    Args:
+        cursor (mariadb Cursor): cursor to execute on
+        queries (list): SQL statements
+
+    Returns:
+        result_sets (list): one list of rows per statement
+    """
+
+    if not queries:
+        return []
+
+    cursor.execute(';\n'.join(normalize_query(q) for q in queries))
+
+    result_sets = []
+    while True:
+        if cursor.description is not None:
+            result_sets.append(cursor.fetchall())
+        else:
+            result_sets.append([])
+        if not cursor.nextset():
+            break
+
+    if len(result_sets) != len(queries):
+        raise ValueError(
+            "Expected {} result sets, got {}".format(
+                len(queries), len(result_sets)
+            )
+        )
+
+    return result_sets
+
+
+def _run_side(cursor, queries, known):
+    """
+    Run the queries whose digest is not already known on one side.
+
+    Returns:
+        results (list): rows per query, None where the digest was known
+    """
+
+    to_run = [q for q, digest in zip(queries, known) if digest is None]
+    fetched = iter(_fetch_result_sets(cursor, to_run))
+    return [
+        next(fetched) if digest is None else None
+        for digest in known
+    ]
+
+
+def _server_version(db_instance):
+    """
+    Returns:
+        version (str): server build of db_instance
+    """
+
+    with db_instance.clone() as db:
+        with db.cursor() as cursor:
+            cursor.execute('SELECT VERSION()')
+            return cursor.fetchone()[0]
+
+
+def _cache_keys(cache_ctx, query):
+    """
+    Returns:
+        (keyA, keyB): result cache keys of query for both sides
+    """
+
+    return tuple(
+        cache_ctx.cache.make_key(
+            query, cache_ctx.data_checksum, version, routing_mode
+        )
+        for version, routing_mode in zip(
+            cache_ctx.server_versions, cache_ctx.routing_modes
+        )
+    )
+
+
+def _lookup_cached(cache_ctx, list_queries):
+    """
+    Split list_queries into the queries that still need running and the
+    queries whose result digests are both cached and equal. Only SELECTs
+    are looked up, every other statement always runs.
+
+    Returns:
+        (to_run, skipped, known_digests): queries to run, queries verified
+            from the cache, and query -> (digestA, digestB) for queries with
+            at least one side cached
+    """
+
+    to_run, skipped, known_digests = [], [], {}
+    for query in list_queries:
+        if classify_statement(query) != KIND_SELECT:
+            to_run.append(query)
+            continue
+        key_a, key_b = _cache_keys(cache_ctx, query)
+        digests = (cache_ctx.cache.get(key_a), cache_ctx.cache.get(key_b))
+        if digests[0] is not None and digests[0] == digests[1]:
+            skipped.append((query, digests))
+            continue
+        if digests[0] is not None and digests[1] is not None:
+            # Both known but different: rerun both to report the mismatch
+            digests = (None, None)
+        if digests != (None, None):
+            known_digests[query] = digests
+        to_run.append(query)
+
+    return to_run, skipped, known_digests
+
+
+def _diff_results(rows_a, rows_b, max_rows=MAX_DIFF_ROWS):
+    """
+    Order independent comparison of two result sets, duplicates included.
+
+    Returns:
+        diff (dict): up to max_rows rows only found on each side, None if
+            the results match
+    """
+
+    counter_a = collections.Counter(rows_a)
+    counter_b = collections.Counter(rows_b)
+    if counter_a == counter_b:
+        return None
+
+    only_a = (counter_a - counter_b).elements()
+    only_b = (counter_b - counter_a).elements()
+    return {
+        'only_in_a': [row for row, _ in zip(only_a, range(max_rows))],
+        'only_in_b': [row for row, _ in zip(only_b, range(max_rows))],
+    }
+
+
+def execute_queries(cursorA, cursorB, queries, known_digests=None):
+    """
+    Run a batch of queries against both cursors and compare the results.
+
+    If known_digests holds the result digest of a query for one side, only
+    the other side is run and the comparison is done on digests.
+
+    A batch of SELECTs that fails as a whole is re-run statement by
+    statement so that the error is attributed to the right query. Other
+    statements are never re-run, they may already have changed data.
+
+    The queries of a batch run in one round trip, so their own wall times
+    are unknown: their records carry an even share of the batch time marked
+    'elapsed_approximate', and the batch total as 'batch_elapsed'.
+
+    Args:
+        cursorA (mariadb Cursor): cursor for the first engine
+        cursorB (mariadb Cursor): cursor for the second engine
+        queries (list): SQL statements
+        known_digests (dict): query -> (digestA, digestB), None for unknown
+
+    Returns:
+        (records, elapsed): list of per-query result dictionaries and the
+            total wall time spent on the batch
+    """
+
+    known_digests = known_digests or {}
+    known = [known_digests.get(q, (None, None)) for q in queries]
+
+    start = time.monotonic()
+    try:
+        results_a = _run_side(cursorA, queries, [k[0] for k in known])
+        results_b = _run_side(cursorB, queries, [k[1] for k in known])
+    except Exception as e:
+        if len(queries) > 1 and all(
+                classify_statement(q) == KIND_SELECT for q in queries):
+            log.debug(
+                "Batch of {} queries failed ({}), retrying one by one".format(
+                    len(queries), str(e)
+                )
+            )
+            records = []
+            for query in queries:
+                records.extend(
+                    execute_queries(
+                        cursorA, cursorB, [query], known_digests
+                    )[0]
+                )
+            return records, time.monotonic() - start
+
+        elapsed = time.monotonic() - start
+        return [{
+            'query': query,
+            'status': STATUS_ERROR,
+            'error': str(e),
+            'elapsed': elapsed,
+        } for query in queries], elapsed
+
+    elapsed = time.monotonic() - start
+    records = []
+    for query, (known_a, known_b), rows_a, rows_b in zip(
+            queries, known, results_a, results_b):
+        digest_a = known_a or result_digest(rows_a)
+        digest_b = known_b or result_digest(rows_b)
+        diff = None
+        if rows_a is not None and rows_b is not None:
+            diff = _diff_results(rows_a, rows_b)
+            matched = diff is None
+        else:
+            matched = digest_a == digest_b
+        record = {
+            'query': query,
+            'status': STATUS_PASS if matched else STATUS_FAIL,
+            'rows': int(digest_a.split(':')[0]),
+            'elapsed': elapsed / len(queries),
+            'digests': (digest_a, digest_b),
+        }
+        if len(queries) > 1:
+            record['elapsed_approximate'] = True
+            record['batch_elapsed'] = elapsed
+        if diff is not None:
+            record['diff'] = diff
+        if not matched:
+            log.error("Result mismatch for query: {}".format(query))
+        records.append(record)
+
+    return records, elapsed
+
 
 def execute_queries_parallel(db_instanceA, db_instanceB, randomize,
-                             continue_on_fail, select_only,list_queries):
-    pass
+                             continue_on_fail, select_only, list_queries,
+                             num_workers=DEFAULT_NUM_WORKERS,
+                             cost_history=None, result_cache=None,
+                             data_checksum=None, routing_modes=(None, None),
+                             status_samplers=()):
+    """
+    Run list_queries against both database instances in parallel and compare
+    the results of every query.
 
-def run_queries(list_queries,db_instanceA, db_instanceB, random_execution, proc_sum, run_report):
-    pass
+    Args:
+        db_instanceA (MariaDB): first database instance
+        db_instanceB (MariaDB): second database instance
+        randomize (bool): run queries in random order instead of
+            longest-expected-first
+        continue_on_fail (bool): keep going after the first failed query
+        select_only (bool): only run SELECT statements
+        list_queries (list or QueryCorpus): SQL statements, or a corpus
+            whose cached classification is used for select_only
+        num_workers (int): number of concurrent workers
+        cost_history (QueryCostHistory): persisted per-query costs used for
+            scheduling and batching
+        result_cache (ResultFingerprintCache): cache of result digests.
+            SELECTs whose digests are cached for both sides are not run,
+            SELECTs cached for one side only run on the other side.
+        data_checksum (str): checksum of the schema and data queried, part
+            of the result cache key, required with result_cache
+        routing_modes (tuple): query routing mode of each side, applied to
+            every worker connection when set
+        status_samplers (list): db.ServerStatusSampler of either server,
+            run for the duration of the queries. Their summaries are added
+            to proc_sum under 'server_status'.
+
+    Returns:
+        (proc_sum, run_report): summary counters and per-query records
+    """
+
+    if isinstance(list_queries, QueryCorpus):
+        list_queries = list_queries.queries(
+            kinds=[KIND_SELECT] if select_only else None
+        )
+    elif select_only:
+        list_queries = [
+            query for query in list_queries
+            if classify_statement(query) == KIND_SELECT
+        ]
+
+    proc_sum = {
+        'total': len(list_queries),
+        STATUS_PASS: 0,
+        STATUS_FAIL: 0,
+        STATUS_ERROR: 0,
+    }
+    run_report = []
+
+    for sampler in status_samplers:
+        sampler.start()
+    try:
+        run_queries(
+            list_queries, db_instanceA, db_instanceB, randomize, proc_sum,
+            run_report, num_workers=num_workers, cost_history=cost_history,
+            continue_on_fail=continue_on_fail, result_cache=result_cache,
+            data_checksum=data_checksum, routing_modes=routing_modes,
+        )
+    finally:
+        for sampler in status_samplers:
+            sampler.stop()
+            log.info(sampler.report())
+
+    if status_samplers:
+        proc_sum['server_status'] = [s.summary() for s in status_samplers]
+
+    return proc_sum, run_report
+
+
+def run_queries(list_queries,db_instanceA, db_instanceB, random_execution, proc_sum, run_report,
+                num_workers=DEFAULT_NUM_WORKERS, cost_history=None,
+                continue_on_fail=True,
+                batch_threshold=DEFAULT_BATCH_THRESHOLD,
+                max_batch_size=DEFAULT_MAX_BATCH_SIZE,
+                result_cache=None, data_checksum=None,
+                routing_modes=(None, None)):
+    """
+    Schedule list_queries over num_workers workers and record the outcome of
+    every query.
+
+    Unless random_execution is set, queries are scheduled
+    longest-expected-first using cost_history, and cheap queries are packed
+    into multi-statement batches. Random execution keeps the shuffled order
+    and runs every query on its own.
+
+    Every worker is a separate process with its own connections which
+    computes digests and diffs locally. Workers pull batches from this
+    process over a pipe and only send back compact per-query summaries, the
+    rare mismatch diff is passed through a shared memory ring. Full result
+    sets never leave the worker.
+
+    Args:
+        list_queries (list): SQL statements
+        db_instanceA (MariaDB): first database instance, every worker
+            process opens its own connection with the same parameters
+        db_instanceB (MariaDB): second database instance
+        random_execution (bool): shuffle the queries
+        proc_sum (dict): summary counters keyed by status, updated in place
+        run_report (list): per-query records, appended in place
+        num_workers (int): number of concurrent workers
+        cost_history (QueryCostHistory): persisted per-query costs. The
+            history is updated with observed costs and saved at the end.
+        continue_on_fail (bool): keep going after the first failed query
+        batch_threshold (float): cost (seconds) below which a query is cheap
+        max_batch_size (int): maximum statements per batch
+        result_cache (ResultFingerprintCache): cache of result digests
+        data_checksum (str): checksum of the schema and data queried,
+            required with result_cache
+        routing_modes (tuple): query routing mode of each side
+
+    Raises:
+        ValueError if result_cache is given without data_checksum
+    """
+
+    if result_cache is not None and data_checksum is None:
+        # Without it cached digests outlive changes of the data and queries
+        # would pass without running
+        raise ValueError("result_cache requires a data_checksum")
+
+    cost_history = cost_history or QueryCostHistory()
+
+    cache_ctx = None
+    known_digests = {}
+    if result_cache is not None:
+        cache_ctx = _CacheContext(
+            result_cache, data_checksum,
+            (_server_version(db_instanceA), _server_version(db_instanceB)),
+            routing_modes,
+        )
+        list_queries, skipped, known_digests = _lookup_cached(
+            cache_ctx, list_queries
+        )
+        for query, digests in skipped:
+            proc_sum[STATUS_PASS] += 1
+            run_report.append({
+                'query': query,
+                'status': STATUS_PASS,
+                'rows': int(digests[0].split(':')[0]),
+                'elapsed': 0.0,
+                'digests': digests,
+                'cached': True,
+            })
+        log.info(
+            "Result cache verified {} queries, {} run on one side only".format(
+                len(skipped), len(known_digests)
+            )
+        )
+
+    if random_execution:
+        list_queries = list(list_queries)
+        random.shuffle(list_queries)
+        batches = make_batches(list_queries, cost_history, max_batch_size=1)
+    else:
+        batches = make_batches(
+            list_queries, cost_history, batch_threshold=batch_threshold,
+            max_batch_size=max_batch_size,
+        )
+
+    if not batches:
+        cost_history.save()
+        return
+
+    num_workers = max(1, min(num_workers, len(batches)))
+    scheduler = WorkStealingScheduler(
+        batches, num_workers, preserve_order=random_execution
+    )
+
+    log.info(
+        "Running {} queries in {} batches on {} workers".format(
+            len(list_queries), len(batches), num_workers
+        )
+    )
+
+    specs = (_instance_spec(db_instanceA), _instance_spec(db_instanceB))
+    workers = {}
+    states = []
+    start = time.monotonic()
+    try:
+        for worker in range(num_workers):
+            ring = SharedMemoryRing(create=True)
+            conn, child_conn = multiprocessing.Pipe()
+            proc = multiprocessing.Process(
+                target=_execute_worker,
+                args=(worker, child_conn, specs, routing_modes, ring.name),
+                name='query-worker-{}'.format(worker),
+                daemon=True,
+            )
+            proc.start()
+            child_conn.close()
+            workers[conn] = _WorkerState(worker, proc, ring)
+            states.append(workers[conn])
+
+        _coordinate(
+            workers, scheduler, known_digests, cost_history, cache_ctx,
+            continue_on_fail, proc_sum, run_report
+        )
+    finally:
+        for state in states:
+            state.proc.join(timeout=WORKER_JOIN_TIMEOUT)
+            if state.proc.is_alive():
+                state.proc.terminate()
+            state.ring.close()
+
+    log.info(
+        "Ran {} queries in {:.2f}s ({} batches stolen)".format(
+            len(run_report), time.monotonic() - start, scheduler.steals
+        )
+    )
+    cost_history.save()
+
+
+class _WorkerState(object):
+    """
+    Coordinator side bookkeeping of a worker process.
+    """
+
+    def __init__(self, worker, proc, ring):
+        self.worker = worker
+        self.proc = proc
+        self.ring = ring
+        self.batch = None
+
+
+def _instance_spec(db_instance):
+    """
+    Picklable description of a database instance, from which a worker
+    process opens its own connection.
+    """
+
+    return db_instance.__class__, db_instance.conn_params, db_instance.settings
+
+
+def _coordinate(workers, scheduler, known_digests, cost_history, cache_ctx,
+                continue_on_fail, proc_sum, run_report):
+    """
+    Hand out batches to workers as they ask for work and fold their
+    summaries into the report. Scheduling, cost history and the result
+    cache are only touched here, the workers hold no shared state.
+    """
+
+    stopping = False
+    while workers:
+        for conn in multiprocessing.connection.wait(list(workers)):
+            state = workers[conn]
+            try:
+                message = conn.recv()
+            except EOFError:
+                message = ('error', 'worker exited unexpectedly')
+
+            kind, payload = message
+            if kind == 'error':
+                log.error(
+                    "Worker {} failed: {}".format(state.worker, payload)
+                )
+                if state.batch is not None:
+                    _record_batch_error(state.batch, payload, proc_sum,
+                                        run_report)
+                conn.close()
+                del workers[conn]
+                continue
+
+            if kind == 'result':
+                records = _collect_records(state, payload)
+                for record in records:
+                    # The batch time bounds the cost of each of its queries.
+                    # Overestimating is self-correcting: a query whose bound
+                    # exceeds the batch threshold runs alone next time and
+                    # is measured exactly.
+                    cost_history.record(
+                        record['query'],
+                        record.get('batch_elapsed', record['elapsed'])
+                    )
+                    if cache_ctx is not None and 'digests' in record and \
+                            classify_statement(record['query']) == KIND_SELECT:
+                        keys = _cache_keys(cache_ctx, record['query'])
+                        for key, digest in zip(keys, record['digests']):
+                            cache_ctx.cache.put(key, digest)
+                    proc_sum[record['status']] += 1
+                    run_report.append(record)
+
+                if not continue_on_fail and any(
+                        r['status'] != STATUS_PASS for r in records):
+                    stopping = True
+
+            state.batch = None if stopping else \
+                scheduler.next_batch(state.worker)
+            if state.batch is None:
+                conn.send(None)
+                conn.close()
+                del workers[conn]
+            else:
+                conn.send((
+                    state.batch.queries,
+                    {q: known_digests[q] for q in state.batch.queries
+                     if q in known_digests},
+                ))
+
+    if stopping:
+        return
+    # Batches left over when every worker died
+    while True:
+        batch = scheduler.next_batch(0)
+        if batch is None:
+            break
+        _record_batch_error(batch, 'no worker left to run the batch',
+                            proc_sum, run_report)
+
+
+def _collect_records(state, summaries):
+    """
+    Attach query text and, for mismatches, the diff stored in the worker's
+    shared memory ring to the summaries sent by a worker.
+    """
+
+    records = []
+    for idx, summary in summaries:
+        summary['query'] = state.batch.queries[idx]
+        handle = summary.pop('diff_handle', None)
+        if handle is not None:
+            summary['diff'] = state.ring.read_object(handle)
+        records.append(summary)
+    return records
+
+
+def _record_batch_error(batch, error, proc_sum, run_report):
+    for query in batch.queries:
+        proc_sum[STATUS_ERROR] += 1
+        run_report.append({
+            'query': query,
+            'status': STATUS_ERROR,
+            'error': error,
+            'elapsed': 0.0,
+        })
+
+
+def _execute_worker(worker, conn, specs, routing_modes, ring_name):
+    """
+    Worker process loop. The worker opens its own connections to both
+    database instances, runs the batches the coordinator sends, and only
+    sends back compact summaries: status, row count, timing and digests.
+    Diffs of mismatching queries go through the shared memory ring.
+    """
+
+    ring = SharedMemoryRing(name=ring_name)
+    dbs = []
+    try:
+        for db_cls, conn_params, settings in specs:
+            dbs.append(db_cls(conn_params=conn_params, settings=settings))
+        cursors = [db.cursor() for db in dbs]
+
+        for cursor, routing_mode in zip(cursors, routing_modes):
+            if routing_mode:
+                cursor.execute(ROUTING_MODE_SQL.format(routing_mode))
+
+        conn.send(('ready', None))
+        while True:
+            task = conn.recv()
+            if task is None:
+                break
+            queries, known_digests = task
+
+            records, elapsed = execute_queries(
+                cursors[0], cursors[1], queries, known_digests
+            )
+
+            ring.begin()
+            summaries = []
+            for idx, record in enumerate(records):
+                del record['query']
+                diff = record.pop('diff', None)
+                if diff is not None:
+                    record['diff_handle'] = ring.write_object(diff)
+                    if record['diff_handle'] is None:
+                        log.warning(
+                            "Diff of {} bytes does not fit the shared memory "
+                            "ring, dropping it".format(len(repr(diff)))
+                        )
+                summaries.append((idx, record))
 
-def _execute_worker():
-    pass
\ No newline at end of file
+            conn.send(('result', summaries))
+    except Exception as e:
+        log.exception("Worker {} failed".format(worker))
+        try:
+            conn.send(('error', str(e)))
+        except (OSError, ValueError):
+            pass
+    finally:
+        for db in dbs:
+            db.close()
+        ring.close()
+        conn.close()
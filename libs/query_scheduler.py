@@ -0,0 +1,325 @@
+import collections
+import hashlib
+import heapq
+import json
+import logging
+import os
+import re
+import threading
+
+from query_corpus import KIND_SELECT, classify_statement
+
+log = logging.getLogger(__name__)
+
+# Expected cost (seconds) for queries we have never seen before
+DEFAULT_QUERY_COST = 1.0
+
+# Weight given to the newest observation in the cost moving average
+DEFAULT_COST_ALPHA = 0.3
+
+# Queries cheaper than this (seconds) are candidates for batching
+DEFAULT_BATCH_THRESHOLD = 0.05
+
+# Maximum number of statements sent in a single multi-statement batch
+DEFAULT_MAX_BATCH_SIZE = 20
+
+_WHITESPACE_RE = re.compile(r'\s+')
+
+
+def normalize_query(query):
+    """
+    Normalize a query so that cosmetic differences (whitespace, trailing
+    semicolons) map to the same text.
+
+    Args:
+        query (str): SQL statement
+
+    Returns:
+        normalized (str): normalized SQL statement
+    """
+
+    return _WHITESPACE_RE.sub(' ', query).strip().rstrip(';').strip()
+
+
+def query_hash(query):
+    """
+    Stable hash of the normalized query text.
+
+    Args:
+        query (str): SQL statement
+
+    Returns:
+        digest (str): hex digest of the normalized query
+    """
+
+    return hashlib.sha1(
+        normalize_query(query).encode('utf-8')
+    ).hexdigest()
+
+
+class QueryCostHistory(object):
+    """
+    Persisted per-query cost history. Costs are stored as an exponentially
+    weighted moving average of observed wall time, keyed by the hash of the
+    normalized query text, in a small JSON file.
+
+    Example usage:
+
+        history = QueryCostHistory('/tmp/query_costs.json')
+        history.record('select 1', 0.002)
+        history.expected_cost('select 1')
+        history.save()
+    """
+
+    def __init__(
+            self,
+            filepath=None,
+            alpha=DEFAULT_COST_ALPHA,
+            default_cost=DEFAULT_QUERY_COST,
+    ):
+        """
+        Args:
+            filepath (str): JSON file to load from and save to. When None the
+                history lives only in memory.
+            alpha (float): weight of the newest observation
+            default_cost (float): expected cost of unseen queries
+        """
+
+        self._filepath = filepath
+        self._alpha = alpha
+        self._default_cost = default_cost
+        self._lock = threading.Lock()
+        self._costs = dict()
+        self._dirty = False
+
+        if filepath and os.path.isfile(filepath):
+            self.load()
+
+    @property
+    def filepath(self):
+        return self._filepath
+
+    def __len__(self):
+        return len(self._costs)
+
+    def __contains__(self, query):
+        return query_hash(query) in self._costs
+
+    def load(self):
+        """
+        Load cost history from self.filepath. A corrupt file is logged and
+        ignored, the history then starts empty.
+        """
+
+        try:
+            with open(self._filepath, 'r') as rfp:
+                costs = json.load(rfp)
+            self._costs = {k: float(v) for k, v in costs.items()}
+        except (IOError, ValueError) as e:
+            log.warning(
+                "Ignoring unreadable cost history {} ({})".format(
+                    self._filepath, str(e)
+                )
+            )
+            self._costs = dict()
+
+    def save(self):
+        """
+        Atomically write the cost history to self.filepath.
+        """
+
+        if not self._filepath or not self._dirty:
+            return
+
+        tmp_path = '{}.tmp'.format(self._filepath)
+        with self._lock:
+            with open(tmp_path, 'w') as wfp:
+                json.dump(self._costs, wfp)
+            os.replace(tmp_path, self._filepath)
+            self._dirty = False
+
+    def expected_cost(self, query):
+        """
+        Args:
+            query (str): SQL statement
+
+        Returns:
+            cost (float): expected wall time in seconds
+        """
+
+        return self._costs.get(query_hash(query), self._default_cost)
+
+    def record(self, query, elapsed):
+        """
+        Fold an observed wall time into the moving average.
+
+        Args:
+            query (str): SQL statement
+            elapsed (float): observed wall time in seconds
+        """
+
+        key = query_hash(query)
+        with self._lock:
+            previous = self._costs.get(key)
+            if previous is None:
+                self._costs[key] = elapsed
+            else:
+                self._costs[key] = (
+                    self._alpha * elapsed + (1 - self._alpha) * previous
+                )
+            self._dirty = True
+
+
+# A unit of work handed to a worker: one or more statements executed in a
+# single round trip, along with the sum of their expected costs.
+QueryBatch = collections.namedtuple('QueryBatch', ['queries', 'expected_cost'])
+
+
+def make_batches(
+        list_queries,
+        cost_history,
+        batch_threshold=DEFAULT_BATCH_THRESHOLD,
+        max_batch_size=DEFAULT_MAX_BATCH_SIZE,
+):
+    """
+    Group queries into batches. Queries whose expected cost is at least
+    batch_threshold are run on their own, cheaper queries are packed into
+    multi-statement batches of up to max_batch_size statements.
+
+    Queries with no recorded history are never batched as we cannot tell
+    whether they are cheap. Only SELECTs are batched: a failing batch is
+    re-run statement by statement, which must not repeat any writes.
+
+    Args:
+        list_queries (list): SQL statements
+        cost_history (QueryCostHistory): cost history
+        batch_threshold (float): cost (seconds) below which a query is cheap
+        max_batch_size (int): maximum statements per batch
+
+    Returns:
+        batches (list): list of QueryBatch
+    """
+
+    batches = []
+    cheap, cheap_cost = [], 0.0
+
+    for query in list_queries:
+        cost = cost_history.expected_cost(query)
+        if max_batch_size > 1 and query in cost_history and \
+                cost < batch_threshold and \
+                classify_statement(query) == KIND_SELECT:
+            cheap.append(query)
+            cheap_cost += cost
+            if len(cheap) == max_batch_size:
+                batches.append(QueryBatch(cheap, cheap_cost))
+                cheap, cheap_cost = [], 0.0
+        else:
+            batches.append(QueryBatch([query], cost))
+
+    if cheap:
+        batches.append(QueryBatch(cheap, cheap_cost))
+
+    return batches
+
+
+class WorkStealingScheduler(object):
+    """
+    Thread safe scheduler handing out QueryBatch objects to a fixed number of
+    workers.
+
+    Batches are assigned longest-expected-first to the least loaded worker
+    (LPT scheduling), and each worker consumes its own queue from the
+    longest end. A worker whose queue runs dry steals the cheapest pending
+    batch from the worker with the most expected work remaining, so late
+    long-running queries do not leave the other workers idle.
+
+    With preserve_order set the batches are dealt round-robin in the given
+    order and never sorted, which keeps random execution orders random.
+    """
+
+    def __init__(self, batches, num_workers, preserve_order=False):
+        """
+        Args:
+            batches (list): list of QueryBatch
+            num_workers (int): number of workers pulling from the scheduler
+            preserve_order (bool): keep the given order instead of LPT
+        """
+
+        if num_workers < 1:
+            raise ValueError("num_workers must be at least 1")
+
+        self._lock = threading.Lock()
+        self._queues = [collections.deque() for _ in range(num_workers)]
+        self._loads = [0.0] * num_workers
+        self.steals = 0
+
+        if preserve_order:
+            for idx, batch in enumerate(batches):
+                self._assign(idx % num_workers, batch)
+        else:
+            heap = [(0.0, worker) for worker in range(num_workers)]
+            ordered = sorted(
+                batches, key=lambda b: b.expected_cost, reverse=True
+            )
+            for batch in ordered:
+                load, worker = heapq.heappop(heap)
+                self._assign(worker, batch)
+                heapq.heappush(heap, (load + batch.expected_cost, worker))
+
+    def _assign(self, worker, batch):
+        self._queues[worker].append(batch)
+        self._loads[worker] += batch.expected_cost
+
+    @property
+    def num_workers(self):
+        return len(self._queues)
+
+    @property
+    def pending(self):
+        """
+        Number of batches not yet handed out.
+        """
+
+        with self._lock:
+            return sum(len(q) for q in self._queues)
+
+    def expected_loads(self):
+        """
+        Returns:
+            loads (list): expected remaining seconds of work per worker
+        """
+
+        with self._lock:
+            return list(self._loads)
+
+    def next_batch(self, worker):
+        """
+        Args:
+            worker (int): index of the requesting worker
+
+        Returns:
+            batch (QueryBatch): next batch to run, None when all work is done
+        """
+
+        with self._lock:
+            queue = self._queues[worker]
+            if queue:
+                batch = queue.popleft()
+                self._loads[worker] -= batch.expected_cost
+                return batch
+
+            # Steal from the victim with the most expected work remaining
+            victims = [w for w, q in enumerate(self._queues) if q]
+            if not victims:
+                return None
+            victim = max(victims, key=lambda w: self._loads[w])
+
+            batch = self._queues[victim].pop()
+            self._loads[victim] -= batch.expected_cost
+            self.steals += 1
+            log.debug(
+                "Worker {} stole a batch of {} queries from worker {}".format(
+                    worker, len(batch.queries), victim
+                )
+            )
+            return batch
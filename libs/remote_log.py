@@ -0,0 +1,262 @@
+import logging
+import shlex
+import time
+
+log = logging.getLogger(__name__)
+
+# Maximum bytes returned by a single poll
+DEF_MAX_READ = 16 * 1024 * 1024
+
+DEF_POLL_INTERVAL = 1.0
+
+
+class RemoteLogCursor(object):
+    """
+    Incremental reader of a growing remote file, typically a log. Every
+    poll() transfers only the bytes appended since the previous one over the
+    connection's persistent SFTP channel.
+
+    Rotation is detected by the file's inode: when the path points to a new
+    file, the rest of the old file is drained through the still open handle
+    before switching to the new file from its start. A file that shrank in
+    place (copytruncate) is re-read from its start; like tail -F, this is
+    only noticed if the file is polled before it grows past the old offset.
+
+    The position can be saved with state() and restored later, so repeated
+    runs of a monitor do not re-read what they already saw.
+
+    Example usage:
+
+        cursor = RemoteLogCursor(conn, '/var/log/mysql/error.log')
+        while running:
+            data = cursor.poll()
+            ...
+    """
+
+    def __init__(self, conn, path, offset=None, inode=None,
+                 max_read=DEF_MAX_READ):
+        """
+        Args:
+            conn (Connection): connection to the host holding the file
+            path (str): remote file path
+            offset (int): position to start from, the current end of the
+                file when None
+            inode (int): inode the offset refers to, e.g. from state()
+            max_read (int): maximum bytes returned by one poll
+        """
+        self._conn = conn
+        self._path = path
+        self._max_read = max_read
+        self._handle = None
+
+        current_inode, size = self._stat()
+        if offset is None:
+            offset = size or 0
+        if inode is not None and inode != current_inode:
+            # Rotated while we were away, the old file is gone for us
+            offset = 0
+        self._inode = current_inode
+        self._offset = offset
+        if current_inode is not None:
+            self._open()
+
+    @property
+    def path(self):
+        return self._path
+
+    @property
+    def offset(self):
+        return self._offset
+
+    def state(self):
+        """
+        Returns:
+            dictionary with path, inode and offset, accepted back as
+            RemoteLogCursor(conn, **state)
+        """
+        return {
+            'path': self._path,
+            'inode': self._inode,
+            'offset': self._offset,
+        }
+
+    def _stat(self):
+        """
+        Inode lookup, SFTP attributes do not carry it. Only needed when the
+        file is first opened or looks different from the open handle.
+
+        Returns:
+            (inode, size) of the file at path, (None, None) if missing
+        """
+        stdout, _, exit_code = self._conn.execute(
+            'stat -L -c "%i %s" {}'.format(shlex.quote(self._path)),
+            raise_on_error=False
+        )
+        if exit_code != 0:
+            return None, None
+        inode, size = stdout.split()
+        return int(inode), int(size)
+
+    def _path_attrs(self):
+        try:
+            return self._conn.sftp.stat(self._path)
+        except IOError:
+            return None
+
+    def _rotated(self, attrs):
+        """
+        The path no longer names the open file. The handle and the path
+        agreeing on size and mtime is the cheap common case, the inode is
+        only checked when they differ.
+        """
+        if attrs is None:
+            return True
+        handle_attrs = self._handle.stat()
+        if (handle_attrs.st_size, handle_attrs.st_mtime) == \
+                (attrs.st_size, attrs.st_mtime):
+            return False
+        inode, _ = self._stat()
+        return inode != self._inode
+
+    def _open(self):
+        self._handle = self._conn.sftp.open(self._path, 'rb')
+
+    def _read(self, limit):
+        """
+        Read from the open handle at the current offset, up to limit bytes.
+        """
+        self._handle.seek(self._offset)
+        data = self._handle.read(limit)
+        self._offset += len(data)
+        return data
+
+    def _close_handle(self):
+        if self._handle is not None:
+            self._handle.close()
+            self._handle = None
+
+    def poll(self):
+        """
+        Returns:
+            bytes appended since the previous poll, at most max_read
+        """
+        attrs = self._path_attrs()
+        data = b''
+
+        if self._handle is None:
+            if attrs is None:
+                return data
+            # The file appeared since the last poll
+            self._inode, _ = self._stat()
+            self._offset = 0
+            if self._inode is None:
+                return data
+            self._open()
+
+        elif self._rotated(attrs):
+            # Drain what was appended to the rotated file first
+            data = self._read(self._max_read)
+            if len(data) == self._max_read:
+                return data
+
+            log.info(
+                "{}:{} rotated".format(self._conn.hostname, self._path)
+            )
+            self._close_handle()
+            self._offset = 0
+            self._inode = None
+            if attrs is None:
+                return data
+            self._inode, _ = self._stat()
+            if self._inode is None:
+                return data
+            self._open()
+            attrs = self._handle.stat()
+
+        elif attrs.st_size < self._offset:
+            log.info(
+                "{}:{} truncated".format(self._conn.hostname, self._path)
+            )
+            self._offset = 0
+
+        remaining = self._max_read - len(data)
+        if attrs.st_size > self._offset and remaining > 0:
+            data += self._read(min(attrs.st_size - self._offset, remaining))
+        return data
+
+    def close(self):
+        self._close_handle()
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, exc_type, exc_val, exc_tb):
+        self.close()
+
+
+def fetch_since(conn, path, offset, max_bytes=DEF_MAX_READ):
+    """
+    Stateless incremental fetch: bytes of a remote file from offset to its
+    current end. A file smaller than offset was truncated or rotated and is
+    read from its start.
+
+    Args:
+        conn (Connection): connection to the host holding the file
+        path (str): remote file path
+        offset (int): position already fetched
+        max_bytes (int): maximum bytes returned
+
+    Returns:
+        tuple of (data, new offset)
+    """
+    size = conn.sftp.stat(path).st_size
+    if size < offset:
+        offset = 0
+    if size == offset:
+        return b'', offset
+
+    with conn.sftp.open(path, 'rb') as rfp:
+        rfp.seek(offset)
+        data = rfp.read(min(size - offset, max_bytes))
+    return data, offset + len(data)
+
+
+def tail(conn, path, follow=True, from_start=False,
+         poll_interval=DEF_POLL_INTERVAL, timeout=None, encoding='utf-8'):
+    """
+    Generator over the lines of a remote file, like tail -F.
+
+    Args:
+        conn (Connection): connection to the host holding the file
+        path (str): remote file path
+        follow (bool): keep waiting for new lines, stop at the end of the
+            file otherwise
+        from_start (bool): start at the beginning instead of the end
+        poll_interval (float): seconds between polls when idle
+        timeout (float): stop following after this many seconds
+        encoding (str): text encoding of the file
+
+    Yields:
+        lines without their trailing newline
+    """
+    deadline = None if timeout is None else time.monotonic() + timeout
+    pending = b''
+
+    with RemoteLogCursor(conn, path, 0 if from_start else None) as cursor:
+        while True:
+            data = cursor.poll()
+            if data:
+                lines = (pending + data).split(b'\n')
+                pending = lines.pop()
+                for line in lines:
+                    yield line.decode(encoding, errors='replace')
+                continue
+
+            if not follow:
+                break
+            if deadline is not None and time.monotonic() >= deadline:
+                break
+            time.sleep(poll_interval)
+
+    if pending:
+        yield pending.decode(encoding, errors='replace')
@@ -0,0 +1,746 @@
+"""
+Capture and replay of production traffic from MariaDB general or slow
+query logs.
+
+Logs are parsed as a stream of lines, from a local file or from a remote
+host through Connection.tail(), so a log of any size is replayed in
+bounded memory. Statements keep the connection (thread id) they were
+captured on: every captured connection is replayed on a connection of its
+own, taken from a pool, in its original order. Statements start at their
+original offset from the start of the capture, divided by the speed up
+factor.
+
+    statements = read_log('/var/log/mysql/slow.log', conn=host_conn)
+    report = WorkloadReplayer(conn_params, speed=2.0).replay(statements)
+    log.info(report.format())
+
+Replay runs every captured statement, writes included, so it is meant for
+a disposable copy of the captured database.
+"""
+import collections
+import gzip
+import logging
+import queue
+import re
+import threading
+import time
+from datetime import datetime, timezone
+
+from db.instrumentation import Histogram
+from db.mariadb import MariaDB
+
+log = logging.getLogger(__name__)
+
+clock = time.perf_counter
+
+LOG_GENERAL = 'general'
+LOG_SLOW = 'slow'
+
+# Captured commands replayed
+COMMAND_CONNECT = 'Connect'
+COMMAND_INIT_DB = 'Init DB'
+COMMAND_QUERY = 'Query'
+COMMAND_QUIT = 'Quit'
+
+DEFAULT_WORKERS = 8
+# Statements waiting per worker, the dispatcher blocks beyond that
+DEFAULT_QUEUE_SIZE = 1000
+# Seconds of the capture dispatched ahead of the replay clock
+DEFAULT_MAX_LEAD_SEC = 5.0
+# Pooled connections a worker holds at most, the least recently used is
+# released to open another one
+DEFAULT_CONNECTIONS_PER_WORKER = 32
+# Seconds after which a worker releases the connection of a captured
+# connection that never logged a Connect (all of them in slow logs, which
+# log neither connects nor quits) and ran no statement since
+DEFAULT_IDLE_TIMEOUT_SEC = 5.0
+# Distinct statement fingerprints reported, later ones are counted as
+# OTHER_FINGERPRINT
+MAX_FINGERPRINTS = 10000
+OTHER_FINGERPRINT = '<other>'
+# Lines read to detect the log format
+DETECT_LINES = 200
+
+# A statement of a captured connection. timestamp is epoch seconds of its
+# start (None if the log has none), latency the captured execution time in
+# seconds (slow logs only).
+CapturedStatement = collections.namedtuple(
+    'CapturedStatement',
+    ['thread_id', 'timestamp', 'command', 'sql', 'database', 'latency']
+)
+
+# MariaDB writes 'YYMMDD HH:MM:SS', MySQL and MariaDB with
+# log_timestamps ISO 8601
+_TIME_RE = r'(\d{6}\s+\d{1,2}:\d{2}:\d{2}|\d{4}-\d{2}-\d{2}T[\d:.]+Z?)'
+_GENERAL_ENTRY_RE = re.compile(
+    r'^(?:' + _TIME_RE + r')?\s+(\d+)\s+(Query|Execute|Connect|Quit|'
+    r'Init DB|Prepare|Close stmt|Reset stmt|Field List|Statistics|Ping|'
+    r'Change user|Long Data|Refresh|Shutdown|Kill|Processlist|Set option|'
+    r'Binlog Dump|Daemon|Debug)(?:\t| |$)(.*)$'
+)
+_GENERAL_HEADER_RE = re.compile(
+    r'^(\S+, Version: |Tcp port: |Time\s+Id\s+Command\s+Argument)'
+)
+_CONNECT_DB_RE = re.compile(r'\son\s+(\S*)\s+using\s')
+
+_SLOW_TIME_RE = re.compile(r'^# Time:\s*' + _TIME_RE)
+_SLOW_THREAD_RE = re.compile(r'(?:Thread_id|Id):\s*(\d+)')
+_SLOW_SCHEMA_RE = re.compile(r'Schema:\s*(\S*)')
+_SLOW_QUERY_TIME_RE = re.compile(r'Query_time:\s*([\d.]+)')
+_SLOW_SET_TIMESTAMP_RE = re.compile(r'^SET timestamp=(\d+(?:\.\d+)?);$', re.I)
+_SLOW_USE_RE = re.compile(r'^use `?([^`;]+)`?;$', re.I)
+
+_FINGERPRINT_RES = (
+    (re.compile(r"'(?:[^'\\]|\\.|'')*'"), '?'),
+    (re.compile(r'"(?:[^"\\]|\\.|"")*"'), '?'),
+    (re.compile(r'\b0x[0-9a-f]+\b', re.I), '?'),
+    (re.compile(r'(?<![\w.])-?\d+(?:\.\d+)?(?:e[-+]?\d+)?\b', re.I), '?'),
+    (re.compile(r'\s+'), ' '),
+    (re.compile(r'\(\?(?:\s*,\s*\?)+\)'), '(?+)'),
+    (re.compile(r'(\(\?\+\))(?:\s*,\s*\(\?\+\))+'), r'\1+'),
+)
+
+
+def _parse_time(value):
+    """
+    Returns:
+        epoch seconds of a log timestamp, None if it is not one
+    """
+    try:
+        if 'T' not in value:
+            return datetime.strptime(
+                ' '.join(value.split()), '%y%m%d %H:%M:%S').timestamp()
+        seconds, _, fraction = value.rstrip('Z').partition('.')
+        parsed = datetime.strptime(seconds, '%Y-%m-%dT%H:%M:%S')
+        if value.endswith('Z'):
+            parsed = parsed.replace(tzinfo=timezone.utc)
+        return parsed.timestamp() + float('0.' + (fraction or '0'))
+    except ValueError:
+        return None
+
+
+def fingerprint(sql):
+    """
+    Statement text with literals replaced by ?, grouping the executions of
+    a statement with different values.
+
+    Args:
+        sql (str): SQL statement
+
+    Returns:
+        fingerprint (str)
+    """
+    for regex, replacement in _FINGERPRINT_RES:
+        sql = regex.sub(replacement, sql)
+    return sql.strip().rstrip(';').strip()
+
+
+def parse_general_log(lines):
+    """
+    Statements of a general query log.
+
+    The general log timestamps an entry only when the second changed since
+    the previous one, so the statements of one second share its timestamp.
+
+    Args:
+        lines (iterable): lines of the log, without line endings
+
+    Yields:
+        CapturedStatement for every Connect, Init DB, Query (and Execute of
+        a prepared statement) and Quit
+    """
+    timestamp = None
+    databases = {}
+    entry = None
+
+    def finish(entry):
+        thread_id, ts, command, argument = entry
+        argument = '\n'.join(argument).strip()
+        if command == COMMAND_CONNECT:
+            match = _CONNECT_DB_RE.search(argument)
+            databases[thread_id] = match.group(1) if match else ''
+            return CapturedStatement(thread_id, ts, COMMAND_CONNECT, None,
+                                     databases[thread_id] or None, None)
+        if command == COMMAND_INIT_DB:
+            databases[thread_id] = argument
+            return CapturedStatement(thread_id, ts, COMMAND_INIT_DB, None,
+                                     argument, None)
+        if command in (COMMAND_QUERY, 'Execute'):
+            if not argument:
+                return None
+            return CapturedStatement(thread_id, ts, COMMAND_QUERY, argument,
+                                     databases.get(thread_id) or None, None)
+        if command == COMMAND_QUIT:
+            databases.pop(thread_id, None)
+            return CapturedStatement(thread_id, ts, COMMAND_QUIT, None, None,
+                                     None)
+        return None
+
+    for line in lines:
+        match = _GENERAL_ENTRY_RE.match(line)
+        if match:
+            if entry is not None:
+                statement = finish(entry)
+                if statement is not None:
+                    yield statement
+            if match.group(1):
+                timestamp = _parse_time(match.group(1))
+            entry = (int(match.group(2)), timestamp, match.group(3),
+                     [match.group(4)])
+        elif _GENERAL_HEADER_RE.match(line):
+            # Server (re)start banner
+            if entry is not None:
+                statement = finish(entry)
+                if statement is not None:
+                    yield statement
+            entry = None
+        elif entry is not None:
+            # Continuation of a multi-line statement
+            entry[3].append(line)
+
+    if entry is not None:
+        statement = finish(entry)
+        if statement is not None:
+            yield statement
+
+
+def parse_slow_log(lines):
+    """
+    Statements of a slow query log, with their captured Query_time as
+    baseline latency. Run it with long_query_time=0 to capture every
+    statement.
+
+    Args:
+        lines (iterable): lines of the log, without line endings
+
+    Yields:
+        CapturedStatement of every logged query
+    """
+    attrs = {}
+    text = []
+    databases = {}
+
+    def finish():
+        sql = '\n'.join(text).strip()
+        del text[:]
+        if not sql or 'thread_id' not in attrs:
+            return None
+        thread_id = attrs['thread_id']
+        if attrs.get('schema'):
+            databases[thread_id] = attrs['schema']
+        return CapturedStatement(
+            thread_id, attrs.get('timestamp'), COMMAND_QUERY, sql,
+            databases.get(thread_id), attrs.get('latency')
+        )
+
+    in_header = False
+    for line in lines:
+        if line.startswith('# '):
+            if not in_header:
+                statement = finish()
+                if statement is not None:
+                    yield statement
+                in_header = True
+                time_attr = attrs.get('time')
+                attrs = {'time': time_attr}
+
+            match = _SLOW_TIME_RE.match(line)
+            if match:
+                attrs['time'] = _parse_time(match.group(1))
+            match = _SLOW_THREAD_RE.search(line)
+            if match:
+                attrs['thread_id'] = int(match.group(1))
+            match = _SLOW_SCHEMA_RE.search(line)
+            if match:
+                attrs['schema'] = match.group(1)
+            match = _SLOW_QUERY_TIME_RE.search(line)
+            if match:
+                attrs['latency'] = float(match.group(1))
+            continue
+
+        if in_header:
+            in_header = False
+            attrs.setdefault('timestamp', attrs.get('time'))
+
+        if _GENERAL_HEADER_RE.match(line):
+            continue
+        match = _SLOW_SET_TIMESTAMP_RE.match(line.strip())
+        if match:
+            attrs['timestamp'] = float(match.group(1))
+            continue
+        match = _SLOW_USE_RE.match(line.strip())
+        if match and not text:
+            attrs['schema'] = match.group(1)
+            continue
+        text.append(line)
+
+    statement = finish()
+    if statement is not None:
+        yield statement
+
+
+def detect_log_format(lines):
+    """
+    Args:
+        lines (list): first lines of a log
+
+    Returns:
+        LOG_SLOW or LOG_GENERAL, None if neither is recognized
+    """
+    for line in lines:
+        if line.startswith('# Time:') or line.startswith('# User@Host:') \
+                or line.startswith('# Query_time:'):
+            return LOG_SLOW
+        match = _GENERAL_ENTRY_RE.match(line)
+        if match and match.group(3) in (COMMAND_QUERY, COMMAND_CONNECT,
+                                        COMMAND_QUIT, COMMAND_INIT_DB):
+            return LOG_GENERAL
+    return None
+
+
+def _local_lines(path):
+    opener = gzip.open if path.endswith('.gz') else open
+    with opener(path, 'rt', errors='replace') as fp:
+        for line in fp:
+            yield line.rstrip('\r\n')
+
+
+def read_log(path, conn=None, log_format=None, follow=False, timeout=None):
+    """
+    Stream the statements of a general or slow query log.
+
+    Args:
+        path (str): log file, local or on the host of conn
+        conn (Connection): connection to the database host, the log is
+            read locally without one
+        log_format (str): LOG_GENERAL or LOG_SLOW, detected by default
+        follow (bool): keep reading what the server appends, remote logs
+            only
+        timeout (float): stop following after this many seconds
+
+    Returns:
+        generator of CapturedStatement
+
+    Raises:
+        ValueError if the log format cannot be detected
+    """
+    if conn is None:
+        lines = _local_lines(path)
+    else:
+        lines = conn.tail(path, follow=follow, from_start=True,
+                          timeout=timeout)
+
+    if log_format is None:
+        head = []
+        for line in lines:
+            head.append(line)
+            if len(head) >= DETECT_LINES:
+                break
+        log_format = detect_log_format(head)
+        if log_format is None:
+            raise ValueError(
+                "{} is neither a general nor a slow query log".format(path))
+        lines = _chain(head, lines)
+
+    parser = parse_slow_log if log_format == LOG_SLOW else parse_general_log
+    return parser(lines)
+
+
+def _chain(head, rest):
+    for line in head:
+        yield line
+    for line in rest:
+        yield line
+
+
+StatementLatency = collections.namedtuple(
+    'StatementLatency',
+    ['fingerprint', 'count', 'errors', 'baseline_mean', 'baseline_p95',
+     'replay_mean', 'replay_p95', 'ratio']
+)
+
+
+class _FingerprintStats(object):
+
+    def __init__(self):
+        self.baseline = Histogram()
+        self.replay = Histogram()
+        self.errors = 0
+
+
+class ReplayReport(object):
+    """
+    Per fingerprint replay latencies against the captured baseline, kept in
+    fixed size histograms. Shared by the replay workers.
+    """
+
+    def __init__(self):
+        self._lock = threading.Lock()
+        self._stats = collections.OrderedDict()
+        self.statements = 0
+        self.errors = 0
+        # How late statements started against their intended replay time
+        self.lag = Histogram()
+        self.duration = 0.0
+
+    def _entry(self, sql):
+        key = fingerprint(sql)
+        stats = self._stats.get(key)
+        if stats is None:
+            if len(self._stats) >= MAX_FINGERPRINTS:
+                key = OTHER_FINGERPRINT
+                stats = self._stats.get(key)
+            if stats is None:
+                stats = self._stats[key] = _FingerprintStats()
+        return stats
+
+    def record(self, statement, latency, lag, error=None):
+        with self._lock:
+            stats = self._entry(statement.sql)
+            self.statements += 1
+            self.lag.add(max(0.0, lag))
+            if statement.latency is not None:
+                stats.baseline.add(statement.latency)
+            if error is not None:
+                stats.errors += 1
+                self.errors += 1
+            else:
+                stats.replay.add(latency)
+
+    def rows(self):
+        """
+        Returns:
+            list of StatementLatency, latencies in ms, by total replay time
+        """
+        rows = []
+        with self._lock:
+            for key, stats in self._stats.items():
+                baseline, replay = stats.baseline, stats.replay
+                baseline_mean = baseline.total / baseline.count * 1000 \
+                    if baseline.count else None
+                replay_mean = replay.total / replay.count * 1000 \
+                    if replay.count else None
+                rows.append(StatementLatency(
+                    fingerprint=key,
+                    count=replay.count + stats.errors,
+                    errors=stats.errors,
+                    baseline_mean=baseline_mean,
+                    baseline_p95=baseline.percentile(95) * 1000
+                    if baseline.count else None,
+                    replay_mean=replay_mean,
+                    replay_p95=replay.percentile(95) * 1000
+                    if replay.count else None,
+                    ratio=replay_mean / baseline_mean
+                    if replay_mean is not None and baseline_mean else None,
+                ))
+        rows.sort(key=lambda r: -(r.replay_mean or 0.0) * r.count)
+        return rows
+
+    def format(self, limit=20):
+        """
+        Returns:
+            the most expensive statements, replay against baseline
+        """
+        def ms(value):
+            return '{:.3f}'.format(value) if value is not None else '-'
+
+        lines = [
+            "Replayed {} statements in {:.1f}s, {} errors, p95 start lag "
+            "{:.1f} ms".format(self.statements, self.duration, self.errors,
+                               self.lag.percentile(95) * 1000),
+            "  {:>8} {:>6} {:>10} {:>10} {:>10} {:>10} {:>7}  {}".format(
+                'count', 'errors', 'base ms', 'base p95', 'replay ms',
+                'rep p95', 'ratio', 'statement'),
+        ]
+        for row in self.rows()[:limit]:
+            lines.append(
+                "  {:>8} {:>6} {:>10} {:>10} {:>10} {:>10} {:>7}  {}".format(
+                    row.count, row.errors, ms(row.baseline_mean),
+                    ms(row.baseline_p95), ms(row.replay_mean),
+                    ms(row.replay_p95),
+                    '{:.2f}'.format(row.ratio) if row.ratio else '-',
+                    row.fingerprint[:80]
+                )
+            )
+        return '\n'.join(lines)
+
+    def as_dict(self):
+        return {
+            'statements': self.statements,
+            'errors': self.errors,
+            'duration': self.duration,
+            'lag_p95_ms': self.lag.percentile(95) * 1000,
+            'statement_latencies': [r._asdict() for r in self.rows()],
+        }
+
+
+class _ReplaySession(object):
+    """
+    Pooled connection replaying a captured connection.
+    """
+
+    def __init__(self, db, connected):
+        self.db = db
+        # Current database
+        self.database = None
+        # Opened by a captured Connect, released by its Quit only
+        self.connected = connected
+        self.last_used = clock()
+
+
+class _ReplayWorker(threading.Thread):
+    """
+    Replays the captured connections assigned to it, each on a pooled
+    connection of its own, waiting for every statement's intended time.
+    Connections without a captured Connect are released once idle, and a
+    worker holds at most connections_per_worker of them.
+    """
+
+    def __init__(self, replayer, queue_size):
+        super(_ReplayWorker, self).__init__()
+        self.daemon = True
+        self.queue = queue.Queue(queue_size)
+        self.active = 0
+        self._replayer = replayer
+        # Captured thread id to _ReplaySession, least recently used first
+        self._sessions = collections.OrderedDict()
+
+    def _session(self, statement):
+        session = self._sessions.get(statement.thread_id)
+        if session is None:
+            if len(self._sessions) >= \
+                    self._replayer.connections_per_worker:
+                thread_id = next(iter(self._sessions))
+                log.debug("Thread {}: released for thread {}".format(
+                    thread_id, statement.thread_id))
+                self._release(thread_id)
+            session = self._sessions[statement.thread_id] = _ReplaySession(
+                self._replayer._acquire(),
+                statement.command == COMMAND_CONNECT
+            )
+        else:
+            self._sessions.move_to_end(statement.thread_id)
+        session.last_used = clock()
+        if statement.database and statement.database != session.database:
+            cursor = session.db.connection.cursor()
+            cursor.execute('USE `{}`'.format(statement.database))
+            cursor.close()
+            session.database = statement.database
+        return session.db
+
+    def _release(self, thread_id):
+        session = self._sessions.pop(thread_id, None)
+        if session is not None:
+            self._replayer._release(session.db)
+
+    def _release_idle(self):
+        timeout = self._replayer.idle_timeout
+        if timeout is None:
+            return
+        now = clock()
+        for thread_id, session in list(self._sessions.items()):
+            if not session.connected and now - session.last_used > timeout:
+                self._release(thread_id)
+
+    def run(self):
+        replayer = self._replayer
+        report = replayer.report
+        # Wake up to release idle connections while no statements arrive
+        wait = replayer.idle_timeout or None
+        while True:
+            self._release_idle()
+            try:
+                item = self.queue.get(timeout=wait)
+            except queue.Empty:
+                continue
+            if item is None:
+                break
+            intended, statement = item
+
+            # Connects and quits keep their timing too, so that as many
+            # connections are open as there were
+            delay = intended - clock()
+            if delay > 0:
+                time.sleep(delay)
+
+            if statement.command == COMMAND_QUIT:
+                self._release(statement.thread_id)
+                continue
+            if statement.command != COMMAND_QUERY:
+                try:
+                    self._session(statement)
+                except Exception as e:
+                    log.debug("Thread {}: {}".format(statement.thread_id, e))
+                continue
+
+            start = clock()
+            try:
+                db = self._session(statement)
+                cursor = db.connection.cursor()
+                try:
+                    cursor.execute(statement.sql)
+                    if cursor.with_rows:
+                        cursor.fetchall()
+                finally:
+                    cursor.close()
+            except Exception as e:
+                log.debug("Thread {}: {} failed: {}".format(
+                    statement.thread_id, statement.sql[:200], e))
+                report.record(statement, clock() - start, start - intended,
+                              error=e)
+                # A broken connection is not reused
+                if getattr(e, 'errno', None) in (2006, 2013):
+                    session = self._sessions.pop(statement.thread_id, None)
+                    if session is not None:
+                        session.db.close()
+            else:
+                report.record(statement, clock() - start, start - intended)
+
+        for thread_id in list(self._sessions):
+            self._release(thread_id)
+
+
+class WorkloadReplayer(object):
+    """
+    Replays captured statements against a database.
+
+    Every captured connection is assigned to the least busy of a fixed
+    number of worker threads for its whole life, so its statements run in
+    their original order on one connection. Workers take connections from
+    a shared pool and return them when the captured connection quits, or,
+    for captured connections without a logged Connect, once they are idle.
+    """
+
+    def __init__(self, conn_params, speed=1.0, workers=DEFAULT_WORKERS,
+                 queue_size=DEFAULT_QUEUE_SIZE,
+                 max_lead=DEFAULT_MAX_LEAD_SEC,
+                 connections_per_worker=DEFAULT_CONNECTIONS_PER_WORKER,
+                 idle_timeout=DEFAULT_IDLE_TIMEOUT_SEC):
+        """
+        Args:
+            conn_params (dict): connection parameters of the target database
+            speed (float): speed up of the original timing, 2.0 replays
+                twice as fast; 0 replays as fast as possible
+            workers (int): replay threads
+            queue_size (int): statements queued per worker
+            max_lead (float): seconds of capture read ahead of the replay
+            connections_per_worker (int): pooled connections a worker
+                holds at most
+            idle_timeout (float): seconds after which the connection of a
+                captured connection without a logged Connect is released,
+                0 to release it after every statement, None to keep it
+        """
+        if speed < 0:
+            raise ValueError("speed must not be negative")
+        if connections_per_worker < 1:
+            raise ValueError("connections_per_worker must be at least 1")
+        self.conn_params = conn_params
+        self.speed = speed
+        self.workers = workers
+        self.queue_size = queue_size
+        self.max_lead = max_lead
+        self.connections_per_worker = connections_per_worker
+        self.idle_timeout = idle_timeout
+        self.report = ReplayReport()
+        self._idle = queue.LifoQueue()
+        self._all = []
+        self._pool_lock = threading.Lock()
+
+    def _acquire(self):
+        try:
+            db = self._idle.get_nowait()
+        except queue.Empty:
+            db = MariaDB(self.conn_params, {'autocommit': True})
+            with self._pool_lock:
+                self._all.append(db)
+        if db.connection is None:
+            db.connect()
+        return db
+
+    def _release(self, db):
+        if db.connection is not None:
+            try:
+                # Session variables, temporary tables, open transactions
+                # of the captured connection must not leak into the next
+                db.connection.reset_session()
+            except Exception:
+                db.close()
+        self._idle.put(db)
+
+    def replay(self, statements):
+        """
+        Replay statements, as read_log() returns them.
+
+        Args:
+            statements (iterable): CapturedStatement in log order
+
+        Returns:
+            ReplayReport
+        """
+        workers = [_ReplayWorker(self, self.queue_size)
+                   for _ in range(self.workers)]
+        for worker in workers:
+            worker.start()
+
+        assignment = {}
+        first_ts = None
+        last_ts = None
+        started = clock()
+        try:
+            for statement in statements:
+                worker = assignment.get(statement.thread_id)
+                if worker is None:
+                    if statement.command == COMMAND_QUIT:
+                        continue
+                    worker = min(workers, key=lambda w: w.active)
+                    worker.active += 1
+                    assignment[statement.thread_id] = worker
+                if statement.command == COMMAND_QUIT:
+                    worker.active -= 1
+                    del assignment[statement.thread_id]
+
+                # Untimed entries run right after the previous one
+                ts = statement.timestamp
+                if ts is None:
+                    ts = last_ts
+                if ts is not None:
+                    last_ts = ts
+                    if first_ts is None:
+                        first_ts = ts
+
+                if self.speed and ts is not None:
+                    intended = started + (ts - first_ts) / self.speed
+                else:
+                    intended = started
+                lead = intended - clock() - self.max_lead
+                if lead > 0:
+                    time.sleep(lead)
+                worker.queue.put((intended, statement))
+        finally:
+            for worker in workers:
+                worker.queue.put(None)
+            for worker in workers:
+                worker.join()
+            for db in self._all:
+                db.close()
+            self.report.duration = clock() - started
+
+        return self.report
+
+
+def replay_log(conn_params, path, conn=None, log_format=None, **kwargs):
+    """
+    Replay a general or slow query log against a database.
+
+    Args:
+        conn_params (dict): connection parameters of the target database
+        path (str): log file, see read_log()
+        conn (Connection): connection to the host of the log
+        log_format (str): LOG_GENERAL or LOG_SLOW, detected by default
+        kwargs: options of WorkloadReplayer
+
+    Returns:
+        ReplayReport
+    """
+    statements = read_log(path, conn=conn, log_format=log_format)
+    return WorkloadReplayer(conn_params, **kwargs).replay(statements)
@@ -0,0 +1,318 @@
+import collections
+import decimal
+import hashlib
+import logging
+import math
+import os
+import sqlite3
+import threading
+import time
+
+from query_scheduler import query_hash
+
+log = logging.getLogger(__name__)
+
+DEFAULT_MAX_ENTRIES = 500000
+
+_DIGEST_MOD = 1 << 128
+_FIELD_SEP = '\x1f'
+_NULL = '\\N'
+# Prefixes of canonical values by kind
+_TAG_NUMBER = 'n'
+_TAG_STRING = 's'
+_TAG_BYTES = 'b'
+
+# Identifies one side of a comparison: the query result digest of a given
+# query depends on the data it runs against, the server build, and how the
+# server routes the query (e.g. mapi_monetdb_query_routing=OFF/ALWAYS).
+CacheKey = collections.namedtuple(
+    'CacheKey',
+    ['query_hash', 'data_checksum', 'server_version', 'routing_mode']
+)
+
+
+def _canonical_value(value):
+    """
+    Text form of a column value such that values comparing equal in Python
+    (e.g. Decimal('0') and Decimal('0E-10'), 1 and Decimal('1')) produce the
+    same text. The text starts with a tag of the kind of value, so that
+    e.g. the number 1 and the string '1' differ.
+    """
+
+    if value is None:
+        return _NULL
+    if isinstance(value, bool):
+        return _TAG_NUMBER + str(int(value))
+    if isinstance(value, int):
+        return _TAG_NUMBER + str(value)
+    if isinstance(value, float):
+        if math.isfinite(value) and value == int(value):
+            return _TAG_NUMBER + str(int(value))
+        return _TAG_NUMBER + repr(value)
+    if isinstance(value, decimal.Decimal):
+        if value.is_finite() and value == value.to_integral_value():
+            return _TAG_NUMBER + str(int(value))
+        return _TAG_NUMBER + str(value.normalize())
+    if isinstance(value, (bytes, bytearray)):
+        return _TAG_BYTES + value.hex()
+    if isinstance(value, str):
+        return _TAG_STRING + value
+    # Dates, times, sets, ...: tagged with their type
+    return '{}:{}'.format(type(value).__name__, value)
+
+
+def row_hash(row):
+    """
+    Args:
+        row (tuple): result row
+
+    Returns:
+        value (int): 128 bit hash of the canonical row text
+    """
+
+    text = _FIELD_SEP.join(_canonical_value(v) for v in row)
+    return int.from_bytes(
+        hashlib.md5(text.encode('utf-8')).digest(), 'big'
+    )
+
+
+def result_digest(rows):
+    """
+    Order independent digest of a result set. The digest is the row count
+    and the sum of the row hashes modulo 2^128, so duplicate rows are
+    accounted for, unlike with XOR.
+
+    Args:
+        rows (list): result rows
+
+    Returns:
+        digest (str): '<row count>:<hex sum>'
+    """
+
+    total = 0
+    count = 0
+    for row in rows:
+        total = (total + row_hash(row)) % _DIGEST_MOD
+        count += 1
+    return '{}:{:032x}'.format(count, total)
+
+
+class ResultFingerprintCache(object):
+    """
+    Persistent cache of result digests backed by a SQLite file.
+
+    Entries are keyed by CacheKey. Lookups refresh an entry's last use time
+    and the least recently used entries are evicted once the cache grows
+    beyond max_entries.
+
+    Entries never go stale by themselves as every input that affects a
+    result is part of the key. The invalidate* methods allow dropping
+    entries explicitly, e.g. after a server side bug fix that does not bump
+    the version string.
+
+    The cache is thread safe.
+
+    Example usage:
+
+        cache = ResultFingerprintCache('/tmp/results.sqlite')
+        key = cache.make_key('select 1', data_checksum, version, 'OFF')
+        if cache.get(key) is None:
+            cache.put(key, result_digest(rows))
+    """
+
+    _SCHEMA = (
+        "CREATE TABLE IF NOT EXISTS digests ("
+        " query_hash TEXT NOT NULL,"
+        " data_checksum TEXT NOT NULL,"
+        " server_version TEXT NOT NULL,"
+        " routing_mode TEXT NOT NULL,"
+        " digest TEXT NOT NULL,"
+        " last_used REAL NOT NULL,"
+        " PRIMARY KEY (query_hash, data_checksum, server_version,"
+        " routing_mode))"
+    )
+
+    def __init__(self, filepath=':memory:', max_entries=DEFAULT_MAX_ENTRIES):
+        """
+        Args:
+            filepath (str): SQLite file, in memory by default
+            max_entries (int): maximum number of digests kept
+        """
+
+        if filepath != ':memory:':
+            dirname = os.path.dirname(os.path.abspath(filepath))
+            os.makedirs(dirname, exist_ok=True)
+
+        self._filepath = filepath
+        self._max_entries = max_entries
+        self._lock = threading.Lock()
+        self._db = sqlite3.connect(filepath, check_same_thread=False)
+        self._db.execute(self._SCHEMA)
+        self._db.execute(
+            "CREATE INDEX IF NOT EXISTS digests_lru ON digests (last_used)"
+        )
+        self._db.commit()
+        self._count, last_stamp = self._db.execute(
+            "SELECT COUNT(*), MAX(last_used) FROM digests"
+        ).fetchone()
+        self._last_stamp = last_stamp or 0.0
+
+    def _stamp(self):
+        """
+        Strictly increasing use time, so entries touched within the clock
+        resolution still evict in order.
+        """
+
+        self._last_stamp = max(time.time(), self._last_stamp + 1e-6)
+        return self._last_stamp
+
+    @staticmethod
+    def make_key(query, data_checksum, server_version, routing_mode):
+        """
+        Args:
+            query (str): SQL statement, normalized before hashing
+            data_checksum (str): checksum of the schema and data queried
+            server_version (str): server build, e.g. SELECT VERSION()
+            routing_mode (str): query routing mode of the session
+
+        Returns:
+            key (CacheKey): cache key
+        """
+
+        return CacheKey(
+            query_hash(query), str(data_checksum or ''),
+            str(server_version or ''), str(routing_mode or ''),
+        )
+
+    def __len__(self):
+        return self._count
+
+    def get(self, key):
+        """
+        Args:
+            key (CacheKey): cache key
+
+        Returns:
+            digest (str): cached digest, None on a cache miss
+        """
+
+        with self._lock:
+            row = self._db.execute(
+                "SELECT digest FROM digests WHERE query_hash=? AND "
+                "data_checksum=? AND server_version=? AND routing_mode=?",
+                tuple(key)
+            ).fetchone()
+            if row is None:
+                return None
+            self._db.execute(
+                "UPDATE digests SET last_used=? WHERE query_hash=? AND "
+                "data_checksum=? AND server_version=? AND routing_mode=?",
+                (self._stamp(),) + tuple(key)
+            )
+            self._db.commit()
+            return row[0]
+
+    def put(self, key, digest):
+        """
+        Store digest under key, evicting the least recently used entries if
+        the cache is full.
+
+        Args:
+            key (CacheKey): cache key
+            digest (str): result digest
+        """
+
+        with self._lock:
+            now = self._stamp()
+            inserted = self._db.execute(
+                "INSERT OR IGNORE INTO digests VALUES (?, ?, ?, ?, ?, ?)",
+                tuple(key) + (digest, now)
+            ).rowcount
+            if inserted:
+                self._count += 1
+            else:
+                self._db.execute(
+                    "UPDATE digests SET digest=?, last_used=? WHERE "
+                    "query_hash=? AND data_checksum=? AND server_version=? "
+                    "AND routing_mode=?", (digest, now) + tuple(key)
+                )
+            self._evict()
+            self._db.commit()
+
+    def _evict(self):
+        excess = self._count - self._max_entries
+        if excess > 0:
+            log.debug("Evicting {} result digests".format(excess))
+            self._count -= self._db.execute(
+                "DELETE FROM digests WHERE rowid IN (SELECT rowid FROM "
+                "digests ORDER BY last_used LIMIT ?)", (excess,)
+            ).rowcount
+
+    def invalidate(self, query=None, data_checksum=None, server_version=None,
+                   routing_mode=None):
+        """
+        Drop every entry matching all of the given fields. Calling it without
+        arguments clears the cache.
+
+        Args:
+            query (str): SQL statement
+            data_checksum (str): checksum of the schema and data
+            server_version (str): server build
+            routing_mode (str): query routing mode
+
+        Returns:
+            count (int): number of entries dropped
+        """
+
+        clauses, params = [], []
+        for column, value in (
+                ('query_hash', query and query_hash(query)),
+                ('data_checksum', data_checksum),
+                ('server_version', server_version),
+                ('routing_mode', routing_mode)):
+            if value is not None:
+                clauses.append('{}=?'.format(column))
+                params.append(str(value))
+
+        sql = "DELETE FROM digests"
+        if clauses:
+            sql += " WHERE " + " AND ".join(clauses)
+
+        with self._lock:
+            count = self._db.execute(sql, params).rowcount
+            self._db.commit()
+            self._count -= count
+
+        log.info("Invalidated {} result digests".format(count))
+        return count
+
+    def invalidate_data(self, data_checksum):
+        """
+        Drop every entry recorded against the given data checksum.
+        """
+
+        return self.invalidate(data_checksum=data_checksum)
+
+    def invalidate_server(self, server_version):
+        """
+        Drop every entry recorded against the given server build.
+        """
+
+        return self.invalidate(server_version=server_version)
+
+    def clear(self):
+        """
+        Drop every entry.
+        """
+
+        return self.invalidate()
+
+    def close(self):
+        with self._lock:
+            self._db.close()
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, exc_type, exc_val, exc_tb):
+        self.close()
@@ -0,0 +1,145 @@
+import logging
+import pickle
+
+from multiprocessing import shared_memory
+
+log = logging.getLogger(__name__)
+
+DEFAULT_RING_SIZE = 4 * 1024 * 1024
+
+
+class SharedMemoryRing(object):
+    """
+    Single producer ring buffer on top of multiprocessing.shared_memory, used
+    to hand large, rare payloads from a worker process to its coordinator
+    without pushing them through a pipe.
+
+    The coordinator creates the ring and passes its name to the worker, which
+    attaches to it. The worker writes payloads and sends only the returned
+    (offset, length) handles through its pipe. The protocol is request and
+    response: the worker calls begin() before writing the payloads of a new
+    message, which it may only do once the coordinator has read the payloads
+    of the previous message. Payloads that do not fit in the space left for
+    the current message are dropped and write() returns None.
+
+    Example usage:
+
+        # coordinator
+        ring = SharedMemoryRing(create=True)
+        # worker
+        ring = SharedMemoryRing(name=ring_name)
+        ring.begin()
+        handle = ring.write_object(diff)
+        # coordinator, after receiving handle
+        diff = ring.read_object(handle)
+    """
+
+    def __init__(self, name=None, size=DEFAULT_RING_SIZE, create=False):
+        """
+        Args:
+            name (str): name of an existing segment to attach to
+            size (int): segment size in bytes when creating
+            create (bool): create a new segment instead of attaching
+        """
+
+        self._owner = create
+        if create:
+            self._shm = shared_memory.SharedMemory(create=True, size=size)
+        else:
+            # Workers are children of the creator and share its resource
+            # tracker, so attaching does not register a second owner
+            self._shm = shared_memory.SharedMemory(name=name)
+        self._size = size if create else self._shm.size
+        self._head = 0
+        self._free = self._size
+
+    @property
+    def name(self):
+        return self._shm.name
+
+    @property
+    def size(self):
+        return self._size
+
+    def begin(self):
+        """
+        Start a new message. All space not written since is reusable as the
+        reader has consumed the previous message.
+        """
+
+        self._free = self._size
+
+    def write(self, payload):
+        """
+        Args:
+            payload (bytes): data to store
+
+        Returns:
+            handle (tuple): (offset, length), None if it does not fit
+        """
+
+        length = len(payload)
+        offset = self._head
+        if offset + length > self._size:
+            # Skip the tail end of the buffer and wrap around
+            skipped = self._size - offset
+            if skipped + length > self._free:
+                return None
+            self._free -= skipped
+            offset = 0
+        if length > self._free:
+            return None
+
+        self._shm.buf[offset:offset + length] = payload
+        self._head = offset + length
+        self._free -= length
+        return offset, length
+
+    def read(self, handle):
+        """
+        Args:
+            handle (tuple): (offset, length) returned by write()
+
+        Returns:
+            payload (bytes): a copy of the stored data
+        """
+
+        offset, length = handle
+        return bytes(self._shm.buf[offset:offset + length])
+
+    def write_object(self, obj):
+        """
+        Pickle obj into the ring.
+
+        Returns:
+            handle (tuple): (offset, length), None if it does not fit
+        """
+
+        return self.write(pickle.dumps(obj, protocol=pickle.HIGHEST_PROTOCOL))
+
+    def read_object(self, handle):
+        """
+        Returns:
+            obj: the object stored with write_object()
+        """
+
+        offset, length = handle
+        return pickle.loads(self._shm.buf[offset:offset + length])
+
+    def close(self):
+        """
+        Detach from the segment, the creator also destroys it.
+        """
+
+        self._shm.close()
+        if self._owner:
+            try:
+                self._shm.unlink()
+            except FileNotFoundError:
+                pass
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, exc_type, exc_val, exc_tb):
+        self.close()
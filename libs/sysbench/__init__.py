@@ -1,4 +1,31 @@
-from .sysbench_config import SysbenchConfig
-from .sysbenchutil import Sysbench
-from .sysbench_exception import SBMultipleJobs
-from .sysbench_log_parser import SysbenchParseLogfile
+import importlib
+
+# Public names and the submodule defining them, imported on first access
+# (PEP 562): configs can be read without loading paramiko or
+# multiprocessing, which only Sysbench needs.
+_LAZY_ATTRS = {
+    'SysbenchConfig': '.sysbench_config',
+    'Sysbench': '.sysbenchutil',
+    'SBMultipleJobs': '.sysbench_exception',
+    'SBConfigInvalid': '.sysbench_exception',
+    'SysbenchParseLogfile': '.sysbench_log_parser',
+    'LoadGenerator': '.loadgen',
+    'run_job': '.loadgen',
+}
+
+__all__ = list(_LAZY_ATTRS)
+
+
+def __getattr__(name):
+    module = _LAZY_ATTRS.get(name)
+    if module is None:
+        raise AttributeError(
+            "module {!r} has no attribute {!r}".format(__name__, name)
+        )
+    value = getattr(importlib.import_module(module, __name__), name)
+    globals()[name] = value
+    return value
+
+
+def __dir__():
+    return sorted(set(globals()) | set(_LAZY_ATTRS))
@@ -0,0 +1,859 @@
+"""
+In-process OLTP load generator, an alternative to running sysbench on
+client hosts.
+
+It runs the sysbench OLTP tests (oltp_point_select, oltp_read_only,
+oltp_write_only and oltp_read_write) described by a configuration of the
+sysbench yaml format, from threads sharing a pool of MariaDB connections:
+
+    sysbench:
+        config_rw:
+            options:
+                mysql-host:     localhost
+                mysql-port:     3306
+                mysql-user:     sbtest
+                mysql-password: sbtest
+                threads:        8
+                tables:         4
+                table-size:     100000
+                time:           60
+                rate:           0
+            testname:   oltp_read_write
+            commands:   [prepare, run, cleanup]
+
+With rate 0 every thread starts its next transaction as soon as the
+previous one finished (closed loop). With a rate, transactions arrive at
+that constant rate whatever the response times are (open loop) and wait
+in a queue for a free thread. Open loop latencies are measured from the
+time a transaction was due to start, so time spent queued behind a
+stalled server is part of the latency rather than silently not measured
+(coordinated omission); the service time alone is reported separately.
+"""
+import array
+import collections
+import logging
+import math
+import os
+import queue
+import random
+import threading
+import time
+
+from db.mariadb import MariaDB
+
+from .sysbench_config import SysbenchConfig
+from .sysbench_exception import SBConfigInvalid
+
+log = logging.getLogger(__name__)
+
+clock = time.perf_counter
+
+OLTP_TESTS = (
+    'oltp_point_select',
+    'oltp_read_only',
+    'oltp_write_only',
+    'oltp_read_write',
+)
+
+COMMANDS = ('prepare', 'run', 'cleanup')
+
+# Supported options and their defaults, the same as sysbench's
+DEFAULT_OPTIONS = {
+    'mysql-host': 'localhost',
+    'mysql-port': 3306,
+    'mysql-user': 'sbtest',
+    'mysql-password': '',
+    'mysql-db': 'sbtest',
+    'threads': 1,
+    'tables': 1,
+    'table-size': 10000,
+    # Seconds to run for, 0 to run until events transactions are done
+    'time': 10,
+    'events': 0,
+    # Transactions per second over all threads, 0 runs closed loop
+    'rate': 0,
+    'report-interval': 1,
+    'rand-seed': 0,
+    'range-size': 100,
+    'point-selects': 10,
+    'simple-ranges': 1,
+    'sum-ranges': 1,
+    'order-ranges': 1,
+    'distinct-ranges': 1,
+    'index-updates': 1,
+    'non-index-updates': 1,
+    'delete-inserts': 1,
+    'skip-trx': False,
+}
+
+# Rows per INSERT when preparing tables
+PREPARE_BATCH_SIZE = 1000
+
+# Errors after which the transaction is rolled back and counted as an
+# error: deadlock, lock wait timeout, record changed since last read
+RETRY_ERRNOS = (1213, 1205, 1020)
+# Errors after which the connection is reopened: server gone, lost
+RECONNECT_ERRNOS = (2006, 2013)
+
+# One reporting interval of a run, rates per second and the latency
+# percentile in milliseconds. queue_length (arrivals waiting for a thread)
+# and concurrency (transactions running) are sampled at the end of the
+# interval, open loop runs only.
+IntervalStats = collections.namedtuple(
+    'IntervalStats',
+    ['time', 'threads', 'tps', 'qps', 'reads', 'writes', 'other',
+     'latency_pct', 'errors', 'reconnects', 'queue_length', 'concurrency'],
+    defaults=(0, 0)
+)
+
+
+def _bool_option(value):
+    if isinstance(value, str):
+        return value.lower() in ('on', 'true', 'yes', '1')
+    return bool(value)
+
+
+class WorkloadOptions(object):
+    """
+    Options of a load generator run, from a SysbenchTestConfig.
+    """
+
+    def __init__(self, test_config, **overrides):
+        """
+        Args:
+            test_config (SysbenchTestConfig): configuration to run
+            overrides: option values replacing the configured ones, with
+                underscores for dashes (table_size=1000)
+
+        Raises:
+            SBConfigInvalid for tests other than OLTP_TESTS and options of
+            the wrong type
+        """
+        testname = os.path.basename(test_config.testname)
+        if testname.endswith('.lua'):
+            testname = testname[:-len('.lua')]
+        if testname not in OLTP_TESTS:
+            raise SBConfigInvalid(
+                "{}: test {} is not one of {}".format(
+                    test_config.name, testname, ', '.join(OLTP_TESTS))
+            )
+        self.name = test_config.name
+        self.testname = testname
+
+        values = dict(DEFAULT_OPTIONS)
+        for option, value in test_config.options:
+            if option in values:
+                values[option] = value
+            else:
+                log.debug("{}: ignoring option {}".format(self.name, option))
+        for option, value in overrides.items():
+            if value is not None:
+                values[option.replace('_', '-')] = value
+
+        self._values = {}
+        for option, default in DEFAULT_OPTIONS.items():
+            value = values[option]
+            try:
+                if isinstance(default, bool):
+                    value = _bool_option(value)
+                elif isinstance(default, int):
+                    value = int(value)
+                elif isinstance(default, float):
+                    value = float(value)
+                else:
+                    value = str(value)
+            except (TypeError, ValueError):
+                raise SBConfigInvalid("{}: option {}={!r} must be a {}".format(
+                    self.name, option, value, type(default).__name__))
+            self._values[option] = value
+
+    def __getitem__(self, option):
+        return self._values[option]
+
+    @property
+    def conn_params(self):
+        return {
+            'host': self['mysql-host'],
+            'port': self['mysql-port'],
+            'user': self['mysql-user'],
+            'password': self['mysql-password'],
+            'dbname': self['mysql-db'],
+        }
+
+    @property
+    def reads(self):
+        return self.testname in ('oltp_read_only', 'oltp_read_write')
+
+    @property
+    def writes(self):
+        return self.testname in ('oltp_write_only', 'oltp_read_write')
+
+
+class ConnectionPool(object):
+    """
+    Fixed size pool of MariaDB connections shared by the worker threads.
+    """
+
+    def __init__(self, conn_params, size):
+        self._conn_params = conn_params
+        self._idle = queue.LifoQueue()
+        for _ in range(size):
+            self._idle.put(MariaDB(conn_params, {'autocommit': True}))
+        self._all = list(self._idle.queue)
+
+    def acquire(self):
+        """
+        Returns:
+            MariaDB instance, connected; blocks until one is idle
+        """
+        db = self._idle.get()
+        if db.connection is None:
+            try:
+                db.connect()
+            except Exception:
+                self._idle.put(db)
+                raise
+        return db
+
+    def release(self, db):
+        self._idle.put(db)
+
+    def close(self):
+        for db in self._all:
+            try:
+                db.close()
+            except Exception:
+                pass
+
+
+def _random_string(rng, groups):
+    return '-'.join('{:011d}'.format(rng.randrange(10 ** 11))
+                    for _ in range(groups))
+
+
+class OltpWorkload(object):
+    """
+    Schema and transactions of the sysbench OLTP tests.
+    """
+
+    def __init__(self, options):
+        self.options = options
+
+    def table(self, index):
+        return 'sbtest{}'.format(index)
+
+    def prepare(self, pool):
+        """
+        Create and fill the tables, one thread per table up to the number
+        of threads.
+        """
+        tables = list(range(1, self.options['tables'] + 1))
+        errors = []
+
+        def prepare_tables():
+            db = pool.acquire()
+            try:
+                while True:
+                    try:
+                        index = tables.pop()
+                    except IndexError:
+                        return
+                    self._prepare_table(db, index)
+            except Exception as e:
+                errors.append(e)
+            finally:
+                pool.release(db)
+
+        threads = [threading.Thread(target=prepare_tables)
+                   for _ in range(min(len(tables), self.options['threads']))]
+        for thread in threads:
+            thread.start()
+        for thread in threads:
+            thread.join()
+        if errors:
+            raise errors[0]
+
+    def _prepare_table(self, db, index):
+        table = self.table(index)
+        log.info("Creating table {}".format(table))
+        rng = random.Random(self.options['rand-seed'] + index)
+        size = self.options['table-size']
+        cursor = db.connection.cursor()
+        try:
+            cursor.execute(
+                "CREATE TABLE IF NOT EXISTS {} ("
+                "id INTEGER NOT NULL AUTO_INCREMENT, "
+                "k INTEGER DEFAULT '0' NOT NULL, "
+                "c CHAR(120) DEFAULT '' NOT NULL, "
+                "pad CHAR(60) DEFAULT '' NOT NULL, "
+                "PRIMARY KEY (id))".format(table)
+            )
+            sql = "INSERT INTO {} (k, c, pad) VALUES (%s, %s, %s)".format(
+                table)
+            for start in range(0, size, PREPARE_BATCH_SIZE):
+                cursor.executemany(sql, [
+                    (rng.randint(1, size), _random_string(rng, 10),
+                     _random_string(rng, 5))
+                    for _ in range(min(PREPARE_BATCH_SIZE, size - start))
+                ])
+            cursor.execute(
+                "CREATE INDEX k_{0} ON {1} (k)".format(index, table))
+        finally:
+            cursor.close()
+
+    def cleanup(self, pool):
+        db = pool.acquire()
+        try:
+            cursor = db.connection.cursor()
+            for index in range(1, self.options['tables'] + 1):
+                log.info("Dropping table {}".format(self.table(index)))
+                cursor.execute(
+                    "DROP TABLE IF EXISTS {}".format(self.table(index)))
+            cursor.close()
+        finally:
+            pool.release(db)
+
+    def transaction(self, cursor, rng):
+        """
+        Run one transaction of the test.
+
+        Returns:
+            tuple of (reads, writes, other) statement counts
+        """
+        options = self.options
+        table = self.table(rng.randint(1, options['tables']))
+        size = options['table-size']
+        reads = writes = other = 0
+
+        def row_id():
+            return rng.randint(1, size)
+
+        def id_range():
+            start = rng.randint(1, max(1, size - options['range-size']))
+            return start, start + options['range-size'] - 1
+
+        def read(sql, params):
+            cursor.execute(sql, params)
+            cursor.fetchall()
+
+        if self.options.testname == 'oltp_point_select':
+            read("SELECT c FROM {} WHERE id=%s".format(table), (row_id(),))
+            return 1, 0, 0
+
+        use_trx = not options['skip-trx']
+        if use_trx:
+            cursor.execute("BEGIN")
+            other += 1
+
+        if self.options.reads:
+            for _ in range(options['point-selects']):
+                read("SELECT c FROM {} WHERE id=%s".format(table),
+                     (row_id(),))
+            for _ in range(options['simple-ranges']):
+                read("SELECT c FROM {} WHERE id BETWEEN %s AND %s".format(
+                    table), id_range())
+            for _ in range(options['sum-ranges']):
+                read("SELECT SUM(k) FROM {} WHERE id BETWEEN %s AND "
+                     "%s".format(table), id_range())
+            for _ in range(options['order-ranges']):
+                read("SELECT c FROM {} WHERE id BETWEEN %s AND %s "
+                     "ORDER BY c".format(table), id_range())
+            for _ in range(options['distinct-ranges']):
+                read("SELECT DISTINCT c FROM {} WHERE id BETWEEN %s AND %s "
+                     "ORDER BY c".format(table), id_range())
+            reads += (options['point-selects'] + options['simple-ranges'] +
+                      options['sum-ranges'] + options['order-ranges'] +
+                      options['distinct-ranges'])
+
+        if self.options.writes:
+            for _ in range(options['index-updates']):
+                cursor.execute(
+                    "UPDATE {} SET k=k+1 WHERE id=%s".format(table),
+                    (row_id(),))
+            for _ in range(options['non-index-updates']):
+                cursor.execute(
+                    "UPDATE {} SET c=%s WHERE id=%s".format(table),
+                    (_random_string(rng, 10), row_id()))
+            for _ in range(options['delete-inserts']):
+                deleted = row_id()
+                cursor.execute(
+                    "DELETE FROM {} WHERE id=%s".format(table), (deleted,))
+                cursor.execute(
+                    "INSERT INTO {} (id, k, c, pad) VALUES "
+                    "(%s, %s, %s, %s)".format(table),
+                    (deleted, row_id(), _random_string(rng, 10),
+                     _random_string(rng, 5)))
+            writes += (options['index-updates'] +
+                       options['non-index-updates'] +
+                       2 * options['delete-inserts'])
+
+        if use_trx:
+            cursor.execute("COMMIT")
+            other += 1
+        return reads, writes, other
+
+
+class _Recorder(object):
+    """
+    Counters and latencies of the running interval and of the whole run,
+    shared by the worker threads.
+    """
+
+    def __init__(self):
+        self._lock = threading.Lock()
+        # Response times, from the intended start in open loop runs
+        self.latencies = array.array('d')
+        # Time from the actual start of the transaction
+        self.service_times = array.array('d')
+        self.totals = collections.Counter()
+        self.concurrency = 0
+        self._reset_interval()
+
+    def _reset_interval(self):
+        self._interval = collections.Counter()
+        self._interval_latencies = array.array('d')
+
+    def enter(self):
+        with self._lock:
+            self.concurrency += 1
+
+    def leave(self):
+        with self._lock:
+            self.concurrency -= 1
+
+    def record(self, latency, service_time, reads, writes, other):
+        with self._lock:
+            self._interval_latencies.append(latency)
+            self.latencies.append(latency)
+            self.service_times.append(service_time)
+            for counters in (self._interval, self.totals):
+                counters['transactions'] += 1
+                counters['reads'] += reads
+                counters['writes'] += writes
+                counters['other'] += other
+
+    def count(self, name):
+        with self._lock:
+            self._interval[name] += 1
+            self.totals[name] += 1
+
+    def take_interval(self):
+        """
+        Returns:
+            tuple of (counters, latencies) of the interval, starting a new
+            one
+        """
+        with self._lock:
+            interval = self._interval, self._interval_latencies
+            self._reset_interval()
+        return interval
+
+
+def percentile(values, pct):
+    """
+    Args:
+        values (sequence): values, need not be sorted
+        pct (float): percentile, 0 to 100
+
+    Returns:
+        the nearest-rank percentile, 0.0 for no values
+    """
+    if not len(values):
+        return 0.0
+    ordered = sorted(values)
+    rank = max(1, math.ceil(pct / 100.0 * len(ordered)))
+    return ordered[min(rank, len(ordered)) - 1]
+
+
+class LoadResult(object):
+    """
+    Outcome of a run: the per-interval statistics and the totals.
+    """
+
+    def __init__(self, options, intervals, totals, latencies, duration,
+                 service_times=None):
+        self.options = options
+        self.intervals = intervals
+        self.totals = totals
+        self.latencies = latencies
+        self.duration = duration
+        self.service_times = service_times if service_times is not None \
+            else latencies
+
+    def summary(self):
+        """
+        Returns:
+            dictionary of the sections and values of the sysbench final
+            report, as SysbenchParseLogfile returns them; latencies in ms.
+            Open loop runs add the service time as 'Service_time' and the
+            event queue as 'queue'.
+        """
+        totals = self.totals
+        queries = totals['reads'] + totals['writes'] + totals['other']
+        duration = self.duration or float('nan')
+        summary = {
+            'SQL_statistics': {
+                'read': totals['reads'],
+                'write': totals['writes'],
+                'other': totals['other'],
+                'total': queries,
+                'transactions': totals['transactions'],
+                'tps': totals['transactions'] / duration,
+                'queries': queries,
+                'qps': queries / duration,
+                'ignored_errors': totals['errors'],
+                'reconnects': totals['reconnects'],
+            },
+            'General_statistics': {
+                'total_time': self.duration,
+                'total_number_of_events': totals['transactions'],
+            },
+            'Latency': _latency_stats(self.latencies),
+        }
+        if self.options['rate']:
+            summary['Service_time'] = _latency_stats(self.service_times)
+            summary['queue'] = {
+                'max_length': max(
+                    (i.queue_length for i in self.intervals), default=0),
+                'last_length': (self.intervals[-1].queue_length
+                                if self.intervals else 0),
+            }
+        return summary
+
+
+def _latency_stats(latencies):
+    """
+    Returns:
+        min, avg, max, 95th percentile and sum of latencies in ms
+    """
+    return {
+        'min': min(latencies) * 1000 if latencies else 0.0,
+        'avg': (sum(latencies) / len(latencies) * 1000
+                if latencies else 0.0),
+        'max': max(latencies) * 1000 if latencies else 0.0,
+        '95th_percentile': percentile(latencies, 95) * 1000,
+        'sum': sum(latencies) * 1000,
+    }
+
+
+def format_interval(stats):
+    """
+    Returns:
+        the interval as sysbench prints it with --report-interval
+    """
+    return (
+        "[ {:.0f}s ] thds: {} tps: {:.2f} qps: {:.2f} "
+        "(r/w/o: {:.2f}/{:.2f}/{:.2f}) lat (ms,95%): {:.2f} err/s: {:.2f} "
+        "reconn/s: {:.2f}".format(
+            stats.time, stats.threads, stats.tps, stats.qps, stats.reads,
+            stats.writes, stats.other, stats.latency_pct, stats.errors,
+            stats.reconnects
+        )
+    )
+
+
+def format_queue(stats):
+    """
+    Returns:
+        the interval's queue line, as sysbench prints it in --rate mode
+    """
+    return "[ {:.0f}s ] queue length: {}, concurrency: {}".format(
+        stats.time, stats.queue_length, stats.concurrency
+    )
+
+
+class LoadGenerator(object):
+    """
+    Runs one sysbench OLTP configuration in this process.
+
+    Example usage:
+
+        config = SysbenchConfig('oltp.yaml', 'job_1')
+        generator = LoadGenerator(config.configs['config_rw'], threads=16)
+        generator.prepare()
+        result = generator.run()
+        generator.cleanup()
+    """
+
+    def __init__(self, test_config, conn_params=None, **overrides):
+        """
+        Args:
+            test_config (SysbenchTestConfig): configuration to run
+            conn_params (dict): connection parameters, replacing the mysql-*
+                options
+            overrides: option values replacing the configured ones, see
+                WorkloadOptions
+        """
+        self.options = WorkloadOptions(test_config, **overrides)
+        self.conn_params = conn_params or self.options.conn_params
+        self.workload = OltpWorkload(self.options)
+        self._stop = threading.Event()
+        self._errors = []
+
+    def execute(self, command):
+        """
+        Run a sysbench command: prepare, run or cleanup.
+
+        Returns:
+            LoadResult for run, None otherwise
+        """
+        if command not in COMMANDS:
+            raise SBConfigInvalid(
+                "{}: unsupported command {}".format(self.options.name,
+                                                    command))
+        return getattr(self, command)()
+
+    def prepare(self):
+        pool = ConnectionPool(self.conn_params, self.options['threads'])
+        try:
+            self.workload.prepare(pool)
+        finally:
+            pool.close()
+
+    def cleanup(self):
+        pool = ConnectionPool(self.conn_params, 1)
+        try:
+            self.workload.cleanup(pool)
+        finally:
+            pool.close()
+
+    def stop(self):
+        """
+        End a run early, from another thread.
+        """
+        self._stop.set()
+
+    def _run_transaction(self, pool, rng, recorder, intended=None):
+        """
+        Run one transaction on a pooled connection.
+
+        Args:
+            intended (float): clock() time the transaction was due to
+                start, its latency is measured from there
+        """
+        recorder.enter()
+        try:
+            db = pool.acquire()
+        except Exception as e:
+            recorder.leave()
+            self._errors.append(e)
+            self._stop.set()
+            return
+
+        start = clock()
+        try:
+            cursor = db.connection.cursor()
+            try:
+                reads, writes, other = self.workload.transaction(cursor, rng)
+            finally:
+                cursor.close()
+        except Exception as e:
+            errno = getattr(e, 'errno', None)
+            if errno in RECONNECT_ERRNOS:
+                recorder.count('reconnects')
+                db.close()
+            elif errno in RETRY_ERRNOS:
+                recorder.count('errors')
+                try:
+                    db.connection.rollback()
+                except Exception:
+                    db.close()
+            else:
+                # Anything else ends the run, run() raises it
+                self._errors.append(e)
+                self._stop.set()
+        else:
+            end = clock()
+            recorder.record(end - (start if intended is None else intended),
+                            end - start, reads, writes, other)
+        finally:
+            recorder.leave()
+            pool.release(db)
+
+    def _closed_loop_worker(self, thread_id, pool, recorder, budget):
+        rng = random.Random(self.options['rand-seed'] * 1000 + thread_id)
+        while not self._stop.is_set() and budget():
+            self._run_transaction(pool, rng, recorder)
+
+    def _open_loop_worker(self, thread_id, pool, recorder, arrivals,
+                          expired):
+        rng = random.Random(self.options['rand-seed'] * 1000 + thread_id)
+        while True:
+            intended = arrivals.get()
+            if intended is None:
+                return
+            # Arrivals still queued when the run ends are dropped
+            if self._stop.is_set() or expired():
+                continue
+            self._run_transaction(pool, rng, recorder, intended)
+
+    def _dispatch(self, arrivals, budget, threads):
+        """
+        Put transaction arrivals at the configured constant rate, until
+        the run ends.
+        """
+        interval = 1.0 / self.options['rate']
+        intended = clock()
+        while not self._stop.is_set() and budget():
+            delay = intended - clock()
+            if delay > 0 and self._stop.wait(delay):
+                break
+            arrivals.put(intended)
+            intended += interval
+
+        for _ in range(threads):
+            arrivals.put(None)
+
+    def _report(self, recorder, started, threads, arrivals=None):
+        intervals = []
+        report_interval = self.options['report-interval']
+        last = started
+        while True:
+            stopped = self._stop.wait(report_interval) \
+                if report_interval > 0 else self._stop.wait()
+            now = clock()
+            counters, latencies = recorder.take_interval()
+            elapsed = max(now - last, 1e-9)
+            last = now
+            if report_interval > 0 and (counters or not stopped):
+                stats = IntervalStats(
+                    time=now - started,
+                    threads=threads,
+                    tps=counters['transactions'] / elapsed,
+                    qps=(counters['reads'] + counters['writes'] +
+                         counters['other']) / elapsed,
+                    reads=counters['reads'] / elapsed,
+                    writes=counters['writes'] / elapsed,
+                    other=counters['other'] / elapsed,
+                    latency_pct=percentile(latencies, 95) * 1000,
+                    errors=counters['errors'] / elapsed,
+                    reconnects=counters['reconnects'] / elapsed,
+                    queue_length=arrivals.qsize() if arrivals else 0,
+                    concurrency=recorder.concurrency,
+                )
+                intervals.append(stats)
+                log.info(format_interval(stats))
+                if arrivals is not None:
+                    log.info(format_queue(stats))
+            if stopped:
+                return intervals
+
+    def run(self):
+        """
+        Run transactions for the configured time or number of events.
+
+        Returns:
+            LoadResult
+        """
+        options = self.options
+        threads = options['threads']
+        duration = options['time']
+        events = options['events']
+        if not duration and not events:
+            raise SBConfigInvalid(
+                "{}: time or events must be set".format(options.name))
+
+        self._stop.clear()
+        self._errors = []
+        recorder = _Recorder()
+        pool = ConnectionPool(self.conn_params, threads)
+        started = clock()
+        issued = [0]
+        issued_lock = threading.Lock()
+
+        def expired():
+            return bool(duration) and clock() - started >= duration
+
+        def budget():
+            if expired():
+                return False
+            if events:
+                with issued_lock:
+                    if issued[0] >= events:
+                        return False
+                    issued[0] += 1
+            return True
+
+        arrivals = None
+        if options['rate']:
+            arrivals = queue.Queue()
+            workers = [
+                threading.Thread(target=self._open_loop_worker,
+                                 args=(i, pool, recorder, arrivals, expired))
+                for i in range(threads)
+            ]
+            workers.append(threading.Thread(
+                target=self._dispatch, args=(arrivals, budget, threads)))
+        else:
+            workers = [
+                threading.Thread(target=self._closed_loop_worker,
+                                 args=(i, pool, recorder, budget))
+                for i in range(threads)
+            ]
+
+        intervals = []
+        reporter = threading.Thread(
+            target=lambda: intervals.extend(
+                self._report(recorder, started, threads, arrivals)))
+        reporter.start()
+        log.info("Running {} with {} threads{}".format(
+            options.testname, threads,
+            ", {} tps".format(options['rate']) if options['rate'] else ''))
+        try:
+            for worker in workers:
+                worker.start()
+            for worker in workers:
+                worker.join()
+        finally:
+            self._stop.set()
+            reporter.join()
+            pool.close()
+
+        if self._errors:
+            raise self._errors[0]
+        return LoadResult(options, intervals, recorder.totals,
+                          recorder.latencies, clock() - started,
+                          recorder.service_times)
+
+
+def run_job(yaml_config, job_name=None, conn_params=None, **overrides):
+    """
+    Run the configurations of sysbench jobs with the load generator. The
+    instances of all clients of a job become threads of this process: a
+    job with 2 instances of an 8 thread configuration runs 16 threads.
+    Their target rates add up likewise, as every sysbench instance gets
+    its own --rate: 2 instances at rate 100 run at 200 tps.
+
+    Args:
+        yaml_config (str): sysbench yaml config file
+        job_name (str or list): jobs to run, all by default
+        conn_params (dict): connection parameters, replacing the mysql-*
+            options
+        overrides: option values replacing the configured ones
+
+    Returns:
+        OrderedDict of job name to the LoadResult of its run command, None
+        if it has none
+    """
+    config = SysbenchConfig(yaml_config, job_name)
+    results = collections.OrderedDict()
+    for name in config.job_list:
+        job = config.jobs[name]
+        test_config = config.configs[job.config]
+        instances = sum(count for _, count in job.clients)
+        options = WorkloadOptions(test_config, **overrides)
+        job_overrides = dict(overrides,
+                             threads=options['threads'] * instances,
+                             rate=options['rate'] * instances)
+
+        generator = LoadGenerator(test_config, conn_params, **job_overrides)
+        commands = test_config.commands
+        if isinstance(commands, str):
+            commands = (commands,)
+        results[name] = None
+        for command in commands:
+            log.info("[{}] {} {}".format(name, options.testname, command))
+            result = generator.execute(command)
+            if result is not None:
+                results[name] = result
+    return results
@@ -1,16 +1,309 @@
+import collections
+import functools
+import os
+import threading
 from cachedproperty import cached_property
-from yamlconfig import read_yaml
-from .sysbench_exception import SBMultipleJobs
+from yamlconfig import file_signature, load_yaml
+from .sysbench_exception import SBMultipleJobs, SBConfigInvalid
 import logging
 
 log = logging.getLogger(__name__)
 
+SYSBENCH_BINARY = "/usr/local/bin/sysbench"
+
+# A sysbench configuration: one sysbench invocation per command. options
+# is a tuple of (option, value) pairs in file order, commands a single
+# command or a tuple of them.
+SysbenchTestConfig = collections.namedtuple(
+    'SysbenchTestConfig', ['name', 'options', 'testname', 'commands']
+)
+
+# A job runs one configuration with a number of instances per client host.
+# clients is a tuple of (hostname, instances) pairs.
+SysbenchJob = collections.namedtuple(
+    'SysbenchJob', ['name', 'config', 'clients']
+)
+
+
+class CompiledSysbenchConfig(object):
+    """
+    Validated contents of a sysbench yaml file. Instances are shared
+    between all SysbenchConfig objects of the same unchanged file.
+    """
+
+    def __init__(self, raw, configs, jobs):
+        self.raw = raw
+        self.configs = configs
+        self.jobs = jobs
+        self._commands = {}
+        self._lock = threading.Lock()
+
+    def cli_commands(self, job_list, rate=None):
+        """
+        Args:
+            job_list (tuple): names of the jobs to run
+            rate (int): target rate replacing the configured ones
+
+        Returns:
+            dictionary of client to list of commands, memoized per job list
+            and rate
+        """
+        key = (job_list, rate)
+        with self._lock:
+            commands = self._commands.get(key)
+        if commands is not None:
+            return commands
+
+        commands = collections.OrderedDict()
+        for job_name in job_list:
+            job = self.jobs[job_name]
+            config = self.configs[job.config]
+            if rate is not None:
+                config = with_rate(config, rate)
+            cli = build_cli_command(config)
+            for client, instances in job.clients:
+                commands.setdefault(client, []).extend([cli] * instances)
+
+        with self._lock:
+            self._commands[key] = commands
+        return commands
+
+
 class SysbenchConfigValidator(object):
     """
-    TODO:
-    validate sysbench yaml config file and throw exception if incorrect
+    Validate a parsed sysbench yaml file into typed records. Every problem
+    found is reported at once in a single SBConfigInvalid.
+
+    Expected layout:
+
+        sysbench:
+            <config name>:
+                options: {<option>: <value>, ...}    (optional)
+                rate: <transactions per second>        (optional)
+                testname: <test name or lua script>
+                commands: <command> or [<command>, ...]
+        job:
+            <job name>:
+                config: <config name>
+                clients: {<hostname>: <instances>, ...}
+
+    rate is the target arrival rate of an open loop run, passed to sysbench
+    as --rate; 0 runs closed loop.
     """
-    pass
+
+    def __init__(self, raw, filepath=None):
+        """
+        Args:
+            raw (dict): parsed yaml file
+            filepath (str): file the data was read from, for messages
+        """
+        self._raw = raw
+        self._filepath = filepath
+        self._errors = []
+
+    def _error(self, msg):
+        self._errors.append(msg)
+
+    def _section(self, name):
+        section = self._raw.get(name)
+        if not isinstance(section, dict) or not section:
+            self._error("'{}' must be a non-empty mapping".format(name))
+            return {}
+        return section
+
+    def _validate_config(self, name, cfg):
+        where = "sysbench.{}".format(name)
+        if not isinstance(cfg, dict):
+            self._error("{} must be a mapping".format(where))
+            return None
+
+        options = cfg.get('options') or {}
+        if not isinstance(options, dict):
+            self._error("{}.options must be a mapping".format(where))
+            options = {}
+        for option, value in options.items():
+            if isinstance(value, (dict, list)):
+                self._error(
+                    "{}.options.{} must be a scalar".format(where, option)
+                )
+
+        rate = cfg.get('rate')
+        if rate is not None:
+            if 'rate' in options:
+                self._error(
+                    "{} sets rate both as rate and in options".format(where)
+                )
+            else:
+                options = dict(options, rate=rate)
+        if 'rate' in options and not _valid_rate(options['rate']):
+            self._error(
+                "{}.rate must be a non-negative number of transactions per "
+                "second".format(where)
+            )
+
+        testname = cfg.get('testname')
+        if not isinstance(testname, str) or not testname:
+            self._error("{}.testname must be a string".format(where))
+
+        commands = cfg.get('commands')
+        if isinstance(commands, list) and commands and \
+                all(isinstance(c, str) for c in commands):
+            commands = tuple(commands)
+        elif not isinstance(commands, str) or not commands:
+            self._error(
+                "{}.commands must be a command or a list of commands".format(
+                    where
+                )
+            )
+
+        return SysbenchTestConfig(
+            name, tuple(options.items()), testname, commands
+        )
+
+    def _validate_job(self, name, job, configs):
+        where = "job.{}".format(name)
+        if not isinstance(job, dict):
+            self._error("{} must be a mapping".format(where))
+            return None
+
+        config = job.get('config')
+        if config not in configs:
+            self._error(
+                "{}.config refers to unknown config '{}'".format(where, config)
+            )
+
+        clients = job.get('clients')
+        if not isinstance(clients, dict) or not clients:
+            self._error("{}.clients must be a non-empty mapping".format(where))
+            clients = {}
+        for client, instances in clients.items():
+            if not isinstance(instances, int) or isinstance(instances, bool) \
+                    or instances < 1:
+                self._error(
+                    "{}.clients.{} must be a positive number of "
+                    "instances".format(where, client)
+                )
+
+        return SysbenchJob(name, config, tuple(clients.items()))
+
+    def validate(self):
+        """
+        Returns:
+            CompiledSysbenchConfig
+
+        Raises:
+            SBConfigInvalid listing every problem found
+        """
+        if not isinstance(self._raw, dict):
+            raise SBConfigInvalid(
+                "{}: not a yaml mapping".format(self._filepath)
+            )
+
+        configs = collections.OrderedDict()
+        for name, cfg in self._section('sysbench').items():
+            record = self._validate_config(name, cfg)
+            if record:
+                configs[name] = record
+
+        jobs = collections.OrderedDict()
+        for name, job in self._section('job').items():
+            record = self._validate_job(name, job, configs)
+            if record:
+                jobs[name] = record
+
+        if self._errors:
+            raise SBConfigInvalid(
+                "{}: {}".format(self._filepath, '; '.join(self._errors))
+            )
+        return CompiledSysbenchConfig(self._raw, configs, jobs)
+
+
+def _valid_rate(rate):
+    return isinstance(rate, int) and not isinstance(rate, bool) and rate >= 0
+
+
+def with_rate(test_config, rate):
+    """
+    Args:
+        test_config (SysbenchTestConfig): configuration
+        rate (int): target transactions per second, 0 for closed loop
+
+    Returns:
+        SysbenchTestConfig running at rate
+    """
+    if not _valid_rate(rate):
+        raise SBConfigInvalid(
+            "rate must be a non-negative number of transactions per second"
+        )
+    options = tuple(o for o in test_config.options if o[0] != 'rate')
+    return test_config._replace(options=options + (('rate', rate),))
+
+
+# Compiled configs keyed by absolute path, with the file signature they
+# were compiled at
+_compiled_cache = {}
+_compiled_cache_lock = threading.Lock()
+
+
+def load_sysbench_config(filepath):
+    """
+    Read and validate a sysbench yaml file, reusing the compiled config
+    while the file is unchanged.
+
+    Args:
+        filepath (str): path to yaml config file
+
+    Returns:
+        CompiledSysbenchConfig
+
+    Raises:
+        SBConfigInvalid if the file cannot be read or is invalid
+    """
+    filepath = os.path.abspath(filepath)
+    try:
+        signature = file_signature(filepath)
+        with _compiled_cache_lock:
+            cached = _compiled_cache.get(filepath)
+        if cached and cached[0] == signature:
+            return cached[1]
+        raw = load_yaml(filepath)
+    except Exception as e:
+        raise SBConfigInvalid("{}: {}".format(filepath, e))
+
+    compiled = SysbenchConfigValidator(raw, filepath).validate()
+    with _compiled_cache_lock:
+        _compiled_cache[filepath] = (signature, compiled)
+    return compiled
+
+
+@functools.lru_cache(maxsize=None)
+def build_cli_command(test_config):
+    """
+    generate sysbench cli command from a SysbenchTestConfig. Multiple
+    commands are chained in a single command line.
+    """
+    cli_cmd = "{} ".format(SYSBENCH_BINARY)
+
+    # add options
+    for option, value in test_config.options:
+        cli_cmd += ' --{}={}'.format(option, value)
+
+    # add testname
+    cli_cmd += ' --test={}'.format(test_config.testname)
+
+    ret_cmd = ""
+    # add command. For each command create a separate entry if
+    # multiple commands are provided
+    if isinstance(test_config.commands, tuple):
+        for cmd in test_config.commands:
+            ret_cmd += "{} {};".format(cli_cmd, cmd)
+    else:
+        ret_cmd = '{} {}'.format(cli_cmd, test_config.commands)
+
+    log.info("generated Sysbench cmd ( {} ) from config ( {} )".format(
+        ret_cmd, test_config.name
+    ))
+    return ret_cmd
 
 
 class SysbenchConfig(object):
@@ -18,18 +311,50 @@ class SysbenchConfig(object):
     def __init__(
         self,
         yaml_config,    # path to yaml config file
-        job_list=[],  # list of jobs to run (None - runs all jobs)
+        job_list=None,  # job name or list of jobs to run (None - runs all jobs)
+        rate=None,      # target rate of every job (None - as configured)
     ):
+        if rate is not None and not _valid_rate(rate):
+            raise SBConfigInvalid(
+                "rate must be a non-negative number of transactions per "
+                "second"
+            )
+        self._rate = rate
         self._yaml_config = yaml_config
-        self._job_list = job_list
-        self._sysbench_cfg = read_yaml(self._yaml_config)
-        ###################################################################
-        # TODO - validate self._sysbench_cfg with SysbenchConfigValidator
-        ##################################################################
+        if isinstance(job_list, str):
+            job_list = [job_list]
+        self._job_list = list(job_list or [])
+        self._compiled = load_sysbench_config(self._yaml_config)
+
+        unknown = [j for j in self._job_list if j not in self._compiled.jobs]
+        if unknown:
+            raise SBConfigInvalid(
+                "{}: unknown jobs {}".format(self._yaml_config, unknown)
+            )
 
     @property
     def sysbench_config(self):
-        return self._sysbench_cfg
+        return self._compiled.raw
+
+    @property
+    def configs(self):
+        """
+        returns SysbenchTestConfig records by config name, with the rate
+        given to the constructor
+        """
+        if self._rate is None:
+            return self._compiled.configs
+        return collections.OrderedDict(
+            (name, with_rate(config, self._rate))
+            for name, config in self._compiled.configs.items()
+        )
+
+    @property
+    def jobs(self):
+        """
+        returns SysbenchJob records by job name
+        """
+        return self._compiled.jobs
 
     @property
     def job_list(self):
@@ -37,8 +362,7 @@ class SysbenchConfig(object):
         returns job name to run
         """
         if not self._job_list:
-            all_jobs = self._get_job_config()
-            self._job_list = [ job for job in all_jobs.keys() ]
+            self._job_list = list(self._compiled.jobs)
 
         return self._job_list
 
@@ -60,67 +384,20 @@ class SysbenchConfig(object):
         """
         job_list = self.sysbench_config['job']
         if job_name:
-            log.info("Job Config Return {}".format(job_list[job_name]))
             return job_list[job_name]
         else:
-            log.info("Job Config Return {}".format(job_list))
             return job_list
 
-    def _generate_sysbenchcli_command(self, config_dict):
-        """
-        generate sysbench cli command from self.sysbench_config
-        Keys : options, testname, commands (list)
-        """
-        cli_cmd = "/usr/local/bin/sysbench "
-
-        # add options
-        for option, value in config_dict.get('options', {}).items():
-            cli_cmd += ' --{}={}'.format(option, value)
-
-        # add testname
-        cli_cmd += ' --test={}'.format(config_dict['testname'])
-
-        ret_cmd = ""
-        # add command. For each command create a separate entry if
-        # multiple commands are provided
-        if type(config_dict['commands']) is list:
-            for cmd in config_dict['commands']:
-                ret_cmd += "{} {};".format(cli_cmd, cmd)
-        else:
-            ret_cmd = '{} {}'.format(cli_cmd, config_dict['commands'])
-
-        log_msg = "generated Sysbench cmd ( {} ) from config_dict ( {} )"
-        log.info( log_msg.format(ret_cmd, config_dict))
-        return ret_cmd
-
-
-    def _get_sysbench_for_joblist(self):
-        """
-        return dictionary of commands to be run on each client
-        """
-        job_dict = dict()
-        for job in self.job_list:
-            # get job dictionary
-            tmp_job_cfg = self._get_job_config(job)
-
-            # get sysbench config name and its dictionary
-            config_dict = self._get_sysbench_config(tmp_job_cfg['config'])
-
-            # get sysbench_cli to be run on each client
-            sysbench_cli = self._generate_sysbenchcli_command(config_dict)
-
-            # generate requested number of sysbench command for each client
-            for client, instances in tmp_job_cfg['clients'].items():
-                add_sysbench_cmds = [sysbench_cli] * instances
-                if client in job_dict:
-                    job_dict[client].extend(add_sysbench_cmds)
-                else:
-                    job_dict[client] = add_sysbench_cmds
-
-        return job_dict
+    @cached_property
+    def _cli_commands(self):
+        return self._compiled.cli_commands(tuple(self.job_list), self._rate)
 
     def get_cli_commands(self):
         """
-        get cli commands to be executed
+        get cli commands to be executed, as a dictionary of client to list
+        of commands
         """
-        return self._get_sysbench_for_joblist()
+        return {
+            client: list(commands)
+            for client, commands in self._cli_commands.items()
+        }
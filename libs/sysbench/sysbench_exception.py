@@ -1,3 +1,6 @@
 
 class SBMultipleJobs(Exception):
     pass
+
+class SBConfigInvalid(Exception):
+    pass
@@ -1,5 +1,43 @@
 import re
 
+# Intermediate report lines (--report-interval), e.g.
+#   [ 10s ] thds: 8 tps: 99.99 qps: ... reconn/s: 0.00
+#   [ 10s ] queue length: 3, concurrency: 8
+# the latter only in --rate mode
+_INTERVAL_RE = re.compile(r'^\[\s*\d+(\.\d+)?s\s*\]')
+_QUEUE_RE = re.compile(
+    r'^\[\s*(\d+(?:\.\d+)?)s\s*\]\s*queue length:\s*(\d+),\s*'
+    r'concurrency:\s*(\d+)'
+)
+
+
+def _parse_tps_line(line):
+    temp = re.findall(r'[\d.]+', line)
+    res = []
+    for x in temp:
+        try:
+            res.append(int(x))
+        except ValueError:
+            res.append(float(x))
+
+    assert len(res) == 11 and res[7] == 95
+
+    return {
+        'time':     res[0],
+        'threads':  res[1],
+        'tps':      res[2],
+        'qps': {
+            'total': res[3],
+            'reads': res[4],
+            'writes':res[5],
+            'other': res[6],
+        },
+        'latency':  res[8],
+        'errors':   res[9],
+        'reconnects':res[10],
+    }
+
+
 class SysbenchParseLogfile:
 
     SECTIONS = [
@@ -44,30 +82,24 @@ class SysbenchParseLogfile:
                     stat_attr_value = _modifystr(stat_split[1])
                     stats_dict[section_name_us][stat_attr_name] = stat_attr_value
 
-        if 'tps' in stats:
-            temp = re.findall(r'[\d.]+', stats['tps'])
-            res = []
-            for x in temp:
-                try:
-                    res.append(int(x))
-                except ValueError:
-                    res.append(float(x))
-
-            assert len(res) == 11 and res[7] == 95
-
-            stats_dict['tps'] = {
-                'time':     res[0],
-                'threads':  res[1],
-                'tps':      res[2],
-                'qps': {
-                    'total': res[3],
-                    'reads': res[4],
-                    'writes':res[5],
-                    'other': res[6],
-                },
-                'latency':  res[8],
-                'errors':   res[9],
-                'reconnects':res[10],
+        # Every intermediate report, the last one as 'tps'
+        stats_dict['intervals'] = [
+            _parse_tps_line(line) for line in stats['intervals']
+        ]
+        if stats_dict['intervals']:
+            stats_dict['tps'] = stats_dict['intervals'][-1]
+
+        # Event queue of --rate runs: a growing queue means the server does
+        # not keep up with the offered load
+        queue = [
+            {'time': t, 'length': length, 'concurrency': concurrency}
+            for t, length, concurrency in stats['queue']
+        ]
+        if queue:
+            stats_dict['queue'] = {
+                'samples': queue,
+                'max_length': max(q['length'] for q in queue),
+                'last_length': queue[-1]['length'],
             }
 
         return stats_dict
@@ -76,6 +108,8 @@ class SysbenchParseLogfile:
     def _parse_log(cls, filepath):
 
         sysbench_attributes = dict()
+        intervals = []
+        queue = []
 
         with open(filepath) as fp:
 
@@ -87,9 +121,15 @@ class SysbenchParseLogfile:
 
                 line = line.strip()
 
-                # check if line with tps entry
-                if re.match('[ [0-9]+s ]', line):
-                    tps_end_line = line
+                # check if line with an intermediate report
+                if _INTERVAL_RE.match(line):
+                    match = _QUEUE_RE.match(line)
+                    if match:
+                        queue.append((float(match.group(1)),
+                                      int(match.group(2)),
+                                      int(match.group(3))))
+                    else:
+                        intervals.append(line)
 
                 # section ended if line is empty
                 elif start_section and not line:
@@ -111,7 +151,8 @@ class SysbenchParseLogfile:
                             break
 
 
-            sysbench_attributes['tps'] = tps_end_line
+            sysbench_attributes['intervals'] = intervals
+            sysbench_attributes['queue'] = queue
 
         return sysbench_attributes
 
@@ -29,9 +29,24 @@ class Sysbench(object):
         self,
         yaml_config,
         job_name=None,
+        host_metrics=None,
+        server_status=None,
+        rate=None,
     ):
-        self._sysbench_config = SysbenchConfig(yaml_config, job_name)
+        """
+        host_metrics - optional hostmetrics.HostMetricsSampler, sampling
+        the client and server hosts for the duration of the run
+        server_status - optional db.ServerStatusSampler, sampling the
+        database server counters for the duration of the run
+        rate - optional target transactions per second of every sysbench
+        instance (--rate), replacing the configured rate
+        """
+        self._sysbench_config = SysbenchConfig(yaml_config, job_name, rate)
         self._pool = Pool()
+        self._host_metrics = host_metrics
+        self._server_status = server_status
+        # Samplers started by start() and not stopped yet
+        self._samplers = []
 
 
     @property
@@ -64,6 +79,12 @@ class Sysbench(object):
         start IO
         """
 
+        self._samplers = [
+            s for s in (self._host_metrics, self._server_status) if s
+        ]
+        for sampler in self._samplers:
+            sampler.start()
+
         self._async_return = self._pool.starmap_async(
             execute_on_target, self._get_command_list()
         )
@@ -94,12 +115,31 @@ class Sysbench(object):
             self.stop()
             raise
 
+        finally:
+            self._stop_samplers()
+
+    def _stop_samplers(self):
+        samplers, self._samplers = self._samplers, []
+        for sampler in samplers:
+            sampler.stop()
+            log.info(sampler.report())
+
+    @property
+    def host_metrics(self):
+        return self._host_metrics
+
+    @property
+    def server_status(self):
+        return self._server_status
+
     def stop(self):
         try:
             self._pool.terminate()
         except:
             pass
 
+        self._stop_samplers()
+
         #######################################################
         #TODO - force kill sysbench on remote host if required
         #######################################################
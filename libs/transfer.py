@@ -0,0 +1,489 @@
+import hashlib
+import json
+import logging
+import os
+import queue
+import shlex
+import stat
+import tempfile
+import threading
+import time
+import zlib
+from concurrent.futures import ThreadPoolExecutor
+
+log = logging.getLogger(__name__)
+
+# Files are split into chunks of this size, the unit of parallelism and of
+# resumption
+DEF_CHUNK_SIZE = 8 * 1024 * 1024
+
+# Size of a single pipelined read or write within a chunk
+DEF_BLOCK_SIZE = 1024 * 1024
+
+# Number of SFTP channels used for one large file
+DEF_PARALLEL_CHUNKS = 4
+
+# Files smaller than this are sent over a single channel
+DEF_PARALLEL_THRESHOLD = 64 * 1024 * 1024
+
+# Maximum number of files copied at once by copy_many
+DEF_MAX_PARALLEL_FILES = 8
+
+# gzip level used for compressed transfers; low levels keep up with the link
+DEF_COMPRESS_LEVEL = 1
+
+DEF_STATE_DIR = os.path.join(tempfile.gettempdir(), 'mdb-transfer')
+
+
+class TransferError(Exception):
+    pass
+
+
+class _Progress(object):
+    """
+    Thread safe byte counter reporting to a progress callback.
+    """
+
+    def __init__(self, path, total, done, callback):
+        self._path = path
+        self._total = total
+        self._done = done
+        self._start_done = done
+        self._callback = callback
+        self._start = time.monotonic()
+        self._lock = threading.Lock()
+
+    def add(self, nbytes):
+        with self._lock:
+            self._done += nbytes
+            done = self._done
+        if self._callback:
+            elapsed = max(time.monotonic() - self._start, 1e-6)
+            self._callback(
+                self._path, done, self._total,
+                (done - self._start_done) / elapsed
+            )
+
+
+class _ChunkState(object):
+    """
+    Set of completed chunk indices of a transfer, persisted so that an
+    interrupted transfer resumes with the missing chunks only.
+    """
+
+    def __init__(self, path, signature):
+        self._path = path
+        self._signature = signature
+        self._lock = threading.Lock()
+        self.done = set()
+
+        try:
+            with open(path, 'r') as rfp:
+                state = json.load(rfp)
+            if state.get('signature') == signature:
+                self.done = set(state['done'])
+        except (IOError, ValueError):
+            pass
+
+    def mark_done(self, index):
+        with self._lock:
+            self.done.add(index)
+            os.makedirs(os.path.dirname(self._path), exist_ok=True)
+            tmp_path = '{}.tmp'.format(self._path)
+            with open(tmp_path, 'w') as wfp:
+                json.dump(
+                    {'signature': self._signature, 'done': list(self.done)},
+                    wfp
+                )
+            os.replace(tmp_path, self._path)
+
+    def remove(self):
+        try:
+            os.remove(self._path)
+        except FileNotFoundError:
+            pass
+
+
+class SftpTransfer(object):
+    """
+    File transfer engine over an established paramiko SSHClient.
+
+    * Reads and writes are pipelined: many SFTP requests are in flight at
+      once instead of waiting for a round trip per 32KB block.
+    * Large files are split into chunks which are moved over several SFTP
+      channels in parallel.
+    * Transfers go to a '.part' file next to the destination and the
+      completed chunks are recorded in state_dir, so an interrupted transfer
+      resumes with the missing chunks only. The destination appears
+      atomically once complete.
+    * With compress set the file is streamed through gzip on the remote side
+      instead, which is much faster for logs over slow links. Compressed
+      transfers are sequential and resume from the size of the '.part' file.
+
+    The progress callback is called as progress(path, bytes_done,
+    total_bytes, bytes_per_sec).
+
+    Example usage:
+
+        engine = SftpTransfer(ssh_client, progress=print)
+        engine.get('/var/log/mysql/slow.log', '/tmp/slow.log')
+        engine.put('/tmp/my.cnf', '/etc/my.cnf')
+    """
+
+    def __init__(
+            self,
+            ssh_client,
+            chunk_size=DEF_CHUNK_SIZE,
+            parallel_chunks=DEF_PARALLEL_CHUNKS,
+            parallel_threshold=DEF_PARALLEL_THRESHOLD,
+            compress=False,
+            progress=None,
+            state_dir=DEF_STATE_DIR,
+            timeout=None,
+    ):
+        """
+        Args:
+            ssh_client (paramiko.SSHClient): connected client
+            chunk_size (int): bytes per chunk
+            parallel_chunks (int): SFTP channels used for one large file
+            parallel_threshold (int): files at least this large use
+                parallel_chunks channels
+            compress (bool): stream through gzip instead of SFTP
+            progress (callable): progress callback
+            state_dir (str): directory holding resumption state
+            timeout (int): seconds without progress on a channel before
+                the transfer fails
+        """
+        self._ssh = ssh_client
+        self._chunk_size = chunk_size
+        self._parallel_chunks = parallel_chunks
+        self._parallel_threshold = parallel_threshold
+        self._compress = compress
+        self._progress = progress
+        self._state_dir = state_dir
+        self._timeout = timeout
+        self._sftp = None
+
+    @property
+    def hostname(self):
+        return self._ssh.get_transport().getpeername()[0]
+
+    @property
+    def sftp(self):
+        """
+        SFTP channel for metadata operations, opened on first use.
+        """
+        if self._sftp is None:
+            self._sftp = self._open_sftp()
+        return self._sftp
+
+    def _open_sftp(self):
+        sftp = self._ssh.open_sftp()
+        sftp.get_channel().settimeout(self._timeout)
+        return sftp
+
+    def close(self):
+        if self._sftp is not None:
+            self._sftp.close()
+            self._sftp = None
+
+    def is_remote_dir(self, remote_path):
+        return stat.S_ISDIR(self.sftp.stat(remote_path).st_mode)
+
+    def _state(self, direction, local_path, remote_path, signature):
+        key = '{}:{}:{}:{}'.format(
+            direction, self.hostname, os.path.abspath(local_path),
+            remote_path
+        )
+        name = hashlib.sha1(key.encode('utf-8')).hexdigest()
+        return _ChunkState(
+            os.path.join(self._state_dir, name + '.json'), signature
+        )
+
+    def _chunks(self, size):
+        return [
+            (index, offset, min(self._chunk_size, size - offset))
+            for index, offset in enumerate(range(0, size, self._chunk_size))
+        ]
+
+    def _run_chunks(self, chunks, state, progress, copy_chunk, size):
+        """
+        Copy the chunks not yet done, over one SFTP channel per worker.
+        copy_chunk(sftp, offset, length) moves one chunk.
+        """
+        pending = queue.Queue()
+        for chunk in chunks:
+            if chunk[0] not in state.done:
+                pending.put(chunk)
+
+        workers = 1
+        if size >= self._parallel_threshold:
+            workers = max(1, min(self._parallel_chunks, pending.qsize()))
+
+        def _worker():
+            sftp = self._open_sftp()
+            try:
+                while True:
+                    try:
+                        index, offset, length = pending.get_nowait()
+                    except queue.Empty:
+                        return
+                    copy_chunk(sftp, offset, length)
+                    state.mark_done(index)
+                    progress.add(length)
+            finally:
+                sftp.close()
+
+        with ThreadPoolExecutor(max_workers=workers) as executor:
+            futures = [executor.submit(_worker) for _ in range(workers)]
+            for future in futures:
+                future.result()
+
+    def get(self, remote_path, local_path, resume=True, preserve_times=True):
+        """
+        Copy a remote file to local_path.
+
+        Args:
+            remote_path (str): remote file
+            local_path (str): local file or existing directory
+            resume (bool): continue an interrupted transfer
+            preserve_times (bool): copy the modification time
+        """
+        if os.path.isdir(local_path):
+            local_path = os.path.join(
+                local_path, os.path.basename(remote_path)
+            )
+        part_path = local_path + '.part'
+        attrs = self.sftp.stat(remote_path)
+        size = attrs.st_size
+
+        if self._compress:
+            self._get_compressed(remote_path, part_path, size, resume)
+        else:
+            state = self._state(
+                'get', local_path, remote_path, [size, attrs.st_mtime]
+            )
+            if not resume or not os.path.exists(part_path):
+                state.done = set()
+            chunks = self._chunks(size)
+            progress = _Progress(
+                remote_path, size,
+                sum(c[2] for c in chunks if c[0] in state.done),
+                self._progress
+            )
+
+            with open(part_path, 'ab'):
+                pass
+            fd = os.open(part_path, os.O_WRONLY)
+            try:
+                os.ftruncate(fd, size)
+
+                def _copy_chunk(sftp, offset, length):
+                    blocks = [
+                        (off, min(DEF_BLOCK_SIZE, offset + length - off))
+                        for off in range(offset, offset + length,
+                                         DEF_BLOCK_SIZE)
+                    ]
+                    with sftp.open(remote_path, 'rb') as rfp:
+                        for (off, _), data in zip(blocks, rfp.readv(blocks)):
+                            os.pwrite(fd, data, off)
+
+                self._run_chunks(chunks, state, progress, _copy_chunk, size)
+            finally:
+                os.close(fd)
+            state.remove()
+
+        os.replace(part_path, local_path)
+        if preserve_times:
+            os.utime(local_path, (attrs.st_atime, attrs.st_mtime))
+        log.info(
+            "copied {} bytes from {}:{} to {}".format(
+                size, self.hostname, remote_path, local_path
+            )
+        )
+
+    def _get_compressed(self, remote_path, part_path, size, resume):
+        offset = 0
+        if resume and os.path.exists(part_path):
+            offset = min(os.path.getsize(part_path), size)
+        progress = _Progress(remote_path, size, offset, self._progress)
+
+        cmd = 'tail -c +{} {} | gzip -c -{}'.format(
+            offset + 1, shlex.quote(remote_path), DEF_COMPRESS_LEVEL
+        )
+        _, stdout, stderr = self._ssh.exec_command(
+            cmd, timeout=self._timeout
+        )
+        decompressor = zlib.decompressobj(16 + zlib.MAX_WBITS)
+
+        with open(part_path, 'ab' if offset else 'wb') as wfp:
+            wfp.truncate(offset)
+            while True:
+                data = stdout.read(DEF_BLOCK_SIZE)
+                if not data:
+                    break
+                plain = decompressor.decompress(data)
+                wfp.write(plain)
+                progress.add(len(plain))
+            wfp.write(decompressor.flush())
+
+        exit_status = stdout.channel.recv_exit_status()
+        if exit_status != 0:
+            raise TransferError(
+                "compressed read of {} failed: {}".format(
+                    remote_path, stderr.read().decode('utf-8').rstrip()
+                )
+            )
+
+    def put(self, local_path, remote_path, resume=True, preserve_times=True):
+        """
+        Copy a local file to remote_path.
+
+        Args:
+            local_path (str): local file
+            remote_path (str): remote file or existing directory
+            resume (bool): continue an interrupted transfer
+            preserve_times (bool): copy the modification time
+        """
+        try:
+            if self.is_remote_dir(remote_path):
+                remote_path = '{}/{}'.format(
+                    remote_path.rstrip('/'), os.path.basename(local_path)
+                )
+        except IOError:
+            pass
+
+        part_path = remote_path + '.part'
+        local_stat = os.stat(local_path)
+        size = local_stat.st_size
+
+        if self._compress:
+            self._put_compressed(local_path, part_path, size, resume)
+        else:
+            state = self._state(
+                'put', local_path, remote_path,
+                [size, local_stat.st_mtime]
+            )
+            try:
+                part_exists = stat.S_ISREG(self.sftp.stat(part_path).st_mode)
+            except IOError:
+                part_exists = False
+            if not resume or not part_exists:
+                state.done = set()
+                with self.sftp.open(part_path, 'wb') as wfp:
+                    wfp.truncate(size)
+            chunks = self._chunks(size)
+            progress = _Progress(
+                local_path, size,
+                sum(c[2] for c in chunks if c[0] in state.done),
+                self._progress
+            )
+
+            def _copy_chunk(sftp, offset, length):
+                with open(local_path, 'rb') as rfp, \
+                        sftp.open(part_path, 'r+b') as wfp:
+                    wfp.set_pipelined(True)
+                    rfp.seek(offset)
+                    wfp.seek(offset)
+                    remaining = length
+                    while remaining > 0:
+                        data = rfp.read(min(DEF_BLOCK_SIZE, remaining))
+                        wfp.write(data)
+                        remaining -= len(data)
+
+            self._run_chunks(chunks, state, progress, _copy_chunk, size)
+            state.remove()
+
+        self.sftp.posix_rename(part_path, remote_path)
+        if preserve_times:
+            self.sftp.utime(
+                remote_path, (local_stat.st_atime, local_stat.st_mtime)
+            )
+        log.info(
+            "copied {} bytes from {} to {}:{}".format(
+                size, local_path, self.hostname, remote_path
+            )
+        )
+
+    def _put_compressed(self, local_path, part_path, size, resume):
+        offset = 0
+        if resume:
+            try:
+                offset = min(self.sftp.stat(part_path).st_size, size)
+            except IOError:
+                offset = 0
+        progress = _Progress(local_path, size, offset, self._progress)
+
+        quoted = shlex.quote(part_path)
+        cmd = 'truncate -s {} {} && gzip -dc >> {}'.format(
+            offset, quoted, quoted
+        )
+        stdin, stdout, stderr = self._ssh.exec_command(
+            cmd, timeout=self._timeout
+        )
+        compressor = zlib.compressobj(
+            DEF_COMPRESS_LEVEL, zlib.DEFLATED, 16 + zlib.MAX_WBITS
+        )
+
+        with open(local_path, 'rb') as rfp:
+            rfp.seek(offset)
+            for data in iter(lambda: rfp.read(DEF_BLOCK_SIZE), b''):
+                stdin.write(compressor.compress(data))
+                progress.add(len(data))
+        stdin.write(compressor.flush())
+        stdin.channel.shutdown_write()
+
+        exit_status = stdout.channel.recv_exit_status()
+        if exit_status != 0:
+            raise TransferError(
+                "compressed write of {} failed: {}".format(
+                    part_path, stderr.read().decode('utf-8').rstrip()
+                )
+            )
+
+
+def copy_many(jobs, max_parallel=DEF_MAX_PARALLEL_FILES,
+              raise_on_error=True, **kwargs):
+    """
+    Run many copies, across files and hosts, at most max_parallel at a time.
+    Copies on the same connection run concurrently over its SSH transport.
+
+    Args:
+        jobs (list): (connection, local_file, remote_file, from_remote)
+            tuples, connection being a connection.Connection
+        max_parallel (int): maximum number of files copied at once
+        raise_on_error (bool): raise once all copies are done if any failed
+        kwargs: passed on to Connection.copy
+
+    Returns:
+        list of exceptions, None for successful copies, in the order of jobs
+
+    Raises:
+        TransferError listing the failed copies
+    """
+    def _copy(job):
+        conn, local_file, remote_file, from_remote = job
+        try:
+            conn.copy(local_file, remote_file, from_remote=from_remote,
+                      raise_on_error=True, **kwargs)
+        except Exception as e:
+            return e
+        return None
+
+    if not jobs:
+        return []
+
+    with ThreadPoolExecutor(max_workers=min(max_parallel, len(jobs))) as ex:
+        errors = list(ex.map(_copy, jobs))
+
+    failed = [
+        '{}:{} ({})'.format(job[0].hostname, job[2], error)
+        for job, error in zip(jobs, errors) if error is not None
+    ]
+    if failed and raise_on_error:
+        raise TransferError(
+            "{} of {} copies failed: {}".format(
+                len(failed), len(jobs), failed
+            )
+        )
+    return errors
@@ -1,9 +1,58 @@
+import copy
 import yaml
 import os
 import logging
+import threading
+
+# libyaml based loader when PyYAML was built with it, several times faster
+try:
+    from yaml import CSafeLoader as SafeLoader
+except ImportError:
+    from yaml import SafeLoader
 
 log = logging.getLogger(__name__)
 
+# Parsed documents keyed by absolute path, with the (mtime_ns, size) they
+# were parsed at
+_yaml_cache = {}
+_yaml_cache_lock = threading.Lock()
+
+def file_signature(filepath):
+    """
+    (mtime_ns, size) of filepath, the key cached parses are validated by
+    """
+    stat = os.stat(filepath)
+    return stat.st_mtime_ns, stat.st_size
+
+def load_yaml(filepath):
+    """
+    Parse a yaml file, reusing the previous parse while the file is
+    unchanged. The returned data is shared between callers and must not
+    be modified.
+
+    Args:
+        filepath (str): yaml file path to read
+
+    Returns:
+        parsed data
+
+    Raises:
+        IOError, yaml.YAMLError
+    """
+    filepath = os.path.abspath(filepath)
+    signature = file_signature(filepath)
+    with _yaml_cache_lock:
+        cached = _yaml_cache.get(filepath)
+    if cached and cached[0] == signature:
+        return cached[1]
+
+    with open(filepath, 'r') as rfp:
+        data = yaml.load(rfp, Loader=SafeLoader)
+
+    with _yaml_cache_lock:
+        _yaml_cache[filepath] = (signature, data)
+    return data
+
 def read_yaml(filepath):
     """
     read yaml file and returns data in dictionary format
@@ -12,9 +61,7 @@ def read_yaml(filepath):
         filepath (str): yaml file path to read
     """
     try:
-        with open(filepath, 'r') as rfp:
-            data = yaml.safe_load(rfp)
-        return data
+        return copy.deepcopy(load_yaml(filepath))
     except IOError as ioe:
         log.error("Unable to read file: {}".format(filepath))
     except yaml.YAMLError as ye:
@@ -17,6 +17,10 @@ sys.path.insert(0, lib_dir)
 
 from infra import print_banner
 
+# Database fixtures (db_session_fxt, cursor_fxt and their module, session
+# and per-worker variants) for every test module
+pytest_plugins = ['db.fixture']
+
 
 LOGLEVELS = {
     'critical': logging.CRITICAL,
@@ -38,6 +42,7 @@ def pytest_addoption(parser):
     parser.addoption(
         "--port",
         action="store",
+        type=int,
         default=3306,
         help="db port"
     )
@@ -137,4 +137,161 @@ def switch_db_and_compare_query(cursor, sql1):
         cursor.execute(each_query)
         monet_output = cursor.fetchall()
         log.info("Monet Output is {}".format(monet_output))
-        compare_sql_queries(inno_output, monet_output)
\ No newline at end of file
+        compare_sql_queries(inno_output, monet_output)
+
+def test_table_checksum(conn_params):
+    with db.DbSession(conn_params, isolate_db=True) as session_a, \
+            db.DbSession(conn_params, isolate_db=True) as session_b:
+
+        for session in (session_a, session_b):
+            with session.cursor() as cursor:
+                cursor.execute(
+                    "CREATE TABLE t1 (id int primary key, val varchar(10));")
+                cursor.execute(
+                    "INSERT INTO t1 VALUES (1, 'a'), (2, NULL), (3, 'c');")
+
+        checksum = session_a.table_checksum('t1', chunk_size=2)
+        log.info("Checksum is {}".format(checksum))
+        assert len(checksum.chunks) == 2
+        assert session_a.compare_table(session_b, 't1', chunk_size=2) == []
+
+        with session_b.cursor() as cursor:
+            cursor.execute("UPDATE t1 SET val = '' WHERE id = 2;")
+
+        diffs = session_a.compare_table(session_b, 't1', chunk_size=2)
+        assert len(diffs) == 1
+        assert diffs[0].only_in_a == [(2, None)]
+        assert diffs[0].only_in_b == [(2, '')]
+
+def test_session_reset(db_session_fxt):
+
+    with db_session_fxt.cursor() as cursor:
+        cursor.execute("CREATE TABLE t1 (col1 int primary key);")
+        cursor.execute(
+            "CREATE TABLE t2 (col1 int, FOREIGN KEY (col1) REFERENCES t1 (col1));")
+        cursor.execute("CREATE VIEW v1 AS SELECT * FROM t1;")
+        cursor.execute("SET @marker = 1;")
+
+    db_session_fxt.reset()
+
+    with db_session_fxt.cursor() as cursor:
+        cursor.execute("show tables")
+        assert cursor.fetchall() == []
+        cursor.execute("SELECT @marker")
+        assert cursor.fetchall() == [(None,)]
+
+def test_transaction_isolation(conn_params):
+    with db.DbSession(conn_params, isolation='transaction') as session:
+        with session.cursor() as cursor:
+            cursor.execute("CREATE TABLE t1 (col1 int);")
+            cursor.execute("INSERT INTO t1 values (1);")
+            session.connection.commit()
+
+        with session.scope():
+            with session.cursor() as cursor:
+                cursor.execute("INSERT INTO t1 values (2);")
+                with session.scope():
+                    cursor.execute("DELETE FROM t1;")
+                cursor.execute("select count(*) from t1;")
+                assert cursor.fetchall() == [(2,)]
+
+        with session.cursor() as cursor:
+            cursor.execute("select * from t1;")
+            assert cursor.fetchall() == [(1,)]
+
+        # DDL commits, the scope falls back to dropping and truncating
+        with session.scope():
+            with session.cursor() as cursor:
+                cursor.execute("CREATE TABLE t2 (col1 int);")
+                cursor.execute("INSERT INTO t1 values (3);")
+
+        with session.cursor() as cursor:
+            cursor.execute("show tables")
+            assert cursor.fetchall() == [('t1',)]
+            cursor.execute("select count(*) from t1;")
+            assert cursor.fetchall() == [(0,)]
+
+def test_generated_data_load(db_session_fxt):
+    from db.datagen import Sequential, Uniform, Zipf
+
+    spec = db.TableSpec('num_exp_gen', [
+        db.Column('id1', 'int4 NOT NULL', Sequential()),
+        db.Column('id2', 'int4', Zipf(1.5, values=10)),
+        db.Column('expected', 'numeric(65,10)', Uniform(0, 10, decimals=2),
+                  null_fraction=0.1),
+    ], primary_key='id1', indexes=['id2'])
+    generator = db.DataGenerator(spec, rows=5000, seed=1, chunk_size=1000)
+
+    for method in ('infile', 'insert'):
+        generator.load(db_session_fxt, workers=2, method=method)
+        with db_session_fxt.cursor() as cursor:
+            cursor.execute("select count(*), count(expected), max(id1) "
+                           "from num_exp_gen")
+            count, not_null, max_id = cursor.fetchall()[0]
+            assert (count, max_id) == (5000, 5000)
+            assert 4000 < not_null < 5000
+            cursor.execute("DROP TABLE num_exp_gen")
+
+def test_query_columns(db_session_fxt):
+    with db_session_fxt.cursor() as cursor:
+        cursor.execute("CREATE TABLE num_exp_add (id1 int4, id2 int4, "
+                       "expected numeric(65,10), label varchar(10));")
+        cursor.execute("INSERT INTO num_exp_add VALUES (0,0,'0','a'), "
+                       "(0,1,NULL,'b'), (1,3,'4.31',NULL);")
+        cursor.execute("select * from num_exp_add order by id2")
+        rows = cursor.fetchall()
+
+    result = db_session_fxt.query_columns(
+        "select * from num_exp_add order by id2")
+    assert result.names == ['id1', 'id2', 'expected', 'label']
+    assert result['id2'].tolist() == [0, 1, 3]
+    assert result.null_mask('expected').tolist() == [False, True, False]
+    assert result.rows() == [
+        (0, 0, 0.0, 'a'), (0, 1, None, 'b'), (1, 3, 4.31, None)]
+    assert len(rows) == len(result)
+
+    reordered = db_session_fxt.query_columns(
+        "select * from num_exp_add order by id2 desc")
+    assert db.compare_columns(result, reordered, ignore_order=True) == []
+    assert len(db.compare_columns(result, reordered)) == 4
+
+def test_table_info(db_session_fxt):
+    with db_session_fxt.cursor() as cursor:
+        cursor.execute("CREATE TABLE t1 (id int primary key, val varchar(10), "
+                       "KEY ix_val (val));")
+
+    info = db_session_fxt.table_info('t1')
+    assert info.column_names == ['id', 'val']
+    assert info.primary_key == ['id']
+    assert db_session_fxt.table_info('t2') is None
+
+    with db_session_fxt.cursor() as cursor:
+        cursor.execute("ALTER TABLE t1 ADD COLUMN extra int;")
+    assert db_session_fxt.table_info('t1').column_names == [
+        'id', 'val', 'extra']
+
+def test_session_reaper(conn_params):
+    from db import reaper
+
+    # A session whose process died without closing it
+    session = db.DbSession(conn_params, isolate_db=True)
+    with session.cursor() as cursor:
+        cursor.execute("select 1")
+        cursor.fetchall()
+    session._close_conn_attempt(session.session_db)
+
+    with db.MariaDB(conn_params) as base_db:
+        with base_db.cursor() as cursor:
+            cursor.execute(
+                "UPDATE {}.sessions SET pid = -1 WHERE dbname = %s".format(
+                    reaper.REGISTRY_DATABASE), (session.dbname,))
+        result = db.reap_sessions(base_db, interval=0)
+        assert result.databases >= 1
+
+        with base_db.cursor() as cursor:
+            cursor.execute("SHOW DATABASES LIKE %s", (session.dbname,))
+            assert cursor.fetchall() == []
+            cursor.execute(
+                "SELECT count(*) FROM {}.sessions WHERE dbname = %s".format(
+                    reaper.REGISTRY_DATABASE), (session.dbname,))
+            assert cursor.fetchall() == [(0,)]
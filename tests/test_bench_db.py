@@ -0,0 +1,103 @@
+import argparse
+import importlib.util
+import os
+
+import pytest
+
+import db.session
+
+BENCH_DB = os.path.join(os.path.dirname(os.path.abspath(__file__)),
+                        '..', 'benchmarks', 'bench_db.py')
+
+
+class FakeCursor(object):
+
+    def __init__(self, statements):
+        self._statements = statements
+        self._rows = []
+        self.rowcount = 0
+        self.description = None
+
+    def execute(self, sql, params=None):
+        self._statements.append(sql)
+        self._rows = [('10.11.0-fake',)] if 'VERSION' in sql else [(1,)]
+
+    def executemany(self, sql, seq_params):
+        self._statements.append(sql)
+        self.rowcount = len(seq_params)
+
+    def fetchall(self):
+        return self._rows
+
+    def close(self):
+        pass
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *args):
+        pass
+
+
+class FakeConnection(object):
+
+    def __init__(self, statements):
+        self._statements = statements
+        self.autocommit = True
+
+    def cursor(self, **kwargs):
+        return FakeCursor(self._statements)
+
+    def commit(self):
+        pass
+
+    def close(self):
+        pass
+
+
+@pytest.fixture
+def bench_db(monkeypatch):
+    statements = []
+
+    class FakeMariaDB(object):
+
+        def __init__(self, conn_params, settings=None):
+            self.conn_params = conn_params
+            self.connection = None
+
+        def connect(self):
+            self.connection = FakeConnection(statements)
+
+        def cursor(self):
+            if self.connection is None:
+                self.connect()
+            return self.connection.cursor()
+
+        def close(self):
+            self.connection = None
+
+    spec = importlib.util.spec_from_file_location('bench_db', BENCH_DB)
+    module = importlib.util.module_from_spec(spec)
+    spec.loader.exec_module(module)
+    monkeypatch.setattr(module, 'MariaDB', FakeMariaDB)
+    monkeypatch.setattr(db.session, 'MariaDB', FakeMariaDB)
+    module.statements = statements
+    return module
+
+
+def test_run(bench_db):
+    args = argparse.Namespace(sessions=2, iterations=3, repeat=2, rows=10,
+                              fetch_rows=100)
+    report = bench_db.run({'host': 'localhost', 'port': 3306,
+                           'user': 'root', 'password': '',
+                           'dbname': 'test'}, args)
+
+    assert report['server_version'] == '10.11.0-fake'
+    names = [bench_db.key(result) for result in report['results']]
+    assert names[:4] == ['session_create', 'session_teardown',
+                         'connection_acquire', 'ensure_connection']
+    assert 'select_1' in names
+    assert 'insert[batch_size=1000]' in names
+    assert 'fetch[cursor=raw,rows=100]' in names
+    assert all(r['iterations'] > 0 for r in report['results'])
+    assert 'SELECT 1' in bench_db.statements
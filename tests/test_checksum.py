@@ -0,0 +1,46 @@
+import pytest
+
+from db import checksum
+
+
+class _FakeCursor(object):
+    """
+    Cursor of a table with keys 1..10, answering the boundary walk.
+    """
+
+    def __init__(self):
+        self.executed = []
+        self._row = None
+
+    def execute(self, sql, params=()):
+        self.executed.append(sql)
+        lower = params[0] if len(params) > 1 else 0
+        key = lower + params[-1]
+        self._row = (key,) if key <= 10 else None
+
+    def fetchone(self):
+        return self._row
+
+
+class _NoCursor(object):
+
+    def cursor(self):
+        raise AssertionError("no statement should run")
+
+
+def test_chunk_boundaries():
+    boundaries = checksum.chunk_boundaries(_FakeCursor(), 't1', 'id', 4)
+    assert boundaries == [(None, 4), (4, 8), (8, None)]
+
+
+@pytest.mark.parametrize('chunk_size', [0, -1])
+def test_chunk_size_below_one_rejected(chunk_size):
+    cursor = _FakeCursor()
+    with pytest.raises(ValueError):
+        checksum.chunk_boundaries(cursor, 't1', 'id', chunk_size)
+    with pytest.raises(ValueError):
+        checksum.table_checksum(cursor, 't1', chunk_size)
+    with pytest.raises(ValueError):
+        checksum.compare_table_checksums(_NoCursor(), _NoCursor(), 't1',
+                                         chunk_size)
+    assert cursor.executed == []
@@ -0,0 +1,100 @@
+from decimal import Decimal
+import datetime
+
+import numpy as np
+import pytest
+from mysql.connector.constants import FieldFlag, FieldType
+
+from db.columnar import compare_columns, fetch_columnar, ColumnarResult
+
+
+class FakeCursor(object):
+
+    def __init__(self, description, rows):
+        self.description = description
+        self._rows = list(rows)
+
+    def fetchmany(self, size):
+        batch, self._rows = self._rows[:size], self._rows[size:]
+        return batch
+
+
+DESCRIPTION = [
+    ('id', FieldType.LONGLONG, None, None, None, None, 0, 0),
+    ('amount', FieldType.NEWDECIMAL, None, None, None, None, 1, 0),
+    ('name', FieldType.VAR_STRING, None, None, None, None, 1, 0),
+    ('day', FieldType.DATE, None, None, None, None, 1, 0),
+    ('data', FieldType.BLOB, None, None, None, None, 1, FieldFlag.BINARY),
+]
+
+RAW_ROWS = [
+    (b'1', b'1.50', b'caf\xc3\xa9', b'2024-01-31', b'\x00\x01'),
+    (b'2', None, b'b', None, None),
+    (b'3', b'-2.25', None, b'0000-00-00', b'x'),
+]
+
+ROWS = [
+    (1, Decimal('1.50'), 'café', datetime.date(2024, 1, 31),
+     b'\x00\x01'),
+    (2, None, 'b', None, None),
+    (3, Decimal('-2.25'), None, None, b'x'),
+]
+
+
+@pytest.mark.parametrize('rows', [RAW_ROWS, ROWS])
+def test_fetch_columnar(rows):
+    result = fetch_columnar(FakeCursor(DESCRIPTION, rows), batch_size=2)
+
+    assert len(result) == 3
+    assert result['id'].dtype == np.int64
+    assert result['amount'].dtype == np.float64
+    assert result['amount'].tolist() == [1.5, 0.0, -2.25]
+    assert result.nulls[0] is None
+    assert result.null_mask('amount').tolist() == [False, True, False]
+    assert result['name'].tolist() == ['café', 'b', '']
+    assert result['data'].tolist() == [b'\x00\x01', b'', b'x']
+    assert result.rows()[1] == (2, None, 'b', None, None)
+
+
+def test_fetch_columnar_raw_zero_date():
+    result = fetch_columnar(FakeCursor(DESCRIPTION, RAW_ROWS))
+    assert str(result['day'][0]) == '2024-01-31'
+    assert np.isnat(result['day'][2])
+
+
+def test_fetch_columnar_empty():
+    result = fetch_columnar(FakeCursor(DESCRIPTION, []))
+    assert len(result) == 0
+    assert result['amount'].dtype == np.float64
+    assert compare_columns(result, result) == []
+
+
+def test_compare_columns():
+    a = ColumnarResult(
+        ['id', 'value'],
+        [np.array([1, 2, 3]), np.array([0.1, 0.2, 0.0])],
+        [None, np.array([False, False, True])],
+    )
+    b = ColumnarResult(
+        ['id', 'value'],
+        [np.array([3, 1, 2]), np.array([0.0, 0.1 + 1e-12, 0.2])],
+        [None, np.array([True, False, False])],
+    )
+    assert compare_columns(a, b, ignore_order=True) == []
+
+    diffs = compare_columns(a, b)
+    assert [diff.column for diff in diffs] == ['id', 'value']
+    assert diffs[1].mismatches == 3
+    assert diffs[1].examples[0] == (0, 0.1, None)
+
+    c = ColumnarResult(
+        ['id', 'value'],
+        [np.array([1, 2, 3]), np.array([0.1, 0.25, 0.0])],
+        [None, np.array([False, False, False])],
+    )
+    diffs = compare_columns(a, c)
+    assert [(d.column, d.examples) for d in diffs] == [
+        ('value', [(1, 0.2, 0.25), (2, None, 0.0)])]
+
+    with pytest.raises(ValueError):
+        compare_columns(a, ColumnarResult(['id'], [np.array([1])], [None]))
@@ -0,0 +1,74 @@
+import pytest
+
+import baseexception as be
+import connection
+
+
+class _StubConnection(object):
+    """
+    Connection answering every command with its hostname. Hosts named
+    'down*' cannot be reached, commands fail on 'bad*' hosts and cannot be
+    run at all on 'lost*' hosts.
+    """
+
+    def __init__(self, hostname, username='root', password=''):
+        if hostname.startswith('down'):
+            raise Exception('Connection refused')
+        self.hostname = hostname
+        self.timeouts = []
+        self.closed = False
+
+    def execute(self, cmd, raise_on_error=True, timeout=None):
+        self.timeouts.append(timeout)
+        if self.hostname.startswith('lost'):
+            raise Exception('Connection lost')
+        if self.hostname.startswith('bad'):
+            return '', 'failed', 1
+        return self.hostname, '', 0
+
+    def close(self):
+        self.closed = True
+
+
+@pytest.fixture
+def stub_connections(monkeypatch):
+    monkeypatch.setattr(connection, 'Connection', _StubConnection)
+
+
+def test_unreachable_hosts_left_out(stub_connections):
+    group = connection.ConnectionGroup(['host1', 'down1', 'host2'])
+
+    assert group.hostnames == ['host1', 'host2']
+    assert list(group.connect_errors) == ['down1']
+
+    results = group.execute('uptime', timeout=5, timeouts={'host2': 10})
+    assert sorted(results) == ['host1', 'host2']
+    assert results['host1'].stdout == 'host1'
+    assert group['host1'].timeouts == [5]
+    assert group['host2'].timeouts == [10]
+
+
+def test_partial_failure_aggregated(stub_connections):
+    with connection.ConnectionGroup(['host1', 'bad1', 'lost1']) as group:
+        with pytest.raises(be.GroupCommandError) as excinfo:
+            group.execute('sync')
+        hosts = group.hostnames
+
+    error = excinfo.value
+    assert isinstance(error, be.CommandError)
+    assert 'on 2 of 3 hosts' in str(error)
+    assert error.results['host1'].exit_code == 0
+    assert error.results['bad1'].exit_code == 1
+    assert error.results['bad1'].error is None
+    assert error.results['lost1'].error == 'Connection lost'
+    assert all(group[hostname].closed for hostname in hosts)
+
+
+def test_execute_iter_without_raising(stub_connections):
+    group = connection.ConnectionGroup(['host1', 'bad1'])
+
+    results = list(group.execute_iter('sync', hostnames=['bad1']))
+    assert [r.hostname for r in results] == ['bad1']
+
+    results = group.execute('sync', raise_on_error=False)
+    assert results['bad1'].exit_code == 1
@@ -0,0 +1,161 @@
+import mysql.connector
+import numpy as np
+
+from db import datagen
+from db.datagen import (
+    Choice, Column, DataGenerator, DateRange, Normal, Pattern, RandomString,
+    Sequential, TableSpec, Uniform, Zipf,
+)
+
+
+SPEC = TableSpec('orders', [
+    Column('id', 'BIGINT NOT NULL', Sequential()),
+    Column('customer', 'INT', Zipf(1.3, values=50)),
+    Column('amount', 'DECIMAL(12,2)', Uniform(0, 100, decimals=2),
+           null_fraction=0.25),
+    Column('state', 'VARCHAR(16)', Choice(['new', 'paid'], [3, 1])),
+    Column('code', 'CHAR(8)', RandomString(8)),
+    Column('email', 'VARCHAR(64)', Pattern('user{}@example.com',
+                                           Uniform(1, 9))),
+    Column('weight', 'DOUBLE', Normal(10, 2)),
+    Column('created', 'DATE', DateRange('2024-01-01', '2024-02-01')),
+], primary_key='id', indexes=['customer', 'state, created'])
+
+
+def test_create_sql():
+    assert SPEC.create_sql.startswith(
+        'CREATE TABLE `orders` (`id` BIGINT NOT NULL, `customer` INT,')
+    assert SPEC.create_sql.endswith('PRIMARY KEY (id))')
+    assert SPEC.index_sql == [
+        'CREATE INDEX `ix_orders_customer` ON `orders` (customer)',
+        'CREATE INDEX `ix_orders_state_created` ON `orders` '
+        '(state, created)',
+    ]
+
+
+def test_chunks_are_deterministic():
+    generator = DataGenerator(SPEC, rows=2500, seed=7, chunk_size=1000)
+    assert generator.chunks == 3
+    assert generator.chunk_tsv(1) == generator.chunk_tsv(1)
+    assert DataGenerator(SPEC, 2500, seed=7, chunk_size=1000).chunk_rows(2) \
+        == generator.chunk_rows(2)
+    assert DataGenerator(SPEC, 2500, seed=8, chunk_size=1000).chunk_rows(2) \
+        != generator.chunk_rows(2)
+
+    rows = generator.chunk_rows(2)
+    assert len(rows) == 500
+    assert [row[0] for row in rows] == list(range(2001, 2501))
+
+
+def test_distributions():
+    generator = DataGenerator(SPEC, rows=20000, seed=1, chunk_size=20000)
+    (ids, customers, amounts, states, codes, emails, weights, created), \
+        nulls = generator.chunk(0)
+
+    assert customers.min() >= 1 and customers.max() <= 50
+    # Zipf: the first value is by far the most frequent
+    assert np.bincount(customers).argmax() == 1
+    assert 0.22 < nulls[2].mean() < 0.28
+    assert nulls[0] is None
+    assert 0.72 < (states == 'new').mean() < 0.78
+    assert all(len(code) == 8 and code.isalnum() for code in codes[:100])
+    assert emails[0].startswith('user') and emails[0].endswith('@example.com')
+    assert 9.5 < weights.mean() < 10.5
+    assert str(created.min()) >= '2024-01-01'
+    assert str(created.max()) < '2024-02-01'
+
+
+def test_tsv():
+    spec = TableSpec('t', [
+        Column('id', 'INT', Sequential()),
+        Column('name', 'TEXT', Choice(['a\tb', 'c\\d\ne'])),
+        Column('value', 'INT', Uniform(1, 1), null_fraction=0.5),
+    ])
+    generator = DataGenerator(spec, rows=200, seed=3)
+    lines = generator.chunk_tsv(0).splitlines()
+    assert len(lines) == 200
+    for line, row in zip(lines, generator.chunk_rows(0)):
+        fields = line.split('\t')
+        assert len(fields) == 3
+        assert fields[0] == str(row[0])
+        assert fields[1] in ('a\\tb', 'c\\\\d\\ne')
+        assert fields[2] == ('\\N' if row[2] is None else '1')
+
+
+class FakeCursor(object):
+    """
+    Cursor recording statements, LOAD DATA fails as disabled.
+    """
+
+    def __init__(self, statements):
+        self.statements = statements
+        self.rowcount = 0
+
+    def execute(self, sql, params=None):
+        if sql.startswith('LOAD DATA'):
+            raise mysql.connector.ProgrammingError(msg='disabled',
+                                                   errno=3948)
+        self.statements.append(sql.split()[0])
+
+    def executemany(self, sql, rows):
+        self.statements.append('INSERT')
+        self.rowcount = len(rows)
+
+    def close(self):
+        pass
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *args):
+        pass
+
+
+class FakeMariaDB(object):
+
+    instances = []
+
+    def __init__(self, conn_params, settings=None):
+        self.conn_params = conn_params
+        self.settings = settings
+        self.statements = []
+        FakeMariaDB.instances.append(self)
+
+    def cursor(self):
+        return FakeCursor(self.statements)
+
+    def commit(self):
+        pass
+
+    def rollback(self):
+        self.statements.append('ROLLBACK')
+
+    def close(self):
+        pass
+
+
+class FakeSession(object):
+
+    def __init__(self):
+        self.session_db = FakeMariaDB(
+            {'dbname': 'db1'}, {'autocommit': True, 'connect_timeout': 5})
+
+    def cursor(self):
+        return FakeCursor([])
+
+
+def test_load_falls_back_once(monkeypatch, caplog):
+    monkeypatch.setattr(datagen, 'MariaDB', FakeMariaDB)
+    FakeMariaDB.instances = []
+    spec = TableSpec('t', [Column('id', 'INT', Sequential())])
+
+    DataGenerator(spec, rows=30, chunk_size=10).load(
+        FakeSession(), workers=1, create=False)
+
+    session_db, worker_db = FakeMariaDB.instances
+    assert worker_db.settings == {'autocommit': False, 'connect_timeout': 5,
+                                  'allow_local_infile': True}
+    # Only the first chunk tries LOAD DATA
+    assert worker_db.statements == ['SET', 'ROLLBACK', 'INSERT', 'INSERT',
+                                    'INSERT']
+    assert caplog.text.count('LOAD DATA LOCAL is disabled') == 1
@@ -0,0 +1,65 @@
+import pytest
+
+from db import fixture
+
+
+ENDPOINT_CONN_PARAMS = {
+    'endpoints': [
+        {'host': 'db1', 'role': 'primary'},
+        {'host': 'db2', 'role': 'replica'},
+    ],
+    'port': 3306,
+    'dbname': 'dev',
+    'user': 'master',
+    'password': 'Testing1234',
+}
+
+# Connection parameters the fake reaper and sessions were given
+_reaped = []
+_sessions = []
+
+
+class _FakeMariaDB(object):
+
+    def __init__(self, conn_params, settings=None):
+        self.conn_params = conn_params
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *args):
+        pass
+
+
+class _FakeDbSession(object):
+
+    def __init__(self, conn_params, **kwargs):
+        _sessions.append(conn_params)
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *args):
+        pass
+
+
+@pytest.fixture(scope='module')
+def conn_params():
+    """
+    Connection parameters with endpoints, for the session fixtures of this
+    module, which run against fakes.
+    """
+    with pytest.MonkeyPatch.context() as mp:
+        mp.setattr(fixture, '_reaped', set())
+        mp.setattr(fixture, 'MariaDB', _FakeMariaDB)
+        mp.setattr(fixture, 'DbSession', _FakeDbSession)
+        mp.setattr(fixture.reaper, 'reap_sessions',
+                   lambda base_db: _reaped.append(base_db.conn_params))
+        yield ENDPOINT_CONN_PARAMS
+
+
+def test_session_fixture_with_endpoints(module_db_session_fxt):
+    assert len(_reaped) == 1
+    assert _reaped[0]['host'] == 'db1'
+    assert 'endpoints' not in _reaped[0]
+    assert _sessions == [ENDPOINT_CONN_PARAMS]
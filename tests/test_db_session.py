@@ -0,0 +1,74 @@
+import pytest
+
+from db import session as db_session
+
+
+class _FlakyCursor(object):
+
+    def __init__(self, failures, error):
+        self.failures = failures
+        self.error = error
+        self.executed = []
+
+    def execute(self, sql):
+        self.executed.append(sql)
+        if len(self.executed) <= self.failures:
+            raise self.error
+
+
+@pytest.fixture
+def sleeps(monkeypatch):
+    delays = []
+    monkeypatch.setattr(db_session.time, 'sleep', delays.append)
+    return delays
+
+
+def test_try_execute_backs_off(sleeps):
+    import mysql.connector
+
+    cursor = _FlakyCursor(
+        3, mysql.connector.DatabaseError(msg='Deadlock found', errno=1213)
+    )
+    db_session._try_execute('CREATE USER u', cursor, 'Creating user')
+
+    assert len(cursor.executed) == 4
+    assert len(sleeps) == 3
+    assert sleeps[-1] <= db_session.RETRY_BASE_DELAY_SEC * 4
+    assert sum(sleeps) < 1
+
+
+def test_try_execute_gives_up(sleeps):
+    import mysql.connector
+
+    cursor = _FlakyCursor(
+        100,
+        mysql.connector.DatabaseError(msg='Lock wait timeout exceeded',
+                                      errno=1205)
+    )
+    with pytest.raises(mysql.connector.DatabaseError):
+        db_session._try_execute('GRANT ALL', cursor, 'Granting')
+
+    assert len(cursor.executed) == db_session.MAX_EXECUTE_ATTEMPTS
+    assert all(d <= db_session.RETRY_MAX_DELAY_SEC for d in sleeps)
+
+
+def test_try_execute_raises_non_transient(sleeps):
+    cursor = _FlakyCursor(1, db_session.DatabaseError('Access denied'))
+    with pytest.raises(db_session.DatabaseError):
+        db_session._try_execute('GRANT ALL', cursor, 'Granting')
+
+    assert len(cursor.executed) == 1
+    assert sleeps == []
+
+
+def test_try_execute_raises_server_error(sleeps):
+    import mysql.connector
+
+    cursor = _FlakyCursor(
+        1, mysql.connector.ProgrammingError(msg='Syntax error', errno=1064)
+    )
+    with pytest.raises(mysql.connector.ProgrammingError):
+        db_session._try_execute('GRANT ALL', cursor, 'Granting')
+
+    assert len(cursor.executed) == 1
+    assert sleeps == []
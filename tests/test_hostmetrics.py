@@ -0,0 +1,115 @@
+import subprocess
+import time
+
+import hostmetrics
+
+
+class _LocalHost(object):
+    """
+    Loopback host: runs the sampling loop as a local process.
+    """
+
+    def __init__(self, hostname):
+        self.hostname = hostname
+
+    def open_stream(self, cmd):
+        proc = subprocess.Popen(
+            ['sh', '-c', cmd], stdout=subprocess.PIPE,
+            stdin=subprocess.DEVNULL
+        )
+
+        def _stop():
+            proc.kill()
+            proc.wait()
+            proc.stdout.close()
+
+        return proc.stdout, _stop
+
+
+DISKSTATS = """\
+   8       0 sda 100 0 2048 10 200 0 4096 20 0 500 30 0 0 0 0
+   8       1 sda1 90 0 2000 10 190 0 4000 20 0 490 30 0 0 0 0
+ 259       0 nvme0n1 10 0 0 0 10 0 0 0 0 10 0 0 0 0 0
+ 259       1 nvme0n1p1 10 0 0 0 10 0 0 0 0 10 0 0 0 0 0
+   7       0 loop0 10 0 0 0 10 0 0 0 0 10 0 0 0 0 0
+"""
+
+NET_DEV = """\
+Inter-|   Receive                                                |  Transmit
+ face |bytes    packets errs drop fifo frame compressed multicast|bytes
+    lo: 999 1 0 0 0 0 0 0 999 1 0 0 0 0 0 0
+  eth0: 1048576 10 0 0 0 0 0 0 2097152 20 0 0 0 0 0 0
+"""
+
+
+def _snapshot(uptime, idle, sectors, io_ticks, rx):
+    return hostmetrics.Snapshot(
+        uptime,
+        hostmetrics.parse_cpu(
+            'cpu  100 0 50 {} 10 0 0 0 0 0\ncpu0 1 2 3\n'.format(idle)
+        ),
+        {'sda': (sectors, sectors, io_ticks)},
+        {'eth0': (rx, rx)},
+        hostmetrics.parse_meminfo(
+            'MemTotal: 1000 kB\nMemAvailable: 250 kB\n'
+        ),
+    )
+
+
+def test_parsers():
+    assert sorted(hostmetrics.parse_diskstats(DISKSTATS)) == \
+        ['nvme0n1', 'sda']
+    assert hostmetrics.parse_diskstats(DISKSTATS)['sda'] == (2048, 4096, 500)
+    assert hostmetrics.parse_net_dev(NET_DEV) == {'eth0': (1048576, 2097152)}
+
+    values = hostmetrics.snapshot_delta(
+        _snapshot(10.0, 0, 0, 0, 0),
+        _snapshot(12.0, 40, 4096, 1000, 4 * 1024 * 1024),
+    )
+    # 40 ticks passed, all idle
+    assert values['cpu_util'] == 0.0
+    assert values['disk_read_mbps'] == 1.0
+    assert values['disk_util'] == 50.0
+    assert values['net_rx_mbps'] == 2.0
+    assert values['mem_used'] == 75.0
+
+
+def test_aligned_and_saturation():
+    sampler = hostmetrics.HostMetricsSampler()
+    sampler.add_host(_LocalHost('client1'), hostmetrics.ROLE_CLIENT)
+    sampler.add_host(_LocalHost('db1'), hostmetrics.ROLE_SERVER)
+
+    values = dict.fromkeys(hostmetrics.METRICS[1:], 0.0)
+    for second in range(1, 7):
+        sampler.series['client1'].append(
+            second, dict(values, cpu_util=95.0 if second > 2 else second)
+        )
+        sampler.series['db1'].append(second, dict(values, cpu_util=40.0))
+
+    assert sampler.series['client1'].aligned('cpu_util', 2) == \
+        [1.5, 95.0, 95.0]
+    assert sampler.series['client1'].aligned('cpu_util', 4, count=2) == \
+        [(1 + 2 + 95 + 95) / 4.0, 95.0]
+
+    saturated = sampler.saturation()
+    assert [(s.hostname, s.resource) for s in saturated] == \
+        [('client1', 'cpu')]
+    assert sampler.client_limited()
+    assert 'Client hosts, not the database' in sampler.report()
+
+
+def test_sampler_on_loopback():
+    sampler = hostmetrics.HostMetricsSampler(interval=0.2)
+    sampler.add_host(_LocalHost('localhost'), hostmetrics.ROLE_CLIENT)
+
+    with sampler:
+        deadline = time.monotonic() + 10
+        while len(sampler.series['localhost']) < 3 and \
+                time.monotonic() < deadline:
+            time.sleep(0.1)
+
+    series = sampler.series['localhost']
+    assert len(series) >= 3
+    assert list(series.values('time')) == sorted(series.values('time'))
+    assert 0.0 <= series.mean('cpu_util') <= 100.0
+    assert 0.0 < series.mean('mem_used') < 100.0
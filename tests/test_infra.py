@@ -0,0 +1,71 @@
+import logging
+import subprocess
+import sys
+import time
+
+import pytest
+
+import baseexception as be
+from infra import execute_cmd, execute_cmds
+
+log = logging.getLogger(__name__)
+
+
+def _python_cmd(code):
+    return '{} -c "{}"'.format(sys.executable, code)
+
+
+def test_execute_cmd_large_output():
+    # well beyond the pipe buffer on both streams
+    code = ("import sys; sys.stdout.write('x' * 1000000); "
+            "sys.stderr.write('y' * 1000000)")
+    stdout, stderr, exit_status = execute_cmd(_python_cmd(code), timeout=30)
+
+    assert exit_status == 0
+    assert len(stdout) == 1000000
+    assert len(stderr) == 1000000
+
+
+def test_execute_cmd_streams_lines(tmp_path):
+    lines = []
+    output_file = str(tmp_path / 'out.log')
+    code = "print('a'); print('b'); import sys; sys.stderr.write('c')"
+
+    execute_cmd(
+        _python_cmd(code), line_callback=lambda s, l: lines.append((s, l)),
+        output_file=output_file, capture_output=False,
+    )
+
+    assert ('stdout', 'a') in lines and ('stdout', 'b') in lines
+    assert ('stderr', 'c') in lines
+    with open(output_file) as rfp:
+        assert sorted(rfp.read()) == sorted('a\nb\nc')
+
+
+def test_execute_cmd_timeout_kills_process_group():
+    start = time.monotonic()
+    with pytest.raises(subprocess.TimeoutExpired):
+        execute_cmd('sh -c "sleep 30 & sleep 30; echo done"', timeout=1)
+    assert time.monotonic() - start < 10
+
+    stdout, _, exit_status = execute_cmd(
+        'sh -c "echo started; sleep 30"', timeout=1, raise_on_error=False
+    )
+    assert stdout.strip() == 'started'
+    assert exit_status < 0
+
+
+def test_execute_cmd_failure():
+    with pytest.raises(be.CommandError):
+        execute_cmd('false')
+    assert execute_cmd('false', raise_on_error=False)[2] == 1
+
+
+def test_execute_cmds_parallel():
+    start = time.monotonic()
+    results = execute_cmds(['sleep 1'] * 4 + ['echo last'], max_parallel=5)
+    assert time.monotonic() - start < 3
+    assert results[-1] == ('last\n', '', 0)
+
+    with pytest.raises(be.CommandError):
+        execute_cmds(['true', 'false'])
@@ -0,0 +1,120 @@
+import pytest
+
+from db import Aggregator
+from db import instrumentation
+from db import session as db_session
+
+
+class _FakeCursor(object):
+
+    def __init__(self, rows):
+        self.rows = rows
+        self.rowcount = -1
+        self.closed = False
+
+    def execute(self, sql, params=None):
+        self.rowcount = len(self.rows)
+
+    def fetchone(self):
+        return self.rows.pop(0) if self.rows else None
+
+    def fetchall(self):
+        rows, self.rows = self.rows, []
+        return rows
+
+    def close(self):
+        self.closed = True
+
+
+def test_disabled_takes_no_timings():
+    assert instrumentation.hooks == ()
+    assert instrumentation.start() is None
+    # Nothing to deliver and no error without a start time
+    instrumentation.emit(instrumentation.EVENT_EXECUTE, None, rows=1)
+
+
+def test_aggregator_counts_cursor_events():
+    with Aggregator() as agg:
+        assert instrumentation.hooks == (agg,)
+        with instrumentation.TimedCursor(_FakeCursor([(1,), (2,), (3,)])) \
+                as cursor:
+            cursor.execute('SELECT a FROM t1')
+            assert cursor.fetchone() == (1,)
+            assert cursor.fetchall() == [(2,), (3,)]
+        assert cursor._cursor.closed
+    assert instrumentation.hooks == ()
+
+    summary = agg.summary()
+    assert summary['execute']['count'] == 1
+    assert summary['execute']['rows'] == 3
+    assert summary['fetch']['count'] == 2
+    assert summary['fetch']['rows'] == 3
+    assert agg.database_time() == pytest.approx(
+        summary['execute']['total'] + summary['fetch']['total'])
+    assert 'harness' in agg.report(wall_time=1.0)
+
+
+def test_histogram_percentiles():
+    histogram = instrumentation.Histogram()
+    for _ in range(99):
+        histogram.add(0.000015)
+    histogram.add(0.5)
+
+    assert histogram.percentile(50) == pytest.approx(0.00002)
+    assert histogram.percentile(99) == pytest.approx(0.00002)
+    assert histogram.percentile(100) == 0.5
+    assert instrumentation.Histogram().percentile(99) == 0.0
+
+
+def test_retry_sleeps_emitted(monkeypatch):
+    import mysql.connector
+
+    monkeypatch.setattr(db_session.time, 'sleep', lambda delay: None)
+
+    class _FailingCursor(object):
+        def execute(self, sql):
+            raise mysql.connector.DatabaseError(msg='Deadlock found',
+                                                errno=1213)
+
+    events = []
+    instrumentation.add_hook(events.append)
+    try:
+        with pytest.raises(mysql.connector.DatabaseError):
+            db_session._try_execute('CREATE USER u', _FailingCursor(),
+                                    'Creating')
+    finally:
+        instrumentation.remove_hook(events.append)
+
+    assert len(events) == db_session.MAX_EXECUTE_ATTEMPTS - 1
+    assert {e.kind for e in events} == {instrumentation.EVENT_RETRY}
+    assert events[0].detail == 'CREATE USER u'
+
+
+def test_connect_emitted_with_settings(monkeypatch):
+    import mysql.connector
+    from db.mariadb import MariaDB
+
+    class _FakeConnection(object):
+        autocommit = None
+
+    connects = []
+
+    def connect(**kwargs):
+        connects.append(kwargs)
+        return _FakeConnection()
+
+    monkeypatch.setattr(mysql.connector, 'connect', connect)
+    conn_params = {'host': 'db1', 'port': 3306, 'user': 'u',
+                   'password': '', 'dbname': 'd'}
+    events = []
+    instrumentation.add_hook(events.append)
+    try:
+        MariaDB(conn_params, {'autocommit': False, 'connect_timeout': 5,
+                              'allow_local_infile': True}).connect()
+    finally:
+        instrumentation.remove_hook(events.append)
+
+    assert connects[0]['connect_timeout'] == 5
+    assert connects[0]['allow_local_infile']
+    assert [(e.kind, e.detail) for e in events] == [
+        (instrumentation.EVENT_CONNECT, 'db1')]
@@ -0,0 +1,175 @@
+import textwrap
+import time
+
+import pytest
+
+from sysbench import SysbenchConfig, SBConfigInvalid
+from sysbench import loadgen
+
+CONFIG = """
+sysbench:
+    config_rw:
+        options:
+            mysql-host:     db1
+            threads:        4
+            tables:         2
+            table-size:     1000
+            time:           1
+            verbosity:      5
+        testname:   /usr/share/sysbench/oltp_read_write.lua
+        commands:   run
+    config_cpu:
+        testname:   cpu
+        commands:   run
+job:
+    job_1:
+        config: config_rw
+        clients:
+            client1: 2
+"""
+
+
+class _FakeCursor(object):
+
+    def __init__(self, log):
+        self.log = log
+
+    def execute(self, sql, params=None):
+        self.log.append(sql.split()[0])
+
+    def fetchall(self):
+        return []
+
+    def close(self):
+        pass
+
+
+class _FakeConnection(object):
+
+    def __init__(self):
+        self.statements = []
+
+    def cursor(self):
+        return _FakeCursor(self.statements)
+
+
+class _FakeMariaDB(object):
+    instances = []
+
+    def __init__(self, conn_params, settings=None):
+        self.conn_params = conn_params
+        self.connection = None
+        _FakeMariaDB.instances.append(self)
+
+    def connect(self):
+        self.connection = _FakeConnection()
+
+    def close(self):
+        self.connection = None
+
+
+@pytest.fixture
+def config(tmp_path):
+    path = tmp_path / 'oltp.yaml'
+    path.write_text(textwrap.dedent(CONFIG))
+    return SysbenchConfig(str(path))
+
+
+def test_workload_options(config):
+    options = loadgen.WorkloadOptions(config.configs['config_rw'],
+                                      table_size=50)
+    assert options.testname == 'oltp_read_write'
+    assert options.reads and options.writes
+    assert options['threads'] == 4
+    assert options['table-size'] == 50
+    assert options.conn_params['host'] == 'db1'
+
+    with pytest.raises(SBConfigInvalid):
+        loadgen.WorkloadOptions(config.configs['config_cpu'])
+
+
+def test_transaction_statements(config):
+    options = loadgen.WorkloadOptions(config.configs['config_rw'])
+    statements = []
+    counts = loadgen.OltpWorkload(options).transaction(
+        _FakeCursor(statements), loadgen.random.Random(1))
+
+    assert counts == (14, 4, 2)
+    assert statements[0] == 'BEGIN' and statements[-1] == 'COMMIT'
+    assert statements.count('SELECT') == 14
+    assert len(statements) == sum(counts)
+
+
+@pytest.mark.parametrize('rate', [0, 200])
+def test_run_reports_intervals(config, monkeypatch, rate):
+    monkeypatch.setattr(loadgen, 'MariaDB', _FakeMariaDB)
+    _FakeMariaDB.instances = []
+    generator = loadgen.LoadGenerator(config.configs['config_rw'],
+                                      events=100, time=0, rate=rate)
+    result = generator.run()
+
+    assert result.totals['transactions'] == 100
+    assert len(_FakeMariaDB.instances) == 4
+    summary = result.summary()
+    assert summary['SQL_statistics']['read'] == 1400
+    assert summary['General_statistics']['total_number_of_events'] == 100
+    assert summary['Latency']['max'] >= summary['Latency']['95th_percentile']
+    assert sum(i.tps for i in result.intervals) > 0 or result.duration < 1
+    if rate:
+        # 100 arrivals at 200 tps take half a second
+        assert result.duration >= 0.45
+
+
+def test_percentile_and_format():
+    assert loadgen.percentile([], 95) == 0.0
+    assert loadgen.percentile(range(1, 101), 95) == 95
+    line = loadgen.format_interval(loadgen.IntervalStats(
+        1, 4, 10.0, 200.0, 140.0, 40.0, 20.0, 12.5, 0.0, 0.0))
+    assert line.startswith('[ 1s ] thds: 4 tps: 10.00 qps: 200.00')
+
+
+class _SlowCursor(_FakeCursor):
+
+    def execute(self, sql, params=None):
+        time.sleep(0.01)
+
+
+def test_open_loop_latency_includes_queueing(config, monkeypatch):
+    monkeypatch.setattr(loadgen, 'MariaDB', _FakeMariaDB)
+    monkeypatch.setattr(loadgen.OltpWorkload, 'transaction',
+                        lambda self, cursor, rng: (cursor.execute('x'),
+                                                   (1, 0, 0))[1])
+    monkeypatch.setattr(_FakeConnection, 'cursor',
+                        lambda self: _SlowCursor(self.statements))
+
+    # One thread serves 100 tps at most, arrivals come at 200 tps
+    generator = loadgen.LoadGenerator(config.configs['config_rw'], threads=1,
+                                      events=60, time=0, rate=200)
+    summary = generator.run().summary()
+
+    service = summary['Service_time']['95th_percentile']
+    assert service < 50
+    # Later transactions waited for the earlier ones
+    assert summary['Latency']['max'] > 3 * service
+    assert 'queue' in summary
+
+
+@pytest.mark.parametrize('rate', [0, 100])
+def test_run_job_scales_threads_and_rate(tmp_path, monkeypatch, rate):
+    path = tmp_path / 'oltp.yaml'
+    path.write_text(textwrap.dedent(CONFIG))
+    generators = []
+
+    class _RecordingGenerator(object):
+
+        def __init__(self, test_config, conn_params=None, **overrides):
+            generators.append(overrides)
+
+        def execute(self, command):
+            return None
+
+    monkeypatch.setattr(loadgen, 'LoadGenerator', _RecordingGenerator)
+    loadgen.run_job(str(path), rate=rate)
+
+    # 2 instances of client1, each sysbench instance with its own --rate
+    assert generators == [{'threads': 8, 'rate': rate * 2}]
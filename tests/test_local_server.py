@@ -0,0 +1,28 @@
+import pytest
+
+from db import LocalMariaDB
+from db.db_exception import OperationalError
+from db.local_server import free_port
+
+
+def test_missing_binaries(tmp_path, monkeypatch):
+    monkeypatch.setenv('PATH', str(tmp_path))
+    monkeypatch.setattr('db.local_server.shutil.which',
+                        lambda name, path=None: None)
+    server = LocalMariaDB(binary_dir=str(tmp_path))
+
+    with pytest.raises(OperationalError) as excinfo:
+        server.start()
+    assert 'mariadbd' in str(excinfo.value)
+    # Nothing was created
+    assert server.basedir is None
+    server.stop()
+
+
+def test_conn_params():
+    port = free_port()
+    server = LocalMariaDB(port=port)
+    params = server.conn_params
+    assert params['port'] == port
+    assert params['user'] == 'root'
+    assert '--innodb-doublewrite=0' in server.options
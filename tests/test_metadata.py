@@ -0,0 +1,88 @@
+from db.metadata import MetadataCache, is_schema_change
+
+
+ROWS = [
+    ('table', 't1', None, 'InnoDB', 'BASE TABLE', 1000, 16384, None),
+    ('table', 'v1', None, None, 'VIEW', None, None, None),
+    ('column', 't1', 'val', 'varchar', 'varchar(10)', 'YES', 'NULL', 2),
+    ('column', 't1', 'id', 'int', 'int(11)', 'NO', None, 1),
+    ('column', 'v1', 'id', 'int', 'int(11)', 'NO', None, 1),
+    ('index', 't1', 'ix_val', 'id', 1, None, None, 2),
+    ('index', 't1', 'PRIMARY', 'id', 0, None, None, 1),
+    ('index', 't1', 'ix_val', 'val', 1, None, None, 1),
+]
+
+
+class FakeCursor(object):
+
+    def __init__(self, queries, rows):
+        self.queries = queries
+        self.rows = rows
+
+    def execute(self, sql, params=None):
+        self.queries.append(params)
+
+    def fetchall(self):
+        return self.rows
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *args):
+        pass
+
+
+def test_table_info():
+    queries = []
+    cache = MetadataCache(lambda: FakeCursor(queries, ROWS))
+
+    info = cache.table_info('db1', 't1')
+    assert info.column_names == ['id', 'val']
+    assert info.column('VAL').nullable
+    assert not info.column('id').nullable
+    assert info.primary_key == ['id']
+    assert [(i.name, i.columns, i.unique) for i in info.indexes] == [
+        ('PRIMARY', ('id',), True), ('ix_val', ('val', 'id'), False)]
+    assert info.row_estimate == 1000
+    assert cache.table_info('db1', 'v1').is_view
+
+    # One query per database
+    assert queries == [('db1', 'db1', 'db1')]
+
+    # Unknown tables are looked up once more, they may be new, but only
+    # once until the next invalidation
+    assert cache.table_info('db1', 'missing') is None
+    assert len(queries) == 2
+    for _ in range(3):
+        assert cache.table_info('db1', 'missing') is None
+    assert len(queries) == 2
+
+    cache.invalidate('db1')
+    assert cache.table_info('db1', 'missing') is None
+    assert cache.table_info('db1', 'missing') is None
+    assert len(queries) == 3
+
+
+def test_invalidation():
+    queries = []
+    cache = MetadataCache(lambda: FakeCursor(queries, ROWS))
+    cache.table_info('db1', 't1')
+
+    for sql in ("INSERT INTO t1 VALUES (1)", "CREATE TEMPORARY TABLE t2 "
+                "(id int)", "SELECT 1"):
+        cache.on_statement(sql)
+        cache.table_info('db1', 't1')
+    assert len(queries) == 1
+
+    cache.on_statement("/* x */ ALTER TABLE t1 ADD COLUMN c int")
+    cache.table_info('db1', 't1')
+    assert len(queries) == 2
+
+
+def test_is_schema_change():
+    assert is_schema_change("create table t (id int)")
+    assert is_schema_change("  DROP VIEW v1")
+    assert is_schema_change("TRUNCATE TABLE t")
+    assert not is_schema_change("DROP TEMPORARY TABLE t")
+    assert not is_schema_change("select * from created")
+    assert not is_schema_change("UPDATE t SET a = 'DROP'")
@@ -0,0 +1,73 @@
+import logging
+import os
+
+import query_corpus
+from query_corpus import (
+    KIND_DDL,
+    KIND_DML,
+    KIND_OTHER,
+    KIND_SELECT,
+    QueryCorpus,
+    classify_statement,
+)
+
+log = logging.getLogger(__name__)
+
+CORPUS = """
+-- setup
+CREATE TABLE t1 (col1 int);
+INSERT INTO t1 VALUES (1), (2);
+
+-- tags: smoke, agg
+SELECT count(*) FROM t1;
+WITH c AS (SELECT col1 FROM t1) SELECT * FROM c;
+-- tags: smoke
+(SELECT col1 FROM t1) UNION (SELECT 2);
+set mapi_monetdb_query_routing=OFF;
+"""
+
+
+def test_classify_statement():
+    assert classify_statement('select 1') == KIND_SELECT
+    assert classify_statement('/* hint */ UPDATE t1 SET a=1') == KIND_DML
+    assert classify_statement('with x as (select 1) select * from x') == \
+        KIND_SELECT
+    assert classify_statement('drop table t1') == KIND_DDL
+    assert classify_statement('show tables') == KIND_OTHER
+
+
+def test_corpus_split_classify_and_filter(tmp_path):
+    sql_file = tmp_path / 'queries' / 'q1.sql'
+    sql_file.parent.mkdir()
+    sql_file.write_text(CORPUS)
+
+    corpus = QueryCorpus([str(tmp_path / 'queries')],
+                         cache_dir=str(tmp_path / 'cache'))
+    kinds = [stmt.kind for stmt in corpus]
+    assert kinds == [KIND_DDL, KIND_DML, KIND_SELECT, KIND_SELECT,
+                     KIND_SELECT, KIND_OTHER]
+    assert corpus.queries(tags=['agg']) == ['SELECT count(*) FROM t1;']
+    assert len(corpus.statements(kinds=[KIND_SELECT], tags=['smoke'])) == 2
+
+
+def test_corpus_index_reused(tmp_path, monkeypatch):
+    sql_file = tmp_path / 'q1.sql'
+    sql_file.write_text(CORPUS)
+    cache_dir = str(tmp_path / 'cache')
+
+    first = QueryCorpus(str(sql_file), cache_dir=cache_dir).load()
+
+    def fail_parse(filepath):
+        raise AssertionError("{} parsed again".format(filepath))
+
+    monkeypatch.setattr(query_corpus, 'parse_sql_file', fail_parse)
+
+    # touching the file without changing it keeps the index valid
+    stat = os.stat(str(sql_file))
+    os.utime(str(sql_file), ns=(stat.st_atime_ns, stat.st_mtime_ns + 10**9))
+    assert QueryCorpus(str(sql_file), cache_dir=cache_dir).load() == first
+
+    sql_file.write_text(CORPUS + 'SELECT 2;\n')
+    monkeypatch.undo()
+    reloaded = QueryCorpus(str(sql_file), cache_dir=cache_dir).load()
+    assert reloaded[-1].sql == 'SELECT 2;'
@@ -0,0 +1,113 @@
+import pytest
+
+import query_helper
+from query_helper import STATUS_ERROR, STATUS_PASS, execute_queries
+from result_cache import ResultFingerprintCache
+
+
+class FakeCursor(object):
+    """
+    Runs multi-statement strings statement by statement: every statement
+    returns one row with its own text, statements containing 'bad' fail.
+    """
+
+    def __init__(self):
+        self.executed = []
+        self._results = []
+        self.description = None
+
+    def execute(self, sql):
+        self._results = []
+        for statement in sql.split(';\n'):
+            if 'bad' in statement:
+                raise RuntimeError('syntax error near bad')
+            self.executed.append(statement)
+            self._results.append([(statement,)])
+        self.description = [('text',)]
+
+    def fetchall(self):
+        return self._results.pop(0)
+
+    def nextset(self):
+        return bool(self._results)
+
+
+def test_failed_select_batch_rerun_one_by_one():
+    cursor_a, cursor_b = FakeCursor(), FakeCursor()
+    queries = ['select 1', 'select bad', 'select 2']
+
+    records, elapsed = execute_queries(cursor_a, cursor_b, queries)
+
+    assert [r['status'] for r in records] == [
+        STATUS_PASS, STATUS_ERROR, STATUS_PASS]
+    assert 'bad' in records[1]['error']
+    assert elapsed >= 0
+
+
+def test_failed_write_batch_not_rerun():
+    cursor_a, cursor_b = FakeCursor(), FakeCursor()
+    queries = ['insert into t values (1)', 'update bad']
+
+    records, _ = execute_queries(cursor_a, cursor_b, queries)
+
+    assert [r['status'] for r in records] == [STATUS_ERROR, STATUS_ERROR]
+    # The insert ran once, in the failed batch
+    assert cursor_a.executed == ['insert into t values (1)']
+    assert cursor_b.executed == []
+
+
+def test_batch_elapsed_approximate():
+    records, elapsed = execute_queries(
+        FakeCursor(), FakeCursor(), ['select 1', 'select 2'])
+    for record in records:
+        assert record['elapsed_approximate']
+        assert record['batch_elapsed'] == elapsed
+        assert record['elapsed'] == elapsed / 2
+
+    records, _ = execute_queries(FakeCursor(), FakeCursor(), ['select 1'])
+    assert 'elapsed_approximate' not in records[0]
+
+
+def test_result_cache_requires_data_checksum(tmp_path):
+    cache = ResultFingerprintCache(str(tmp_path / 'results.sqlite'))
+    with pytest.raises(ValueError):
+        query_helper.run_queries(
+            ['select 1'], None, None, False, {}, [], result_cache=cache)
+
+
+def test_only_selects_looked_up_in_cache(tmp_path):
+    cache = ResultFingerprintCache(str(tmp_path / 'results.sqlite'))
+    ctx = query_helper._CacheContext(cache, 'checksum', ('a', 'b'),
+                                     ('OFF', 'OFF'))
+    queries = ['select 1', 'insert into t values (1)']
+    for query in queries:
+        for key in query_helper._cache_keys(ctx, query):
+            cache.put(key, 'digest')
+
+    to_run, skipped, _ = query_helper._lookup_cached(ctx, queries)
+
+    assert [query for query, _ in skipped] == ['select 1']
+    assert to_run == ['insert into t values (1)']
+
+
+class FakeInstance(object):
+    conn_params = {}
+    settings = {}
+
+
+def _dying_worker(worker, conn, specs, routing_modes, ring_name):
+    conn.close()
+
+
+def test_batches_of_dead_workers_recorded(monkeypatch):
+    monkeypatch.setattr(query_helper, '_execute_worker', _dying_worker)
+    queries = ['select {}'.format(i) for i in range(5)]
+    proc_sum = {STATUS_PASS: 0, STATUS_ERROR: 0}
+    run_report = []
+
+    query_helper.run_queries(
+        queries, FakeInstance(), FakeInstance(), False, proc_sum, run_report,
+        num_workers=2, max_batch_size=1)
+
+    assert proc_sum[STATUS_ERROR] == len(queries)
+    assert sorted(r['query'] for r in run_report) == queries
@@ -0,0 +1,104 @@
+import logging
+import threading
+
+from query_scheduler import (
+    QueryBatch,
+    QueryCostHistory,
+    WorkStealingScheduler,
+    make_batches,
+    normalize_query,
+)
+
+log = logging.getLogger(__name__)
+
+
+def test_cost_history_persisted(tmp_path):
+    filepath = str(tmp_path / 'costs.json')
+
+    history = QueryCostHistory(filepath)
+    history.record('select  1;', 2.0)
+    history.record('select 1', 4.0)
+    history.save()
+
+    reloaded = QueryCostHistory(filepath)
+    assert normalize_query('select  1;') == 'select 1'
+    assert 'select 1' in reloaded
+    assert abs(reloaded.expected_cost('select 1') - 2.6) < 1e-9
+    assert reloaded.expected_cost('select 2') == 1.0
+
+
+def test_cheap_queries_batched():
+    history = QueryCostHistory()
+    for idx in range(5):
+        history.record('select {}'.format(idx), 0.001)
+
+    queries = ['select {}'.format(idx) for idx in range(5)] + ['select 99']
+    batches = make_batches(queries, history, max_batch_size=2)
+
+    # unseen query runs on its own, cheap ones are packed two at a time
+    assert [len(b.queries) for b in batches] == [2, 2, 1, 1]
+    assert batches[2].queries == ['select 99']
+
+
+def test_longest_expected_first():
+    batches = [QueryBatch(['q{}'.format(c)], c) for c in (1, 8, 3, 5)]
+    scheduler = WorkStealingScheduler(batches, num_workers=2)
+
+    assert scheduler.expected_loads() == [9, 8]
+    assert scheduler.next_batch(0).expected_cost == 8
+    assert scheduler.next_batch(1).expected_cost == 5
+
+
+def test_idle_worker_steals():
+    batches = [QueryBatch(['q{}'.format(c)], c) for c in (10, 1, 1, 1)]
+    scheduler = WorkStealingScheduler(batches, num_workers=2)
+
+    # worker 0 takes the long query, worker 1 drains its queue and then
+    # steals nothing since worker 0 has no pending work left
+    assert scheduler.next_batch(0).expected_cost == 10
+    taken = [scheduler.next_batch(1) for _ in range(4)]
+    assert [b.expected_cost for b in taken[:3]] == [1, 1, 1]
+    assert taken[3] is None
+
+    batches = [QueryBatch(['q{}'.format(c)], c) for c in (4, 3, 2, 2, 1)]
+    scheduler = WorkStealingScheduler(batches, num_workers=2)
+    while scheduler.next_batch(1) is not None:
+        pass
+    assert scheduler.steals > 0
+    assert scheduler.pending == 0
+
+
+def test_scheduler_threads_see_every_batch_once():
+    batches = [QueryBatch(['q{}'.format(i)], i % 7) for i in range(200)]
+    scheduler = WorkStealingScheduler(batches, num_workers=4)
+    seen = []
+    lock = threading.Lock()
+
+    def worker(idx):
+        while True:
+            batch = scheduler.next_batch(idx)
+            if batch is None:
+                return
+            with lock:
+                seen.append(batch.queries[0])
+
+    threads = [threading.Thread(target=worker, args=(i,)) for i in range(4)]
+    for thread in threads:
+        thread.start()
+    for thread in threads:
+        thread.join()
+
+    assert sorted(seen) == sorted(b.queries[0] for b in batches)
+
+
+def test_only_selects_batched():
+    history = QueryCostHistory()
+    queries = ['select 1', 'insert into t values (1)', 'select 2',
+               'delete from t']
+    for query in queries:
+        history.record(query, 0.001)
+
+    batches = make_batches(queries, history, max_batch_size=4)
+    assert sorted(b.queries for b in batches) == [
+        ['delete from t'], ['insert into t values (1)'],
+        ['select 1', 'select 2']]
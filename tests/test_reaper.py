@@ -0,0 +1,65 @@
+import os
+
+import pytest
+
+from db import reaper
+
+
+class FakeCursor(object):
+
+    def __init__(self, rows=()):
+        self.rows = list(rows)
+        self.statements = []
+
+    def execute(self, sql, params=None):
+        self.statements.append((sql, params))
+
+    def fetchall(self):
+        return self.rows
+
+    def nextset(self):
+        return False
+
+
+@pytest.fixture
+def no_pause(monkeypatch):
+    monkeypatch.setattr(reaper, 'REAP_BATCH_PAUSE_SEC', 0)
+
+
+def dead_pid():
+    pid = 2 ** 22 - 1
+    while reaper._pid_alive(pid):
+        pid -= 1
+    return pid
+
+
+def test_find_stale_sessions():
+    here, other = reaper.HOSTNAME, reaper.HOSTNAME + '-other'
+    cursor = FakeCursor([
+        ('usr1', 'db1', here, os.getpid(), 0, 0),
+        ('usr2', 'db2', here, dead_pid(), 0, 0),
+        ('usr3', 'db3', here, dead_pid(), 0, 1),
+        ('usr4', 'db4', other, 1, 0, 0),
+        ('usr5', 'db5', other, 1, 1, 0),
+        ('usr6', '', other, 1, 1, 1),
+    ])
+    assert reaper.find_stale_sessions(cursor, max_age=60) == [
+        ('usr2', 'db2'), ('usr5', 'db5')]
+    assert cursor.statements[0][1] == (60,)
+
+
+def test_drop_session_resources(no_pause, monkeypatch):
+    monkeypatch.setattr(reaper, 'REAP_BATCH_SIZE', 2)
+    cursor = FakeCursor()
+    sessions = [('usr1', 'db1'), ('usr2', ''), ('', 'db3')]
+
+    assert reaper.drop_session_resources(cursor, sessions) == \
+        reaper.ReapResult(users=2, databases=2)
+
+    statements = [sql for sql, _ in cursor.statements]
+    assert statements[0] == \
+        "DROP USER IF EXISTS 'usr1'@localhost, 'usr2'@localhost"
+    assert statements[1] == \
+        'DROP DATABASE IF EXISTS `db1`;\nDROP DATABASE IF EXISTS `db3`'
+    assert [params for _, params in cursor.statements[2:]] == [
+        ['usr1', 'db1', 'usr2', ''], ['', 'db3']]
@@ -0,0 +1,133 @@
+import os
+import shlex
+import subprocess
+
+import remote_log
+
+
+class _LocalSftp(object):
+    """
+    The part of paramiko's SFTPClient used by remote_log, on local files.
+    """
+
+    class _File(object):
+        def __init__(self, path):
+            self._fp = open(path, 'rb')
+
+        def stat(self):
+            return os.fstat(self._fp.fileno())
+
+        def seek(self, offset):
+            self._fp.seek(offset)
+
+        def read(self, size):
+            return self._fp.read(size)
+
+        def close(self):
+            self._fp.close()
+
+        def __enter__(self):
+            return self
+
+        def __exit__(self, *args):
+            self.close()
+
+    def stat(self, path):
+        return os.stat(path)
+
+    def open(self, path, mode):
+        return self._File(path)
+
+
+class _LocalConnection(object):
+    hostname = 'localhost'
+
+    def __init__(self):
+        self.sftp = _LocalSftp()
+        self.stat_calls = 0
+
+    def execute(self, cmd, raise_on_error=True):
+        self.stat_calls += 1
+        proc = subprocess.run(
+            shlex.split(cmd), stdout=subprocess.PIPE, stderr=subprocess.PIPE
+        )
+        return proc.stdout.decode(), proc.stderr.decode(), proc.returncode
+
+
+def _append(path, data):
+    with open(path, 'ab') as wfp:
+        wfp.write(data)
+
+
+def test_cursor_reads_appended_bytes_only(tmp_path):
+    path = str(tmp_path / 'error.log')
+    _append(path, b'old\n')
+    conn = _LocalConnection()
+
+    with remote_log.RemoteLogCursor(conn, path) as cursor:
+        assert cursor.poll() == b''
+        _append(path, b'one\n')
+        assert cursor.poll() == b'one\n'
+        _append(path, b'two\n')
+        assert cursor.poll() == b'two\n'
+        assert cursor.offset == 12
+        # Steady growth needs no inode lookups after the first
+        assert conn.stat_calls == 1
+
+
+def test_cursor_follows_rotation_and_truncation(tmp_path):
+    path = str(tmp_path / 'error.log')
+    _append(path, b'a\n')
+    conn = _LocalConnection()
+
+    with remote_log.RemoteLogCursor(conn, path, offset=0) as cursor:
+        assert cursor.poll() == b'a\n'
+
+        _append(path, b'b\n')
+        os.rename(path, path + '.1')
+        _append(path, b'c\n')
+        assert cursor.poll() == b'b\nc\n'
+
+        with open(path, 'wb'):
+            pass
+        assert cursor.poll() == b''
+        _append(path, b'd\n')
+        assert cursor.poll() == b'd\n'
+
+        os.remove(path)
+        assert cursor.poll() == b''
+        _append(path, b'e\n')
+        assert cursor.poll() == b'e\n'
+
+
+def test_cursor_state_resumes(tmp_path):
+    path = str(tmp_path / 'error.log')
+    _append(path, b'a\n')
+    conn = _LocalConnection()
+
+    with remote_log.RemoteLogCursor(conn, path, offset=0) as cursor:
+        cursor.poll()
+        state = cursor.state()
+
+    _append(path, b'b\n')
+    with remote_log.RemoteLogCursor(conn, **state) as cursor:
+        assert cursor.poll() == b'b\n'
+
+    os.rename(path, path + '.1')
+    _append(path, b'c\n')
+    with remote_log.RemoteLogCursor(conn, **state) as cursor:
+        assert cursor.poll() == b'c\n'
+
+
+def test_fetch_since_and_tail(tmp_path):
+    path = str(tmp_path / 'error.log')
+    _append(path, b'one\ntwo\nthr')
+    conn = _LocalConnection()
+
+    data, offset = remote_log.fetch_since(conn, path, 0)
+    assert data == b'one\ntwo\nthr'
+    assert remote_log.fetch_since(conn, path, offset) == (b'', offset)
+    assert remote_log.fetch_since(conn, path, 100) == (data, offset)
+
+    lines = list(remote_log.tail(conn, path, follow=False, from_start=True))
+    assert lines == ['one', 'two', 'thr']
@@ -0,0 +1,165 @@
+import replay
+
+GENERAL_LOG = """/usr/sbin/mariadbd, Version: 10.6.12-MariaDB (MariaDB Server). started with:
+Tcp port: 3306  Unix socket: /run/mysqld/mysqld.sock
+Time\t\t    Id Command\tArgument
+231019 10:01:02\t    5 Connect\tapp@localhost on shop using TCP/IP
+\t\t    5 Query\tSELECT * FROM orders
+WHERE id = 17
+\t\t    6 Connect\tapp@localhost on  using TCP/IP
+231019 10:01:04\t    6 Init DB\tshop
+\t\t    6 Query\tUPDATE orders SET state = 'paid' WHERE id = 18
+\t\t    5 Quit\t
+"""
+
+SLOW_LOG = """# Time: 231019 10:01:02
+# User@Host: app[app] @ localhost []
+# Thread_id: 7  Schema: shop  QC_hit: No
+# Query_time: 0.250000  Lock_time: 0.000045  Rows_sent: 1  Rows_examined: 10
+# Rows_affected: 0  Bytes_sent: 61
+use shop;
+SET timestamp=1697709662;
+SELECT * FROM orders WHERE id = 17;
+# User@Host: app[app] @ localhost []
+# Thread_id: 7  Schema: shop  QC_hit: No
+# Query_time: 0.010000  Lock_time: 0.000045  Rows_sent: 1  Rows_examined: 10
+SET timestamp=1697709663;
+SELECT * FROM orders WHERE id = 18;
+"""
+
+
+def test_parse_general_log():
+    statements = list(replay.parse_general_log(GENERAL_LOG.splitlines()))
+    commands = [(s.thread_id, s.command) for s in statements]
+    assert commands == [
+        (5, 'Connect'), (5, 'Query'), (6, 'Connect'), (6, 'Init DB'),
+        (6, 'Query'), (5, 'Quit'),
+    ]
+    assert statements[1].sql == 'SELECT * FROM orders\nWHERE id = 17'
+    assert statements[1].database == 'shop'
+    assert statements[4].database == 'shop'
+    assert statements[4].timestamp - statements[1].timestamp == 2
+
+
+def test_parse_slow_log(tmp_path):
+    path = tmp_path / 'slow.log'
+    path.write_text(SLOW_LOG)
+    statements = list(replay.read_log(str(path)))
+
+    assert len(statements) == 2
+    first, second = statements
+    assert first.thread_id == 7 and first.database == 'shop'
+    assert first.sql == 'SELECT * FROM orders WHERE id = 17;'
+    assert first.latency == 0.25
+    assert second.timestamp - first.timestamp == 1
+    assert replay.fingerprint(first.sql) == replay.fingerprint(second.sql)
+
+
+def test_fingerprint():
+    assert replay.fingerprint(
+        "INSERT INTO t1 VALUES (1, 'a'), (2, 'b''c');"
+    ) == 'INSERT INTO t1 VALUES (?+)+'
+    assert replay.fingerprint("SELECT c1 FROM t2 WHERE id=-3.5") == \
+        'SELECT c1 FROM t2 WHERE id=?'
+
+
+class _FakeCursor(object):
+    with_rows = False
+
+    def __init__(self, executed):
+        self.executed = executed
+
+    def execute(self, sql):
+        self.executed.append(sql)
+
+    def close(self):
+        pass
+
+
+class _FakeConnection(object):
+
+    def __init__(self):
+        self.executed = []
+        self.resets = 0
+
+    def cursor(self):
+        return _FakeCursor(self.executed)
+
+    def reset_session(self):
+        self.resets += 1
+
+
+class _FakeMariaDB(object):
+    instances = []
+
+    def __init__(self, conn_params, settings=None):
+        self.connection = None
+        self.conn = _FakeConnection()
+        _FakeMariaDB.instances.append(self)
+
+    def connect(self):
+        self.connection = self.conn
+
+    def close(self):
+        self.connection = None
+
+
+def test_replay_keeps_connections_and_timing(monkeypatch):
+    monkeypatch.setattr(replay, 'MariaDB', _FakeMariaDB)
+    _FakeMariaDB.instances = []
+    statements = list(replay.parse_general_log(GENERAL_LOG.splitlines()))
+
+    # 2 seconds of capture at 10x
+    report = replay.WorkloadReplayer({}, speed=10.0, workers=2).replay(
+        statements)
+
+    assert report.statements == 2 and report.errors == 0
+    assert 0.2 <= report.duration < 1.0
+    assert len(_FakeMariaDB.instances) == 2
+    executed = sorted(db.conn.executed for db in _FakeMariaDB.instances)
+    assert executed == [
+        ['USE `shop`', 'SELECT * FROM orders\nWHERE id = 17'],
+        ['USE `shop`', "UPDATE orders SET state = 'paid' WHERE id = 18"],
+    ]
+    # Connections are reset when their captured thread quits or the replay
+    # ends, before anything else can reuse them
+    assert sum(db.conn.resets for db in _FakeMariaDB.instances) == 2
+    assert 'UPDATE orders SET state = ? WHERE id = ?' in report.format()
+
+
+def _slow_log_statements(threads):
+    return [
+        replay.CapturedStatement(thread_id, None, replay.COMMAND_QUERY,
+                                 'SELECT {}'.format(thread_id), 'shop', 0.1)
+        for thread_id in range(threads)
+    ]
+
+
+def test_replay_caps_connections_per_worker(monkeypatch):
+    monkeypatch.setattr(replay, 'MariaDB', _FakeMariaDB)
+    _FakeMariaDB.instances = []
+
+    report = replay.WorkloadReplayer(
+        {}, speed=0, workers=1, connections_per_worker=2, idle_timeout=None
+    ).replay(_slow_log_statements(10))
+
+    assert report.statements == 10 and report.errors == 0
+    assert len(_FakeMariaDB.instances) == 2
+    # Every captured thread but the last two was released for another one
+    assert sum(db.conn.resets for db in _FakeMariaDB.instances) == 10
+
+
+def test_replay_releases_idle_connections(monkeypatch):
+    monkeypatch.setattr(replay, 'MariaDB', _FakeMariaDB)
+    _FakeMariaDB.instances = []
+
+    report = replay.WorkloadReplayer(
+        {}, speed=0, workers=1, idle_timeout=0
+    ).replay(_slow_log_statements(10))
+
+    assert report.statements == 10 and report.errors == 0
+    assert len(_FakeMariaDB.instances) == 1
+    assert _FakeMariaDB.instances[0].conn.executed == [
+        sql for i in range(10)
+        for sql in ('USE `shop`', 'SELECT {}'.format(i))
+    ]
@@ -0,0 +1,59 @@
+import decimal
+import logging
+
+from result_cache import ResultFingerprintCache, result_digest
+
+log = logging.getLogger(__name__)
+
+
+def test_result_digest_order_independent():
+    rows = [(0, 0, decimal.Decimal('0')), (1, 3, decimal.Decimal('4.31'))]
+    other = [(1, 3, decimal.Decimal('4.3100000000')),
+             (0, 0, decimal.Decimal('0E-10'))]
+
+    assert result_digest(rows) == result_digest(other)
+    assert result_digest(rows) != result_digest(rows + rows[:1])
+    assert result_digest([]) == '0:{}'.format('0' * 32)
+
+
+def test_result_digest_tells_types_apart():
+    digest = result_digest([(1, None)])
+
+    assert result_digest([(decimal.Decimal('1.0'), None)]) == digest
+    assert result_digest([(1.0, None)]) == digest
+    assert result_digest([('1', None)]) != digest
+    assert result_digest([(b'1', None)]) != result_digest([('31', None)])
+    assert result_digest([('\\N', None)]) != result_digest([(None, None)])
+
+
+def test_cache_roundtrip_and_invalidate(tmp_path):
+    filepath = str(tmp_path / 'results.sqlite')
+    key = ResultFingerprintCache.make_key('select 1;', 'abc', '10.6', 'OFF')
+
+    with ResultFingerprintCache(filepath) as cache:
+        assert cache.get(key) is None
+        cache.put(key, '1:ff')
+
+    with ResultFingerprintCache(filepath) as cache:
+        assert len(cache) == 1
+        same_key = cache.make_key('select  1', 'abc', '10.6', 'OFF')
+        assert cache.get(same_key) == '1:ff'
+        assert cache.invalidate_server('10.5') == 0
+        assert cache.invalidate_data('abc') == 1
+        assert cache.get(key) is None
+
+
+def test_cache_evicts_least_recently_used():
+    cache = ResultFingerprintCache(max_entries=2)
+    keys = [cache.make_key('select {}'.format(i), '', '', '')
+            for i in range(3)]
+
+    cache.put(keys[0], 'a')
+    cache.put(keys[1], 'b')
+    cache.get(keys[0])
+    cache.put(keys[2], 'c')
+
+    assert len(cache) == 2
+    assert cache.get(keys[1]) is None
+    assert cache.get(keys[0]) == 'a'
+    assert cache.get(keys[2]) == 'c'
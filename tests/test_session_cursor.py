@@ -0,0 +1,60 @@
+import pytest
+
+from db import DbSession
+from db.session_cursor import (
+    classify_session_statement,
+    STATEMENT_COMMIT,
+    STATEMENT_QUERY,
+    STATEMENT_ROLLBACK,
+    STATEMENT_WRITE,
+)
+from db.session_cursor import TransactionScope
+
+CONN_PARAMS = {
+    'host': 'localhost',
+    'port': 3306,
+    'user': 'root',
+    'password': '',
+    'dbname': 'test',
+}
+
+
+@pytest.mark.parametrize('sql,expected', [
+    ("SELECT * FROM t1", (STATEMENT_QUERY, None)),
+    ("INSERT INTO t1 VALUES (1)", (STATEMENT_WRITE, (None, 't1'))),
+    ("insert ignore `t 1` values (1)", (STATEMENT_WRITE, (None, 't 1'))),
+    ("UPDATE db1.t1 SET a = 1", (STATEMENT_WRITE, ('db1', 't1'))),
+    ("/* hint */ DELETE FROM t2 WHERE 1", (STATEMENT_WRITE, (None, 't2'))),
+    ("CREATE TABLE IF NOT EXISTS t3 (a int)", (STATEMENT_COMMIT, (None, 't3'))),
+    ("CREATE TEMPORARY TABLE t4 (a int)", (STATEMENT_QUERY, None)),
+    ("ALTER TABLE t1 ADD COLUMN b int", (STATEMENT_COMMIT, None)),
+    ("LOCK TABLES t1 WRITE", (STATEMENT_COMMIT, None)),
+    ("ROLLBACK", (STATEMENT_ROLLBACK, None)),
+    ("ROLLBACK TO SAVEPOINT s1", (STATEMENT_QUERY, None)),
+])
+def test_classify_session_statement(sql, expected):
+    assert classify_session_statement(sql) == expected
+
+
+def test_scope_bookkeeping():
+    session = DbSession(CONN_PARAMS, isolation='transaction')
+    assert session.isolate_db
+    assert session.conn_settings['autocommit'] is False
+
+    # No connection needed to track statements of open scopes
+    outer, inner = TransactionScope(), TransactionScope('mdb_scope_1')
+    session._scopes = [outer, inner]
+    session._on_statement("INSERT INTO t1 VALUES (1)")
+    session._on_statement("INSERT INTO other_db.t1 VALUES (1)")
+    assert inner.written == {'t1'} and not outer.written
+    assert not inner.committed
+
+    session._on_statement("CREATE TABLE t2 (a int)")
+    assert inner.created == {'t2'}
+    assert outer.committed and inner.committed
+    assert inner.savepoint_lost
+
+    with pytest.raises(ValueError):
+        DbSession(CONN_PARAMS, isolation='snapshot')
+    with pytest.raises(ValueError):
+        DbSession(CONN_PARAMS).begin_scope()
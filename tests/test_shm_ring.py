@@ -0,0 +1,49 @@
+import logging
+import multiprocessing
+
+from shm_ring import SharedMemoryRing
+
+log = logging.getLogger(__name__)
+
+
+def _writer(ring_name, conn):
+    ring = SharedMemoryRing(name=ring_name)
+    for count in (1, 2, 3):
+        conn.recv()
+        ring.begin()
+        handles = [ring.write_object({'rows': [(idx,)] * 100})
+                   for idx in range(count)]
+        conn.send(handles)
+    ring.close()
+
+
+def test_ring_across_processes():
+    with SharedMemoryRing(size=4096, create=True) as ring:
+        conn, child_conn = multiprocessing.Pipe()
+        proc = multiprocessing.Process(
+            target=_writer, args=(ring.name, child_conn)
+        )
+        proc.start()
+
+        for count in (1, 2, 3):
+            conn.send('next')
+            handles = conn.recv()
+            assert len(handles) == count
+            for idx, handle in enumerate(handles):
+                assert ring.read_object(handle) == {'rows': [(idx,)] * 100}
+
+        proc.join()
+        assert proc.exitcode == 0
+
+
+def test_ring_wraps_and_rejects_oversized():
+    with SharedMemoryRing(size=100, create=True) as ring:
+        ring.begin()
+        assert ring.write(b'a' * 60) == (0, 60)
+        assert ring.write(b'b' * 60) is None
+
+        ring.begin()
+        assert ring.write(b'c' * 30) == (60, 30)
+        assert ring.write(b'd' * 50) == (0, 50)
+        assert ring.read((0, 50)) == b'd' * 50
+        assert ring.write(b'e' * 101) is None
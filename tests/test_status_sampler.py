@@ -0,0 +1,78 @@
+import math
+
+from db.status_sampler import StatusSeries, parse_innodb_status
+
+
+INNODB_STATUS = """
+------------
+TRANSACTIONS
+------------
+Trx id counter 1234
+History list length 42
+---
+LOG
+---
+Log sequence number 50000
+Log flushed up to   49000
+Last checkpoint at  30000
+"""
+
+
+def _sample(uptime, questions, commits, reqs, reads, waits, wait_ms,
+            running):
+    return {
+        'Uptime': uptime,
+        'Questions': questions,
+        'Com_commit': commits,
+        'Com_rollback': 0,
+        'Innodb_buffer_pool_read_requests': reqs,
+        'Innodb_buffer_pool_reads': reads,
+        'Innodb_row_lock_waits': waits,
+        'Innodb_row_lock_time': wait_ms,
+        'Threads_running': running,
+        'active_trx': 3,
+        'statement_wait_ms': questions * 2,
+    }
+
+
+def test_parse_innodb_status():
+    assert parse_innodb_status(INNODB_STATUS) == {
+        'history_list_length': 42.0,
+        'checkpoint_age': 20000.0,
+    }
+    assert all(math.isnan(v) for v in parse_innodb_status('').values())
+
+
+def test_rates_from_deltas():
+    series = StatusSeries()
+    series.append(10.0, _sample(100, 1000, 100, 1000, 10, 0, 0, 4))
+    series.append(12.0, _sample(102, 3000, 300, 3000, 30, 4, 40, 8))
+    series.append(13.0, _sample(103, 3500, 300, 3000, 30, 4, 40, 2))
+    # Restart: counters start over
+    series.append(14.0, _sample(1, 10, 1, 10, 10, 0, 0, 1))
+
+    rates = series.rates()
+    assert list(rates['time']) == [2.0, 3.0, 4.0]
+    assert list(rates['qps'])[:2] == [1000.0, 500.0]
+    assert list(rates['tps'])[:2] == [100.0, 0.0]
+    assert rates['bp_hit_ratio'][0] == 0.99
+    assert math.isnan(rates['bp_hit_ratio'][1])
+    assert list(rates['lock_waits'])[:2] == [2.0, 0.0]
+    assert rates['lock_wait_ms'][0] == 10.0
+    assert list(rates['Threads_running'])[:2] == [8.0, 2.0]
+    assert list(rates['active_trx'])[:2] == [3.0, 3.0]
+    assert list(rates['statement_wait_ms'])[:2] == [2000.0, 1000.0]
+    assert math.isnan(rates['qps'][2])
+
+    summary = series.summary()
+    assert summary['qps'] == {
+        'mean': 750.0, 'min': 500.0, 'max': 1000.0, 'last': 500.0
+    }
+    assert summary['bp_hit_ratio']['mean'] == 0.99
+
+
+def test_rates_need_two_samples():
+    series = StatusSeries()
+    assert len(series.rates()['qps']) == 0
+    series.append(1.0, _sample(1, 1, 1, 1, 1, 1, 1, 1))
+    assert series.summary() == {}
@@ -0,0 +1,113 @@
+import os
+
+import pytest
+
+from sysbench import SysbenchConfig, SBConfigInvalid
+from sysbench.sysbench_config import load_sysbench_config
+
+SAMPLE_YAML = os.path.join(
+    os.path.dirname(os.path.abspath(__file__)),
+    '../libs/sysbench/yaml/sample2.yaml'
+)
+
+CONFIG = """
+sysbench:
+    config_ro:
+        options:
+            threads: 4
+            tables:  {tables}
+        testname:   oltp_read_only
+        commands:   [prepare, run]
+job:
+    job_1:
+        config: config_ro
+        clients:
+            client1: 2
+            client2: 1
+"""
+
+
+def test_sample_config_commands():
+    config = SysbenchConfig(SAMPLE_YAML, 'job_1')
+    assert config.job_list == ['job_1']
+    commands = config.get_cli_commands()
+    assert list(commands) == ['localhost']
+    assert commands['localhost'][0].startswith('/usr/local/bin/sysbench  --')
+    assert commands['localhost'][0].endswith(' --test=cpu run')
+
+    all_jobs = SysbenchConfig(SAMPLE_YAML)
+    assert all_jobs.job_list == ['job_1', 'job_2']
+    assert len(all_jobs.get_cli_commands()['localhost']) == 2
+
+
+def test_compiled_config_cached_by_mtime(tmp_path):
+    path = tmp_path / 'sweep.yaml'
+    path.write_text(CONFIG.format(tables=10))
+
+    compiled = load_sysbench_config(str(path))
+    assert load_sysbench_config(str(path)) is compiled
+    config = SysbenchConfig(str(path))
+    commands = config.get_cli_commands()
+    assert commands['client1'] == [commands['client2'][0]] * 2
+    assert commands['client1'][0].count('--tables=10') == 2
+
+    # Callers modifying the result do not affect the memoized commands
+    commands['client1'].clear()
+    assert len(config.get_cli_commands()['client1']) == 2
+
+    path.write_text(CONFIG.format(tables=200))
+    os.utime(str(path), ns=(1, 1))
+    reloaded = SysbenchConfig(str(path)).get_cli_commands()
+    assert '--tables=200' in reloaded['client1'][0]
+
+
+def test_validation_reports_every_problem(tmp_path):
+    path = tmp_path / 'bad.yaml'
+    path.write_text("""
+sysbench:
+    config_a:
+        options: [threads]
+        commands: run
+job:
+    job_1:
+        config: config_missing
+        clients:
+            client1: 0
+""")
+    with pytest.raises(SBConfigInvalid) as excinfo:
+        SysbenchConfig(str(path))
+
+    msg = str(excinfo.value)
+    assert 'sysbench.config_a.options must be a mapping' in msg
+    assert 'sysbench.config_a.testname must be a string' in msg
+    assert "unknown config 'config_missing'" in msg
+    assert 'job.job_1.clients.client1 must be a positive' in msg
+
+    with pytest.raises(SBConfigInvalid):
+        SysbenchConfig(SAMPLE_YAML, ['job_9'])
+
+    with pytest.raises(SBConfigInvalid):
+        SysbenchConfig(str(tmp_path / 'missing.yaml'))
+
+
+def test_target_rate(tmp_path):
+    path = tmp_path / 'rate.yaml'
+    path.write_text(CONFIG.format(tables=10).replace(
+        "        testname:", "        rate:       250\n        testname:"))
+
+    config = SysbenchConfig(str(path))
+    assert dict(config.configs['config_ro'].options)['rate'] == 250
+    assert ' --rate=250 ' in config.get_cli_commands()['client1'][0]
+
+    swept = SysbenchConfig(str(path), rate=1000).get_cli_commands()
+    assert ' --rate=1000 ' in swept['client1'][0]
+    assert '--rate=250' not in swept['client1'][0]
+    # The configured rate is untouched by the override
+    assert ' --rate=250 ' in config.get_cli_commands()['client1'][0]
+
+    path.write_text(CONFIG.format(tables=10).replace(
+        "        testname:", "        rate:       fast\n        testname:"))
+    os.utime(str(path), ns=(2, 2))
+    with pytest.raises(SBConfigInvalid) as excinfo:
+        SysbenchConfig(str(path))
+    assert 'rate must be a non-negative number' in str(excinfo.value)
@@ -0,0 +1,53 @@
+from sysbench import SysbenchParseLogfile
+
+LOG = """sysbench 1.0.20 (using bundled LuaJIT 2.1.0-beta2)
+
+Running the test with following options:
+Number of threads: 8
+Target transaction rate: 100/sec
+Report intermediate results every 1 second(s)
+
+Threads started!
+
+[ 1s ] thds: 8 tps: 99.93 qps: 1998.62 (r/w/o: 1399.04/399.72/199.86) lat (ms,95%): 12.30 err/s: 0.00 reconn/s: 0.00
+[ 1s ] queue length: 0, concurrency: 2
+[ 2s ] thds: 8 tps: 61.00 qps: 1220.00 (r/w/o: 854.00/244.00/122.00) lat (ms,95%): 450.77 err/s: 0.00 reconn/s: 0.00
+[ 2s ] queue length: 39, concurrency: 8
+SQL statistics:
+    queries performed:
+        read:                            2253
+        write:                           644
+        other:                           322
+        total:                           3219
+    transactions:                        161    (80.46 per sec.)
+
+General statistics:
+    total time:                          2.0010s
+    total number of events:              161
+
+Latency (ms):
+         min:                                    4.02
+         avg:                                  120.35
+         max:                                  470.12
+         95th percentile:                      450.77
+         sum:                                19376.35
+
+Threads fairness:
+    events (avg/stddev):           20.1250/1.05
+
+"""
+
+
+def test_parse_rate_run(tmp_path):
+    path = tmp_path / 'sysbench.log'
+    path.write_text(LOG)
+    stats = SysbenchParseLogfile(str(path))
+
+    # The banner line is not taken for an intermediate report
+    assert len(stats['intervals']) == 2
+    assert stats['tps']['time'] == 2
+    assert stats['tps']['latency'] == 450.77
+    assert stats['queue']['max_length'] == 39
+    assert stats['queue']['samples'][0] == {
+        'time': 1.0, 'length': 0, 'concurrency': 2}
+    assert stats['Latency']['95th_percentile'] == '450.77'
@@ -0,0 +1,248 @@
+import mysql.connector
+import pytest
+
+from db import topology
+from db.db_exception import OperationalError
+from db.helper import primary_conn_params, validate_conn_params
+
+
+CONN_PARAMS = {
+    'endpoints': [
+        {'host': 'db1', 'role': 'primary'},
+        {'host': 'db2', 'role': 'replica'},
+        {'host': 'db3', 'port': 3307, 'role': 'replica'},
+    ],
+    'port': 3306,
+    'dbname': 'dev',
+    'user': 'master',
+    'password': 'Testing1234',
+}
+
+
+class FakeServers(object):
+    """
+    State of the fake servers: hosts refusing connections, replica lag by
+    host (None: not replicating), statements run, by host, and connections
+    closed. Statements containing 'dup' fail with a duplicate key,
+    statements containing 'lost' lose the connection.
+    """
+
+    def __init__(self):
+        self.down = set()
+        self.lag = {'db2': 0, 'db3': 0}
+        self.statements = []
+        self.closed = 0
+
+
+class FakeCursor(object):
+
+    def __init__(self, servers, host):
+        self._servers = servers
+        self._host = host
+        self.description = None
+        self._rows = []
+        self.rowcount = 0
+
+    def execute(self, sql, params=None):
+        self._servers.statements.append((self._host, sql))
+        if 'dup' in sql:
+            raise mysql.connector.IntegrityError(msg='Duplicate entry',
+                                                 errno=1062)
+        if 'lost' in sql:
+            raise mysql.connector.OperationalError(msg='Lost connection',
+                                                   errno=2013)
+        if sql == 'SHOW SLAVE STATUS':
+            lag = self._servers.lag.get(self._host)
+            self.description = [('Slave_IO_Running',),
+                                ('Slave_SQL_Running',),
+                                ('Seconds_Behind_Master',)]
+            self._rows = [('Yes', 'No' if lag is None else 'Yes', lag)]
+        elif sql.startswith('SELECT'):
+            self.description = [('host',)]
+            self._rows = [(self._host,)]
+        else:
+            self.description = None
+            self.rowcount = 1
+
+    def fetchall(self):
+        return self._rows
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *args):
+        pass
+
+
+@pytest.fixture
+def servers(monkeypatch):
+    servers = FakeServers()
+
+    class FakeMariaDB(object):
+
+        def __init__(self, conn_params, settings=None):
+            self.conn_params = conn_params
+
+        def connect(self):
+            if self.conn_params['host'] in servers.down:
+                raise OperationalError("Can't connect")
+
+        def cursor(self):
+            return FakeCursor(servers, self.conn_params['host'])
+
+        def close(self):
+            servers.closed += 1
+
+    monkeypatch.setattr(topology, 'MariaDB', FakeMariaDB)
+    return servers
+
+
+def test_validate_endpoints():
+    validate_conn_params(CONN_PARAMS)
+    assert primary_conn_params(CONN_PARAMS) == {
+        'host': 'db1', 'port': 3306, 'dbname': 'dev', 'user': 'master',
+        'password': 'Testing1234'}
+
+    for endpoints in ([], [{'host': 'db2', 'role': 'replica'}],
+                      [{'host': 'db1', 'role': 'leader'}],
+                      [{'role': 'primary'}]):
+        with pytest.raises(ValueError):
+            validate_conn_params(dict(CONN_PARAMS, endpoints=endpoints))
+
+
+def test_statement_classification():
+    assert topology.is_read_statement("select 1")
+    assert topology.is_read_statement("  /* x */ SHOW TABLES")
+    assert not topology.is_read_statement("SELECT * FROM t FOR UPDATE")
+    assert not topology.is_read_statement("INSERT INTO t VALUES (1)")
+    assert not topology.is_read_statement("SET @a = 1")
+    assert not topology.is_write_statement("SET @a = 1")
+    assert topology.is_write_statement("DELETE FROM t")
+    assert not topology.is_read_statement("SELECT @a := 1")
+    assert topology.is_session_state_statement("USE shop")
+    assert topology.is_session_state_statement(
+        "CREATE TEMPORARY TABLE t (a INT)")
+    assert topology.is_session_state_statement("CALL p()")
+    assert not topology.is_session_state_statement("SELECT 1")
+
+
+def test_least_connections(servers):
+    provider = topology.TopologyProvider(CONN_PARAMS)
+    held = [provider.acquire(read_only=True) for _ in range(4)]
+    hosts = sorted(endpoint.conn_params['host'] for endpoint, _ in held)
+    assert hosts == ['db2', 'db2', 'db3', 'db3']
+    assert held[0][0].conn_params['port'] in (3306, 3307)
+
+    for endpoint, db in held:
+        provider.release(endpoint, db)
+    assert [e.active for e in provider.endpoints] == [0, 0, 0]
+
+    endpoint, _ = provider.acquire()
+    assert endpoint.conn_params['host'] == 'db1'
+
+
+def test_latency_balancing(servers):
+    provider = topology.TopologyProvider(
+        CONN_PARAMS, balancing=topology.BALANCE_LATENCY)
+    provider.endpoints[1].latency = 0.001
+    provider.endpoints[2].latency = 0.1
+    counts = {'db2': 0, 'db3': 0}
+    for _ in range(200):
+        endpoint, db = provider.acquire(read_only=True)
+        counts[endpoint.conn_params['host']] += 1
+        provider.release(endpoint, db)
+    assert counts['db2'] > 5 * counts['db3']
+
+
+def test_lag_and_failover(servers):
+    provider = topology.TopologyProvider(CONN_PARAMS, lag_check_interval=0)
+
+    servers.lag['db2'] = 60
+    servers.down.add('db3')
+    for _ in range(3):
+        endpoint, db = provider.acquire(read_only=True)
+        assert endpoint.conn_params['host'] == 'db1'
+        provider.release(endpoint, db)
+    assert provider.endpoints[2].down_until > 0
+
+    servers.lag['db2'] = None
+    endpoint, db = provider.acquire(read_only=True)
+    assert endpoint.conn_params['host'] == 'db1'
+    provider.release(endpoint, db)
+
+    servers.lag['db2'] = 1
+    endpoint, db = provider.acquire(read_only=True)
+    assert endpoint.conn_params['host'] == 'db2'
+
+    servers.down.add('db1')
+    provider.endpoints[0]._idle = []
+    with pytest.raises(OperationalError):
+        provider.acquire()
+
+
+def test_read_your_writes(servers):
+    provider = topology.TopologyProvider(CONN_PARAMS)
+    with provider.session(pin_sec=60) as session:
+        assert session.execute("SELECT host") != [('db1',)]
+        assert session.execute("INSERT INTO t VALUES (1)") == 1
+        assert session.pinned
+        assert session.execute("SELECT host") == [('db1',)]
+
+    with provider.session(pin_sec=0) as session:
+        session.execute("START TRANSACTION")
+        session.execute("SELECT host")
+        assert session.execute("SELECT host") == [('db1',)]
+        session.execute("COMMIT")
+        assert not session.pinned
+        assert session.execute("SELECT host") != [('db1',)]
+    assert [e.active for e in provider.endpoints] == [0, 0, 0]
+
+
+@pytest.mark.parametrize('sql', [
+    "SET @x = 1", "USE dev", "CREATE TEMPORARY TABLE t (a INT)", "CALL p()",
+])
+def test_session_state_pins_for_good(servers, sql):
+    provider = topology.TopologyProvider(CONN_PARAMS)
+    with provider.session(pin_sec=0) as session:
+        session.execute(sql)
+        session.execute("COMMIT")
+        assert session.pinned
+        assert session.execute("SELECT host") == [('db1',)]
+    assert [e.active for e in provider.endpoints] == [0, 0, 0]
+
+
+def test_autocommit_off_is_a_transaction(servers):
+    provider = topology.TopologyProvider(CONN_PARAMS)
+    with provider.session(pin_sec=0) as session:
+        session.execute("SET autocommit=0")
+        assert session.execute("SELECT host") == [('db1',)]
+        session.execute("COMMIT")
+        assert session.execute("SELECT host") == [('db1',)]
+        session.execute("SET autocommit = 1")
+        assert not session.pinned
+        assert session.execute("SELECT host") != [('db1',)]
+
+
+def test_statement_error_keeps_transaction(servers):
+    provider = topology.TopologyProvider(CONN_PARAMS)
+    with provider.session(pin_sec=0) as session:
+        session.execute("BEGIN")
+        with pytest.raises(mysql.connector.IntegrityError):
+            session.execute("INSERT INTO t VALUES ('dup')")
+        assert session.pinned
+        session.execute("INSERT INTO t VALUES (2)")
+        session.execute("COMMIT")
+        assert servers.closed == 0
+        assert [e.active for e in provider.endpoints] == [1, 0, 0]
+        assert not session.pinned
+
+
+def test_lost_connection_dropped(servers):
+    provider = topology.TopologyProvider(CONN_PARAMS)
+    with provider.session(pin_sec=0) as session:
+        session.execute("BEGIN")
+        with pytest.raises(mysql.connector.OperationalError):
+            session.execute("INSERT INTO t VALUES ('lost')")
+        assert servers.closed == 1
+        assert not session.pinned
+        assert [e.active for e in provider.endpoints] == [0, 0, 0]
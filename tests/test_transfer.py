@@ -0,0 +1,310 @@
+import os
+import subprocess
+import threading
+
+import pytest
+
+import connection
+import transfer
+
+
+class _LocalSftp(object):
+    """
+    The part of paramiko's SFTPClient used by SftpTransfer, on local files.
+    Reads of the offsets in fail_offsets fail, every read offset is
+    recorded in reads.
+    """
+
+    class _Channel(object):
+        def settimeout(self, timeout):
+            pass
+
+    class _File(object):
+        def __init__(self, sftp, path, mode):
+            self._sftp = sftp
+            self._fp = open(path, mode)
+
+        def readv(self, blocks):
+            for offset, length in blocks:
+                with self._sftp.lock:
+                    if offset in self._sftp.fail_offsets:
+                        raise IOError('read of {} failed'.format(offset))
+                    self._sftp.reads.append(offset)
+                self._fp.seek(offset)
+                yield self._fp.read(length)
+
+        def set_pipelined(self, pipelined):
+            pass
+
+        def seek(self, offset):
+            self._fp.seek(offset)
+
+        def write(self, data):
+            self._fp.write(data)
+
+        def truncate(self, size):
+            self._fp.truncate(size)
+
+        def close(self):
+            self._fp.close()
+
+        def __enter__(self):
+            return self
+
+        def __exit__(self, *args):
+            self.close()
+
+    def __init__(self, fail_offsets, reads, lock):
+        self.fail_offsets = fail_offsets
+        self.reads = reads
+        self.lock = lock
+
+    def get_channel(self):
+        return self._Channel()
+
+    def stat(self, path):
+        return os.stat(path)
+
+    def open(self, path, mode):
+        return self._File(self, path, mode)
+
+    def posix_rename(self, old_path, new_path):
+        os.replace(old_path, new_path)
+
+    def utime(self, path, times):
+        os.utime(path, times)
+
+    def close(self):
+        pass
+
+
+class _LocalStream(object):
+    """
+    stdin, stdout or stderr of paramiko's exec_command, on a local process.
+    """
+
+    class _Channel(object):
+        def __init__(self, proc):
+            self._proc = proc
+
+        def shutdown_write(self):
+            self._proc.stdin.close()
+
+        def recv_exit_status(self):
+            return self._proc.wait()
+
+    def __init__(self, proc, fp):
+        self._fp = fp
+        self.channel = self._Channel(proc)
+
+    def read(self, size=-1):
+        return self._fp.read(size)
+
+    def write(self, data):
+        self._fp.write(data)
+
+
+class _LocalSsh(object):
+    """
+    The part of paramiko's SSHClient used by SftpTransfer: SFTP channels on
+    local files and commands run by the local shell.
+    """
+
+    class _Transport(object):
+        def getpeername(self):
+            return ('127.0.0.1', 22)
+
+    def __init__(self):
+        self.fail_offsets = set()
+        self.reads = []
+        self._lock = threading.Lock()
+
+    def get_transport(self):
+        return self._Transport()
+
+    def open_sftp(self):
+        return _LocalSftp(self.fail_offsets, self.reads, self._lock)
+
+    def exec_command(self, cmd, timeout=None):
+        proc = subprocess.Popen(
+            cmd, shell=True, stdin=subprocess.PIPE, stdout=subprocess.PIPE,
+            stderr=subprocess.PIPE
+        )
+        return (_LocalStream(proc, proc.stdin),
+                _LocalStream(proc, proc.stdout),
+                _LocalStream(proc, proc.stderr))
+
+
+def _write(path, size):
+    data = os.urandom(size)
+    with open(path, 'wb') as wfp:
+        wfp.write(data)
+    return data
+
+
+def _read(path):
+    with open(path, 'rb') as rfp:
+        return rfp.read()
+
+
+def test_failed_chunk_resumes_with_missing_chunks(tmp_path):
+    remote = str(tmp_path / 'remote.log')
+    local = str(tmp_path / 'local.log')
+    data = _write(remote, 10 * 1024)
+    ssh = _LocalSsh()
+    ssh.fail_offsets.add(4096)
+
+    engine = transfer.SftpTransfer(
+        ssh, chunk_size=1024, parallel_chunks=1,
+        state_dir=str(tmp_path / 'state')
+    )
+    with pytest.raises(IOError):
+        engine.get(remote, local)
+    assert not os.path.exists(local)
+    assert os.path.getsize(local + '.part') == len(data)
+    assert ssh.reads == [0, 1024, 2048, 3072]
+
+    ssh.fail_offsets.clear()
+    del ssh.reads[:]
+    engine.get(remote, local)
+
+    assert _read(local) == data
+    assert not os.path.exists(local + '.part')
+    assert sorted(ssh.reads) == list(range(4096, 10 * 1024, 1024))
+    assert os.listdir(str(tmp_path / 'state')) == []
+
+
+def test_parallel_chunks_put(tmp_path):
+    local = str(tmp_path / 'local.log')
+    remote = str(tmp_path / 'remote.log')
+    data = _write(local, 64 * 1024 + 17)
+    progress = []
+
+    engine = transfer.SftpTransfer(
+        _LocalSsh(), chunk_size=4096, parallel_chunks=4,
+        parallel_threshold=0, state_dir=str(tmp_path / 'state'),
+        progress=lambda path, done, total, rate: progress.append(done)
+    )
+    engine.put(local, remote)
+
+    assert _read(remote) == data
+    assert max(progress) == len(data)
+
+
+def test_compressed_round_trip(tmp_path):
+    local = str(tmp_path / 'local.log')
+    remote = str(tmp_path / 'remote.log')
+    copy = str(tmp_path / 'copy.log')
+    data = b''.join(b'line %d\n' % i for i in range(20000))
+    with open(local, 'wb') as wfp:
+        wfp.write(data)
+
+    engine = transfer.SftpTransfer(
+        _LocalSsh(), compress=True, state_dir=str(tmp_path / 'state')
+    )
+    engine.put(local, remote)
+    assert _read(remote) == data
+
+    # A partial copy resumes from its size
+    with open(copy + '.part', 'wb') as wfp:
+        wfp.write(data[:1000])
+    engine.get(remote, copy)
+    assert _read(copy) == data
+
+
+class _FakeConnection(object):
+    """
+    Connection copying local files, failing for remote paths containing
+    'missing'.
+    """
+
+    def __init__(self, hostname):
+        self.hostname = hostname
+        self.copies = []
+
+    def copy(self, local_file, remote_file, from_remote=True,
+             raise_on_error=True, **kwargs):
+        if 'missing' in remote_file:
+            raise Exception('No such file')
+        self.copies.append((local_file, remote_file, from_remote))
+        with open(local_file, 'w') as wfp:
+            wfp.write(self.hostname)
+
+
+def test_copy_many(tmp_path):
+    conn = _FakeConnection('host1')
+    jobs = [
+        (conn, str(tmp_path / 'a'), '/var/log/a', True),
+        (conn, str(tmp_path / 'b'), '/var/log/missing', True),
+        (conn, str(tmp_path / 'c'), '/var/log/c', True),
+    ]
+
+    with pytest.raises(transfer.TransferError) as excinfo:
+        transfer.copy_many(jobs, max_parallel=2)
+    assert 'host1:/var/log/missing' in str(excinfo.value)
+
+    errors = transfer.copy_many(jobs, raise_on_error=False)
+    assert [error is None for error in errors] == [True, False, True]
+    assert transfer.copy_many([]) == []
+
+
+def test_group_get_all(tmp_path, monkeypatch):
+    monkeypatch.setattr(
+        connection, 'Connection',
+        lambda hostname, username, password: _FakeConnection(hostname)
+    )
+    group = connection.ConnectionGroup(['host1', 'host2'])
+
+    local_files = group.get_all('/var/log/error.log', str(tmp_path))
+
+    assert sorted(local_files) == ['host1', 'host2']
+    for hostname, path in local_files.items():
+        assert path == str(tmp_path / hostname / 'error.log')
+        assert _read(path) == hostname.encode()
+
+
+class _FakeSSHClient(object):
+    """
+    paramiko.SSHClient whose connects take a while and are counted.
+    """
+
+    connects = 0
+
+    class _Transport(object):
+        active = True
+
+        def is_active(self):
+            return self.active
+
+    def __init__(self):
+        self.transport = self._Transport()
+
+    def set_missing_host_key_policy(self, policy):
+        pass
+
+    def connect(self, hostname, **kwargs):
+        _FakeSSHClient.connects += 1
+        threading.Event().wait(0.05)
+
+    def get_transport(self):
+        return self.transport
+
+    def close(self):
+        pass
+
+
+def test_lost_transport_reconnected_once(monkeypatch):
+    monkeypatch.setattr(connection.paramiko, 'SSHClient', _FakeSSHClient)
+    monkeypatch.setattr(connection, 'SCPClient', lambda transport: None)
+    _FakeSSHClient.connects = 0
+    conn = connection.Connection('host1')
+    conn._ssh_paramiko.transport.active = False
+
+    threads = [threading.Thread(target=conn._ensure_transport)
+               for _ in range(8)]
+    for thread in threads:
+        thread.start()
+    for thread in threads:
+        thread.join()
+
+    assert _FakeSSHClient.connects == 2